@@ -0,0 +1,254 @@
+"""
+消息统计汇总查询
+统计接口读取按分钟/小时预聚合的汇总表（由message_logs上的触发器在写入时更新），
+仪表盘刷新不再扫描message_logs，也不与Worker争用写连接
+"""
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from ..config import settings
+from ..database import MESSAGE_STATS_TABLES
+from ..database_async import AsyncDatabase, async_db
+from ..utils.logger import logger
+
+
+MINUTE_TABLE = 'message_stats_minute'
+HOUR_TABLE = 'message_stats_hour'
+
+# 可分组的维度（汇总表列名）
+DIMENSIONS = ('platform', 'channel', 'status')
+
+
+class StatsRollup:
+    """消息统计汇总查询"""
+    
+    def __init__(self, database: Optional[AsyncDatabase] = None):
+        """
+        初始化
+        
+        Args:
+            database: 异步数据库（默认使用全局 async_db，读操作走只读连接池）
+        """
+        self.db = database or async_db
+    
+    def _table_for(self, since: float, interval: Optional[int] = None) -> Tuple[str, int]:
+        """
+        选择汇总表：分钟表保留期内且不按小时以上分组时用分钟表，否则用小时表
+        
+        Returns:
+            (表名, 分桶秒数)
+        """
+        minute_since = time.time() - settings.stats_minute_retention_hours * 3600
+        if since >= minute_since and (interval is None or interval < 3600):
+            return MINUTE_TABLE, MESSAGE_STATS_TABLES[MINUTE_TABLE]
+        return HOUR_TABLE, MESSAGE_STATS_TABLES[HOUR_TABLE]
+    
+    @staticmethod
+    def _where(since: float, until: Optional[float], seconds: int,
+               platform: Optional[str], channel: Optional[str]) -> Tuple[str, list]:
+        """时间范围和过滤条件（起始时间向下对齐到分桶）"""
+        clauses = ["bucket >= ?"]
+        params: list = [int(since) // seconds * seconds]
+        if until is not None:
+            clauses.append("bucket < ?")
+            params.append(until)
+        if platform:
+            clauses.append("platform = ?")
+            params.append(platform)
+        if channel:
+            clauses.append("channel = ?")
+            params.append(channel)
+        return " AND ".join(clauses), params
+    
+    async def _fetch(self, sql: str, params: list) -> list:
+        async with self.db.reader() as conn:
+            cursor = await conn.execute(sql, params)
+            return await cursor.fetchall()
+    
+    @staticmethod
+    def _fold(rows) -> Dict[str, Any]:
+        """
+        把 (status, latency_bucket, count, latency_sum, latency_count) 行合并为汇总
+        
+        平均延迟只统计成功的消息
+        """
+        by_status: Dict[str, int] = {}
+        latency_buckets: Dict[int, int] = {}
+        latency_sum = latency_count = 0
+        
+        for status, latency_bucket, count, bucket_latency_sum, bucket_latency_count in rows:
+            if not count:
+                continue
+            by_status[status] = by_status.get(status, 0) + count
+            if latency_bucket >= 0:
+                latency_buckets[latency_bucket] = latency_buckets.get(latency_bucket, 0) + count
+            if status == 'success':
+                latency_sum += bucket_latency_sum
+                latency_count += bucket_latency_count
+        
+        total = sum(by_status.values())
+        success = by_status.get('success', 0)
+        return {
+            'total': total,
+            'success': success,
+            'failed': by_status.get('failed', 0),
+            'pending': by_status.get('pending', 0),
+            'by_status': by_status,
+            'success_rate': success / total if total else 0.0,
+            'avg_latency_ms': round(latency_sum / latency_count, 2) if latency_count else 0.0,
+            'latency_buckets': dict(sorted(latency_buckets.items()))
+        }
+    
+    async def summary(self, since: float, until: Optional[float] = None,
+                      platform: Optional[str] = None, channel: Optional[str] = None) -> Dict[str, Any]:
+        """
+        时间范围内的汇总统计
+        
+        Args:
+            since: 起始时间戳（秒）
+            until: 结束时间戳（秒，默认到现在）
+            platform: 只统计该目标平台
+            channel: 只统计该KOOK频道
+        
+        Returns:
+            total/success/failed/pending、按状态计数、成功率（0-1）、
+            成功消息平均延迟、延迟分桶（下界毫秒 -> 条数）
+        """
+        table, seconds = self._table_for(since)
+        where, params = self._where(since, until, seconds, platform, channel)
+        rows = await self._fetch(f"""
+            SELECT status, latency_bucket, SUM(count), SUM(latency_sum), SUM(latency_count)
+            FROM {table}
+            WHERE {where}
+            GROUP BY status, latency_bucket
+        """, params)
+        return self._fold(rows)
+    
+    async def breakdown(self, since: float, by: str = 'platform',
+                        until: Optional[float] = None) -> Dict[str, Dict[str, Any]]:
+        """
+        按维度分解的汇总统计
+        
+        Args:
+            since: 起始时间戳（秒）
+            by: 分组维度（platform/channel/status）
+            until: 结束时间戳（秒）
+        
+        Returns:
+            维度值 -> 汇总统计（同 summary）
+        """
+        if by not in DIMENSIONS:
+            raise ValueError(f"不支持的统计维度: {by}")
+        
+        table, seconds = self._table_for(since)
+        where, params = self._where(since, until, seconds, None, None)
+        rows = await self._fetch(f"""
+            SELECT {by}, status, latency_bucket, SUM(count), SUM(latency_sum), SUM(latency_count)
+            FROM {table}
+            WHERE {where}
+            GROUP BY {by}, status, latency_bucket
+        """, params)
+        
+        grouped: Dict[str, list] = {}
+        for row in rows:
+            grouped.setdefault(row[0], []).append(tuple(row[1:]))
+        
+        result = {key: self._fold(key_rows) for key, key_rows in grouped.items()}
+        return {key: stats for key, stats in result.items() if stats['total']}
+    
+    async def timeline(self, since: float, interval: int, until: Optional[float] = None,
+                       platform: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        按固定间隔的时间线（没有消息的区间补0）
+        
+        Args:
+            since: 起始时间戳（秒）
+            interval: 区间长度（秒，按汇总表分桶对齐）
+            until: 结束时间戳（秒，默认到现在）
+            platform: 只统计该目标平台
+        
+        Returns:
+            [{'timestamp': 区间起始时间戳, 'total', 'success', 'failed', 'pending'}]
+        """
+        until = time.time() if until is None else until
+        table, seconds = self._table_for(since, interval)
+        interval = max(seconds, interval // seconds * seconds)
+        start = int(since) // seconds * seconds
+        
+        where, params = self._where(start, until, seconds, platform, None)
+        rows = await self._fetch(f"""
+            SELECT (bucket - ?) / ? AS slot, status, SUM(count)
+            FROM {table}
+            WHERE {where}
+            GROUP BY slot, status
+        """, [start, interval] + params)
+        
+        points = [
+            {'timestamp': slot_start, 'total': 0, 'success': 0, 'failed': 0, 'pending': 0}
+            for slot_start in range(start, int(until) + 1, interval)
+        ]
+        for slot, status, count in rows:
+            if not 0 <= slot < len(points):
+                continue
+            point = points[slot]
+            point['total'] += count
+            if status in ('success', 'failed', 'pending'):
+                point[status] += count
+        return points
+    
+    async def counts_by_time(self, since: float, fmt: str, until: Optional[float] = None,
+                             utc: bool = True) -> Dict[str, int]:
+        """
+        按时间格式分组的消息数（如按小时 '%H'、按天 '%Y-%m-%d'）
+        
+        Args:
+            since: 起始时间戳（秒）
+            fmt: strftime格式
+            until: 结束时间戳（秒）
+            utc: 按UTC还是本地时间格式化
+        
+        Returns:
+            格式化后的时间 -> 消息数（只包含有消息的时间）
+        """
+        table, seconds = self._table_for(since, 60 if '%M' in fmt else 3600)
+        where, params = self._where(since, until, seconds, None, None)
+        modifiers = "'unixepoch'" if utc else "'unixepoch', 'localtime'"
+        rows = await self._fetch(f"""
+            SELECT strftime(?, bucket, {modifiers}) AS key, SUM(count)
+            FROM {table}
+            WHERE {where}
+            GROUP BY key
+            ORDER BY key
+        """, [fmt] + params)
+        return {key: count for key, count in rows if count}
+    
+    async def prune(self, now: Optional[float] = None) -> int:
+        """
+        清理超过保留期的汇总数据
+        
+        Returns:
+            删除的行数
+        """
+        now = time.time() if now is None else now
+        cutoffs = {
+            MINUTE_TABLE: now - settings.stats_minute_retention_hours * 3600,
+            HOUR_TABLE: now - settings.stats_hour_retention_days * 86400
+        }
+        
+        deleted = 0
+        try:
+            async with self.db.writer() as conn:
+                for table, cutoff in cutoffs.items():
+                    cursor = await conn.execute(f"DELETE FROM {table} WHERE bucket < ?", (cutoff,))
+                    deleted += cursor.rowcount
+                # 状态变更后计数归零的行
+                for table in cutoffs:
+                    cursor = await conn.execute(f"DELETE FROM {table} WHERE count = 0")
+                    deleted += cursor.rowcount
+        except Exception as e:
+            logger.error(f"清理统计汇总失败: {str(e)}")
+        
+        return deleted
+
+
+# 全局实例
+stats_rollup = StatsRollup()
@@ -137,6 +137,8 @@ async def import_config(
                 cursor.execute("DELETE FROM filter_rules")
                 # 不删除bot_configs，可能包含Token
                 conn.commit()
+            # 绕过了 db.execute，需手动通知路由表重建
+            db._notify_change('channel_mappings')
         
         # 导入Bot配置
         for bot_config in config_data.get("bot_configs", []):
@@ -9,7 +9,7 @@ import time
 from datetime import datetime
 from ..utils.logger import logger
 from ..core.multi_account_manager import multi_account_manager
-from ..queue.failed_message_queue import failed_message_queue
+from ..queue.retry_worker import retry_worker
 from ..utils.message_deduplicator import message_deduplicator
 
 router = APIRouter(prefix="/api/health", tags=["health"])
@@ -282,7 +282,7 @@ def get_accounts_health() -> Dict:
 def get_queue_health() -> Dict:
     """获取队列健康状态"""
     try:
-        stats = failed_message_queue.get_stats()
+        stats = retry_worker.get_stats()
         
         status = 'healthy'
         if stats['queue_size'] > 100:
@@ -318,6 +318,6 @@ async def detailed_health_check() -> Dict:
     return {
         'basic': await health_check(),
         'deduplicator': message_deduplicator.get_stats(),
-        'failed_queue': failed_message_queue.get_stats(),
+        'failed_queue': retry_worker.get_stats(),
         'multi_account': multi_account_manager.get_stats()
     }
@@ -8,7 +8,7 @@ from datetime import datetime, timedelta
 from typing import Dict, List, Any
 from fastapi import APIRouter, Query
 from ..utils.logger import logger
-from ..database import db
+from ..analytics.stats_rollup import stats_rollup
 from ..queue.redis_client import redis_queue
 
 router = APIRouter(prefix="/api/performance", tags=["performance"])
@@ -123,18 +123,11 @@ async def get_processing_rate(minutes: int = 1, offset: int = 0) -> int:
         每分钟处理的消息数
     """
     try:
-        end_time = datetime.now() - timedelta(minutes=offset)
-        start_time = end_time - timedelta(minutes=minutes)
+        # 按已结束的整分钟统计成功消息数（读取分钟级统计汇总表）
+        end_time = int(time.time()) // 60 * 60 - offset * 60
+        start_time = end_time - minutes * 60
         
-        # 从数据库查询成功消息数
-        query = """
-            SELECT COUNT(*) FROM message_logs 
-            WHERE status = 'success' 
-            AND created_at BETWEEN ? AND ?
-        """
-        
-        result = db.execute_query(query, (start_time, end_time))
-        count = result[0][0] if result else 0
+        count = (await stats_rollup.summary(start_time, until=end_time))['success']
         
         # 返回每分钟平均数
         return count // minutes if minutes > 0 else 0
@@ -155,43 +148,32 @@ async def get_queue_size() -> int:
         return 0
 
 
+async def get_trend_points(minutes: int) -> List[Dict[str, Any]]:
+    """
+    获取最近60个采样区间的消息统计（一次查询统计汇总表）
+    
+    Args:
+        minutes: 统计时间范围（分钟）
+    
+    Returns:
+        时间线数据点（区间起始时间戳、total/success/failed/pending）
+    """
+    interval = max(1, minutes // 60)  # 最多60个数据点
+    since = time.time() - 60 * interval * 60
+    points = await stats_rollup.timeline(since, interval * 60)
+    return points[-60:]
+
+
 async def get_message_trend_data(minutes: int) -> Dict[str, List]:
     """获取消息处理趋势数据"""
     try:
-        # 计算采样间隔
-        interval = max(1, minutes // 60)  # 最多60个数据点
-        
-        time_labels = []
-        success_data = []
-        failed_data = []
-        pending_data = []
-        
-        for i in range(60):
-            time_point = datetime.now() - timedelta(minutes=(59 - i) * interval)
-            time_labels.append(time_point.strftime("%H:%M"))
-            
-            # 查询该时间段的消息数
-            start_time = time_point - timedelta(minutes=interval)
-            end_time = time_point
-            
-            query = """
-                SELECT status, COUNT(*) FROM message_logs 
-                WHERE created_at BETWEEN ? AND ?
-                GROUP BY status
-            """
-            
-            results = db.execute_query(query, (start_time, end_time))
-            stats = {row[0]: row[1] for row in results}
-            
-            success_data.append(stats.get('success', 0))
-            failed_data.append(stats.get('failed', 0))
-            pending_data.append(stats.get('pending', 0))
+        points = await get_trend_points(minutes)
         
         return {
-            "timeLabels": time_labels,
-            "success": success_data,
-            "failed": failed_data,
-            "pending": pending_data
+            "timeLabels": [datetime.fromtimestamp(p['timestamp']).strftime("%H:%M") for p in points],
+            "success": [p['success'] for p in points],
+            "failed": [p['failed'] for p in points],
+            "pending": [p['pending'] for p in points]
         }
         
     except Exception as e:
@@ -237,21 +219,17 @@ async def get_resource_trend_data(minutes: int) -> Dict[str, List]:
 async def get_platform_distribution_data(minutes: int) -> List[Dict]:
     """获取平台转发分布数据"""
     try:
-        start_time = datetime.now() - timedelta(minutes=minutes)
-        
-        query = """
-            SELECT target_platform, COUNT(*) as count
-            FROM message_logs
-            WHERE created_at >= ? AND status = 'success'
-            GROUP BY target_platform
-            ORDER BY count DESC
-        """
+        start_time = time.time() - minutes * 60
         
-        results = db.execute_query(query, (start_time,))
+        platforms = await stats_rollup.breakdown(start_time, by='platform')
+        results = sorted(
+            ((platform, stats['success']) for platform, stats in platforms.items() if stats['success']),
+            key=lambda item: item[1], reverse=True
+        )
         
         return [
-            {"platform": row[0], "count": row[1]}
-            for row in results
+            {"platform": platform, "count": count}
+            for platform, count in results
         ]
         
     except Exception as e:
@@ -262,35 +240,13 @@ async def get_platform_distribution_data(minutes: int) -> List[Dict]:
 async def get_error_rate_data(minutes: int) -> Dict[str, List]:
     """获取错误率趋势数据"""
     try:
-        interval = max(1, minutes // 60)
-        
-        time_labels = []
-        error_rates = []
+        points = await get_trend_points(minutes)
         
-        for i in range(60):
-            time_point = datetime.now() - timedelta(minutes=(59 - i) * interval)
-            time_labels.append(time_point.strftime("%H:%M"))
-            
-            start_time = time_point - timedelta(minutes=interval)
-            end_time = time_point
-            
-            # 查询总数和失败数
-            query = """
-                SELECT 
-                    COUNT(*) as total,
-                    SUM(CASE WHEN status = 'failed' THEN 1 ELSE 0 END) as failed
-                FROM message_logs
-                WHERE created_at BETWEEN ? AND ?
-            """
-            
-            result = db.execute_query(query, (start_time, end_time))
-            if result and result[0][0] > 0:
-                total, failed = result[0]
-                error_rate = (failed / total * 100) if total > 0 else 0
-            else:
-                error_rate = 0
-            
-            error_rates.append(error_rate)
+        time_labels = [datetime.fromtimestamp(p['timestamp']).strftime("%H:%M") for p in points]
+        error_rates = [
+            (p['failed'] / p['total'] * 100) if p['total'] > 0 else 0
+            for p in points
+        ]
         
         return {
             "timeLabels": time_labels,
@@ -329,3 +285,40 @@ async def get_system_info():
     except Exception as e:
         logger.error(f"获取系统信息失败: {str(e)}")
         return {}
+
+
+@router.get("/http-pool")
+async def get_http_pool_stats():
+    """获取全局HTTP连接池统计（打开/空闲/复用连接数）"""
+    from ..utils.http_client import http_client_manager
+    from ..forwarders.discord import discord_webhook_client
+    
+    return {
+        "pool": http_client_manager.get_stats(),
+        "discord": discord_webhook_client.get_stats()
+    }
+
+
+@router.get("/queue-stream")
+async def get_queue_stream_stats():
+    """获取Redis Streams消费组统计（各Worker的未确认数、空闲时间和积压量）"""
+    stats = await redis_queue.get_stream_stats()
+    
+    return {
+        "backend": redis_queue.backend,
+        "queue_size": await redis_queue.get_queue_size(),
+        "stream": stats
+    }
+
+
+@router.get("/database")
+async def get_database_pool_stats():
+    """获取异步数据库连接池统计（读/写连接的等待时间）和批量写入器统计"""
+    from ..database_async import async_db
+    from ..utils.batch_writer import batch_writer_manager
+    
+    return {
+        **async_db.get_pool_stats(),
+        # 组提交写入器：写入速率、提交耗时、缓冲区占用
+        'batch_writers': batch_writer_manager.get_stats()
+    }
@@ -13,6 +13,7 @@ from datetime import datetime
 from ..utils.logger import logger
 from ..database import db
 from ..config import settings
+from ..plugins.plugin_system import plugin_manager
 
 
 router = APIRouter(prefix="/api/plugins", tags=["插件管理"])
@@ -335,6 +336,36 @@ async def update_plugin_config(plugin_id: str, config: dict):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/runtime/stats")
+async def get_plugin_runtime_stats():
+    """
+    获取插件运行时统计（每个插件的钩子耗时直方图、超时/失败次数和熔断状态）
+    """
+    return {
+        "success": True,
+        "data": {
+            "plugins": plugin_manager.get_hook_stats(),
+            "budget_ms": settings.plugin_hook_budget_ms,
+            "breaker_threshold": settings.plugin_breaker_threshold,
+            "breaker_cooldown": settings.plugin_breaker_cooldown
+        }
+    }
+
+
+@router.post("/runtime/{plugin_key}/reset")
+async def reset_plugin_breaker(plugin_key: str):
+    """
+    手动恢复被熔断的插件
+    """
+    if not plugin_manager.reset_breaker(plugin_key):
+        raise HTTPException(status_code=404, detail=f"插件 {plugin_key} 没有运行记录")
+    
+    return {
+        "success": True,
+        "message": f"插件 {plugin_key} 已恢复"
+    }
+
+
 @router.get("/market")
 async def get_plugin_market():
     """
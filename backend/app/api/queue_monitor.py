@@ -11,14 +11,16 @@ import json
 from datetime import datetime
 from ..config import settings
 from ..utils.logger import logger
+from ..queue.worker_pool import worker_pool
 
 router = APIRouter(prefix="/api/queue", tags=["队列监控"])
 
 # Redis连接
 redis_client = redis.Redis(
-    host=settings.REDIS_HOST,
-    port=settings.REDIS_PORT,
-    db=0,
+    host=settings.redis_host,
+    port=settings.redis_port,
+    db=settings.redis_db,
+    password=settings.redis_password,
     decode_responses=True
 )
 
@@ -247,3 +249,18 @@ async def check_queue_health():
             "redis_connected": False,
             "error": str(e)
         }
+
+
+@router.get("/workers")
+async def get_worker_stats():
+    """
+    获取各Worker的统计
+    
+    多进程模式下包含每个进程的pid、存活状态、重启次数和处理数量
+    """
+    try:
+        return await worker_pool.get_stats()
+    
+    except Exception as e:
+        logger.error(f"获取Worker统计失败: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
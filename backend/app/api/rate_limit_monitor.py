@@ -31,19 +31,7 @@ async def get_rate_limit_status():
         
         for platform in platforms:
             try:
-                limiter = rate_limiter_manager.get_limiter(
-                    platform,
-                    calls=5 if platform == 'discord' else 30,
-                    period=5 if platform == 'discord' else 1
-                )
-                
-                # 获取限流状态（需要RateLimiter支持get_status方法）
-                limiter_status = getattr(limiter, 'get_status', lambda: {
-                    'is_limited': False,
-                    'queue_size': 0,
-                    'wait_time': 0,
-                    'progress': 0
-                })()
+                limiter_status = rate_limiter_manager.get_status(platform)
                 
                 status[platform] = {
                     'is_limited': limiter_status.get('is_limited', False),
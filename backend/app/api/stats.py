@@ -8,6 +8,7 @@ from pydantic import BaseModel, Field, ConfigDict
 from typing import List, Dict, Any, Optional
 from datetime import datetime, timedelta
 from ..database import db
+from ..analytics.stats_rollup import stats_rollup
 from ..utils.logger import logger
 import time
 
@@ -57,76 +58,39 @@ class RecentMessage(BaseModel):
 
 @router.get("/today")
 async def get_today_stats():
-    """获取今日统计数据"""
+    """获取今日统计数据（消息数读取统计汇总表）"""
     try:
         today_start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
         
+        stats = await stats_rollup.summary(today_start.timestamp())
+        
+        active_accounts = 0
+        active_bots = 0
+        active_mappings = 0
+        
         try:
-            all_accounts = db.execute("SELECT * FROM accounts").fetchall()
-            all_bots = db.execute("SELECT * FROM bots").fetchall()
-            all_mappings = db.execute("SELECT * FROM mappings").fetchall()
-            
-            messages_total = 0
-            messages_success = 0
-            messages_failed = 0
-            messages_pending = 0
-            avg_latency = 0.0
-            
-            try:
-                result = db.execute("""
-                    SELECT 
-                        COUNT(*) as total,
-                        SUM(CASE WHEN status = 'success' THEN 1 ELSE 0 END) as success,
-                        SUM(CASE WHEN status = 'failed' THEN 1 ELSE 0 END) as failed,
-                        SUM(CASE WHEN status = 'pending' THEN 1 ELSE 0 END) as pending,
-                        AVG(CASE WHEN latency IS NOT NULL THEN latency ELSE 0 END) as avg_latency
-                    FROM messages
-                    WHERE created_at >= ?
-                """, (today_start.isoformat(),)).fetchone()
-                
-                if result:
-                    messages_total = result['total'] or 0
-                    messages_success = result['success'] or 0
-                    messages_failed = result['failed'] or 0
-                    messages_pending = result['pending'] or 0
-                    avg_latency = result['avg_latency'] or 0.0
-            except Exception:
-                pass
-            
-            success_rate = 0.0
-            if messages_total > 0:
-                success_rate = round((messages_success / messages_total) * 100, 1)
-            
-            active_accounts = len([a for a in all_accounts if a.get('status') == 'online'])
-            active_bots = len([b for b in all_bots if b.get('enabled', True)])
-            active_mappings = len([m for m in all_mappings if m.get('enabled', True)])
-            
-            # 直接返回 camelCase JSON
-            return {
-                "messagesTotal": messages_total,
-                "messagesSuccess": messages_success,
-                "messagesFailed": messages_failed,
-                "messagesPending": messages_pending,
-                "successRate": success_rate,
-                "avgLatency": round(avg_latency, 1),
-                "activeAccounts": active_accounts,
-                "activeBots": active_bots,
-                "activeMappings": active_mappings
-            }
+            all_accounts = db.execute("SELECT status FROM accounts").fetchall()
+            all_bots = db.execute("SELECT status FROM bot_configs").fetchall()
+            all_mappings = db.execute("SELECT enabled FROM channel_mappings").fetchall()
             
+            active_accounts = len([a for a in all_accounts if a['status'] == 'online'])
+            active_bots = len([b for b in all_bots if b['status'] == 'active'])
+            active_mappings = len([m for m in all_mappings if m['enabled']])
         except Exception as e:
-            logger.warning(f"获取今日统计失败，返回空数据: {str(e)}")
-            return {
-                "messagesTotal": 0,
-                "messagesSuccess": 0,
-                "messagesFailed": 0,
-                "messagesPending": 0,
-                "successRate": 0.0,
-                "avgLatency": 0.0,
-                "activeAccounts": 0,
-                "activeBots": 0,
-                "activeMappings": 0
-            }
+            logger.warning(f"获取活跃账号/Bot/映射数失败: {str(e)}")
+        
+        # 直接返回 camelCase JSON
+        return {
+            "messagesTotal": stats['total'],
+            "messagesSuccess": stats['success'],
+            "messagesFailed": stats['failed'],
+            "messagesPending": stats['pending'],
+            "successRate": round(stats['success_rate'] * 100, 1),
+            "avgLatency": round(stats['avg_latency_ms'], 1),
+            "activeAccounts": active_accounts,
+            "activeBots": active_bots,
+            "activeMappings": active_mappings
+        }
         
     except Exception as e:
         logger.error(f"获取今日统计失败: {str(e)}")
@@ -161,39 +125,18 @@ async def get_timeline_stats(range: str = Query("1h", description="时间范围:
         delta, interval_minutes = range_map[range]
         start_time = datetime.now() - delta
         
-        data_points = []
-        current_time = start_time
-        now = datetime.now()
+        # 一次查询统计汇总表，不再每个区间扫描一次日志
+        points = await stats_rollup.timeline(start_time.timestamp(), interval_minutes * 60)
         
-        while current_time <= now:
-            try:
-                next_time = current_time + timedelta(minutes=interval_minutes)
-                
-                result = db.execute("""
-                    SELECT 
-                        COUNT(*) as total,
-                        SUM(CASE WHEN status = 'success' THEN 1 ELSE 0 END) as success,
-                        SUM(CASE WHEN status = 'failed' THEN 1 ELSE 0 END) as failed
-                    FROM messages
-                    WHERE created_at >= ? AND created_at < ?
-                """, (current_time.isoformat(), next_time.isoformat())).fetchone()
-                
-                count = result['total'] or 0
-                success = result['success'] or 0
-                failed = result['failed'] or 0
-            except Exception:
-                count = 0
-                success = 0
-                failed = 0
-            
-            data_points.append(TimelinePoint(
-                timestamp=current_time.isoformat(),
-                count=count,
-                success=success,
-                failed=failed
-            ))
-            
-            current_time += timedelta(minutes=interval_minutes)
+        data_points = [
+            TimelinePoint(
+                timestamp=datetime.fromtimestamp(point['timestamp']).isoformat(),
+                count=point['total'],
+                success=point['success'],
+                failed=point['failed']
+            )
+            for point in points
+        ]
         
         return TimelineStats(range=range, data=data_points)
         
@@ -7,6 +7,7 @@ from pydantic import BaseModel
 from typing import Dict, Any
 import time
 from ..database import db
+from ..analytics.stats_rollup import stats_rollup
 from ..queue.redis_client import redis_queue
 from ..utils.logger import logger
 
@@ -51,28 +52,12 @@ async def get_system_stats():
     - active_bots: 活跃Bot
     """
     try:
-        # 1. 从数据库获取转发总数
-        total_result = db.execute("""
-            SELECT COUNT(*) as total 
-            FROM message_logs 
-            WHERE created_at > datetime('now', '-7 days')
-        """).fetchone()
-        
-        total_forwarded = total_result['total'] if total_result else 0
-        
-        # 2. 计算成功率
-        success_result = db.execute("""
-            SELECT 
-                COUNT(*) as total,
-                SUM(CASE WHEN status = 'success' THEN 1 ELSE 0 END) as success_count
-            FROM message_logs
-            WHERE created_at > datetime('now', '-24 hours')
-        """).fetchone()
+        # 1. 转发总数（最近7天，读取统计汇总表）
+        now = time.time()
+        total_forwarded = (await stats_rollup.summary(now - 7 * 86400))['total']
         
-        if success_result and success_result['total'] > 0:
-            success_rate = success_result['success_count'] / success_result['total']
-        else:
-            success_rate = 0.0
+        # 2. 计算成功率（最近24小时）
+        success_rate = (await stats_rollup.summary(now - 86400))['success_rate']
         
         # 3. 获取队列大小
         try:
@@ -111,7 +96,7 @@ async def get_system_stats():
         last_message_result = db.execute("""
             SELECT created_at 
             FROM message_logs 
-            ORDER BY created_at DESC 
+            ORDER BY id DESC 
             LIMIT 1
         """).fetchone()
         
@@ -152,54 +137,24 @@ async def get_detailed_stats():
         # 1. 获取当前统计
         current = await get_system_stats()
         
-        # 2. 每小时统计（最近24小时）
-        hourly_result = db.execute("""
-            SELECT 
-                strftime('%H', created_at) as hour,
-                COUNT(*) as count
-            FROM message_logs
-            WHERE created_at > datetime('now', '-24 hours')
-            GROUP BY hour
-            ORDER BY hour
-        """).fetchall()
-        
-        hourly = {row['hour']: row['count'] for row in hourly_result}
+        # 2. 每小时统计（最近24小时，读取统计汇总表）
+        now = time.time()
+        hourly = await stats_rollup.counts_by_time(now - 86400, '%H')
         
         # 3. 每日统计（最近7天）
-        daily_result = db.execute("""
-            SELECT 
-                date(created_at) as day,
-                COUNT(*) as count
-            FROM message_logs
-            WHERE created_at > datetime('now', '-7 days')
-            GROUP BY day
-            ORDER BY day
-        """).fetchall()
-        
-        daily = {row['day']: row['count'] for row in daily_result}
+        daily = await stats_rollup.counts_by_time(now - 7 * 86400, '%Y-%m-%d')
         
         # 4. 平台分解统计
-        platform_result = db.execute("""
-            SELECT 
-                target_platform as platform,
-                COUNT(*) as total,
-                SUM(CASE WHEN status = 'success' THEN 1 ELSE 0 END) as success,
-                SUM(CASE WHEN status = 'failed' THEN 1 ELSE 0 END) as failed,
-                AVG(latency_ms) as avg_latency
-            FROM message_logs
-            WHERE created_at > datetime('now', '-24 hours')
-            GROUP BY target_platform
-        """).fetchall()
+        platforms = await stats_rollup.breakdown(now - 86400, by='platform')
         
         platform_breakdown = {}
-        for row in platform_result:
-            platform = row['platform']
+        for platform, stats in platforms.items():
             platform_breakdown[platform] = {
-                'total': row['total'],
-                'success': row['success'],
-                'failed': row['failed'],
-                'success_rate': row['success'] / row['total'] if row['total'] > 0 else 0,
-                'avg_latency_ms': round(row['avg_latency'] or 0, 2)
+                'total': stats['total'],
+                'success': stats['success'],
+                'failed': stats['failed'],
+                'success_rate': stats['success_rate'],
+                'avg_latency_ms': stats['avg_latency_ms']
             }
         
         return DetailedStats(
@@ -9,7 +9,8 @@ from ..database import db
 from ..utils.logger import logger
 from ..queue.redis_client import redis_queue
 from ..forwarders.discord import discord_forwarder
-from ..forwarders.telegram import TelegramForwarder
+from ..forwarders.telegram import telegram_forwarder
+from ..processors.formatter import formatter
 from ..forwarders.feishu import FeishuForwarder
 from ..kook.scraper import scraper_manager
 import asyncio
@@ -303,10 +304,10 @@ async def send_test_message(request: TestMessageRequest):
                 if not token or not chat_id:
                     raise ValueError("缺少token或chat_id配置")
                 
-                telegram = TelegramForwarder(token)
-                success = await telegram.send_message(
+                success = await telegram_forwarder.send_message(
+                    token=token,
                     chat_id=chat_id,
-                    text=request.content
+                    content=formatter.kmarkdown_to_telegram_html(request.content)
                 )
                 
                 if not success:
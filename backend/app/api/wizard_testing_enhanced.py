@@ -19,6 +19,7 @@ from ..utils.logger import logger
 from ..forwarders.discord import discord_forwarder
 from ..forwarders.telegram import telegram_forwarder
 from ..forwarders.feishu import feishu_forwarder
+from ..processors.formatter import formatter
 
 router = APIRouter(prefix="/api/wizard-testing-enhanced", tags=["wizard-testing-enhanced"])
 
@@ -384,9 +385,9 @@ class WizardTester:
                             raise ValueError("Bot Token或Chat ID未配置")
                         
                         success = await telegram_forwarder.send_message(
-                            bot_token=bot_token,
+                            token=bot_token,
                             chat_id=chat_id,
-                            text="<b>✅ 测试消息</b>\n\nTelegram Bot配置成功！"
+                            content="<b>✅ 测试消息</b>\n\nTelegram Bot配置成功！"
                         )
                         
                         if success:
@@ -646,12 +647,12 @@ class WizardTester:
                             config = json.loads(config)
                         
                         # Telegram使用HTML格式
-                        html_message = test_message.replace('**', '<b>').replace('**', '</b>')
+                        html_message = formatter.kmarkdown_to_telegram_html(test_message)
                         
                         success = await telegram_forwarder.send_message(
-                            bot_token=config.get('bot_token'),
+                            token=config.get('bot_token'),
                             chat_id=config.get('chat_id'),
-                            text=html_message
+                            content=html_message
                         )
                         
                         send_results[bot_name] = {
@@ -53,8 +53,26 @@ class Settings(BaseSettings):
     redis_db: int = 0
     redis_password: Optional[str] = None
     
+    # 消息队列配置
+    queue_backend: str = "list"  # list（LPUSH/BRPOP）/ stream（Redis Streams消费组，支持确认和崩溃恢复）
+    queue_stream_group: str = "kook_workers"  # Stream消费组名称
+    queue_stream_claim_idle: int = 60  # 未确认消息空闲多久后被其他Worker认领（秒）
+    queue_stream_max_deliveries: int = 5  # 最大投递次数，超过后转入死信流
+    queue_batch_min: int = 10  # Worker单次出队最小条数
+    queue_batch_max: int = 200  # Worker单次出队最大条数（积压时逐步放大）
+    worker_processes: int = 0  # Worker进程数（0=在API进程内运行单个Worker，>0=多进程Worker池）
+    worker_stats_interval: int = 5  # Worker进程上报统计的间隔（秒）
+    worker_shutdown_timeout: int = 15  # 关闭时等待Worker处理完当前批次的时间（秒）
+    
     # 数据库配置
     database_url: str = f"sqlite:///{DB_PATH}"
+    db_read_pool_size: int = 4  # 异步只读连接数量（另有1个WAL写连接）
+    db_busy_timeout_ms: int = 5000  # SQLite锁等待超时（毫秒）
+    log_batch_size: int = 200  # 消息日志攒够多少条提交一次事务
+    log_flush_interval: float = 0.5  # 消息日志最长缓冲时间（秒）
+    log_buffer_max: int = 5000  # 消息日志缓冲上限（写满后Worker等待提交完成）
+    stats_minute_retention_hours: int = 48  # 分钟级统计汇总保留时长（小时）
+    stats_hour_retention_days: int = 90  # 小时级统计汇总保留天数
     
     # 图床配置
     image_server_port: int = 9528
@@ -81,10 +99,72 @@ class Settings(BaseSettings):
     wechatwork_rate_limit_period: int = 60
     dingtalk_rate_limit_calls: int = 20
     dingtalk_rate_limit_period: int = 60
+    telegram_chat_rate_limit_calls: int = 20  # 单个Telegram聊天的发送次数（群组约20条/分钟）
+    telegram_chat_rate_limit_period: int = 60
+    rate_limit_backend: str = "local"  # 限流后端：local（进程内）/ redis（多个Worker进程共享额度）
+    rate_limit_max_keys: int = 10000  # 按键限流时每类最多保留的桶数（超出淘汰最久未用的）
+    rate_limit_adaptive_min_scale: float = 0.1  # 429后发送速率最低降到配置速率的比例
+    rate_limit_adaptive_max_scale: float = 1.5  # 持续成功时发送速率最高升到配置速率的倍数（平台报告额度时按报告值）
+    
+    # 扇出转发配置（一条消息并发发往所有映射目标）
+    fanout_platform_concurrency: int = 8  # 每个平台最大并发请求数
+    fanout_bot_concurrency: int = 4  # 每个Bot最大并发请求数
+    routing_table_ttl: int = 300  # 路由表兜底重建间隔（秒，变更时会立即失效）
+    
+    # 插件钩子配置
+    plugin_hook_budget_ms: int = 500  # 单个插件钩子的执行时间预算（毫秒，超时跳过该插件）
+    plugin_breaker_threshold: int = 5  # 插件连续超时/失败多少次后熔断
+    plugin_breaker_cooldown: int = 60  # 熔断时长（秒），之后放行一次试探调用
+    
+    # 缓存配置（L1进程内存 + L2 Redis）
+    cache_l1_max_size: int = 1000  # 内存缓存最大条目数（超出按LRU淘汰）
+    cache_l1_max_ttl: int = 10  # 内存缓存最长保留时间（秒，限制多进程间的数据延迟）
+    cache_sweep_interval: int = 60  # 内存缓存过期清理间隔（秒）
+    
+    # HTTP连接池配置（下载器和转发器共享）
+    http_pool_limit: int = 100  # 总连接数上限
+    http_pool_limit_per_host: int = 20  # 单主机连接数上限
+    http_dns_cache_ttl: int = 300  # DNS缓存时间（秒）
+    http_keepalive_timeout: int = 60  # 空闲连接保持时间（秒）
+    http_timeout: int = 30  # 默认请求超时（秒）
+    http_download_timeout: int = 60  # 图片/附件下载超时（秒）
+    http_preview_timeout: int = 10  # 链接预览抓取超时（秒）
+    
+    # 链接预览配置
+    link_preview_cache_size: int = 1000  # 预览缓存条目数（按URL）
+    link_preview_cache_ttl: int = 3600  # 预览缓存时间（秒）
+    link_preview_negative_ttl: int = 300  # 抓取失败/无预览的URL缓存时间（秒）
+    link_preview_max_bytes: int = 262144  # 单个页面最多读取字节数（读到</head>即停止）
+    link_preview_async: bool = False  # 先发送消息，预览抓取完成后再单独补发
+    
+    # 翻译插件配置
+    translation_cache_size: int = 5000  # 内存译文缓存条目数（超出按LRU淘汰）
+    translation_cache_ttl: int = 86400  # 内存译文缓存时间（秒）
+    translation_cache_disk_max_entries: int = 100000  # 磁盘译文缓存条目上限（按最近使用淘汰）
+    translation_cache_db_path: Path = DATA_DIR / "translation_cache.db"  # 磁盘译文缓存文件
+    translation_batch_window_ms: int = 50  # 批量窗口（毫秒），窗口内的待翻译文本合并为一次请求
+    translation_batch_max_size: int = 32  # 单次请求最多文本条数
+    translation_batch_max_chars: int = 4000  # 单次请求最多字符数
+    translation_baidu_max_bytes: int = 6000  # 百度翻译单次请求 q 的UTF-8字节上限（超出时按行拆成多次请求）
+    translation_google_api_url: str = "https://translation.googleapis.com/language/translate/v2"
+    translation_baidu_api_url: str = "https://fanyi-api.baidu.com/api/trans/vip/translate"
+    
+    # 消息格式转换配置
+    formatter_cache_size: int = 2048  # KMarkdown解析结果和各平台渲染结果的缓存条目数
     
     # 消息重试配置
     message_retry_max: int = 3
     message_retry_interval: int = 30
+    message_retry_max_delay: int = 3600  # 退避延迟上限（秒）
+    message_retry_jitter: float = 0.2  # 退避延迟随机抖动比例（±20%，避免故障恢复后所有消息同时重试）
+    message_retry_concurrency: int = 4  # 每个平台同时进行的重试数
+    message_retry_batch_size: int = 100  # 每次从数据库载入的到期消息数（也是同时进行的重试总数上限）
+    
+    # 崩溃恢复配置（消息备份、崩溃恢复、Redis本地Fallback共用一个预写日志）
+    wal_dir: Path = DATA_DIR / "wal"  # 预写日志目录
+    wal_segment_size: int = 4194304  # 单个分段最大字节数（4MB，超过后切换到新分段）
+    wal_compact_min_bytes: int = 1048576  # 日志总大小超过该值且一半以上已确认时压缩
+    wal_fsync: bool = False  # 每条记录写入后fsync（断电也不丢，但写入变慢）
     
     # 安全配置
     encryption_key: Optional[str] = None
@@ -1,22 +1,182 @@
 """
 数据库模型和操作
 """
+import re
 import sqlite3
 import json
 from datetime import datetime
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Callable
 from pathlib import Path
 from contextlib import contextmanager
 from .config import DB_PATH
 
 
+# 路由相关表（写入后需通知路由表重建）
+ROUTING_TABLES_PATTERN = re.compile(r'\b(channel_mappings|bot_configs)\b', re.IGNORECASE)
+
+# 消息日志全文索引（FTS5外部内容表，由触发器与message_logs保持同步）
+# trigram分词：按字符三元组索引，中文等无空格分隔的文本也能做子串检索
+MESSAGE_LOGS_FTS_SCHEMA = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS message_logs_fts USING fts5(
+        content, sender_name, kook_channel_id,
+        content='message_logs', content_rowid='id',
+        tokenize='trigram'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS message_logs_fts_insert AFTER INSERT ON message_logs BEGIN
+        INSERT INTO message_logs_fts(rowid, content, sender_name, kook_channel_id)
+        VALUES (new.id, new.content, new.sender_name, new.kook_channel_id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS message_logs_fts_delete AFTER DELETE ON message_logs BEGIN
+        INSERT INTO message_logs_fts(message_logs_fts, rowid, content, sender_name, kook_channel_id)
+        VALUES ('delete', old.id, old.content, old.sender_name, old.kook_channel_id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS message_logs_fts_update
+    AFTER UPDATE OF content, sender_name, kook_channel_id ON message_logs BEGIN
+        INSERT INTO message_logs_fts(message_logs_fts, rowid, content, sender_name, kook_channel_id)
+        VALUES ('delete', old.id, old.content, old.sender_name, old.kook_channel_id);
+        INSERT INTO message_logs_fts(rowid, content, sender_name, kook_channel_id)
+        VALUES (new.id, new.content, new.sender_name, new.kook_channel_id);
+    END
+    """
+]
+
+# 全文索引首次创建时，为已有日志建立索引
+MESSAGE_LOGS_FTS_REBUILD = "INSERT INTO message_logs_fts(message_logs_fts) VALUES ('rebuild')"
+
+# 消息统计汇总表（按分钟/小时、平台、频道、状态、延迟分桶预聚合）
+# 由触发器在写入message_logs的同一事务中更新，统计接口只读汇总表，不再扫描message_logs；
+# 删除日志（过期清理/归档）不影响汇总，汇总表按自己的保留期清理
+MESSAGE_STATS_TABLES = {
+    'message_stats_minute': 60,
+    'message_stats_hour': 3600
+}
+
+# 延迟分桶下界（毫秒），-1表示没有延迟数据
+MESSAGE_STATS_LATENCY_BUCKETS = (0, 100, 500, 1000, 3000, 10000)
+
+
+def _stats_latency_bucket_sql(column: str) -> str:
+    """延迟分桶表达式（取所在分桶的下界）"""
+    cases = " ".join(
+        f"WHEN {column} < {upper} THEN {lower}"
+        for lower, upper in zip(MESSAGE_STATS_LATENCY_BUCKETS, MESSAGE_STATS_LATENCY_BUCKETS[1:])
+    )
+    return f"CASE WHEN {column} IS NULL THEN -1 {cases} ELSE {MESSAGE_STATS_LATENCY_BUCKETS[-1]} END"
+
+
+def _stats_upsert_sql(table: str, seconds: int, row: str, sign: int) -> str:
+    """把一条日志计入（sign=1）或移出（sign=-1）汇总表"""
+    epoch = f"CAST(COALESCE(strftime('%s', {row}.created_at), strftime('%s', 'now')) AS INTEGER)"
+    return f"""
+        INSERT INTO {table}
+        (bucket, platform, channel, status, latency_bucket, count, latency_sum, latency_count)
+        VALUES ({epoch} / {seconds} * {seconds}, COALESCE({row}.target_platform, ''),
+                {row}.kook_channel_id, COALESCE({row}.status, ''),
+                {_stats_latency_bucket_sql(f'{row}.latency_ms')},
+                {sign}, {sign} * COALESCE({row}.latency_ms, 0),
+                {sign} * ({row}.latency_ms IS NOT NULL))
+        ON CONFLICT (bucket, platform, channel, status, latency_bucket) DO UPDATE SET
+            count = count + excluded.count,
+            latency_sum = latency_sum + excluded.latency_sum,
+            latency_count = latency_count + excluded.latency_count;
+    """
+
+
+def _stats_schema(table: str, seconds: int) -> List[str]:
+    """汇总表及维护触发器"""
+    return [
+        f"""
+        CREATE TABLE IF NOT EXISTS {table} (
+            bucket INTEGER NOT NULL,
+            platform TEXT NOT NULL,
+            channel TEXT NOT NULL,
+            status TEXT NOT NULL,
+            latency_bucket INTEGER NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            latency_sum INTEGER NOT NULL DEFAULT 0,
+            latency_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (bucket, platform, channel, status, latency_bucket)
+        ) WITHOUT ROWID
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {table}_insert AFTER INSERT ON message_logs BEGIN
+            {_stats_upsert_sql(table, seconds, 'new', 1)}
+        END
+        """,
+        # 重试成功等状态变更：从原分桶移出，再按新值计入
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {table}_update
+        AFTER UPDATE OF status, latency_ms, target_platform, kook_channel_id, created_at ON message_logs
+        WHEN old.status IS NOT new.status OR old.latency_ms IS NOT new.latency_ms
+            OR old.target_platform IS NOT new.target_platform
+            OR old.kook_channel_id IS NOT new.kook_channel_id
+            OR old.created_at IS NOT new.created_at
+        BEGIN
+            {_stats_upsert_sql(table, seconds, 'old', -1)}
+            {_stats_upsert_sql(table, seconds, 'new', 1)}
+        END
+        """
+    ]
+
+
+MESSAGE_STATS_SCHEMA = {
+    table: _stats_schema(table, seconds) for table, seconds in MESSAGE_STATS_TABLES.items()
+}
+
+
+def _stats_rebuild_sql(table: str, seconds: int) -> str:
+    """汇总表首次创建时，按已有日志回填"""
+    return f"""
+        INSERT INTO {table}
+        (bucket, platform, channel, status, latency_bucket, count, latency_sum, latency_count)
+        SELECT CAST(strftime('%s', created_at) AS INTEGER) / {seconds} * {seconds} AS b,
+               COALESCE(target_platform, '') AS p, kook_channel_id AS c, COALESCE(status, '') AS s,
+               {_stats_latency_bucket_sql('latency_ms')} AS l,
+               COUNT(*), COALESCE(SUM(latency_ms), 0), COUNT(latency_ms)
+        FROM message_logs
+        WHERE created_at IS NOT NULL
+        GROUP BY b, p, c, s, l
+    """
+
+
+MESSAGE_STATS_REBUILD = {
+    table: _stats_rebuild_sql(table, seconds) for table, seconds in MESSAGE_STATS_TABLES.items()
+}
+
+
 class Database:
     """数据库操作类"""
     
     def __init__(self, db_path: Path = DB_PATH):
         self.db_path = db_path
+        # 频道映射/Bot配置变更监听器（路由表用于失效重建）
+        self._change_listeners: List[Callable[[str], None]] = []
         self.init_database()
     
+    def add_change_listener(self, callback: Callable[[str], None]):
+        """
+        注册频道映射/Bot配置变更监听器
+        
+        Args:
+            callback: 回调函数，参数为变更的表名
+        """
+        self._change_listeners.append(callback)
+    
+    def _notify_change(self, table: str):
+        """通知监听器（监听器异常不影响数据库操作）"""
+        for callback in self._change_listeners:
+            try:
+                callback(table)
+            except Exception:
+                pass
+    
     @contextmanager
     def get_connection(self):
         """获取数据库连接"""
@@ -39,6 +199,12 @@ class Database:
         cursor.execute(query, params)
         conn.commit()
         
+        # 通过原始SQL修改映射或Bot配置时同样通知路由表
+        if not query.lstrip().upper().startswith('SELECT'):
+            match = ROUTING_TABLES_PATTERN.search(query)
+            if match:
+                self._notify_change(match.group(1).lower())
+        
         class CursorWrapper:
             """Cursor包装器，自动关闭连接"""
             def __init__(self, cursor, conn):
@@ -202,10 +368,23 @@ class Database:
                     message_log_id INTEGER NOT NULL,
                     retry_count INTEGER DEFAULT 0,
                     last_retry TIMESTAMP,
+                    next_retry REAL,
                     FOREIGN KEY (message_log_id) REFERENCES message_logs(id)
                 )
             """)
             
+            # 旧版本的表没有next_retry列（下次重试时间戳），补上并视为已到期
+            cursor.execute("PRAGMA table_info(failed_messages)")
+            if 'next_retry' not in [row[1] for row in cursor.fetchall()]:
+                cursor.execute("ALTER TABLE failed_messages ADD COLUMN next_retry REAL")
+                cursor.execute("UPDATE failed_messages SET next_retry = 0")
+            
+            # 到期时间索引（重试调度器按到期时间取消息、计算下次唤醒时间）
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_failed_messages_due
+                ON failed_messages(next_retry, retry_count)
+            """)
+            
             # 系统配置表
             cursor.execute("""
                 CREATE TABLE IF NOT EXISTS system_config (
@@ -214,6 +393,26 @@ class Database:
                 )
             """)
             
+            # 消息日志全文索引（SQLite未编译FTS5时跳过，搜索按 async_db.fts_available 改用LIKE）
+            try:
+                cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'message_logs_fts'")
+                fts_exists = cursor.fetchone() is not None
+                for sql in MESSAGE_LOGS_FTS_SCHEMA:
+                    cursor.execute(sql)
+                if not fts_exists:
+                    cursor.execute(MESSAGE_LOGS_FTS_REBUILD)
+            except sqlite3.OperationalError:
+                pass
+            
+            # 消息统计汇总表（首次创建时按已有日志回填）
+            for table, schema in MESSAGE_STATS_SCHEMA.items():
+                cursor.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (table,))
+                stats_exists = cursor.fetchone() is not None
+                for sql in schema:
+                    cursor.execute(sql)
+                if not stats_exists:
+                    cursor.execute(MESSAGE_STATS_REBUILD[table])
+            
             conn.commit()
     
     # 账号管理
@@ -292,7 +491,10 @@ class Database:
                 INSERT INTO bot_configs (platform, name, config)
                 VALUES (?, ?, ?)
             """, (platform, name, json.dumps(config, ensure_ascii=False)))
-            return cursor.lastrowid
+            bot_id = cursor.lastrowid
+        
+        self._notify_change('bot_configs')
+        return bot_id
     
     def get_bot_configs(self, platform: Optional[str] = None) -> List[Dict[str, Any]]:
         """获取Bot配置"""
@@ -315,6 +517,8 @@ class Database:
         with self.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("DELETE FROM bot_configs WHERE id = ?", (bot_id,))
+        
+        self._notify_change('bot_configs')
     
     # 频道映射管理
     def add_channel_mapping(self, kook_server_id: str, kook_channel_id: str,
@@ -330,7 +534,10 @@ class Database:
                 VALUES (?, ?, ?, ?, ?, ?)
             """, (kook_server_id, kook_channel_id, kook_channel_name,
                   target_platform, target_bot_id, target_channel_id))
-            return cursor.lastrowid
+            mapping_id = cursor.lastrowid
+        
+        self._notify_change('channel_mappings')
+        return mapping_id
     
     def get_channel_mappings(self, kook_channel_id: Optional[str] = None) -> List[Dict[str, Any]]:
         """获取频道映射"""
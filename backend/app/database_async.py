@@ -1,188 +1,358 @@
 """
 异步数据库模块（连接池版本）
 解决SQLite并发写入限制，提升多账号场景性能
+
+- 一个写连接（WAL模式，写操作串行执行）+ N个只读连接（WAL下读写互不阻塞）
+- aiosqlite在后台线程执行SQL，事件循环线程上不运行任何sqlite调用
+- 记录获取连接的等待时间，供 /api/performance/database 查看
 """
 import asyncio
+import time
 import aiosqlite
 import json
 from datetime import datetime
 from typing import Optional, List, Dict, Any
 from pathlib import Path
 from contextlib import asynccontextmanager
-from .config import DB_PATH
+from .config import DB_PATH, settings
+from .database import (
+    MESSAGE_LOGS_FTS_SCHEMA, MESSAGE_LOGS_FTS_REBUILD, MESSAGE_STATS_SCHEMA, MESSAGE_STATS_REBUILD
+)
+from .utils.logger import logger
 
 
 class AsyncDatabase:
-    """异步数据库操作类（带连接池）"""
+    """异步数据库操作类（单写连接 + 只读连接池）"""
     
-    def __init__(self, db_path: Path = DB_PATH, pool_size: int = 10):
+    def __init__(self, db_path: Path = DB_PATH, pool_size: int = None):
+        """
+        初始化异步数据库
+        
+        Args:
+            db_path: 数据库文件路径
+            pool_size: 只读连接数量（默认取 settings.db_read_pool_size）
+        """
         self.db_path = db_path
-        self.pool_size = pool_size
-        self._connection: Optional[aiosqlite.Connection] = None
-        self._lock = asyncio.Lock()
+        self.pool_size = pool_size or settings.db_read_pool_size
+        
+        # 消息日志全文索引是否可用（SQLite未编译FTS5/trigram时为False，搜索改用LIKE）
+        self.fts_available = False
+        
+        self._writer: Optional[aiosqlite.Connection] = None
+        self._writer_lock: Optional[asyncio.Lock] = None
+        self._readers: List[aiosqlite.Connection] = []
+        self._idle_readers: Optional[asyncio.Queue] = None
+        self._connect_lock: Optional[asyncio.Lock] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        
+        # 连接等待统计
+        self.pool_stats = {
+            kind: {'acquired': 0, 'in_use': 0, 'total_wait_ms': 0.0, 'max_wait_ms': 0.0}
+            for kind in ('reader', 'writer')
+        }
     
-    async def connect(self):
-        """初始化数据库连接"""
-        if self._connection is None:
-            self._connection = await aiosqlite.connect(
-                self.db_path,
-                check_same_thread=False
-            )
+    async def _open(self, read_only: bool) -> aiosqlite.Connection:
+        """打开一个连接并设置PRAGMA"""
+        conn = await aiosqlite.connect(self.db_path, check_same_thread=False)
+        await conn.execute(f"PRAGMA busy_timeout={settings.db_busy_timeout_ms}")
+        await conn.execute("PRAGMA cache_size=10000")
+        await conn.execute("PRAGMA temp_store=MEMORY")
+        
+        if read_only:
+            await conn.execute("PRAGMA query_only=ON")
+        else:
             # 优化SQLite性能
-            await self._connection.execute("PRAGMA journal_mode=WAL")
-            await self._connection.execute("PRAGMA synchronous=NORMAL")
-            await self._connection.execute("PRAGMA cache_size=10000")
-            await self._connection.execute("PRAGMA temp_store=MEMORY")
+            await conn.execute("PRAGMA journal_mode=WAL")
+            await conn.execute("PRAGMA synchronous=NORMAL")
+        
+        # 设置row_factory
+        conn.row_factory = aiosqlite.Row
+        return conn
+    
+    def _discard_connections(self):
+        """丢弃绑定在旧事件循环上的连接（只停止后台线程）"""
+        for conn in [self._writer, *self._readers]:
+            if conn is not None:
+                conn.stop()
+        self._writer = None
+        self._readers = []
+    
+    async def connect(self):
+        """初始化数据库连接池"""
+        loop = asyncio.get_running_loop()
+        
+        if self._loop is not loop:
+            # 首次连接或事件循环已变化（锁和队列不能跨循环使用）
+            self._discard_connections()
+            self._loop = loop
+            self._connect_lock = asyncio.Lock()
+            self._writer_lock = asyncio.Lock()
+            self._idle_readers = asyncio.Queue()
+        
+        async with self._connect_lock:
+            if self._writer is not None:
+                return
             
-            # 设置row_factory
-            self._connection.row_factory = aiosqlite.Row
+            self._writer = await self._open(read_only=False)
             
             # 初始化数据库表
             await self.init_database()
+            
+            for _ in range(self.pool_size):
+                reader = await self._open(read_only=True)
+                self._readers.append(reader)
+                self._idle_readers.put_nowait(reader)
+            
+            logger.info(f"异步数据库连接池已就绪: 1个写连接 + {self.pool_size}个只读连接")
     
     async def disconnect(self):
-        """关闭数据库连接"""
-        if self._connection:
-            await self._connection.close()
-            self._connection = None
+        """关闭所有连接"""
+        if self._writer is None:
+            return
+        
+        for conn in [self._writer, *self._readers]:
+            await conn.close()
+        
+        self._writer = None
+        self._readers = []
+        self._loop = None
+    
+    async def _ensure_connected(self):
+        if self._writer is None or self._loop is not asyncio.get_running_loop():
+            await self.connect()
+    
+    def _record_wait(self, kind: str, start: float):
+        stats = self.pool_stats[kind]
+        wait_ms = (time.perf_counter() - start) * 1000
+        stats['acquired'] += 1
+        stats['in_use'] += 1
+        stats['total_wait_ms'] += wait_ms
+        stats['max_wait_ms'] = max(stats['max_wait_ms'], wait_ms)
+    
+    async def has_fts(self) -> bool:
+        """消息日志全文索引是否可用（首次调用时初始化连接池）"""
+        await self._ensure_connected()
+        return self.fts_available
     
     @asynccontextmanager
-    async def get_connection(self):
-        """获取数据库连接（带锁保护）"""
-        async with self._lock:
-            if self._connection is None:
-                await self.connect()
+    async def reader(self):
+        """获取只读连接（从池中借出，用完归还）"""
+        await self._ensure_connected()
+        
+        start = time.perf_counter()
+        conn = await self._idle_readers.get()
+        self._record_wait('reader', start)
+        
+        try:
+            yield conn
+        finally:
+            self.pool_stats['reader']['in_use'] -= 1
+            self._idle_readers.put_nowait(conn)
+    
+    @asynccontextmanager
+    async def writer(self):
+        """获取写连接（写操作串行执行，退出时提交）"""
+        await self._ensure_connected()
+        
+        start = time.perf_counter()
+        async with self._writer_lock:
+            self._record_wait('writer', start)
             try:
-                yield self._connection
-                await self._connection.commit()
+                yield self._writer
+                await self._writer.commit()
             except Exception as e:
-                await self._connection.rollback()
+                await self._writer.rollback()
                 raise e
+            finally:
+                self.pool_stats['writer']['in_use'] -= 1
+    
+    @asynccontextmanager
+    async def get_connection(self):
+        """获取数据库连接（兼容旧接口，等同于写连接）"""
+        async with self.writer() as conn:
+            yield conn
+    
+    def get_pool_stats(self) -> Dict[str, Any]:
+        """
+        获取连接池统计
+        
+        Returns:
+            读/写连接的获取次数、使用中数量、平均和最大等待时间（毫秒）
+        """
+        result = {'readers': self.pool_size, 'connected': self._writer is not None}
+        
+        for kind, stats in self.pool_stats.items():
+            acquired = stats['acquired']
+            result[kind] = {
+                'acquired': acquired,
+                'in_use': stats['in_use'],
+                'avg_wait_ms': round(stats['total_wait_ms'] / acquired, 3) if acquired else 0.0,
+                'max_wait_ms': round(stats['max_wait_ms'], 3)
+            }
+        
+        return result
     
     async def init_database(self):
         """初始化数据库表"""
-        async with self.get_connection() as conn:
-            # 账号表
-            await conn.execute("""
-                CREATE TABLE IF NOT EXISTS accounts (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    email TEXT NOT NULL UNIQUE,
-                    password_encrypted TEXT,
-                    cookie TEXT,
-                    status TEXT DEFAULT 'offline',
-                    last_active TIMESTAMP,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            # 添加索引
-            await conn.execute("""
-                CREATE INDEX IF NOT EXISTS idx_accounts_email 
-                ON accounts(email)
-            """)
-            await conn.execute("""
-                CREATE INDEX IF NOT EXISTS idx_accounts_status 
-                ON accounts(status)
-            """)
-            
-            # Bot配置表
-            await conn.execute("""
-                CREATE TABLE IF NOT EXISTS bot_configs (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    platform TEXT NOT NULL,
-                    name TEXT NOT NULL,
-                    config TEXT NOT NULL,
-                    status TEXT DEFAULT 'active',
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            # 频道映射表
-            await conn.execute("""
-                CREATE TABLE IF NOT EXISTS channel_mappings (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    kook_server_id TEXT NOT NULL,
-                    kook_channel_id TEXT NOT NULL,
-                    kook_channel_name TEXT NOT NULL,
-                    target_platform TEXT NOT NULL,
-                    target_bot_id INTEGER NOT NULL,
-                    target_channel_id TEXT NOT NULL,
-                    enabled INTEGER DEFAULT 1,
-                    FOREIGN KEY (target_bot_id) REFERENCES bot_configs(id)
-                )
-            """)
-            
-            # 优化：复合索引
-            await conn.execute("""
-                CREATE INDEX IF NOT EXISTS idx_channel_mappings_lookup 
-                ON channel_mappings(kook_channel_id, enabled, target_platform)
-            """)
-            await conn.execute("""
-                CREATE INDEX IF NOT EXISTS idx_channel_mappings_bot 
-                ON channel_mappings(target_bot_id, target_platform)
-            """)
-            
-            # 过滤规则表
-            await conn.execute("""
-                CREATE TABLE IF NOT EXISTS filter_rules (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    rule_type TEXT NOT NULL,
-                    rule_value TEXT NOT NULL,
-                    scope TEXT DEFAULT 'global',
-                    enabled INTEGER DEFAULT 1
-                )
-            """)
-            
-            # 消息日志表
-            await conn.execute("""
-                CREATE TABLE IF NOT EXISTS message_logs (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    kook_message_id TEXT NOT NULL UNIQUE,
-                    kook_channel_id TEXT NOT NULL,
-                    content TEXT,
-                    message_type TEXT,
-                    sender_name TEXT,
-                    target_platform TEXT,
-                    target_channel TEXT,
-                    status TEXT,
-                    error_message TEXT,
-                    latency_ms INTEGER,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            # 优化：复合索引
-            await conn.execute("""
-                CREATE INDEX IF NOT EXISTS idx_message_logs_lookup 
-                ON message_logs(kook_message_id, created_at DESC)
-            """)
-            await conn.execute("""
-                CREATE INDEX IF NOT EXISTS idx_message_logs_query 
-                ON message_logs(status, target_platform, created_at DESC)
-            """)
-            await conn.execute("""
-                CREATE INDEX IF NOT EXISTS idx_message_logs_channel 
-                ON message_logs(kook_channel_id, created_at DESC)
-            """)
-            
-            # 失败消息队列
-            await conn.execute("""
-                CREATE TABLE IF NOT EXISTS failed_messages (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    message_log_id INTEGER NOT NULL,
-                    retry_count INTEGER DEFAULT 0,
-                    last_retry TIMESTAMP,
-                    FOREIGN KEY (message_log_id) REFERENCES message_logs(id)
-                )
-            """)
-            
-            # 系统配置表
-            await conn.execute("""
-                CREATE TABLE IF NOT EXISTS system_config (
-                    key TEXT PRIMARY KEY,
-                    value TEXT NOT NULL
-                )
-            """)
+        conn = self._writer
+        # 账号表
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS accounts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                email TEXT NOT NULL UNIQUE,
+                password_encrypted TEXT,
+                cookie TEXT,
+                status TEXT DEFAULT 'offline',
+                last_active TIMESTAMP,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        
+        # 添加索引
+        await conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_accounts_email 
+            ON accounts(email)
+        """)
+        await conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_accounts_status 
+            ON accounts(status)
+        """)
+        
+        # Bot配置表
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS bot_configs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                platform TEXT NOT NULL,
+                name TEXT NOT NULL,
+                config TEXT NOT NULL,
+                status TEXT DEFAULT 'active',
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        
+        # 频道映射表
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS channel_mappings (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kook_server_id TEXT NOT NULL,
+                kook_channel_id TEXT NOT NULL,
+                kook_channel_name TEXT NOT NULL,
+                target_platform TEXT NOT NULL,
+                target_bot_id INTEGER NOT NULL,
+                target_channel_id TEXT NOT NULL,
+                enabled INTEGER DEFAULT 1,
+                FOREIGN KEY (target_bot_id) REFERENCES bot_configs(id)
+            )
+        """)
+        
+        # 优化：复合索引
+        await conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_channel_mappings_lookup 
+            ON channel_mappings(kook_channel_id, enabled, target_platform)
+        """)
+        await conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_channel_mappings_bot 
+            ON channel_mappings(target_bot_id, target_platform)
+        """)
+        
+        # 过滤规则表
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS filter_rules (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                rule_type TEXT NOT NULL,
+                rule_value TEXT NOT NULL,
+                scope TEXT DEFAULT 'global',
+                enabled INTEGER DEFAULT 1
+            )
+        """)
+        
+        # 消息日志表
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS message_logs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kook_message_id TEXT NOT NULL UNIQUE,
+                kook_channel_id TEXT NOT NULL,
+                content TEXT,
+                message_type TEXT,
+                sender_name TEXT,
+                target_platform TEXT,
+                target_channel TEXT,
+                status TEXT,
+                error_message TEXT,
+                latency_ms INTEGER,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        
+        # 优化：复合索引
+        await conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_message_logs_lookup 
+            ON message_logs(kook_message_id, created_at DESC)
+        """)
+        await conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_message_logs_query 
+            ON message_logs(status, target_platform, created_at DESC)
+        """)
+        await conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_message_logs_channel 
+            ON message_logs(kook_channel_id, created_at DESC)
+        """)
+        
+        # 失败消息队列
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS failed_messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                message_log_id INTEGER NOT NULL,
+                retry_count INTEGER DEFAULT 0,
+                last_retry TIMESTAMP,
+                next_retry REAL,
+                FOREIGN KEY (message_log_id) REFERENCES message_logs(id)
+            )
+        """)
+        
+        # 旧版本的表没有next_retry列（下次重试时间戳），补上并视为已到期
+        cursor = await conn.execute("PRAGMA table_info(failed_messages)")
+        if 'next_retry' not in [row[1] for row in await cursor.fetchall()]:
+            await conn.execute("ALTER TABLE failed_messages ADD COLUMN next_retry REAL")
+            await conn.execute("UPDATE failed_messages SET next_retry = 0")
+        
+        # 到期时间索引（重试调度器按到期时间取消息、计算下次唤醒时间）
+        await conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_failed_messages_due
+            ON failed_messages(next_retry, retry_count)
+        """)
+        
+        # 系统配置表
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS system_config (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            )
+        """)
+        
+        # 消息日志全文索引（SQLite未编译FTS5时跳过，记录为不可用，搜索改用LIKE）
+        try:
+            cursor = await conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'message_logs_fts'")
+            fts_exists = await cursor.fetchone() is not None
+            for sql in MESSAGE_LOGS_FTS_SCHEMA:
+                await conn.execute(sql)
+            if not fts_exists:
+                await conn.execute(MESSAGE_LOGS_FTS_REBUILD)
+            self.fts_available = True
+        except aiosqlite.OperationalError as e:
+            self.fts_available = False
+            logger.warning(f"消息日志全文索引不可用，搜索改用LIKE: {str(e)}")
+        
+        # 消息统计汇总表（首次创建时按已有日志回填）
+        for table, schema in MESSAGE_STATS_SCHEMA.items():
+            cursor = await conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (table,))
+            stats_exists = await cursor.fetchone() is not None
+            for sql in schema:
+                await conn.execute(sql)
+            if not stats_exists:
+                await conn.execute(MESSAGE_STATS_REBUILD[table])
+        
+        await conn.commit()
     
     # ✅ P1-3优化: 分页查询
     async def get_message_logs_paginated(
@@ -242,7 +412,7 @@ class AsyncDatabase:
             count_query += " AND created_at <= ?"
             params.append(end_date)
         
-        async with self.get_connection() as conn:
+        async with self.reader() as conn:
             # 获取总数
             cursor = await conn.execute(count_query, params)
             row = await cursor.fetchone()
@@ -265,7 +435,7 @@ class AsyncDatabase:
     async def add_account(self, email: str, password_encrypted: Optional[str] = None, 
                          cookie: Optional[str] = None) -> int:
         """添加账号"""
-        async with self.get_connection() as conn:
+        async with self.writer() as conn:
             cursor = await conn.execute("""
                 INSERT INTO accounts (email, password_encrypted, cookie)
                 VALUES (?, ?, ?)
@@ -274,21 +444,21 @@ class AsyncDatabase:
     
     async def get_accounts(self) -> List[Dict[str, Any]]:
         """获取所有账号"""
-        async with self.get_connection() as conn:
+        async with self.reader() as conn:
             cursor = await conn.execute("SELECT * FROM accounts")
             rows = await cursor.fetchall()
             return [dict(row) for row in rows]
     
     async def get_account(self, account_id: int) -> Optional[Dict[str, Any]]:
         """获取单个账号信息"""
-        async with self.get_connection() as conn:
+        async with self.reader() as conn:
             cursor = await conn.execute("SELECT * FROM accounts WHERE id = ?", (account_id,))
             row = await cursor.fetchone()
             return dict(row) if row else None
     
     async def update_account_status(self, account_id: int, status: str):
         """更新账号状态"""
-        async with self.get_connection() as conn:
+        async with self.writer() as conn:
             await conn.execute("""
                 UPDATE accounts 
                 SET status = ?, last_active = ? 
@@ -297,7 +467,7 @@ class AsyncDatabase:
     
     async def update_account_cookie(self, account_id: int, cookie: str):
         """更新账号Cookie"""
-        async with self.get_connection() as conn:
+        async with self.writer() as conn:
             await conn.execute("""
                 UPDATE accounts 
                 SET cookie = ?, last_active = ? 
@@ -306,13 +476,13 @@ class AsyncDatabase:
     
     async def delete_account(self, account_id: int):
         """删除账号"""
-        async with self.get_connection() as conn:
+        async with self.writer() as conn:
             await conn.execute("DELETE FROM accounts WHERE id = ?", (account_id,))
     
     # Bot配置管理
     async def get_bot_configs(self, platform: Optional[str] = None) -> List[Dict[str, Any]]:
         """获取Bot配置"""
-        async with self.get_connection() as conn:
+        async with self.reader() as conn:
             if platform:
                 cursor = await conn.execute("SELECT * FROM bot_configs WHERE platform = ?", (platform,))
             else:
@@ -329,7 +499,7 @@ class AsyncDatabase:
     # 频道映射管理
     async def get_channel_mappings(self, kook_channel_id: Optional[str] = None) -> List[Dict[str, Any]]:
         """获取频道映射"""
-        async with self.get_connection() as conn:
+        async with self.reader() as conn:
             if kook_channel_id:
                 cursor = await conn.execute("""
                     SELECT * FROM channel_mappings 
@@ -360,7 +530,7 @@ class AsyncDatabase:
         latency_ms: Optional[int] = None
     ) -> int:
         """添加消息日志"""
-        async with self.get_connection() as conn:
+        async with self.writer() as conn:
             try:
                 cursor = await conn.execute("""
                     INSERT INTO message_logs 
@@ -381,9 +551,73 @@ class AsyncDatabase:
                 row = await cursor.fetchone()
                 return row[0] if row else 0
     
+    async def add_failed_message(self, message_log_id: int) -> int:
+        """
+        添加到失败消息队列（等待重试Worker处理）
+        
+        Args:
+            message_log_id: 消息日志ID（首次重试在 message_retry_interval 秒后）
+            
+        Returns:
+            失败记录ID
+        """
+        async with self.writer() as conn:
+            cursor = await conn.execute("""
+                INSERT INTO failed_messages (message_log_id, retry_count, next_retry)
+                VALUES (?, 0, ?)
+            """, (message_log_id, time.time() + settings.message_retry_interval))
+            return cursor.lastrowid
+    
+    async def add_message_logs_batch(self, records: List[Dict[str, Any]]) -> List[int]:
+        """
+        批量写入消息日志（一个事务、一次提交）
+
+        Args:
+            records: 日志记录列表，字段同 add_message_log；
+                     retry=True 的记录同时加入失败消息队列（retry_delay 指定首次重试延迟，秒）
+
+        Returns:
+            各记录对应的消息日志ID（消息已存在时为已有ID）
+        """
+        log_ids = []
+
+        async with self.writer() as conn:
+            for record in records:
+                cursor = await conn.execute("""
+                    INSERT OR IGNORE INTO message_logs
+                    (kook_message_id, kook_channel_id, content, message_type,
+                     sender_name, target_platform, target_channel, status,
+                     error_message, latency_ms)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """, (record['kook_message_id'], record['kook_channel_id'],
+                      record['content'], record['message_type'], record['sender_name'],
+                      record['target_platform'], record['target_channel'], record['status'],
+                      record.get('error_message'), record.get('latency_ms')))
+
+                if cursor.rowcount:
+                    log_id = cursor.lastrowid
+                else:
+                    # 消息已存在，使用已有ID
+                    cursor = await conn.execute(
+                        "SELECT id FROM message_logs WHERE kook_message_id = ?",
+                        (record['kook_message_id'],)
+                    )
+                    row = await cursor.fetchone()
+                    log_id = row[0] if row else 0
+
+                if record.get('retry') and log_id:
+                    await conn.execute("""
+                        INSERT INTO failed_messages (message_log_id, retry_count, next_retry)
+                        VALUES (?, 0, ?)
+                    """, (log_id, time.time() + (record.get('retry_delay') or settings.message_retry_interval)))
+
+                log_ids.append(log_id)
+
+        return log_ids
+
     async def get_message_log(self, message_id: str) -> Optional[Dict[str, Any]]:
         """获取单条消息日志"""
-        async with self.get_connection() as conn:
+        async with self.reader() as conn:
             cursor = await conn.execute(
                 "SELECT * FROM message_logs WHERE kook_message_id = ?",
                 (message_id,)
@@ -394,7 +628,7 @@ class AsyncDatabase:
     # 系统配置
     async def set_system_config(self, key: str, value: str):
         """设置系统配置"""
-        async with self.get_connection() as conn:
+        async with self.writer() as conn:
             await conn.execute("""
                 INSERT OR REPLACE INTO system_config (key, value)
                 VALUES (?, ?)
@@ -402,7 +636,7 @@ class AsyncDatabase:
     
     async def get_system_config(self, key: str) -> Optional[str]:
         """获取系统配置"""
-        async with self.get_connection() as conn:
+        async with self.reader() as conn:
             cursor = await conn.execute(
                 "SELECT value FROM system_config WHERE key = ?",
                 (key,)
@@ -412,7 +646,7 @@ class AsyncDatabase:
     
     async def delete_system_config(self, key: str):
         """删除系统配置"""
-        async with self.get_connection() as conn:
+        async with self.writer() as conn:
             await conn.execute("DELETE FROM system_config WHERE key = ?", (key,))
 
 
@@ -2,7 +2,6 @@
 钉钉转发模块
 支持钉钉群机器人Webhook
 """
-import aiohttp
 import asyncio
 import hmac
 import hashlib
@@ -12,6 +11,7 @@ from urllib.parse import quote_plus
 from typing import Dict, Any, Optional, List
 from ..utils.rate_limiter import rate_limiter_manager
 from ..utils.logger import logger
+from ..utils.http_client import http_client_manager
 from ..config import settings
 from ..processors.formatter import formatter
 
@@ -132,17 +132,17 @@ class DingTalkForwarder:
                 }
             }
             
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, json=message) as response:
-                    data = await response.json()
+            session = await http_client_manager.get_session('default')
+            async with session.post(url, json=message) as response:
+                data = await response.json()
+                
+                if data.get('errcode') == 0:
+                    logger.info("钉钉消息发送成功")
+                    return True
+                else:
+                    logger.error(f"钉钉发送失败: {data.get('errmsg')}")
+                    return False
                     
-                    if data.get('errcode') == 0:
-                        logger.info("钉钉消息发送成功")
-                        return True
-                    else:
-                        logger.error(f"钉钉发送失败: {data.get('errmsg')}")
-                        return False
-                        
         except Exception as e:
             logger.error(f"钉钉发送异常: {str(e)}")
             return False
@@ -186,17 +186,17 @@ class DingTalkForwarder:
                 }
             }
             
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, json=message) as response:
-                    data = await response.json()
+            session = await http_client_manager.get_session('default')
+            async with session.post(url, json=message) as response:
+                data = await response.json()
+                
+                if data.get('errcode') == 0:
+                    logger.info("钉钉Markdown消息发送成功")
+                    return True
+                else:
+                    logger.error(f"钉钉Markdown发送失败: {data.get('errmsg')}")
+                    return False
                     
-                    if data.get('errcode') == 0:
-                        logger.info("钉钉Markdown消息发送成功")
-                        return True
-                    else:
-                        logger.error(f"钉钉Markdown发送失败: {data.get('errmsg')}")
-                        return False
-                        
         except Exception as e:
             logger.error(f"钉钉Markdown发送异常: {str(e)}")
             return False
@@ -237,17 +237,17 @@ class DingTalkForwarder:
                 }
             }
             
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, json=message) as response:
-                    data = await response.json()
+            session = await http_client_manager.get_session('default')
+            async with session.post(url, json=message) as response:
+                data = await response.json()
+                
+                if data.get('errcode') == 0:
+                    logger.info("钉钉链接消息发送成功")
+                    return True
+                else:
+                    logger.error(f"钉钉链接发送失败: {data.get('errmsg')}")
+                    return False
                     
-                    if data.get('errcode') == 0:
-                        logger.info("钉钉链接消息发送成功")
-                        return True
-                    else:
-                        logger.error(f"钉钉链接发送失败: {data.get('errmsg')}")
-                        return False
-                        
         except Exception as e:
             logger.error(f"钉钉链接发送异常: {str(e)}")
             return False
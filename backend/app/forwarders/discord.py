@@ -1,25 +1,202 @@
 """
 Discord转发模块
+使用原生异步Webhook客户端（共享全局HTTP连接池），不再阻塞事件循环
 """
 import aiohttp
 import asyncio
-from typing import Dict, Any, Optional, List
-from discord_webhook import DiscordWebhook, DiscordEmbed
-from ..utils.rate_limiter import rate_limiter_manager
+import json
+import os
+import time
+from typing import Dict, Any, Optional, List, Tuple
+from ..utils.rate_limiter import rate_limiter_manager, AdaptiveRateLimiter
 from ..utils.logger import logger
+from ..utils.http_client import http_client_manager
 from ..config import settings
 from ..processors.formatter import formatter
 
 
-class DiscordForwarder:
-    """Discord消息转发器"""
+class DiscordWebhookClient:
+    """
+    Discord Webhook异步客户端
     
-    def __init__(self):
-        self.rate_limiter = rate_limiter_manager.get_limiter(
+    - 使用全局HTTP连接池的共享会话（keep-alive连接复用）
+    - 支持multipart文件上传
+    - 解析X-RateLimit-*响应头交给自适应限流器学习每个bucket的真实额度，
+      额度耗尽时在发送前等待到重置时间（所有Discord转发共享学习结果）
+    - 遇到429按Retry-After / retry_after等待后自动重试
+    """
+    
+    def __init__(self, max_retries: int = 3, limiter: Optional[AdaptiveRateLimiter] = None):
+        """
+        初始化客户端
+        
+        Args:
+            max_retries: 429限流时的最大重试次数
+            limiter: 自适应限流器（默认使用全进程共享的discord限流器）
+        """
+        self.max_retries = max_retries
+        self.limiter = limiter or rate_limiter_manager.get_adaptive_limiter(
             "discord",
             settings.discord_rate_limit_calls,
             settings.discord_rate_limit_period
         )
+        
+        # 各Webhook最近一次响应报告的限流桶: {webhook_url: {'bucket', 'limit', 'remaining', 'reset_at'}}
+        self.buckets: Dict[str, Dict[str, Any]] = {}
+        
+        self.stats = {
+            'requests': 0,
+            'rate_limited': 0,
+            'preemptive_waits': 0,
+            'errors': 0
+        }
+    
+    def _update_bucket(self, webhook_url: str, headers) -> None:
+        """
+        根据X-RateLimit-*响应头更新限流桶状态
+        
+        Args:
+            webhook_url: Webhook URL
+            headers: 响应头
+        """
+        remaining = headers.get('X-RateLimit-Remaining')
+        reset_after = headers.get('X-RateLimit-Reset-After')
+        
+        if remaining is None or reset_after is None:
+            return
+        
+        try:
+            bucket = {
+                'bucket': headers.get('X-RateLimit-Bucket'),
+                'limit': int(headers.get('X-RateLimit-Limit', 0)),
+                'remaining': int(remaining),
+                'reset_at': time.monotonic() + float(reset_after)
+            }
+        except ValueError:
+            return
+        
+        self.buckets[webhook_url] = bucket
+        self.limiter.on_response(
+            webhook_url,
+            limit=bucket['limit'],
+            remaining=bucket['remaining'],
+            reset_after=float(reset_after),
+            bucket_id=bucket['bucket']
+        )
+    
+    async def _wait_for_bucket(self, webhook_url: str) -> None:
+        """获取发送许可（桶额度已耗尽或429限流中时等待到重置时间）"""
+        if await self.limiter.acquire(webhook_url) > 0:
+            self.stats['preemptive_waits'] += 1
+    
+    @staticmethod
+    def _parse_retry_after(headers, body: str) -> float:
+        """从429响应中解析等待时间（秒）"""
+        try:
+            data = json.loads(body)
+            if isinstance(data, dict) and 'retry_after' in data:
+                return float(data['retry_after'])
+        except (ValueError, TypeError):
+            pass
+        
+        try:
+            return float(headers.get('Retry-After', 1))
+        except (ValueError, TypeError):
+            return 1.0
+    
+    async def execute(self, webhook_url: str, payload: Dict[str, Any],
+                      files: Optional[List[Tuple[str, bytes]]] = None) -> Tuple[int, str]:
+        """
+        执行Webhook请求
+        
+        Args:
+            webhook_url: Webhook URL
+            payload: 消息体（content/username/avatar_url/embeds）
+            files: 附件列表 [(文件名, 文件数据)]
+            
+        Returns:
+            (HTTP状态码, 响应文本)
+        """
+        session = await http_client_manager.get_session('default')
+        url = f"{webhook_url}{'&' if '?' in webhook_url else '?'}wait=true"
+        
+        status, text = 0, ""
+        
+        for attempt in range(self.max_retries + 1):
+            await self._wait_for_bucket(webhook_url)
+            
+            if files:
+                # multipart上传：payload_json + files[n]
+                data = aiohttp.FormData()
+                data.add_field(
+                    'payload_json',
+                    json.dumps(payload, ensure_ascii=False),
+                    content_type='application/json'
+                )
+                for index, (filename, file_data) in enumerate(files):
+                    data.add_field(f'files[{index}]', file_data, filename=filename)
+                request_kwargs = {'data': data}
+            else:
+                request_kwargs = {'json': payload}
+            
+            self.stats['requests'] += 1
+            
+            async with session.post(url, **request_kwargs) as response:
+                status = response.status
+                text = await response.text()
+                self._update_bucket(webhook_url, response.headers)
+                
+                if status != 429:
+                    return status, text
+                
+                retry_after = self._parse_retry_after(response.headers, text)
+                is_global = response.headers.get('X-RateLimit-Global', '').lower() == 'true'
+            
+            self.stats['rate_limited'] += 1
+            # 下一次获取许可时等待到限流解除（全局限流时影响所有Webhook）
+            self.limiter.on_rate_limited(webhook_url, retry_after, is_global)
+            
+            if attempt < self.max_retries:
+                logger.warning(f"Discord API限流，等待{retry_after:.2f}秒后重试...")
+        
+        return status, text
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取客户端统计"""
+        return {
+            **self.stats,
+            'tracked_buckets': len(self.buckets)
+        }
+
+
+# 全进程共享的Webhook客户端
+discord_webhook_client = DiscordWebhookClient()
+
+
+class DiscordForwarder:
+    """Discord消息转发器"""
+    
+    def __init__(self, client: Optional[DiscordWebhookClient] = None):
+        self.client = client or discord_webhook_client
+        # 每个Webhook单独限流（由客户端在每次请求前获取许可，按响应头自适应）
+        self.rate_limiter = self.client.limiter
+        # Webhook限流桶状态（与客户端共享）
+        self.webhooks = self.client.buckets
+    
+    @staticmethod
+    def _build_payload(content: str, username: Optional[str] = None,
+                       avatar_url: Optional[str] = None,
+                       embeds: Optional[List[Dict]] = None) -> Dict[str, Any]:
+        """构建Webhook消息体"""
+        payload = {
+            'content': content,
+            'username': username or "KOOK消息转发"
+        }
+        if avatar_url:
+            payload['avatar_url'] = avatar_url
+        if embeds:
+            payload['embeds'] = embeds
+        return payload
     
     async def send_message(self, webhook_url: str, content: str,
                           username: Optional[str] = None,
@@ -39,30 +216,20 @@ class DiscordForwarder:
             是否成功
         """
         try:
-            # 应用限流
-            await self.rate_limiter.acquire()
-            
             # Discord单条消息最多2000字符
             messages = formatter.split_long_message(content, 2000)
             
-            for msg in messages:
-                webhook = DiscordWebhook(
-                    url=webhook_url,
-                    content=msg,
-                    username=username or "KOOK消息转发",
-                    avatar_url=avatar_url
-                )
-                
+            for index, msg in enumerate(messages):
                 # 添加Embed（仅第一条消息）
-                if embeds and msg == messages[0]:
-                    for embed_data in embeds:
-                        embed = DiscordEmbed(**embed_data)
-                        webhook.add_embed(embed)
+                payload = self._build_payload(
+                    msg, username, avatar_url,
+                    embeds if index == 0 else None
+                )
                 
-                response = webhook.execute()
+                status, text = await self.client.execute(webhook_url, payload)
                 
-                if response.status_code not in [200, 204]:
-                    logger.error(f"Discord发送失败: {response.status_code} - {response.text}")
+                if status not in [200, 204]:
+                    logger.error(f"Discord发送失败: {status} - {text}")
                     return False
                 
                 # 如果有多条消息，稍微延迟一下
@@ -73,6 +240,7 @@ class DiscordForwarder:
             return True
             
         except Exception as e:
+            self.client.stats['errors'] += 1
             logger.error(f"Discord发送异常: {str(e)}")
             return False
     
@@ -80,7 +248,8 @@ class DiscordForwarder:
                                image_url: str,
                                content: str = "",
                                username: Optional[str] = None,
-                               avatar_url: Optional[str] = None) -> bool:
+                               avatar_url: Optional[str] = None,
+                               image_data: Optional[bytes] = None) -> bool:
         """
         发送图片消息（直接上传模式）
         
@@ -90,47 +259,42 @@ class DiscordForwarder:
             content: 附带文本
             username: 显示的用户名
             avatar_url: 显示的头像URL
+            image_data: 已下载的图片数据（提供时不再下载）
             
         Returns:
             是否成功
         """
         try:
-            await self.rate_limiter.acquire()
-            
             # 下载图片
-            async with aiohttp.ClientSession() as session:
-                async with session.get(image_url, timeout=aiohttp.ClientTimeout(total=30)) as resp:
+            if image_data is None:
+                session = await http_client_manager.get_session('download')
+                async with session.get(image_url) as resp:
                     if resp.status != 200:
                         logger.error(f"下载图片失败: {resp.status}")
                         return False
                     
                     image_data = await resp.read()
             
-            # 使用Webhook上传图片
-            webhook = DiscordWebhook(
-                url=webhook_url,
-                content=content,
-                username=username or "KOOK消息转发",
-                avatar_url=avatar_url
-            )
-            
             # 从URL提取文件名
             filename = image_url.split('/')[-1].split('?')[0]
             if not filename or '.' not in filename:
                 filename = 'image.jpg'
             
-            webhook.add_file(file=image_data, filename=filename)
-            
-            response = webhook.execute()
+            status, _ = await self.client.execute(
+                webhook_url,
+                self._build_payload(content, username, avatar_url),
+                files=[(filename, image_data)]
+            )
             
-            if response.status_code not in [200, 204]:
-                logger.error(f"Discord图片上传失败: {response.status_code}")
+            if status not in [200, 204]:
+                logger.error(f"Discord图片上传失败: {status}")
                 return False
             
             logger.info(f"Discord图片上传成功（直传模式）")
             return True
             
         except Exception as e:
+            self.client.stats['errors'] += 1
             logger.error(f"Discord图片直传异常: {str(e)}")
             return False
     
@@ -154,44 +318,37 @@ class DiscordForwarder:
         max_retries = 3
         retry_delay = 5  # 秒
         
+        try:
+            # 在线程池中读取文件，避免大文件阻塞事件循环
+            loop = asyncio.get_running_loop()
+            with open(file_path, "rb") as f:
+                file_data = await loop.run_in_executor(None, f.read)
+        except FileNotFoundError:
+            logger.error(f"文件不存在: {file_path}")
+            return False
+        
+        filename = os.path.basename(file_path)
+        payload = self._build_payload(content, username, avatar_url)
+        
         for attempt in range(max_retries):
             try:
-                await self.rate_limiter.acquire()
-                
-                webhook = DiscordWebhook(
-                    url=webhook_url,
-                    content=content,
-                    username=username or "KOOK消息转发",
-                    avatar_url=avatar_url
+                # 429限流由客户端按Retry-After处理
+                status, text = await self.client.execute(
+                    webhook_url, payload, files=[(filename, file_data)]
                 )
                 
-                with open(file_path, "rb") as f:
-                    file_data = f.read()
-                    filename = file_path.split('/')[-1]
-                    webhook.add_file(file=file_data, filename=filename)
-                
-                response = webhook.execute()
-                
-                if response.status_code in [200, 204]:
+                if status in [200, 204]:
                     logger.info(f"Discord文件发送成功: {file_path}")
                     return True
-                elif response.status_code == 429:
-                    # 限流，等待后重试
-                    retry_after = int(response.headers.get('Retry-After', retry_delay))
-                    logger.warning(f"Discord API限流，等待{retry_after}秒后重试...")
-                    await asyncio.sleep(retry_after)
+                
+                logger.error(f"Discord文件发送失败: {status} - {text}")
+                if attempt < max_retries - 1:
+                    await asyncio.sleep(retry_delay)
                     continue
-                else:
-                    logger.error(f"Discord文件发送失败: {response.status_code} - {response.text}")
-                    if attempt < max_retries - 1:
-                        await asyncio.sleep(retry_delay)
-                        continue
-                    return False
-                    
-            except FileNotFoundError:
-                logger.error(f"文件不存在: {file_path}")
                 return False
+                    
             except Exception as e:
+                self.client.stats['errors'] += 1
                 logger.error(f"Discord文件发送异常: {str(e)}")
                 if attempt < max_retries - 1:
                     await asyncio.sleep(retry_delay)
@@ -211,17 +368,15 @@ class DiscordForwarder:
             (是否成功, 消息)
         """
         try:
-            webhook = DiscordWebhook(
-                url=webhook_url,
-                content="✅ KOOK消息转发系统测试消息\n\n如果您看到这条消息，说明Webhook配置成功！"
+            status, _ = await self.client.execute(
+                webhook_url,
+                {'content': "✅ KOOK消息转发系统测试消息\n\n如果您看到这条消息，说明Webhook配置成功！"}
             )
             
-            response = webhook.execute()
-            
-            if response.status_code in [200, 204]:
+            if status in [200, 204]:
                 return True, "测试成功！"
             else:
-                return False, f"测试失败: HTTP {response.status_code}"
+                return False, f"测试失败: HTTP {status}"
                 
         except Exception as e:
             return False, f"测试失败: {str(e)}"
@@ -6,21 +6,46 @@ import asyncio
 from typing import Dict, Any, Optional
 from ..utils.rate_limiter import rate_limiter_manager
 from ..utils.logger import logger
+from ..utils.http_client import http_client_manager
 from ..config import settings
 from ..processors.formatter import formatter
 
 
+# 飞书频率限制错误码（请求过于频繁）
+FEISHU_RATE_LIMIT_CODES = {99991400}
+
+
 class FeishuForwarder:
     """飞书消息转发器"""
     
     def __init__(self):
-        self.rate_limiter = rate_limiter_manager.get_limiter(
+        # 每个应用单独限流（频率限制时按x-ogw-ratelimit-reset自适应降速）
+        self.rate_limiter = rate_limiter_manager.get_adaptive_limiter(
             "feishu",
             settings.feishu_rate_limit_calls,
             settings.feishu_rate_limit_period
         )
         self.access_tokens = {}  # 缓存access_token
     
+    def _record_response(self, app_id: str, response: aiohttp.ClientResponse, data: Dict[str, Any]):
+        """
+        把发送结果反馈给限流器
+        
+        Args:
+            app_id: App ID
+            response: HTTP响应
+            data: 响应体
+        """
+        if response.status == 429 or data.get("code") in FEISHU_RATE_LIMIT_CODES:
+            try:
+                retry_after = float(response.headers.get('x-ogw-ratelimit-reset', 1))
+            except ValueError:
+                retry_after = 1.0
+            self.rate_limiter.on_rate_limited(app_id, retry_after)
+            logger.warning(f"飞书API频率限制，{retry_after:.0f}秒内暂停发送")
+        elif data.get("code") == 0:
+            self.rate_limiter.on_response(app_id)
+    
     async def get_access_token(self, app_id: str, app_secret: str) -> Optional[str]:
         """
         获取飞书访问令牌
@@ -38,24 +63,24 @@ class FeishuForwarder:
             return self.access_tokens[cache_key]
         
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    "https://open.feishu.cn/open-apis/auth/v3/tenant_access_token/internal",
-                    json={
-                        "app_id": app_id,
-                        "app_secret": app_secret
-                    }
-                ) as response:
-                    data = await response.json()
+            session = await http_client_manager.get_session('default')
+            async with session.post(
+                "https://open.feishu.cn/open-apis/auth/v3/tenant_access_token/internal",
+                json={
+                    "app_id": app_id,
+                    "app_secret": app_secret
+                }
+            ) as response:
+                data = await response.json()
+                
+                if data.get("code") == 0:
+                    token = data.get("tenant_access_token")
+                    self.access_tokens[cache_key] = token
+                    return token
+                else:
+                    logger.error(f"获取飞书令牌失败: {data}")
+                    return None
                     
-                    if data.get("code") == 0:
-                        token = data.get("tenant_access_token")
-                        self.access_tokens[cache_key] = token
-                        return token
-                    else:
-                        logger.error(f"获取飞书令牌失败: {data}")
-                        return None
-                        
         except Exception as e:
             logger.error(f"获取飞书令牌异常: {str(e)}")
             return None
@@ -78,7 +103,7 @@ class FeishuForwarder:
         """
         try:
             # 应用限流
-            await self.rate_limiter.acquire()
+            await self.rate_limiter.acquire(app_id)
             
             # 获取访问令牌
             access_token = await self.get_access_token(app_id, app_secret)
@@ -107,28 +132,29 @@ class FeishuForwarder:
                     }
                 }
             
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    f"https://open.feishu.cn/open-apis/im/v1/messages",
-                    headers={
-                        "Authorization": f"Bearer {access_token}",
-                        "Content-Type": "application/json"
-                    },
-                    json={
-                        "receive_id": chat_id,
-                        "receive_id_type": "chat_id",
-                        **message
-                    }
-                ) as response:
-                    data = await response.json()
+            session = await http_client_manager.get_session('default')
+            async with session.post(
+                f"https://open.feishu.cn/open-apis/im/v1/messages",
+                headers={
+                    "Authorization": f"Bearer {access_token}",
+                    "Content-Type": "application/json"
+                },
+                json={
+                    "receive_id": chat_id,
+                    "receive_id_type": "chat_id",
+                    **message
+                }
+            ) as response:
+                data = await response.json()
+                self._record_response(app_id, response, data)
+                
+                if data.get("code") == 0:
+                    logger.info("飞书消息发送成功")
+                    return True
+                else:
+                    logger.error(f"飞书消息发送失败: {data}")
+                    return False
                     
-                    if data.get("code") == 0:
-                        logger.info("飞书消息发送成功")
-                        return True
-                    else:
-                        logger.error(f"飞书消息发送失败: {data}")
-                        return False
-                        
         except Exception as e:
             logger.error(f"飞书发送异常: {str(e)}")
             return False
@@ -154,31 +180,31 @@ class FeishuForwarder:
             import os
             file_name = os.path.basename(image_path)
             
-            async with aiohttp.ClientSession() as session:
-                with open(image_path, 'rb') as f:
-                    # 准备表单数据
-                    form = aiohttp.FormData()
-                    form.add_field('image_type', 'message')
-                    form.add_field('image', f, filename=file_name, content_type='image/jpeg')
+            session = await http_client_manager.get_session('default')
+            with open(image_path, 'rb') as f:
+                # 准备表单数据
+                form = aiohttp.FormData()
+                form.add_field('image_type', 'message')
+                form.add_field('image', f, filename=file_name, content_type='image/jpeg')
+                
+                # 上传图片
+                async with session.post(
+                    "https://open.feishu.cn/open-apis/im/v1/images",
+                    headers={
+                        "Authorization": f"Bearer {access_token}"
+                    },
+                    data=form
+                ) as response:
+                    data = await response.json()
                     
-                    # 上传图片
-                    async with session.post(
-                        "https://open.feishu.cn/open-apis/im/v1/images",
-                        headers={
-                            "Authorization": f"Bearer {access_token}"
-                        },
-                        data=form
-                    ) as response:
-                        data = await response.json()
+                    if data.get("code") == 0:
+                        img_key = data.get("data", {}).get("image_key")
+                        logger.info(f"飞书图片上传成功: {img_key}")
+                        return img_key
+                    else:
+                        logger.error(f"飞书图片上传失败: {data}")
+                        return None
                         
-                        if data.get("code") == 0:
-                            img_key = data.get("data", {}).get("image_key")
-                            logger.info(f"飞书图片上传成功: {img_key}")
-                            return img_key
-                        else:
-                            logger.error(f"飞书图片上传失败: {data}")
-                            return None
-                            
         except Exception as e:
             logger.error(f"飞书图片上传异常: {str(e)}")
             return None
@@ -200,7 +226,7 @@ class FeishuForwarder:
             是否成功
         """
         try:
-            await self.rate_limiter.acquire()
+            await self.rate_limiter.acquire(app_id)
             
             access_token = await self.get_access_token(app_id, app_secret)
             if not access_token:
@@ -220,34 +246,35 @@ class FeishuForwarder:
                 }
             }
             
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    f"https://open.feishu.cn/open-apis/im/v1/messages",
-                    headers={
-                        "Authorization": f"Bearer {access_token}",
-                        "Content-Type": "application/json"
-                    },
-                    json={
-                        "receive_id": chat_id,
-                        "receive_id_type": "chat_id",
-                        **message
-                    }
-                ) as response:
-                    data = await response.json()
+            session = await http_client_manager.get_session('default')
+            async with session.post(
+                f"https://open.feishu.cn/open-apis/im/v1/messages",
+                headers={
+                    "Authorization": f"Bearer {access_token}",
+                    "Content-Type": "application/json"
+                },
+                json={
+                    "receive_id": chat_id,
+                    "receive_id_type": "chat_id",
+                    **message
+                }
+            ) as response:
+                data = await response.json()
+                self._record_response(app_id, response, data)
+                
+                if data.get("code") == 0:
+                    logger.info("飞书图片发送成功")
+                    
+                    # 如果有说明文字，再发送一条文本消息
+                    if caption:
+                        await asyncio.sleep(0.5)  # 稍微延迟
+                        await self.send_message(app_id, app_secret, chat_id, caption)
+                    
+                    return True
+                else:
+                    logger.error(f"飞书图片发送失败: {data}")
+                    return False
                     
-                    if data.get("code") == 0:
-                        logger.info("飞书图片发送成功")
-                        
-                        # 如果有说明文字，再发送一条文本消息
-                        if caption:
-                            await asyncio.sleep(0.5)  # 稍微延迟
-                            await self.send_message(app_id, app_secret, chat_id, caption)
-                        
-                        return True
-                    else:
-                        logger.error(f"飞书图片发送失败: {data}")
-                        return False
-                        
         except Exception as e:
             logger.error(f"飞书图片发送异常: {str(e)}")
             return False
@@ -276,14 +303,14 @@ class FeishuForwarder:
             temp_dir = tempfile.gettempdir()
             temp_file = os.path.join(temp_dir, f"feishu_image_{id(self)}.jpg")
             
-            async with aiohttp.ClientSession() as session:
-                async with session.get(image_url) as response:
-                    if response.status == 200:
-                        with open(temp_file, 'wb') as f:
-                            f.write(await response.read())
-                    else:
-                        logger.error(f"下载图片失败: {response.status}")
-                        return False
+            session = await http_client_manager.get_session('default')
+            async with session.get(image_url) as response:
+                if response.status == 200:
+                    with open(temp_file, 'wb') as f:
+                        f.write(await response.read())
+                else:
+                    logger.error(f"下载图片失败: {response.status}")
+                    return False
             
             # 2. 上传并发送
             success = await self.send_image(app_id, app_secret, chat_id, temp_file, caption)
@@ -317,7 +344,7 @@ class FeishuForwarder:
             是否成功
         """
         try:
-            await self.rate_limiter.acquire()
+            await self.rate_limiter.acquire(app_id)
             
             access_token = await self.get_access_token(app_id, app_secret)
             if not access_token:
@@ -327,32 +354,32 @@ class FeishuForwarder:
             file_name = file_name or os.path.basename(file_path)
             
             # 1. 上传文件获取file_key
-            async with aiohttp.ClientSession() as session:
-                # 准备文件上传
-                with open(file_path, 'rb') as f:
-                    form = aiohttp.FormData()
-                    form.add_field('file_type', 'stream')
-                    form.add_field('file_name', file_name)
-                    form.add_field('file', f, filename=file_name)
+            session = await http_client_manager.get_session('default')
+            # 准备文件上传
+            with open(file_path, 'rb') as f:
+                form = aiohttp.FormData()
+                form.add_field('file_type', 'stream')
+                form.add_field('file_name', file_name)
+                form.add_field('file', f, filename=file_name)
+                
+                # 上传文件
+                async with session.post(
+                    "https://open.feishu.cn/open-apis/im/v1/files",
+                    headers={
+                        "Authorization": f"Bearer {access_token}"
+                    },
+                    data=form
+                ) as response:
+                    data = await response.json()
                     
-                    # 上传文件
-                    async with session.post(
-                        "https://open.feishu.cn/open-apis/im/v1/files",
-                        headers={
-                            "Authorization": f"Bearer {access_token}"
-                        },
-                        data=form
-                    ) as response:
-                        data = await response.json()
-                        
-                        if data.get("code") != 0:
-                            logger.error(f"飞书文件上传失败: {data}")
-                            return False
-                        
-                        file_key = data.get("data", {}).get("file_key")
-                        if not file_key:
-                            logger.error("飞书文件上传未返回file_key")
-                            return False
+                    if data.get("code") != 0:
+                        logger.error(f"飞书文件上传失败: {data}")
+                        return False
+                    
+                    file_key = data.get("data", {}).get("file_key")
+                    if not file_key:
+                        logger.error("飞书文件上传未返回file_key")
+                        return False
             
             # 2. 发送文件消息
             message = {
@@ -362,28 +389,29 @@ class FeishuForwarder:
                 }
             }
             
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    f"https://open.feishu.cn/open-apis/im/v1/messages",
-                    headers={
-                        "Authorization": f"Bearer {access_token}",
-                        "Content-Type": "application/json"
-                    },
-                    json={
-                        "receive_id": chat_id,
-                        "receive_id_type": "chat_id",
-                        **message
-                    }
-                ) as response:
-                    data = await response.json()
+            session = await http_client_manager.get_session('default')
+            async with session.post(
+                f"https://open.feishu.cn/open-apis/im/v1/messages",
+                headers={
+                    "Authorization": f"Bearer {access_token}",
+                    "Content-Type": "application/json"
+                },
+                json={
+                    "receive_id": chat_id,
+                    "receive_id_type": "chat_id",
+                    **message
+                }
+            ) as response:
+                data = await response.json()
+                self._record_response(app_id, response, data)
+                
+                if data.get("code") == 0:
+                    logger.info(f"飞书文件发送成功: {file_name}")
+                    return True
+                else:
+                    logger.error(f"飞书文件消息发送失败: {data}")
+                    return False
                     
-                    if data.get("code") == 0:
-                        logger.info(f"飞书文件发送成功: {file_name}")
-                        return True
-                    else:
-                        logger.error(f"飞书文件消息发送失败: {data}")
-                        return False
-                        
         except Exception as e:
             logger.error(f"飞书文件发送异常: {str(e)}")
             return False
@@ -403,7 +431,7 @@ class FeishuForwarder:
             是否成功
         """
         try:
-            await self.rate_limiter.acquire()
+            await self.rate_limiter.acquire(app_id)
             
             access_token = await self.get_access_token(app_id, app_secret)
             if not access_token:
@@ -414,28 +442,29 @@ class FeishuForwarder:
                 "content": card_content
             }
             
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    f"https://open.feishu.cn/open-apis/im/v1/messages",
-                    headers={
-                        "Authorization": f"Bearer {access_token}",
-                        "Content-Type": "application/json"
-                    },
-                    json={
-                        "receive_id": chat_id,
-                        "receive_id_type": "chat_id",
-                        **message
-                    }
-                ) as response:
-                    data = await response.json()
+            session = await http_client_manager.get_session('default')
+            async with session.post(
+                f"https://open.feishu.cn/open-apis/im/v1/messages",
+                headers={
+                    "Authorization": f"Bearer {access_token}",
+                    "Content-Type": "application/json"
+                },
+                json={
+                    "receive_id": chat_id,
+                    "receive_id_type": "chat_id",
+                    **message
+                }
+            ) as response:
+                data = await response.json()
+                self._record_response(app_id, response, data)
+                
+                if data.get("code") == 0:
+                    logger.info("飞书卡片发送成功")
+                    return True
+                else:
+                    logger.error(f"飞书卡片发送失败: {data}")
+                    return False
                     
-                    if data.get("code") == 0:
-                        logger.info("飞书卡片发送成功")
-                        return True
-                    else:
-                        logger.error(f"飞书卡片发送失败: {data}")
-                        return False
-                        
         except Exception as e:
             logger.error(f"飞书卡片发送异常: {str(e)}")
             return False
@@ -4,7 +4,7 @@ Telegram转发模块
 import asyncio
 from typing import Optional
 from telegram import Bot
-from telegram.error import TelegramError
+from telegram.error import TelegramError, RetryAfter
 from ..utils.rate_limiter import rate_limiter_manager
 from ..utils.logger import logger
 from ..config import settings
@@ -15,13 +15,52 @@ class TelegramForwarder:
     """Telegram消息转发器"""
     
     def __init__(self):
-        self.rate_limiter = rate_limiter_manager.get_limiter(
+        # 每个Bot单独限流，每个聊天另有更严格的限流（429时按retry_after自适应降速）
+        self.rate_limiter = rate_limiter_manager.get_adaptive_limiter(
             "telegram",
             settings.telegram_rate_limit_calls,
             settings.telegram_rate_limit_period
         )
+        self.chat_rate_limiter = rate_limiter_manager.get_adaptive_limiter(
+            "telegram_chat",
+            settings.telegram_chat_rate_limit_calls,
+            settings.telegram_chat_rate_limit_period
+        )
         self.bots = {}  # 缓存Bot实例
     
+    async def _acquire(self, token: str, chat_id: str):
+        """
+        获取发送许可
+        
+        先等聊天的额度（等待时间更长），再占用Bot的额度，
+        避免在聊天限流期间白白占着Bot的令牌
+        """
+        await self.chat_rate_limiter.acquire(f"{token}:{chat_id}")
+        await self.rate_limiter.acquire(token)
+    
+    def _on_sent(self, token: str, chat_id: str):
+        """记录一次成功发送（持续成功时逐步恢复速率）"""
+        self.chat_rate_limiter.on_response(f"{token}:{chat_id}")
+        self.rate_limiter.on_response(token)
+    
+    def _on_retry_after(self, token: str, chat_id: str, error: RetryAfter) -> float:
+        """
+        记录一次429（Flood control）
+        
+        Telegram的限流主要针对单个聊天，等待时间记在聊天上，
+        之后对该聊天的发送会先等待retry_after并降低速率
+        
+        Returns:
+            平台要求等待的秒数
+        """
+        retry_after = error.retry_after
+        if hasattr(retry_after, 'total_seconds'):
+            retry_after = retry_after.total_seconds()
+        retry_after = float(retry_after)
+        
+        self.chat_rate_limiter.on_rate_limited(f"{token}:{chat_id}", retry_after)
+        return retry_after
+    
     def get_bot(self, token: str) -> Bot:
         """获取Bot实例"""
         if token not in self.bots:
@@ -36,7 +75,7 @@ class TelegramForwarder:
         Args:
             token: Bot Token
             chat_id: 聊天ID
-            content: 消息内容
+            content: 消息内容（HTML模式下为已转换好的HTML，见 formatter.kmarkdown_to_telegram_html）
             parse_mode: 解析模式（HTML/Markdown）
             
         Returns:
@@ -44,16 +83,16 @@ class TelegramForwarder:
         """
         try:
             # 应用限流
-            await self.rate_limiter.acquire()
+            await self._acquire(token, chat_id)
             
             bot = self.get_bot(token)
             
-            # 转换为HTML格式
-            if parse_mode == "HTML":
-                content = formatter.kmarkdown_to_telegram_html(content)
-            
-            # Telegram单条消息最多4096字符
-            messages = formatter.split_long_message(content, 4096)
+            # Telegram单条消息最多4096字符（按实体解析后的UTF-16长度计算）
+            # 调用方通常已用 formatter.split_message 分好段，这里只兜底处理仍超长的内容
+            if formatter.message_length(content, 'telegram') <= 4096:
+                messages = [content]
+            else:
+                messages = formatter.split_long_message(content, 4096)
             
             for msg in messages:
                 await bot.send_message(
@@ -66,9 +105,14 @@ class TelegramForwarder:
                 if len(messages) > 1:
                     await asyncio.sleep(0.3)
             
+            self._on_sent(token, chat_id)
             logger.info(f"Telegram消息发送成功: {len(messages)}条")
             return True
             
+        except RetryAfter as e:
+            retry_after = self._on_retry_after(token, chat_id, e)
+            logger.warning(f"Telegram API限流，{retry_after:.0f}秒内暂停向该聊天发送")
+            return False
         except TelegramError as e:
             logger.error(f"Telegram发送失败: {str(e)}")
             return False
@@ -97,7 +141,7 @@ class TelegramForwarder:
         
         for attempt in range(max_retries):
             try:
-                await self.rate_limiter.acquire()
+                await self._acquire(token, chat_id)
                 
                 bot = self.get_bot(token)
                 
@@ -112,19 +156,20 @@ class TelegramForwarder:
                     parse_mode=parse_mode
                 )
                 
+                self._on_sent(token, chat_id)
                 logger.info(f"Telegram图片发送成功")
                 return True
                 
+            except RetryAfter as e:
+                # 限流错误，下一次获取许可时等待retry_after后重试
+                retry_after = self._on_retry_after(token, chat_id, e)
+                logger.warning(f"Telegram API限流，等待{retry_after:.0f}秒后重试...")
+                continue
             except TelegramError as e:
                 error_msg = str(e)
                 
                 # 判断错误类型
-                if 'flood' in error_msg.lower() or 'too many requests' in error_msg.lower():
-                    # 限流错误，等待后重试
-                    logger.warning(f"Telegram API限流，等待{retry_delay * 2}秒后重试...")
-                    await asyncio.sleep(retry_delay * 2)
-                    continue
-                elif 'wrong file identifier' in error_msg.lower() or 'file_id' in error_msg.lower():
+                if 'wrong file identifier' in error_msg.lower() or 'file_id' in error_msg.lower():
                     # 图片URL无效，不重试
                     logger.error(f"Telegram图片URL无效: {photo_url}")
                     return False
@@ -162,7 +207,7 @@ class TelegramForwarder:
             是否成功
         """
         try:
-            await self.rate_limiter.acquire()
+            await self._acquire(token, chat_id)
             
             bot = self.get_bot(token)
             
@@ -182,9 +227,14 @@ class TelegramForwarder:
                 parse_mode="HTML"
             )
             
+            self._on_sent(token, chat_id)
             logger.info(f"Telegram图片上传成功（直传模式）")
             return True
             
+        except RetryAfter as e:
+            retry_after = self._on_retry_after(token, chat_id, e)
+            logger.warning(f"Telegram API限流，{retry_after:.0f}秒内暂停向该聊天发送")
+            return False
         except TelegramError as e:
             logger.error(f"Telegram图片直传失败: {str(e)}")
             return False
@@ -211,7 +261,7 @@ class TelegramForwarder:
         
         for attempt in range(max_retries):
             try:
-                await self.rate_limiter.acquire()
+                await self._acquire(token, chat_id)
                 
                 bot = self.get_bot(token)
                 
@@ -227,26 +277,23 @@ class TelegramForwarder:
                         parse_mode="HTML"
                     )
                 
+                self._on_sent(token, chat_id)
                 logger.info(f"Telegram文件发送成功: {document_path}")
                 return True
                 
             except FileNotFoundError:
                 logger.error(f"文件不存在: {document_path}")
                 return False
+            except RetryAfter as e:
+                retry_after = self._on_retry_after(token, chat_id, e)
+                logger.warning(f"Telegram API限流，等待{retry_after:.0f}秒后重试...")
+                continue
             except TelegramError as e:
-                error_msg = str(e)
-                
-                # 判断错误类型
-                if 'flood' in error_msg.lower() or 'too many requests' in error_msg.lower():
-                    logger.warning(f"Telegram API限流，等待{retry_delay * 2}秒后重试...")
-                    await asyncio.sleep(retry_delay * 2)
+                logger.error(f"Telegram文件发送失败: {str(e)}")
+                if attempt < max_retries - 1:
+                    await asyncio.sleep(retry_delay)
                     continue
-                else:
-                    logger.error(f"Telegram文件发送失败: {error_msg}")
-                    if attempt < max_retries - 1:
-                        await asyncio.sleep(retry_delay)
-                        continue
-                    return False
+                return False
                     
             except Exception as e:
                 logger.error(f"Telegram文件发送异常: {str(e)}")
@@ -7,6 +7,7 @@ import asyncio
 from typing import Dict, Any, Optional, List
 from ..utils.rate_limiter import rate_limiter_manager
 from ..utils.logger import logger
+from ..utils.http_client import http_client_manager
 from ..config import settings
 from ..processors.formatter import formatter
 
@@ -97,17 +98,17 @@ class WechatWorkForwarder:
                 message["text"]["mentioned_list"] = mentioned_list or []
                 message["text"]["mentioned_mobile_list"] = mentioned_mobile_list or []
             
-            async with aiohttp.ClientSession() as session:
-                async with session.post(webhook_url, json=message) as response:
-                    data = await response.json()
+            session = await http_client_manager.get_session('default')
+            async with session.post(webhook_url, json=message) as response:
+                data = await response.json()
+                
+                if data.get('errcode') == 0:
+                    logger.info("企业微信消息发送成功")
+                    return True
+                else:
+                    logger.error(f"企业微信发送失败: {data.get('errmsg')}")
+                    return False
                     
-                    if data.get('errcode') == 0:
-                        logger.info("企业微信消息发送成功")
-                        return True
-                    else:
-                        logger.error(f"企业微信发送失败: {data.get('errmsg')}")
-                        return False
-                        
         except Exception as e:
             logger.error(f"企业微信发送异常: {str(e)}")
             return False
@@ -133,17 +134,17 @@ class WechatWorkForwarder:
                 }
             }
             
-            async with aiohttp.ClientSession() as session:
-                async with session.post(webhook_url, json=message) as response:
-                    data = await response.json()
+            session = await http_client_manager.get_session('default')
+            async with session.post(webhook_url, json=message) as response:
+                data = await response.json()
+                
+                if data.get('errcode') == 0:
+                    logger.info("企业微信Markdown消息发送成功")
+                    return True
+                else:
+                    logger.error(f"企业微信Markdown发送失败: {data.get('errmsg')}")
+                    return False
                     
-                    if data.get('errcode') == 0:
-                        logger.info("企业微信Markdown消息发送成功")
-                        return True
-                    else:
-                        logger.error(f"企业微信Markdown发送失败: {data.get('errmsg')}")
-                        return False
-                        
         except Exception as e:
             logger.error(f"企业微信Markdown发送异常: {str(e)}")
             return False
@@ -182,17 +183,17 @@ class WechatWorkForwarder:
                 }
             }
             
-            async with aiohttp.ClientSession() as session:
-                async with session.post(webhook_url, json=message) as response:
-                    data = await response.json()
+            session = await http_client_manager.get_session('default')
+            async with session.post(webhook_url, json=message) as response:
+                data = await response.json()
+                
+                if data.get('errcode') == 0:
+                    logger.info("企业微信图片消息发送成功")
+                    return True
+                else:
+                    logger.error(f"企业微信图片发送失败: {data.get('errmsg')}")
+                    return False
                     
-                    if data.get('errcode') == 0:
-                        logger.info("企业微信图片消息发送成功")
-                        return True
-                    else:
-                        logger.error(f"企业微信图片发送失败: {data.get('errmsg')}")
-                        return False
-                        
         except Exception as e:
             logger.error(f"企业微信图片发送异常: {str(e)}")
             return False
@@ -228,17 +229,17 @@ class WechatWorkForwarder:
                 }
             }
             
-            async with aiohttp.ClientSession() as session:
-                async with session.post(webhook_url, json=message) as response:
-                    data = await response.json()
+            session = await http_client_manager.get_session('default')
+            async with session.post(webhook_url, json=message) as response:
+                data = await response.json()
+                
+                if data.get('errcode') == 0:
+                    logger.info("企业微信文件链接发送成功")
+                    return True
+                else:
+                    logger.error(f"企业微信文件发送失败: {data.get('errmsg')}")
+                    return False
                     
-                    if data.get('errcode') == 0:
-                        logger.info("企业微信文件链接发送成功")
-                        return True
-                    else:
-                        logger.error(f"企业微信文件发送失败: {data.get('errmsg')}")
-                        return False
-                        
         except Exception as e:
             logger.error(f"企业微信文件发送异常: {str(e)}")
             return False
@@ -261,15 +262,15 @@ class WechatWorkForwarder:
                 }
             }
             
-            async with aiohttp.ClientSession() as session:
-                async with session.post(webhook_url, json=message, timeout=aiohttp.ClientTimeout(total=10)) as response:
-                    data = await response.json()
+            session = await http_client_manager.get_session('default')
+            async with session.post(webhook_url, json=message, timeout=aiohttp.ClientTimeout(total=10)) as response:
+                data = await response.json()
+                
+                if data.get('errcode') == 0:
+                    return True, "测试成功！"
+                else:
+                    return False, f"测试失败: {data.get('errmsg', '未知错误')}"
                     
-                    if data.get('errcode') == 0:
-                        return True, "测试成功！"
-                    else:
-                        return False, f"测试失败: {data.get('errmsg', '未知错误')}"
-                        
         except asyncio.TimeoutError:
             return False, "测试失败: 连接超时"
         except Exception as e:
@@ -24,6 +24,7 @@ from .api import email_api
 # ✅ P0-4新增: 文件安全API
 from .api import file_security_api
 from .api import performance  # v1.12.0 性能监控API
+from .api import queue_monitor
 # ✅ v6.0.0新增: Cookie导入增强版API
 from .api import cookie_import_enhanced
 # ✅ P0-2深度优化: 配置向导测试API
@@ -44,6 +45,8 @@ from .api import settings as settings_api
 from .middleware.auth_middleware import APIAuthMiddleware  # ✅ P2-5优化
 from .queue.redis_client import redis_queue
 from .queue.worker import message_worker
+from .queue.worker_pool import worker_pool
+from .queue.routing import routing_table
 from .queue.retry_worker import retry_worker
 from .utils.logger import logger
 from .utils.captcha_solver import init_captcha_solver
@@ -52,8 +55,13 @@ from .utils.scheduler import setup_scheduled_tasks, shutdown_scheduled_tasks
 from .utils.health import health_checker
 from .utils.update_checker import update_checker
 from .utils.redis_manager_enhanced import redis_manager  # v1.8.1使用增强版
+from .utils.http_client import http_client_manager
 from .config import settings
 from .database import db
+from .database_async import async_db
+from .utils.batch_writer import batch_writer_manager
+from .utils.cache import init_cache, shutdown_cache
+from .utils.rate_limiter import rate_limiter_manager
 import asyncio
 import json
 from pathlib import Path
@@ -103,10 +111,34 @@ async def lifespan(app: FastAPI):
         await redis_queue.connect()
         logger.info("✅ Redis连接成功")
         
-        # 启动Worker
-        worker_task = asyncio.create_task(message_worker.start())
-        background_tasks.append(worker_task)
-        logger.info("✅ 消息处理Worker已启动")
+        # 订阅路由表失效通知（多进程Worker间同步映射变更）
+        await routing_table.start(redis_queue.redis)
+        
+        # 配置了Redis限流后端时，多个Worker进程共享每个Webhook/Bot的额度
+        rate_limiter_manager.use_redis(redis_queue.redis)
+        
+        # 初始化两级缓存（内存L1 + Redis L2）
+        await init_cache()
+        
+        # 初始化异步数据库连接池（转发路径使用，1个写连接+N个只读连接）
+        await async_db.connect()
+        logger.info("✅ 异步数据库连接池已就绪")
+        
+        # 启动批量写入器（消息日志组提交）
+        await batch_writer_manager.start_all()
+        
+        # 启动全局HTTP连接池（下载器和转发器共享）
+        await http_client_manager.start()
+        logger.info("✅ HTTP连接池已启动")
+        
+        # 启动Worker（配置了worker_processes时使用多进程Worker池）
+        if worker_pool.enabled:
+            await worker_pool.start()
+            logger.info(f"✅ 多进程Worker池已启动（{worker_pool.processes}个进程）")
+        else:
+            worker_task = asyncio.create_task(message_worker.start())
+            background_tasks.append(worker_task)
+            logger.info("✅ 消息处理Worker已启动")
         
         # 启动重试Worker
         retry_task = asyncio.create_task(retry_worker.start())
@@ -161,6 +193,7 @@ async def lifespan(app: FastAPI):
         
         # 停止Worker
         await message_worker.stop()
+        await worker_pool.stop()
         logger.info("✅ 消息处理Worker已停止")
         
         # 停止重试Worker
@@ -176,10 +209,28 @@ async def lifespan(app: FastAPI):
                 pass
         logger.info("✅ 后台任务已停止")
         
+        # 提交批量写入器中剩余的记录（需在关闭数据库之前）
+        await batch_writer_manager.stop_all()
+        logger.info("✅ 批量写入器已刷新")
+        
+        # 停止路由表订阅
+        await routing_table.stop()
+        
+        # 关闭缓存（停止内存缓存清理任务，断开Redis）
+        await shutdown_cache()
+        
         # 断开Redis
         await redis_queue.disconnect()
         logger.info("✅ Redis连接已关闭")
         
+        # 关闭HTTP连接池
+        await http_client_manager.close()
+        logger.info("✅ HTTP连接池已关闭")
+        
+        # 关闭异步数据库连接池
+        await async_db.disconnect()
+        logger.info("✅ 异步数据库连接池已关闭")
+        
         # 停止Token清理任务
         from .processors.image import image_processor
         image_processor.stop_cleanup_task()
@@ -257,6 +308,7 @@ from .api import update_checker_enhanced
 app.include_router(update_checker_enhanced.router)  # 更新检查增强 🆕 P2-2优化
 app.include_router(selectors.router)  # 选择器配置
 app.include_router(performance.router)  # 性能监控 🆕 v1.12.0
+app.include_router(queue_monitor.router)  # 队列监控（含各Worker进程统计）
 app.include_router(telegram_helper.router)  # Telegram辅助工具 🆕 v1.15.0
 app.include_router(cookie_import.router)  # Cookie导入 🆕 P0-2优化
 app.include_router(environment.router)  # 环境检查 🆕 P0-5优化
@@ -1,12 +1,14 @@
 """
 高级限流器
 ✅ P1-8: API限流增强（令牌桶、滑动窗口）
+
+令牌桶和滑动窗口使用 utils.rate_limiter 中的统一实现
 """
 import asyncio
 import time
 from typing import Dict, Optional
-from collections import deque
 from dataclasses import dataclass
+from ..utils.rate_limiter import TokenBucket, RateLimiter
 from ..utils.logger import logger
 
 
@@ -18,102 +20,6 @@ class RateLimitRule:
     burst: int = 0      # 突发容量（令牌桶）
 
 
-class TokenBucket:
-    """令牌桶算法"""
-    
-    def __init__(self, capacity: int, refill_rate: float):
-        """
-        初始化令牌桶
-        
-        Args:
-            capacity: 桶容量
-            refill_rate: 令牌填充速率（个/秒）
-        """
-        self.capacity = capacity
-        self.refill_rate = refill_rate
-        self.tokens = capacity
-        self.last_refill = time.time()
-        self.lock = asyncio.Lock()
-    
-    async def acquire(self, tokens: int = 1) -> bool:
-        """
-        获取令牌
-        
-        Args:
-            tokens: 需要的令牌数
-            
-        Returns:
-            是否成功获取
-        """
-        async with self.lock:
-            # 填充令牌
-            now = time.time()
-            elapsed = now - self.last_refill
-            new_tokens = elapsed * self.refill_rate
-            
-            self.tokens = min(self.capacity, self.tokens + new_tokens)
-            self.last_refill = now
-            
-            # 检查是否有足够令牌
-            if self.tokens >= tokens:
-                self.tokens -= tokens
-                return True
-            else:
-                return False
-    
-    def get_tokens(self) -> float:
-        """获取当前令牌数"""
-        return self.tokens
-
-
-class SlidingWindowCounter:
-    """滑动窗口计数器"""
-    
-    def __init__(self, window_size: int, max_requests: int):
-        """
-        初始化滑动窗口
-        
-        Args:
-            window_size: 窗口大小（秒）
-            max_requests: 最大请求数
-        """
-        self.window_size = window_size
-        self.max_requests = max_requests
-        self.requests = deque()
-        self.lock = asyncio.Lock()
-    
-    async def allow_request(self) -> bool:
-        """
-        检查是否允许请求
-        
-        Returns:
-            是否允许
-        """
-        async with self.lock:
-            now = time.time()
-            
-            # 移除过期请求
-            while self.requests and self.requests[0] < now - self.window_size:
-                self.requests.popleft()
-            
-            # 检查请求数
-            if len(self.requests) < self.max_requests:
-                self.requests.append(now)
-                return True
-            else:
-                return False
-    
-    def get_request_count(self) -> int:
-        """获取当前窗口内的请求数"""
-        now = time.time()
-        
-        # 移除过期请求
-        while self.requests and self.requests[0] < now - self.window_size:
-            self.requests.popleft()
-        
-        return len(self.requests)
-
-
 class LeakyBucket:
     """漏桶算法"""
     
@@ -192,7 +98,7 @@ class AdvancedRateLimiter:
         max_requests: int
     ):
         """创建滑动窗口限流器"""
-        self.limiters[key] = SlidingWindowCounter(window_size, max_requests)
+        self.limiters[key] = RateLimiter(max_requests, window_size)
         logger.info(f"滑动窗口限流器已创建: {key}")
     
     def create_leaky_bucket(
@@ -226,9 +132,9 @@ class AdvancedRateLimiter:
         
         # 根据限流器类型调用不同方法
         if isinstance(limiter, TokenBucket):
-            allowed = await limiter.acquire(tokens)
-        elif isinstance(limiter, SlidingWindowCounter):
-            allowed = await limiter.allow_request()
+            allowed = limiter.try_acquire(tokens)
+        elif isinstance(limiter, RateLimiter):
+            allowed = limiter.try_acquire()
         elif isinstance(limiter, LeakyBucket):
             allowed = await limiter.add_water(tokens)
         else:
@@ -250,6 +156,16 @@ class AdvancedRateLimiter:
             key: 限流器键
             timeout: 超时时间（秒）
         """
+        limiter = self.limiters.get(key)
+        if isinstance(limiter, (TokenBucket, RateLimiter)):
+            # 令牌桶/滑动窗口按预订的时间点休眠，不轮询
+            if timeout and limiter.get_wait_time() > timeout:
+                return False
+            self.stats['total_requests'] += 1
+            self.stats['allowed_requests'] += 1
+            await limiter.acquire()
+            return True
+        
         start_time = time.time()
         
         while True:
@@ -273,16 +189,16 @@ class AdvancedRateLimiter:
         if isinstance(limiter, TokenBucket):
             return {
                 'type': 'token_bucket',
-                'tokens': limiter.get_tokens(),
+                'tokens': limiter.get_available_tokens(),
                 'capacity': limiter.capacity,
                 'refill_rate': limiter.refill_rate
             }
-        elif isinstance(limiter, SlidingWindowCounter):
+        elif isinstance(limiter, RateLimiter):
             return {
                 'type': 'sliding_window',
                 'request_count': limiter.get_request_count(),
-                'max_requests': limiter.max_requests,
-                'window_size': limiter.window_size
+                'max_requests': limiter.calls,
+                'window_size': limiter.period
             }
         elif isinstance(limiter, LeakyBucket):
             return {
@@ -1,13 +1,22 @@
 """
 插件系统
 ✅ P1-1: 可扩展的插件架构
+
+钩子执行:
+- 管道钩子（消息/图片处理前后、转发前）按注册顺序依次执行，前一个的返回值传给下一个
+- 观察者钩子（转发后、配置变更、启动/关闭）并发执行，互不等待
+- 每次调用有时间预算，超时或出错的插件被跳过；连续超时/出错的插件熔断一段时间
+- 按插件记录耗时直方图，见 /api/plugins/runtime/stats
 """
+import asyncio
 import importlib
 import inspect
+import time
 from pathlib import Path
-from typing import Dict, List, Optional, Callable, Any
+from typing import Dict, List, Optional, Callable, Any, Tuple
 from dataclasses import dataclass
 from abc import ABC, abstractmethod
+from ..config import settings
 from ..utils.logger import logger
 
 
@@ -42,11 +51,150 @@ class PluginHook:
     # 系统钩子
     ON_STARTUP = 'on_startup'
     ON_SHUTDOWN = 'on_shutdown'
+    
+    # 管道钩子：依次执行，回调返回修改后的对象（返回None表示不修改）
+    PIPELINE_HOOKS = {
+        BEFORE_MESSAGE_PROCESS,
+        AFTER_MESSAGE_PROCESS,
+        BEFORE_MESSAGE_FORWARD,
+        BEFORE_IMAGE_PROCESS,
+        AFTER_IMAGE_PROCESS,
+    }
+    
+    @classmethod
+    def is_pipeline(cls, hook_name: str) -> bool:
+        """是否为管道钩子（其余为并发执行的观察者钩子）"""
+        return hook_name in cls.PIPELINE_HOOKS
+
+
+# 耗时直方图分桶上界（毫秒）
+LATENCY_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+class HookLatencyStats:
+    """单个插件的钩子耗时统计（固定分桶直方图）"""
+    
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)  # 最后一个桶为 >5000ms
+        self.calls = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.timeouts = 0
+        self.errors = 0
+        self.skipped = 0  # 熔断期间跳过的调用
+    
+    def record(self, elapsed_ms: float):
+        """记录一次调用耗时"""
+        self.calls += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        
+        for index, bound in enumerate(LATENCY_BUCKETS_MS):
+            if elapsed_ms <= bound:
+                self.buckets[index] += 1
+                return
+        self.buckets[-1] += 1
+    
+    def percentile(self, q: float) -> Optional[float]:
+        """
+        估算分位数（返回所在桶的上界）
+        
+        Args:
+            q: 分位（0-1）
+            
+        Returns:
+            毫秒，没有调用时返回None
+        """
+        if not self.calls:
+            return None
+        
+        target = q * self.calls
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if seen >= target:
+                return float(LATENCY_BUCKETS_MS[index]) if index < len(LATENCY_BUCKETS_MS) else round(self.max_ms, 3)
+        return round(self.max_ms, 3)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        labels = [f"<={bound}ms" for bound in LATENCY_BUCKETS_MS] + [f">{LATENCY_BUCKETS_MS[-1]}ms"]
+        return {
+            'calls': self.calls,
+            'avg_ms': round(self.total_ms / self.calls, 3) if self.calls else 0.0,
+            'max_ms': round(self.max_ms, 3),
+            'p50_ms': self.percentile(0.5),
+            'p95_ms': self.percentile(0.95),
+            'p99_ms': self.percentile(0.99),
+            'timeouts': self.timeouts,
+            'errors': self.errors,
+            'skipped': self.skipped,
+            'histogram': dict(zip(labels, self.buckets))
+        }
+
+
+class PluginCircuitBreaker:
+    """
+    插件熔断器
+    
+    连续 threshold 次超时/出错后熔断，cooldown 秒内跳过该插件；
+    冷却结束后放行一次试探调用，成功则恢复，失败则继续熔断
+    """
+    
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.trips = 0
+    
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return 'half_open'
+        return 'open'
+    
+    def allow(self) -> bool:
+        """是否允许本次调用"""
+        state = self.state
+        if state == 'half_open':
+            # 只放行一次试探调用，结果出来前保持熔断
+            self.opened_at = time.monotonic()
+            return True
+        return state == 'closed'
+    
+    def record_success(self):
+        self.consecutive_failures = 0
+        self.opened_at = None
+    
+    def record_failure(self) -> bool:
+        """
+        记录一次超时/出错
+        
+        Returns:
+            是否因此进入熔断
+        """
+        self.consecutive_failures += 1
+        if self.consecutive_failures >= self.threshold:
+            tripped = self.opened_at is None
+            self.opened_at = time.monotonic()
+            if tripped:
+                self.trips += 1
+            return tripped
+        return False
+    
+    def reset(self):
+        self.consecutive_failures = 0
+        self.opened_at = None
 
 
 class PluginBase(ABC):
     """插件基类"""
     
+    # 钩子执行时间预算（毫秒），None表示使用 settings.plugin_hook_budget_ms
+    hook_budget_ms: Optional[int] = None
+    
     def __init__(self):
         self.info: Optional[PluginInfo] = None
         self.enabled = True
@@ -80,7 +228,10 @@ class PluginManager:
         self.plugins: Dict[str, PluginBase] = {}
         self.hooks: Dict[str, List[Callable]] = {}
         self.plugin_dir = Path('plugins')
-        self.plugin_dir.mkdir(parents=True, exist_ok=True)
+        
+        # 按插件的耗时统计和熔断器
+        self.hook_stats: Dict[str, HookLatencyStats] = {}
+        self.breakers: Dict[str, PluginCircuitBreaker] = {}
         
         # 统计
         self.stats = {
@@ -158,6 +309,7 @@ class PluginManager:
     
     async def load_all_plugins(self):
         """加载所有插件"""
+        self.plugin_dir.mkdir(parents=True, exist_ok=True)
         plugin_files = list(self.plugin_dir.glob('*.py'))
         
         logger.info(f"发现{len(plugin_files)}个插件文件")
@@ -275,9 +427,90 @@ class PluginManager:
         
         logger.debug(f"钩子已注册: {hook_name}")
     
+    def _plugin_key(self, callback: Callable) -> str:
+        """钩子所属插件的标识（用于统计和熔断）"""
+        owner = getattr(callback, '__self__', None)
+        if isinstance(owner, PluginBase):
+            if owner.info:
+                return owner.info.id
+            return type(owner).__name__
+        return getattr(callback, '__qualname__', repr(callback))
+    
+    def _budget_seconds(self, callback: Callable) -> float:
+        """钩子的执行时间预算（秒）"""
+        owner = getattr(callback, '__self__', None)
+        budget_ms = getattr(owner, 'hook_budget_ms', None) or settings.plugin_hook_budget_ms
+        return budget_ms / 1000
+    
+    def _get_breaker(self, key: str) -> PluginCircuitBreaker:
+        breaker = self.breakers.get(key)
+        if breaker is None:
+            breaker = PluginCircuitBreaker(
+                settings.plugin_breaker_threshold,
+                settings.plugin_breaker_cooldown
+            )
+            self.breakers[key] = breaker
+        return breaker
+    
+    def _active_callbacks(self, hook_name: str) -> List[Callable]:
+        """钩子上已启用插件的回调"""
+        callbacks = []
+        for callback in self.hooks.get(hook_name, []):
+            # 检查插件是否启用
+            plugin = getattr(callback, '__self__', None)
+            if isinstance(plugin, PluginBase) and not plugin.enabled:
+                continue
+            callbacks.append(callback)
+        return callbacks
+    
+    async def _invoke(self, hook_name: str, callback: Callable, *args, **kwargs) -> Tuple[bool, Any]:
+        """
+        在时间预算内调用一个钩子，并记录耗时和熔断状态
+        
+        Returns:
+            (是否成功, 返回值)
+        """
+        key = self._plugin_key(callback)
+        stats = self.hook_stats.setdefault(key, HookLatencyStats())
+        breaker = self._get_breaker(key)
+        
+        if not breaker.allow():
+            stats.skipped += 1
+            return False, None
+        
+        start = time.perf_counter()
+        try:
+            # 调用钩子
+            if inspect.iscoroutinefunction(callback):
+                result = await asyncio.wait_for(
+                    callback(*args, **kwargs), timeout=self._budget_seconds(callback)
+                )
+            else:
+                result = callback(*args, **kwargs)
+            
+            stats.record((time.perf_counter() - start) * 1000)
+            breaker.record_success()
+            return True, result
+            
+        except asyncio.TimeoutError:
+            stats.record((time.perf_counter() - start) * 1000)
+            stats.timeouts += 1
+            logger.warning(f"钩子超时 {hook_name}: {key}（预算{self._budget_seconds(callback) * 1000:.0f}ms）")
+            
+        except Exception as e:
+            stats.record((time.perf_counter() - start) * 1000)
+            stats.errors += 1
+            logger.error(f"钩子调用失败 {hook_name}: {key}, {str(e)}")
+        
+        if breaker.record_failure():
+            logger.warning(
+                f"插件连续{breaker.threshold}次超时/失败，已熔断{breaker.cooldown}秒: {key}"
+            )
+        return False, None
+    
     async def call_hook(self, hook_name: str, *args, **kwargs) -> List[Any]:
         """
-        调用钩子
+        调用钩子（管道钩子依次执行，观察者钩子并发执行）
         
         Args:
             hook_name: 钩子名称
@@ -285,33 +518,81 @@ class PluginManager:
             **kwargs: 关键字参数
             
         Returns:
-            所有钩子的返回值列表
+            所有成功调用的返回值列表（按注册顺序）
         """
-        if hook_name not in self.hooks:
+        callbacks = self._active_callbacks(hook_name)
+        if not callbacks:
             return []
         
-        results = []
-        
-        for callback in self.hooks[hook_name]:
-            try:
-                # 检查插件是否启用
-                if hasattr(callback, '__self__'):
-                    plugin = callback.__self__
-                    if isinstance(plugin, PluginBase) and not plugin.enabled:
-                        continue
-                
-                # 调用钩子
-                if inspect.iscoroutinefunction(callback):
-                    result = await callback(*args, **kwargs)
-                else:
-                    result = callback(*args, **kwargs)
-                
-                results.append(result)
-                
-            except Exception as e:
-                logger.error(f"钩子调用失败 {hook_name}: {str(e)}")
-        
-        return results
+        if PluginHook.is_pipeline(hook_name):
+            outcomes = []
+            for callback in callbacks:
+                outcomes.append(await self._invoke(hook_name, callback, *args, **kwargs))
+        else:
+            outcomes = await asyncio.gather(
+                *(self._invoke(hook_name, callback, *args, **kwargs) for callback in callbacks)
+            )
+        
+        return [result for ok, result in outcomes if ok]
+    
+    async def run_pipeline(self, hook_name: str, value: Any, *args, **kwargs) -> Any:
+        """
+        执行管道钩子：value依次经过每个插件，插件返回值作为下一个插件的输入
+        
+        字典会先浅拷贝再交给插件，超时或出错的插件的修改不会生效
+        
+        Args:
+            hook_name: 钩子名称
+            value: 被处理的对象（通常是消息字典）
+            *args: 额外的位置参数
+            **kwargs: 额外的关键字参数
+            
+        Returns:
+            处理后的对象
+        """
+        for callback in self._active_callbacks(hook_name):
+            candidate = dict(value) if isinstance(value, dict) else value
+            ok, result = await self._invoke(hook_name, callback, candidate, *args, **kwargs)
+            if ok:
+                value = candidate if result is None else result
+        
+        return value
+    
+    def get_hook_stats(self) -> Dict[str, Any]:
+        """
+        获取各插件的钩子耗时和熔断状态
+        
+        Returns:
+            {插件标识: {calls, avg_ms, p50/p95/p99_ms, histogram, breaker...}}
+        """
+        result = {}
+        for key, stats in self.hook_stats.items():
+            breaker = self._get_breaker(key)
+            result[key] = {
+                **stats.to_dict(),
+                'breaker': {
+                    'state': breaker.state,
+                    'consecutive_failures': breaker.consecutive_failures,
+                    'trips': breaker.trips
+                }
+            }
+        return result
+    
+    def reset_breaker(self, plugin_key: str) -> bool:
+        """
+        手动恢复被熔断的插件
+        
+        Args:
+            plugin_key: 插件标识
+            
+        Returns:
+            是否存在该插件的熔断器
+        """
+        breaker = self.breakers.get(plugin_key)
+        if breaker is None:
+            return False
+        breaker.reset()
+        return True
     
     def get_plugin(self, plugin_id: str) -> Optional[PluginBase]:
         """获取插件实例"""
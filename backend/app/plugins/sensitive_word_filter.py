@@ -1,11 +1,16 @@
 """
 敏感词过滤插件
 ✅ P1-3: 敏感词自动替换和过滤
+
+普通敏感词编译为Aho-Corasick自动机，正则合并为一个表达式，
+一次扫描找出所有命中并一次性拼出替换后的文本，耗时与词库大小无关
 """
 import re
-from typing import Dict, List, Set, Tuple
+from typing import Dict, List, Set, Tuple, Optional
 from pathlib import Path
 from .plugin_system import PluginBase, PluginInfo, PluginHook, plugin_manager
+from ..utils.aho_corasick import AhoCorasick
+from ..utils.regex_merge import can_merge_regex
 from ..utils.logger import logger
 
 
@@ -19,6 +24,11 @@ class SensitiveWordFilter(PluginBase):
         self.sensitive_words: Set[str] = set()
         self.sensitive_patterns: List[re.Pattern] = []
         
+        # 编译后的匹配器（增删敏感词时增量更新）
+        self.automaton = AhoCorasick()
+        self.combined_pattern: Optional[re.Pattern] = None
+        self.separate_patterns: List[re.Pattern] = []  # 无法合并的正则逐个匹配
+        
         # 替换策略
         self.replace_char = '*'
         self.replace_mode = 'mask'  # mask/remove/custom
@@ -58,6 +68,9 @@ class SensitiveWordFilter(PluginBase):
     
     async def load_words(self):
         """加载敏感词库"""
+        words = set()
+        patterns = []
+        
         try:
             if not self.words_file.exists():
                 # 创建默认词库
@@ -80,11 +93,15 @@ class SensitiveWordFilter(PluginBase):
                         continue
                     
                     # 支持正则表达式（以 / 开头和结尾）
-                    if line.startswith('/') and line.endswith('/'):
+                    if len(line) > 1 and line.startswith('/') and line.endswith('/'):
                         pattern = line[1:-1]
-                        self.sensitive_patterns.append(re.compile(pattern))
+                        patterns.append(re.compile(pattern))
                     else:
-                        self.sensitive_words.add(line)
+                        words.add(line)
+            
+            self.sensitive_words = words
+            self.sensitive_patterns = patterns
+            self._compile()
             
             logger.info(
                 f"敏感词库加载完成: {len(self.sensitive_words)}个词，"
@@ -125,60 +142,105 @@ class SensitiveWordFilter(PluginBase):
         
         return message
     
-    def _filter_text(self, text: str) -> Tuple[str, List[str]]:
+    def _compile(self):
+        """根据当前词库重建自动机和合并正则"""
+        self.automaton = AhoCorasick(self.sensitive_words)
+        self._compile_patterns()
+    
+    def _compile_patterns(self):
+        """把正则合并为一个表达式（含反向引用、内联标志等无法合并的正则逐个匹配）"""
+        mergeable = [p for p in self.sensitive_patterns if can_merge_regex(p)]
+        self.separate_patterns = [p for p in self.sensitive_patterns if not can_merge_regex(p)]
+        self.combined_pattern = None
+        if len(mergeable) > 1:
+            try:
+                self.combined_pattern = re.compile(
+                    '|'.join(f'(?:{p.pattern})' for p in mergeable)
+                )
+            except re.error:
+                # 兜底：合并失败时全部逐个匹配
+                self.separate_patterns = list(self.sensitive_patterns)
+        elif mergeable:
+            self.combined_pattern = mergeable[0]
+    
+    def _find_spans(self, text: str) -> Tuple[List[Tuple[int, int]], List[str]]:
         """
-        过滤文本中的敏感词
+        查找所有命中位置
         
         Args:
             text: 原文本
             
         Returns:
-            (过滤后的文本, 发现的敏感词列表)
+            (合并重叠后的命中区间列表, 按出现顺序去重的敏感词列表)
         """
-        filtered_text = text
-        found_words = []
+        hits = [(start, end, word) for start, end, word, _ in self.automaton.iter_matches(text)]
+        
+        patterns = list(self.separate_patterns)
+        if self.combined_pattern is not None:
+            patterns.insert(0, self.combined_pattern)
+        for pattern in patterns:
+            hits.extend((m.start(), m.end(), m.group()) for m in pattern.finditer(text) if m.end() > m.start())
         
-        # 1. 检查敏感词
-        for word in self.sensitive_words:
-            if word in filtered_text:
+        if not hits:
+            return [], []
+        
+        hits.sort()
+        
+        spans = []
+        found_words = []
+        seen = set()
+        for start, end, word in hits:
+            if word not in seen:
+                seen.add(word)
                 found_words.append(word)
-                
-                # 替换敏感词
-                if self.replace_mode == 'mask':
-                    # 用*替换
-                    replacement = self.replace_char * len(word)
-                elif self.replace_mode == 'remove':
-                    # 直接删除
-                    replacement = ''
-                else:
-                    # 自定义替换
-                    replacement = '[已过滤]'
-                
-                filtered_text = filtered_text.replace(word, replacement)
+            
+            if spans and start < spans[-1][1]:
+                # 与上一个区间重叠，合并
+                if end > spans[-1][1]:
+                    spans[-1] = (spans[-1][0], end)
+            else:
+                spans.append((start, end))
+        
+        return spans, found_words
+    
+    def _filter_text(self, text: str) -> Tuple[str, List[str]]:
+        """
+        过滤文本中的敏感词（一次扫描，一次拼接）
+        
+        Args:
+            text: 原文本
+            
+        Returns:
+            (过滤后的文本, 发现的敏感词列表)
+        """
+        spans, found_words = self._find_spans(text)
+        if not spans:
+            return text, []
         
-        # 2. 检查正则表达式
-        for pattern in self.sensitive_patterns:
-            matches = pattern.findall(filtered_text)
+        parts = []
+        last = 0
+        for start, end in spans:
+            parts.append(text[last:start])
             
-            if matches:
-                found_words.extend(matches)
-                
-                # 替换匹配项
-                if self.replace_mode == 'mask':
-                    filtered_text = pattern.sub(
-                        lambda m: self.replace_char * len(m.group()),
-                        filtered_text
-                    )
-                elif self.replace_mode == 'remove':
-                    filtered_text = pattern.sub('', filtered_text)
-                else:
-                    filtered_text = pattern.sub('[已过滤]', filtered_text)
-        
-        return filtered_text, found_words
+            if self.replace_mode == 'mask':
+                # 用*替换
+                parts.append(self.replace_char * (end - start))
+            elif self.replace_mode == 'remove':
+                # 直接删除
+                pass
+            else:
+                # 自定义替换
+                parts.append('[已过滤]')
+            
+            last = end
+        parts.append(text[last:])
+        
+        return ''.join(parts), found_words
     
     async def add_word(self, word: str):
         """添加敏感词"""
         self.sensitive_words.add(word)
+        self.automaton.add(word)
         
         # 追加到文件
         try:
@@ -194,6 +256,7 @@ class SensitiveWordFilter(PluginBase):
         """移除敏感词"""
         if word in self.sensitive_words:
             self.sensitive_words.remove(word)
+            self.automaton.remove(word)
             
             # 重写文件
             try:
@@ -202,6 +265,8 @@ class SensitiveWordFilter(PluginBase):
                     f.write('# 敏感词列表（每行一个）\n')
                     for w in words:
                         f.write(f'{w}\n')
+                    for pattern in self.sensitive_patterns:
+                        f.write(f'/{pattern.pattern}/\n')
                 
                 logger.info(f"敏感词已移除: {word}")
                 
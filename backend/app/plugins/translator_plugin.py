@@ -1,10 +1,20 @@
 """
 消息翻译插件
 ✅ P1-2: 自动消息翻译功能
+
+- 译文缓存在 TranslationCache（内存LRU + 磁盘SQLite），重复短语不再请求翻译API
+- 短时间窗口内到达的待翻译文本按语言对合并为一次API请求
+- 同一文本在排队或请求中时，后来的调用共享同一个结果
 """
+import asyncio
+import hashlib
+import random
+import time
 import aiohttp
-from typing import Optional, Dict
-from .plugin_system import PluginBase, PluginInfo, PluginHook, plugin_manager
+from typing import Optional, Dict, List, Tuple
+from .plugin_system import PluginBase, PluginInfo, PluginHook, HookLatencyStats, plugin_manager
+from ..utils.http_client import http_client_manager
+from ..utils.translation_cache import TranslationCache
 from ..utils.logger import logger
 from ..config import settings
 
@@ -12,7 +22,10 @@ from ..config import settings
 class TranslatorPlugin(PluginBase):
     """消息翻译插件"""
     
-    def __init__(self):
+    # 调用外部翻译API，放宽钩子时间预算（毫秒）
+    hook_budget_ms = 3000
+    
+    def __init__(self, cache: Optional[TranslationCache] = None):
         super().__init__()
         
         # 配置
@@ -25,13 +38,37 @@ class TranslatorPlugin(PluginBase):
         self.google_api_key = getattr(settings, 'google_translate_api_key', '')
         self.baidu_app_id = getattr(settings, 'baidu_translate_app_id', '')
         self.baidu_secret_key = getattr(settings, 'baidu_translate_secret_key', '')
+        self.google_api_url = settings.translation_google_api_url
+        self.baidu_api_url = settings.translation_baidu_api_url
+        
+        # 批量请求配置
+        self.batch_window = settings.translation_batch_window_ms / 1000
+        self.batch_max_size = settings.translation_batch_max_size
+        self.batch_max_chars = settings.translation_batch_max_chars
+        self.baidu_max_bytes = settings.translation_baidu_max_bytes
+        
+        # 译文缓存
+        self.cache = cache or TranslationCache()
+        
+        # 按语言对排队的原文、定时刷新任务，以及排队/请求中的文本 -> Future
+        self._queues: Dict[Tuple[str, str], List[str]] = {}
+        self._flush_timers: Dict[Tuple[str, str], asyncio.Task] = {}
+        self._batch_tasks: set = set()
+        self._waiters: Dict[Tuple[str, str, str], asyncio.Future] = {}
         
         # 统计
         self.stats = {
             'total_translated': 0,
             'success': 0,
-            'failed': 0
+            'failed': 0,
+            'cache_hits': 0,
+            'shared': 0,
+            'api_requests': 0,
+            'api_texts': 0,
+            'api_errors': 0
         }
+        self.latency = HookLatencyStats()  # 单次翻译端到端耗时
+        self.api_latency = HookLatencyStats()  # 单次API请求耗时
     
     def get_info(self) -> PluginInfo:
         """获取插件信息"""
@@ -53,13 +90,27 @@ class TranslatorPlugin(PluginBase):
         
         logger.info("翻译插件已加载")
     
+    async def on_unload(self):
+        """插件卸载：取消排队中的批次并关闭缓存"""
+        for task in [*self._flush_timers.values(), *self._batch_tasks]:
+            task.cancel()
+        self._flush_timers.clear()
+        self._queues.clear()
+        
+        for future in self._waiters.values():
+            if not future.done():
+                future.set_result(None)
+        self._waiters.clear()
+        
+        await self.cache.close()
+    
     async def translate_message(self, message: Dict) -> Dict:
         """
         翻译消息
         
         Args:
             message: 消息对象
-            
+        
         Returns:
             翻译后的消息对象
         """
@@ -94,9 +145,11 @@ class TranslatorPlugin(PluginBase):
                 self.stats['success'] += 1
                 
                 logger.debug(f"消息翻译成功: {content[:50]}... -> {translated_text[:50]}...")
+            else:
+                self.stats['failed'] += 1
             
             return message
-            
+        
         except Exception as e:
             self.stats['failed'] += 1
             logger.error(f"消息翻译失败: {str(e)}")
@@ -109,79 +162,247 @@ class TranslatorPlugin(PluginBase):
         target_lang: str
     ) -> Optional[str]:
         """
-        翻译文本
+        翻译文本（先查缓存，未命中时加入批量请求）
         
         Args:
             text: 原文
             source_lang: 源语言
             target_lang: 目标语言
-            
+        
         Returns:
             翻译后的文本
         """
+        start = time.monotonic()
+        try:
+            cached = await self.cache.get(text, source_lang, target_lang)
+            if cached is not None:
+                self.stats['cache_hits'] += 1
+                return cached
+            
+            # shield：钩子超时只放弃等待，不取消其他消息共享的批次结果
+            return await asyncio.shield(self._enqueue(text, source_lang, target_lang))
+        finally:
+            self.latency.record((time.monotonic() - start) * 1000)
+    
+    def _enqueue(self, text: str, source_lang: str, target_lang: str) -> asyncio.Future:
+        """
+        把原文加入所属语言对的批次
+        
+        窗口内第一个文本启动定时刷新；批次达到条数或字符数上限时立即发送
+        
+        Returns:
+            译文的Future（失败时结果为None）
+        """
+        waiter_key = (source_lang, target_lang, text)
+        future = self._waiters.get(waiter_key)
+        if future is not None:
+            self.stats['shared'] += 1
+            return future
+        
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[waiter_key] = future
+        
+        lang_pair = (source_lang, target_lang)
+        queue = self._queues.setdefault(lang_pair, [])
+        queue.append(text)
+        
+        if (len(queue) >= self.batch_max_size
+                or sum(len(item) for item in queue) >= self.batch_max_chars):
+            timer = self._flush_timers.pop(lang_pair, None)
+            if timer:
+                timer.cancel()
+            self._start_batch(lang_pair)
+        elif lang_pair not in self._flush_timers:
+            self._flush_timers[lang_pair] = asyncio.create_task(self._flush_later(lang_pair))
+        
+        return future
+    
+    async def _flush_later(self, lang_pair: Tuple[str, str]):
+        """等待批量窗口结束后发送"""
+        await asyncio.sleep(self.batch_window)
+        self._flush_timers.pop(lang_pair, None)
+        self._start_batch(lang_pair)
+    
+    def _start_batch(self, lang_pair: Tuple[str, str]):
+        """取出语言对的排队文本，后台发送一次批量请求"""
+        texts = self._queues.pop(lang_pair, None)
+        if not texts:
+            return
+        
+        task = asyncio.create_task(self._flush(lang_pair, texts))
+        self._batch_tasks.add(task)
+        task.add_done_callback(self._batch_tasks.discard)
+    
+    async def _flush(self, lang_pair: Tuple[str, str], texts: List[str]):
+        """发送批量请求，写入缓存并唤醒等待者"""
+        source_lang, target_lang = lang_pair
+        results: List[Optional[str]] = [None] * len(texts)
+        
+        try:
+            start = time.monotonic()
+            self.stats['api_requests'] += 1
+            self.stats['api_texts'] += len(texts)
+            
+            results = await self._translate_batch(texts, source_lang, target_lang)
+            
+            self.api_latency.record((time.monotonic() - start) * 1000)
+            if all(result is None for result in results):
+                self.stats['api_errors'] += 1
+                self.api_latency.errors += 1
+            
+            await self.cache.set_many(
+                {text: result for text, result in zip(texts, results) if result},
+                source_lang,
+                target_lang,
+                provider=self.api_provider
+            )
+        
+        except Exception as e:
+            self.stats['api_errors'] += 1
+            logger.error(f"批量翻译失败: {str(e)}")
+        
+        finally:
+            for text, result in zip(texts, results):
+                future = self._waiters.pop((source_lang, target_lang, text), None)
+                if future is not None and not future.done():
+                    future.set_result(result)
+    
+    async def _translate_batch(
+        self,
+        texts: List[str],
+        source_lang: str,
+        target_lang: str
+    ) -> List[Optional[str]]:
+        """
+        一次请求翻译多段文本
+        
+        Args:
+            texts: 原文列表
+            source_lang: 源语言
+            target_lang: 目标语言
+        
+        Returns:
+            与原文一一对应的译文（失败为None）
+        """
         if self.api_provider == 'google':
-            return await self._translate_with_google(text, source_lang, target_lang)
+            return await self._translate_with_google(texts, source_lang, target_lang)
         elif self.api_provider == 'baidu':
-            return await self._translate_with_baidu(text, source_lang, target_lang)
+            return await self._translate_with_baidu(texts, source_lang, target_lang)
         else:
             logger.error(f"未知的翻译API提供商: {self.api_provider}")
-            return None
+            return [None] * len(texts)
     
     async def _translate_with_google(
         self,
-        text: str,
+        texts: List[str],
         source_lang: str,
         target_lang: str
-    ) -> Optional[str]:
-        """使用Google翻译"""
+    ) -> List[Optional[str]]:
+        """使用Google翻译（q 传列表，译文按顺序返回）"""
         try:
-            url = 'https://translation.googleapis.com/language/translate/v2'
-            
             params = {
-                'q': text,
+                'q': texts,
                 'target': target_lang,
+                'format': 'text',
                 'key': self.google_api_key
             }
             
             if source_lang != 'auto':
                 params['source'] = source_lang
             
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, json=params, timeout=10) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        
-                        translations = data.get('data', {}).get('translations', [])
-                        if translations:
-                            return translations[0].get('translatedText')
-                    else:
-                        logger.error(f"Google翻译API错误: {response.status}")
-                        return None
-                        
+            session = await http_client_manager.get_session('default')
+            async with session.post(
+                self.google_api_url, json=params, timeout=aiohttp.ClientTimeout(total=10)
+            ) as response:
+                if response.status == 200:
+                    data = await response.json()
+                    
+                    translations = data.get('data', {}).get('translations', [])
+                    if len(translations) == len(texts):
+                        return [item.get('translatedText') for item in translations]
+                    
+                    logger.error(f"Google翻译返回条数不匹配: {len(translations)}/{len(texts)}")
+                else:
+                    logger.error(f"Google翻译API错误: {response.status}")
+        
         except Exception as e:
             logger.error(f"Google翻译失败: {str(e)}")
-            return None
+        
+        return [None] * len(texts)
     
     async def _translate_with_baidu(
         self,
-        text: str,
+        texts: List[str],
         source_lang: str,
         target_lang: str
-    ) -> Optional[str]:
-        """使用百度翻译"""
+    ) -> List[Optional[str]]:
+        """
+        使用百度翻译
+        
+        百度按行翻译：所有文本的非空行用换行拼接为 q（q 按UTF-8字节数限制长度，
+        超出 baidu_max_bytes 时按行拆成多次请求），返回的 trans_result 按行顺序对应，
+        再还原回各条文本；某次请求失败时只有行在该请求中的文本翻译失败
+        """
+        lines = []
+        for text in texts:
+            lines.extend(line for line in text.split('\n') if line.strip())
+        
+        translated: List[Optional[str]] = []
+        for chunk in self._split_lines_by_bytes(lines, self.baidu_max_bytes):
+            result = await self._baidu_request(chunk, source_lang, target_lang)
+            translated.extend(result if result is not None else [None] * len(chunk))
+        
+        translated_lines = iter(translated)
+        results: List[Optional[str]] = []
+        for text in texts:
+            text_lines = [
+                next(translated_lines) if line.strip() else line
+                for line in text.split('\n')
+            ]
+            results.append(None if None in text_lines else '\n'.join(text_lines))
+        return results
+    
+    @staticmethod
+    def _split_lines_by_bytes(lines: List[str], max_bytes: int) -> List[List[str]]:
+        """
+        把行拆成若干组，每组用换行拼接后不超过 max_bytes 个UTF-8字节
+        
+        单行超过上限时单独成组（由接口返回错误）
+        """
+        chunks: List[List[str]] = []
+        size = 0
+        for line in lines:
+            line_bytes = len(line.encode('utf-8'))
+            if chunks and size + 1 + line_bytes <= max_bytes:
+                chunks[-1].append(line)
+                size += 1 + line_bytes
+            else:
+                chunks.append([line])
+                size = line_bytes
+        return chunks
+    
+    async def _baidu_request(
+        self,
+        lines: List[str],
+        source_lang: str,
+        target_lang: str
+    ) -> Optional[List[str]]:
+        """
+        发送一次百度翻译请求
+        
+        Returns:
+            与 lines 一一对应的译文，失败返回None
+        """
         try:
-            import hashlib
-            import random
-            
-            url = 'https://fanyi-api.baidu.com/api/trans/vip/translate'
+            query = '\n'.join(lines)
             
             # 生成签名
             salt = str(random.randint(32768, 65536))
-            sign_str = f"{self.baidu_app_id}{text}{salt}{self.baidu_secret_key}"
+            sign_str = f"{self.baidu_app_id}{query}{salt}{self.baidu_secret_key}"
             sign = hashlib.md5(sign_str.encode()).hexdigest()
             
             params = {
-                'q': text,
+                'q': query,
                 'from': 'auto' if source_lang == 'auto' else source_lang,
                 'to': target_lang,
                 'appid': self.baidu_app_id,
@@ -189,21 +410,25 @@ class TranslatorPlugin(PluginBase):
                 'sign': sign
             }
             
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, params=params, timeout=10) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        
-                        trans_result = data.get('trans_result', [])
-                        if trans_result:
-                            return trans_result[0].get('dst')
-                    else:
-                        logger.error(f"百度翻译API错误: {response.status}")
-                        return None
-                        
+            session = await http_client_manager.get_session('default')
+            async with session.post(
+                self.baidu_api_url, data=params, timeout=aiohttp.ClientTimeout(total=10)
+            ) as response:
+                if response.status == 200:
+                    data = await response.json()
+                    
+                    trans_result = data.get('trans_result', [])
+                    if len(trans_result) == len(lines):
+                        return [item.get('dst') for item in trans_result]
+                    
+                    logger.error(f"百度翻译错误: {data.get('error_code', '返回行数不匹配')}")
+                else:
+                    logger.error(f"百度翻译API错误: {response.status}")
+        
         except Exception as e:
             logger.error(f"百度翻译失败: {str(e)}")
-            return None
+        
+        return None
     
     def get_stats(self) -> Dict:
         """获取统计信息"""
@@ -212,7 +437,14 @@ class TranslatorPlugin(PluginBase):
             'success_rate': (
                 self.stats['success'] / self.stats['total_translated'] * 100
                 if self.stats['total_translated'] > 0 else 0
-            )
+            ),
+            'avg_batch_size': (
+                round(self.stats['api_texts'] / self.stats['api_requests'], 2)
+                if self.stats['api_requests'] else 0
+            ),
+            'latency': self.latency.to_dict(),
+            'api_latency': self.api_latency.to_dict(),
+            'cache': self.cache.get_stats()
         }
 
 
@@ -13,6 +13,9 @@ from ..utils.logger import logger
 class URLPreviewPlugin(PluginBase):
     """URL预览插件"""
     
+    # 需要抓取网页，放宽钩子时间预算（毫秒）
+    hook_budget_ms = 3000
+    
     def __init__(self):
         super().__init__()
         
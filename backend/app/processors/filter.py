@@ -1,33 +1,335 @@
 """
 消息过滤模块
 支持关键词过滤、用户过滤、消息类型过滤
+
+规则在加载/变更时编译为匹配器，过滤每条消息时不再逐条遍历规则：
+- 普通关键词放进一个Aho-Corasick自动机，一次扫描完成匹配
+- 正则关键词合并为一个交替表达式
+- 用户名单和消息类型使用集合查找
+
+规则可以限定作用域（filter_rules.scope）：
+- global                 所有消息
+- server:<服务器ID>       该服务器的消息
+- channel:<频道ID>        该频道的消息（兼容旧写法：直接填频道ID）
+- mapping:<映射ID>        仅该转发目标
+各作用域的规则同时生效；前三级每条消息只判断一次，映射级规则在路由阶段
+决定消息发往哪些目标，不需要的目标不再发起转发
 """
 import re
 import json
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Tuple
 from ..database import db
 from ..utils.logger import logger
+from ..utils.aho_corasick import AhoCorasick
+from ..utils.regex_merge import can_merge_regex
+
+
+# 正则元字符（不含这些字符的关键词按普通字符串匹配）
+REGEX_METACHARACTERS = set('.^$*+?{}[]\\|()')
+
+# 作用域级别
+SCOPE_LEVELS = ('global', 'server', 'channel', 'mapping')
+SCOPE_NAMES = {'server': '服务器', 'channel': '频道', 'mapping': '映射'}
+
+
+def empty_rules() -> Dict[str, Any]:
+    """空规则字典"""
+    return {
+        'keyword_blacklist': [],
+        'keyword_whitelist': [],
+        'user_blacklist': [],
+        'user_whitelist': [],
+        'message_types': [],
+        'mention_all_only': False
+    }
+
+
+def parse_scope(scope: Optional[str]) -> Tuple[str, Optional[str]]:
+    """
+    解析规则作用域
+    
+    Args:
+        scope: global / server:<id> / channel:<id> / mapping:<id> / <频道ID>
+        
+    Returns:
+        (级别, 键)，global的键为None
+    """
+    if not scope or scope == 'global':
+        return 'global', None
+    
+    level, sep, key = scope.partition(':')
+    if sep and level in SCOPE_LEVELS and key:
+        return level, key
+    
+    # 旧写法：scope直接填频道ID
+    return 'channel', scope
+
+
+class KeywordMatcher:
+    """关键词列表编译后的匹配器"""
+    
+    def __init__(self, keywords: List[str]):
+        """
+        编译关键词列表
+        
+        Args:
+            keywords: 关键词（可以是正则表达式，无效的正则按普通字符串处理）
+        """
+        self.keywords = [str(keyword) for keyword in keywords]
+        self.match_all: Optional[str] = None  # 空关键词匹配任意内容
+        self.literals = AhoCorasick()
+        self.regex_keywords: List[str] = []  # 合并为一个表达式的正则关键词
+        self.regex: Optional[re.Pattern] = None
+        self.regex_list: List[Tuple[str, re.Pattern]] = []  # 无法合并的正则逐个匹配
+        
+        for keyword in self.keywords:
+            if not keyword:
+                if self.match_all is None:
+                    self.match_all = keyword
+            elif not REGEX_METACHARACTERS.intersection(keyword):
+                self.literals.add(keyword.lower(), keyword)
+            else:
+                try:
+                    pattern = re.compile(keyword, re.IGNORECASE)
+                except re.error:
+                    # 不是有效的正则，当作普通字符串
+                    self.literals.add(keyword.lower(), keyword)
+                    continue
+                if can_merge_regex(pattern):
+                    self.regex_keywords.append(keyword)
+                else:
+                    # 含反向引用、命名分组、全局标志等写法，合并后分组编号会错位
+                    self.regex_list.append((keyword, pattern))
+        
+        if self.regex_keywords:
+            combined = '|'.join(
+                f'(?P<k{index}>{keyword})' for index, keyword in enumerate(self.regex_keywords)
+            )
+            try:
+                self.regex = re.compile(combined, re.IGNORECASE)
+            except re.error:
+                # 兜底：合并失败时全部逐个匹配
+                self.regex_list[:0] = [
+                    (keyword, re.compile(keyword, re.IGNORECASE)) for keyword in self.regex_keywords
+                ]
+                self.regex_keywords = []
+    
+    def __bool__(self) -> bool:
+        return bool(self.keywords)
+    
+    def match(self, content: str) -> Optional[str]:
+        """
+        匹配内容
+        
+        Args:
+            content: 内容
+            
+        Returns:
+            命中的关键词，未命中返回None
+        """
+        if self.match_all is not None:
+            return self.match_all
+        
+        hit = self.literals.find_first(content.lower())
+        if hit:
+            return hit[3]
+        
+        if self.regex is not None:
+            match = self.regex.search(content)
+            if match:
+                index = next(int(name[1:]) for name, value in match.groupdict().items()
+                             if value is not None and name[0] == 'k' and name[1:].isdigit())
+                return self.regex_keywords[index]
+        
+        for keyword, pattern in self.regex_list:
+            if pattern.search(content):
+                return keyword
+        
+        return None
+
+
+class CompiledFilterRules:
+    """编译后的过滤规则"""
+    
+    def __init__(self, rules: Dict[str, Any]):
+        """
+        编译过滤规则
+        
+        Args:
+            rules: _load_rules() 返回的规则字典
+        """
+        self.rules = rules
+        self.message_types = self._to_set(rules['message_types'])
+        self.mention_all_only = rules['mention_all_only']
+        self.user_blacklist = self._to_set(rules['user_blacklist'])
+        self.user_whitelist = self._to_set(rules['user_whitelist'])
+        self.keyword_blacklist = KeywordMatcher(rules['keyword_blacklist'])
+        self.keyword_whitelist = KeywordMatcher(rules['keyword_whitelist'])
+    
+    @staticmethod
+    def _to_set(values: List[Any]) -> set:
+        return {value for value in values if isinstance(value, (str, int))}
+    
+    def evaluate(self, message: Dict[str, Any]) -> Tuple[bool, str, Optional[Tuple[str, Any]]]:
+        """
+        判断消息是否应该转发
+        
+        Args:
+            message: 消息字典
+            
+        Returns:
+            (是否转发, 原因, 触发的规则(规则类型, 规则值)，通过时为None)
+        """
+        # 1. 检查消息类型过滤
+        if self.message_types:
+            message_type = message.get('message_type', 'text')
+            if message_type not in self.message_types:
+                return False, f"消息类型不在允许列表: {message_type}", ('message_type', message_type)
+        
+        # 2. 检查@全体成员过滤
+        if self.mention_all_only:
+            if not message.get('mention_all', False):
+                return False, "未@全体成员", ('mention_all_only', True)
+        
+        # 3. 检查用户黑名单
+        sender_id = message.get('sender_id', '')
+        sender_name = message.get('sender_name', '')
+        
+        if self.user_blacklist:
+            for user in (sender_id, sender_name):
+                if user in self.user_blacklist:
+                    return False, f"发送者在黑名单: {sender_name}", ('user_blacklist', user)
+        
+        # 4. 检查用户白名单
+        if self.user_whitelist:
+            if sender_id not in self.user_whitelist and sender_name not in self.user_whitelist:
+                return False, f"发送者不在白名单: {sender_name}", ('user_whitelist', None)
+        
+        # 5. 检查关键词黑名单
+        content = message.get('content', '') or ''
+        
+        if self.keyword_blacklist:
+            keyword = self.keyword_blacklist.match(content)
+            if keyword is not None:
+                return False, f"包含黑名单关键词: {keyword}", ('keyword_blacklist', keyword)
+        
+        # 6. 检查关键词白名单
+        if self.keyword_whitelist:
+            if self.keyword_whitelist.match(content) is None:
+                return False, "不包含白名单关键词", ('keyword_whitelist', None)
+        
+        # 所有规则通过
+        return True, "通过所有过滤规则", None
+
+
+class FilterDecisionTable:
+    """按作用域编译的过滤规则决策表"""
+    
+    def __init__(self, scoped_rules: Dict[Tuple[str, Optional[str]], Dict[str, Any]]):
+        """
+        编译所有作用域的规则
+        
+        Args:
+            scoped_rules: {(级别, 键): 规则字典}
+        """
+        self.global_rules = CompiledFilterRules(scoped_rules.get(('global', None), empty_rules()))
+        self.scoped: Dict[str, Dict[str, CompiledFilterRules]] = {
+            'server': {}, 'channel': {}, 'mapping': {}
+        }
+        
+        for (level, key), rules in scoped_rules.items():
+            if level != 'global':
+                self.scoped[level][key] = CompiledFilterRules(rules)
+    
+    def _evaluate_scope(self, level: str, key: Any,
+                        message: Dict[str, Any]) -> Optional[Tuple[str, Tuple[str, Any]]]:
+        compiled = self.scoped[level].get(str(key)) if key is not None else None
+        if compiled is None:
+            return None
+        
+        forward, reason, rule = compiled.evaluate(message)
+        if forward:
+            return None
+        return f"[{SCOPE_NAMES[level]} {key}] {reason}", rule
+    
+    def evaluate_message(self, message: Dict[str, Any]) -> Tuple[bool, str, Optional[Tuple[str, Any]]]:
+        """
+        判断与转发目标无关的规则（全局、服务器、频道）
+        
+        Args:
+            message: 消息字典
+            
+        Returns:
+            (是否转发, 原因, 触发的规则)
+        """
+        forward, reason, rule = self.global_rules.evaluate(message)
+        if not forward:
+            return forward, reason, rule
+        
+        for level, field in (('server', 'server_id'), ('channel', 'channel_id')):
+            rejected = self._evaluate_scope(level, message.get(field), message)
+            if rejected:
+                return False, rejected[0], rejected[1]
+        
+        return True, "通过所有过滤规则", None
+    
+    def select_routes(self, message: Dict[str, Any],
+                      routes: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Tuple[Dict[str, Any], str]]]:
+        """
+        计算消息可以发往的目标
+        
+        Args:
+            message: 消息字典
+            routes: 频道的所有转发目标（映射行）
+            
+        Returns:
+            (允许的目标, [(被拒绝的目标, 原因)])
+        """
+        forward, reason, _ = self.evaluate_message(message)
+        if not forward:
+            return [], [(route, reason) for route in routes]
+        
+        if not self.scoped['mapping']:
+            return list(routes), []
+        
+        allowed, rejected = [], []
+        for route in routes:
+            result = self._evaluate_scope('mapping', route.get('id'), message)
+            if result:
+                rejected.append((route, result[0]))
+            else:
+                allowed.append(route)
+        
+        return allowed, rejected
+    
+    def get_stats(self) -> Dict[str, int]:
+        """各作用域的规则集数量"""
+        return {level: len(rules) for level, rules in self.scoped.items()}
 
 
 class MessageFilter:
     """消息过滤器"""
     
     def __init__(self):
-        self.rules_cache = {}  # 缓存过滤规则
+        self.rules_cache = {}  # 缓存过滤规则（全局作用域）
         self.cache_time = 0
+        self.compiled: Optional[FilterDecisionTable] = None  # 与rules_cache同时更新
+    
+    def _cache_valid(self, current_time: float) -> bool:
+        """规则缓存是否有效（5分钟有效期）"""
+        return bool(self.rules_cache and self.compiled and (current_time - self.cache_time) < 300)
     
     def _load_rules(self) -> Dict[str, Any]:
         """
-        加载过滤规则
+        加载过滤规则（同步，供API等非Worker调用方使用）
         
         Returns:
             规则字典
         """
         import time
         
-        # 使用缓存（5分钟有效期）
         current_time = time.time()
-        if self.rules_cache and (current_time - self.cache_time) < 300:
+        if self._cache_valid(current_time):
             return self.rules_cache
         
         try:
@@ -37,141 +339,121 @@ class MessageFilter:
                 cursor.execute("SELECT * FROM filter_rules WHERE enabled = 1")
                 rows = cursor.fetchall()
             
-            rules = {
-                'keyword_blacklist': [],
-                'keyword_whitelist': [],
-                'user_blacklist': [],
-                'user_whitelist': [],
-                'message_types': [],
-                'mention_all_only': False
-            }
-            
-            for row in rows:
-                rule_type = row['rule_type']
-                
-                # 安全地解析JSON（替换eval）
-                try:
-                    rule_value = json.loads(row['rule_value'])
-                except (json.JSONDecodeError, TypeError) as e:
-                    logger.warning(f"规则值JSON解析失败: {row['rule_value']}, 错误: {e}")
-                    continue
-                
-                if rule_type == 'keyword_blacklist':
-                    rules['keyword_blacklist'] = rule_value
-                elif rule_type == 'keyword_whitelist':
-                    rules['keyword_whitelist'] = rule_value
-                elif rule_type == 'user_blacklist':
-                    rules['user_blacklist'] = rule_value
-                elif rule_type == 'user_whitelist':
-                    rules['user_whitelist'] = rule_value
-                elif rule_type == 'message_type':
-                    rules['message_types'] = rule_value
-                elif rule_type == 'mention_all_only':
-                    rules['mention_all_only'] = rule_value[0] if rule_value else False
-            
-            self.rules_cache = rules
-            self.cache_time = current_time
-            
-            return rules
+            return self._apply_rows(rows, current_time)
             
         except Exception as e:
             logger.error(f"加载过滤规则失败: {str(e)}")
-            return {
-                'keyword_blacklist': [],
-                'keyword_whitelist': [],
-                'user_blacklist': [],
-                'user_whitelist': [],
-                'message_types': [],
-                'mention_all_only': False
-            }
+            self.compiled = FilterDecisionTable({})
+            return empty_rules()
     
-    def should_forward(self, message: Dict[str, Any]) -> tuple[bool, str]:
+    async def load_rules_async(self) -> Dict[str, Any]:
         """
-        判断消息是否应该转发
+        加载过滤规则（Worker热路径使用：缓存过期时通过异步只读连接查询，不阻塞事件循环）
         
-        Args:
-            message: 消息字典
-            
         Returns:
-            (是否转发, 原因)
+            规则字典
         """
-        rules = self._load_rules()
-        
-        # 1. 检查消息类型过滤
-        if rules['message_types']:
-            message_type = message.get('message_type', 'text')
-            if message_type not in rules['message_types']:
-                return False, f"消息类型不在允许列表: {message_type}"
+        import time
+        from ..database_async import async_db
         
-        # 2. 检查@全体成员过滤
-        if rules['mention_all_only']:
-            mention_all = message.get('mention_all', False)
-            if not mention_all:
-                return False, "未@全体成员"
+        current_time = time.time()
+        if self._cache_valid(current_time):
+            return self.rules_cache
         
-        # 3. 检查用户黑名单
-        sender_id = message.get('sender_id', '')
-        sender_name = message.get('sender_name', '')
+        try:
+            async with async_db.reader() as conn:
+                cursor = await conn.execute("SELECT * FROM filter_rules WHERE enabled = 1")
+                rows = await cursor.fetchall()
+            
+            return self._apply_rows(rows, current_time)
+            
+        except Exception as e:
+            logger.error(f"加载过滤规则失败: {str(e)}")
+            self.compiled = FilterDecisionTable({})
+            return empty_rules()
+    
+    def _apply_rows(self, rows, current_time: float) -> Dict[str, Any]:
+        """
+        把 filter_rules 行按作用域整理并编译为决策表（规则变化时才编译一次）
         
-        if rules['user_blacklist']:
-            for user in rules['user_blacklist']:
-                if user in [sender_id, sender_name]:
-                    return False, f"发送者在黑名单: {sender_name}"
+        Returns:
+            全局作用域的规则字典
+        """
+        scoped_rules: Dict[Tuple[str, Optional[str]], Dict[str, Any]] = {
+            ('global', None): empty_rules()
+        }
         
-        # 4. 检查用户白名单
-        if rules['user_whitelist']:
-            user_in_whitelist = False
-            for user in rules['user_whitelist']:
-                if user in [sender_id, sender_name]:
-                    user_in_whitelist = True
-                    break
+        for row in rows:
+            rule_type = row['rule_type']
+            rules = scoped_rules.setdefault(parse_scope(row['scope']), empty_rules())
             
-            if not user_in_whitelist:
-                return False, f"发送者不在白名单: {sender_name}"
+            # 安全地解析JSON（替换eval）
+            try:
+                rule_value = json.loads(row['rule_value'])
+            except (json.JSONDecodeError, TypeError) as e:
+                logger.warning(f"规则值JSON解析失败: {row['rule_value']}, 错误: {e}")
+                continue
+            
+            if rule_type in ('keyword_blacklist', 'regex_blacklist'):
+                rules['keyword_blacklist'] = rules['keyword_blacklist'] + rule_value
+            elif rule_type in ('keyword_whitelist', 'regex_whitelist'):
+                rules['keyword_whitelist'] = rules['keyword_whitelist'] + rule_value
+            elif rule_type == 'user_blacklist':
+                rules['user_blacklist'] = rule_value
+            elif rule_type == 'user_whitelist':
+                rules['user_whitelist'] = rule_value
+            elif rule_type == 'message_type':
+                rules['message_types'] = rule_value
+            elif rule_type in ('mention_all_only', 'mention_only'):
+                rules['mention_all_only'] = rule_value[0] if rule_value else False
         
-        # 5. 检查关键词黑名单
-        content = message.get('content', '')
+        self.compiled = FilterDecisionTable(scoped_rules)
+        self.rules_cache = scoped_rules[('global', None)]
+        self.cache_time = current_time
         
-        if rules['keyword_blacklist']:
-            for keyword in rules['keyword_blacklist']:
-                if self._match_keyword(keyword, content):
-                    return False, f"包含黑名单关键词: {keyword}"
+        return self.rules_cache
+    
+    def should_forward(self, message: Dict[str, Any]) -> tuple[bool, str]:
+        """
+        判断消息是否应该转发
         
-        # 6. 检查关键词白名单
-        if rules['keyword_whitelist']:
-            keyword_matched = False
-            for keyword in rules['keyword_whitelist']:
-                if self._match_keyword(keyword, content):
-                    keyword_matched = True
-                    break
+        Args:
+            message: 消息字典
             
-            if not keyword_matched:
-                return False, "不包含白名单关键词"
+        Returns:
+            (是否转发, 原因)
+        """
+        forward, reason, _ = self.evaluate(message)
+        return forward, reason
+    
+    def evaluate(self, message: Dict[str, Any]) -> Tuple[bool, str, Optional[Tuple[str, Any]]]:
+        """
+        判断消息是否应该转发，并返回触发的规则
         
-        # 所有规则通过
-        return True, "通过所有过滤规则"
+        Args:
+            message: 消息字典
+            
+        Returns:
+            (是否转发, 原因, 触发的规则(规则类型, 规则值)，通过时为None)
+            不含映射级规则（见 select_routes）
+        """
+        self._load_rules()
+        return self.compiled.evaluate_message(message)
     
-    def _match_keyword(self, keyword: str, content: str) -> bool:
+    def select_routes(self, message: Dict[str, Any],
+                      routes: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Tuple[Dict[str, Any], str]]]:
         """
-        匹配关键词（支持正则表达式）
+        路由阶段过滤：一次判断全部作用域的规则，返回消息可以发往的目标
         
         Args:
-            keyword: 关键词（可能是正则表达式）
-            content: 内容
+            message: 消息字典
+            routes: 频道的所有转发目标（映射行，需包含id）
             
         Returns:
-            是否匹配
+            (允许的目标, [(被拒绝的目标, 原因)])
         """
-        try:
-            # 尝试作为正则表达式匹配
-            if re.search(keyword, content, re.IGNORECASE):
-                return True
-        except re.error:
-            # 如果不是有效的正则，当作普通字符串
-            if keyword.lower() in content.lower():
-                return True
-        
-        return False
+        self._load_rules()
+        return self.compiled.select_routes(message, routes)
     
     def add_rule(self, rule_type: str, rule_value: List[str], 
                  scope: str = 'global', enabled: bool = True) -> bool:
@@ -181,7 +463,7 @@ class MessageFilter:
         Args:
             rule_type: 规则类型
             rule_value: 规则值（列表）
-            scope: 作用范围（global/channel_id）
+            scope: 作用范围（global/server:<id>/channel:<id>/mapping:<id>）
             enabled: 是否启用
             
         Returns:
@@ -2,7 +2,14 @@
 消息格式转换模块
 """
 import re
+import html
+from functools import lru_cache
 from typing import Dict
+from ..config import settings
+from .kmarkdown import (
+    parse, split_nodes, split_plain,
+    MarkdownRenderer, DiscordRenderer, TelegramHtmlRenderer, PlainTextRenderer
+)
 
 
 # emoji映射表（KMarkdown表情名到Unicode）
@@ -187,37 +194,67 @@ EMOJI_MAP = {
 }
 
 
+# 各平台渲染器（读取同一份KMarkdown解析结果）
+RENDERERS = {
+    'markdown': MarkdownRenderer(EMOJI_MAP),
+    'discord': DiscordRenderer(EMOJI_MAP),
+    'telegram': TelegramHtmlRenderer(EMOJI_MAP),
+    'feishu': MarkdownRenderer(EMOJI_MAP),
+    'text': PlainTextRenderer(EMOJI_MAP),
+}
+
+
+@lru_cache(maxsize=settings.formatter_cache_size)
+def _render(text: str, platform: str) -> str:
+    """渲染KMarkdown（按 (消息, 平台) 缓存，解析结果在平台之间共享）"""
+    return RENDERERS[platform].render(parse(text))
+
+
 class MessageFormatter:
     """消息格式转换器"""
     
     @staticmethod
-    def kmarkdown_to_markdown(text: str) -> str:
+    def render(text: str, platform: str) -> str:
         """
-        将KMarkdown转换为标准Markdown
+        将KMarkdown转换为目标平台格式
         
         Args:
             text: KMarkdown文本
+            platform: 渲染目标（markdown/discord/telegram/feishu/text）
             
         Returns:
-            Markdown文本
+            目标平台格式文本
         """
         if not text:
             return ""
+        return _render(text, platform)
         
-        # 转换表情 (emj)表情名(emj) → emoji
-        text = re.sub(
-            r'\(emj\)(\w+)\(emj\)',
-            lambda m: EMOJI_MAP.get(m.group(1), f":{m.group(1)}:"),
-            text
-        )
+    @staticmethod
+    def get_cache_stats() -> Dict:
+        """获取解析/渲染缓存统计"""
+        stats = {}
+        for name, func in (('parse', parse), ('render', _render)):
+            info = func.cache_info()
+            stats[name] = {
+                'hits': info.hits,
+                'misses': info.misses,
+                'size': info.currsize,
+                'max_size': info.maxsize
+            }
+        return stats
+    
+    @staticmethod
+    def kmarkdown_to_markdown(text: str) -> str:
+        """
+        将KMarkdown转换为标准Markdown
         
-        # KMarkdown和Markdown的基本格式是兼容的
-        # **粗体** 保持不变
-        # *斜体* 保持不变
-        # `代码` 保持不变
-        # ~~删除线~~ 保持不变
+        Args:
+            text: KMarkdown文本
         
-        return text
+        Returns:
+            Markdown文本
+        """
+        return MessageFormatter.render(text, 'markdown')
     
     @staticmethod
     def kmarkdown_to_discord(text: str) -> str:
@@ -230,8 +267,8 @@ class MessageFormatter:
         Returns:
             Discord格式文本
         """
-        # Discord支持标准Markdown
-        return MessageFormatter.kmarkdown_to_markdown(text)
+        # Discord支持标准Markdown，另外支持 __下划线__ 和 ||剧透||
+        return MessageFormatter.render(text, 'discord')
     
     @staticmethod
     def kmarkdown_to_telegram_html(text: str) -> str:
@@ -244,33 +281,9 @@ class MessageFormatter:
         Returns:
             Telegram HTML格式文本
         """
-        if not text:
-            return ""
-        
-        # 转换表情
-        text = re.sub(
-            r'\(emj\)(\w+)\(emj\)',
-            lambda m: EMOJI_MAP.get(m.group(1), f":{m.group(1)}:"),
-            text
-        )
-        
-        # 转换为HTML格式
-        # **粗体** → <b>粗体</b>
-        text = re.sub(r'\*\*(.+?)\*\*', r'<b>\1</b>', text)
-        
-        # *斜体* → <i>斜体</i>
-        text = re.sub(r'\*(.+?)\*', r'<i>\1</i>', text)
-        
-        # `代码` → <code>代码</code>
-        text = re.sub(r'`(.+?)`', r'<code>\1</code>', text)
-        
-        # ~~删除线~~ → <s>删除线</s>
-        text = re.sub(r'~~(.+?)~~', r'<s>\1</s>', text)
-        
-        # [链接文本](URL) → <a href="URL">链接文本</a>
-        text = re.sub(r'\[(.+?)\]\((.+?)\)', r'<a href="\2">\1</a>', text)
-        
-        return text
+        # **粗体** → <b>，*斜体* → <i>，`代码` → <code>，~~删除线~~ → <s>，
+        # [文本](URL) → <a>，其余文本中的 <>& 转义
+        return MessageFormatter.render(text, 'telegram')
     
     @staticmethod
     def kmarkdown_to_feishu_text(text: str) -> str:
@@ -284,216 +297,81 @@ class MessageFormatter:
             飞书文本格式
         """
         # 飞书支持Markdown，但需要特殊处理
-        return MessageFormatter.kmarkdown_to_markdown(text)
+        return MessageFormatter.render(text, 'feishu')
     
     @staticmethod
-    def split_long_message(text: str, max_length: int) -> list:
+    def kmarkdown_to_plain_text(text: str) -> str:
         """
-        智能分割超长消息
-        
-        优先级：
-        1. 段落边界（双换行）
-        2. 句子边界（。！？）
-        3. 子句边界（，；：）
-        4. 单词边界（空格）
-        5. 强制字符截断
+        将KMarkdown转换为纯文本（企业微信、钉钉的text消息）
         
         Args:
-            text: 原始文本
-            max_length: 单条消息最大长度
-            
+            text: KMarkdown文本
+        
         Returns:
-            分割后的消息列表
+            去掉格式标记的文本（链接保留URL）
         """
-        if len(text) <= max_length:
-            return [text]
-        
-        messages = []
-        
-        # 首先尝试按段落分割（双换行）
-        paragraphs = re.split(r'\n\n+', text)
-        current = ""
-        
-        for para in paragraphs:
-            # 如果当前累积内容+段落不超长，继续累积
-            if len(current) + len(para) + 2 <= max_length:
-                if current:
-                    current += '\n\n' + para
-                else:
-                    current = para
-            else:
-                # 保存当前累积内容
-                if current:
-                    messages.append(current)
-                    current = ""
-                
-                # 如果单个段落就超长，需要进一步分割
-                if len(para) > max_length:
-                    # 尝试按句子分割
-                    sentences = MessageFormatter._split_by_sentences(para, max_length)
-                    for i, sent in enumerate(sentences):
-                        if i < len(sentences) - 1:
-                            messages.append(sent)
-                        else:
-                            current = sent
-                else:
-                    current = para
-        
-        if current:
-            messages.append(current)
-        
-        return messages
+        return MessageFormatter.render(text, 'text')
     
     @staticmethod
-    def _split_by_sentences(text: str, max_length: int) -> list:
+    def message_length(text: str, platform: str) -> int:
         """
-        按句子边界分割文本
+        计算已渲染消息在平台上的长度
         
         Args:
-            text: 待分割文本
-            max_length: 最大长度
+            text: 目标平台格式文本
+            platform: 渲染目标（discord/telegram/feishu/text/markdown）
             
         Returns:
-            分割后的文本列表
+            按平台单位计算的长度（Telegram为实体解析后的UTF-16长度）
         """
-        if len(text) <= max_length:
-            return [text]
-        
-        # 句子边界正则：。！？后面可选空格
-        sentence_pattern = r'([。！？!?]+\s*)'
-        parts = re.split(sentence_pattern, text)
-        
-        # 重新组合（分隔符要和前一句合并）
-        sentences = []
-        for i in range(0, len(parts), 2):
-            if i + 1 < len(parts):
-                sentences.append(parts[i] + parts[i + 1])
-            else:
-                sentences.append(parts[i])
-        
-        # 按句子累积
-        result = []
-        current = ""
-        
-        for sent in sentences:
-            if len(current) + len(sent) <= max_length:
-                current += sent
-            else:
-                if current:
-                    result.append(current)
-                    current = ""
-                
-                # 如果单个句子就超长，按子句分割
-                if len(sent) > max_length:
-                    sub_parts = MessageFormatter._split_by_clauses(sent, max_length)
-                    result.extend(sub_parts[:-1])
-                    if sub_parts:
-                        current = sub_parts[-1]
-                else:
-                    current = sent
-        
-        if current:
-            result.append(current)
-        
-        return result
+        return RENDERERS[platform].rendered_length(text)
     
     @staticmethod
-    def _split_by_clauses(text: str, max_length: int) -> list:
+    def split_message(text: str, platform: str, max_length: int,
+                      prefix: str = "", suffix: str = "") -> list:
         """
-        按子句边界分割文本（逗号、分号等）
+        将KMarkdown转换为目标平台格式并分段
+        
+        按平台自己的长度单位计算，优先在段落、句子、子句、空白处断开，
+        不会在格式标记、代码块和链接中间断开
         
         Args:
-            text: 待分割文本
-            max_length: 最大长度
+            text: KMarkdown文本
+            platform: 渲染目标（discord/telegram/feishu/text/markdown）
+            max_length: 单条消息最大长度
+            prefix: 第一段开头的已渲染文本（如引用、发送者）
+            suffix: 最后一段末尾的已渲染文本（如附件列表）
             
         Returns:
-            分割后的文本列表
+            可直接发送的消息列表
         """
-        if len(text) <= max_length:
-            return [text]
-        
-        # 子句边界正则
-        clause_pattern = r'([，,；;：:]+\s*)'
-        parts = re.split(clause_pattern, text)
-        
-        # 重新组合
-        clauses = []
-        for i in range(0, len(parts), 2):
-            if i + 1 < len(parts):
-                clauses.append(parts[i] + parts[i + 1])
-            else:
-                clauses.append(parts[i])
-        
-        # 按子句累积
-        result = []
-        current = ""
-        
-        for clause in clauses:
-            if len(current) + len(clause) <= max_length:
-                current += clause
-            else:
-                if current:
-                    result.append(current)
-                    current = ""
-                
-                # 如果单个子句就超长，按单词分割
-                if len(clause) > max_length:
-                    word_parts = MessageFormatter._split_by_words(clause, max_length)
-                    result.extend(word_parts[:-1])
-                    if word_parts:
-                        current = word_parts[-1]
-                else:
-                    current = clause
-        
-        if current:
-            result.append(current)
-        
-        return result
+        renderer = RENDERERS[platform]
+        rendered = prefix + MessageFormatter.render(text, platform) + suffix
+        if renderer.rendered_length(rendered) <= max_length:
+            return [rendered]
+        return split_nodes(parse(text), renderer, max_length, prefix, suffix)
     
     @staticmethod
-    def _split_by_words(text: str, max_length: int) -> list:
+    def split_long_message(text: str, max_length: int) -> list:
         """
-        按单词边界分割文本
+        智能分割超长消息（纯文本，按字符计算）
+        
+        优先级：
+        1. 段落边界（双换行）
+        2. 换行
+        3. 句子边界（。！？）
+        4. 子句边界（，；：）
+        5. 单词边界（空格）
+        6. 强制字符截断
         
         Args:
-            text: 待分割文本
-            max_length: 最大长度
+            text: 原始文本
+            max_length: 单条消息最大长度
             
         Returns:
-            分割后的文本列表
+            分割后的消息列表
         """
-        if len(text) <= max_length:
-            return [text]
-        
-        # 按空格分割单词
-        words = text.split()
-        
-        result = []
-        current = ""
-        
-        for word in words:
-            if len(current) + len(word) + 1 <= max_length:
-                current += (" " if current else "") + word
-            else:
-                if current:
-                    result.append(current)
-                    current = ""
-                
-                # 如果单个单词就超长，强制截断
-                if len(word) > max_length:
-                    for i in range(0, len(word), max_length):
-                        chunk = word[i:i + max_length]
-                        if i + max_length < len(word):
-                            result.append(chunk)
-                        else:
-                            current = chunk
-                else:
-                    current = word
-        
-        if current:
-            result.append(current)
-        
-        return result
+        return split_plain(text, max_length)
     
     @staticmethod
     def format_mention(user_id: str, username: str, platform: str) -> str:
@@ -554,7 +432,10 @@ class MessageFormatter:
             return f"> **{author}**: {content}\n"
         elif platform == "telegram":
             # Telegram使用HTML格式
-            return f"<blockquote><b>{author}</b>: {content}</blockquote>\n"
+            return (
+                f"<blockquote><b>{html.escape(author)}</b>: "
+                f"{MessageFormatter.kmarkdown_to_telegram_html(content)}</blockquote>\n"
+            )
         elif platform == "feishu":
             # 飞书使用文本格式
             return f"「回复 {author}」: {content}\n"
@@ -5,7 +5,6 @@ v1.8.1新增: 多进程处理池，性能提升800%
 """
 import os
 import asyncio
-import aiohttp
 import hashlib
 import time
 from pathlib import Path
@@ -17,6 +16,7 @@ import multiprocessing
 from functools import partial
 from ..config import settings
 from ..utils.logger import logger
+from ..utils.http_client import http_client_manager
 
 
 class ImageProcessor:
@@ -80,20 +80,19 @@ class ImageProcessor:
             if referer:
                 headers['Referer'] = referer
             
-            async with aiohttp.ClientSession() as session:
-                async with session.get(
-                    url, 
-                    headers=headers, 
-                    cookies=cookies,
-                    timeout=aiohttp.ClientTimeout(total=30)
-                ) as response:
-                    if response.status == 200:
-                        data = await response.read()
-                        logger.info(f"图片下载成功: {url}, 大小: {len(data)} bytes")
-                        return data
-                    else:
-                        logger.error(f"图片下载失败: {url}, 状态码: {response.status}")
-                        return None
+            session = await http_client_manager.get_session('download')
+            async with session.get(
+                url, 
+                headers=headers, 
+                cookies=cookies
+            ) as response:
+                if response.status == 200:
+                    data = await response.read()
+                    logger.info(f"图片下载成功: {url}, 大小: {len(data)} bytes")
+                    return data
+                else:
+                    logger.error(f"图片下载失败: {url}, 状态码: {response.status}")
+                    return None
         except Exception as e:
             logger.error(f"图片下载异常: {url}, 错误: {str(e)}")
             return None
@@ -435,7 +434,7 @@ class ImageProcessor:
         """
         try:
             # 保存到本地
-            filepath = self.save_image(compressed_data)
+            filepath = self.save_to_local(compressed_data)
             
             if strategy == "direct":
                 # 直接使用原始URL
@@ -915,54 +914,53 @@ class AttachmentProcessor:
             if referer:
                 headers['Referer'] = referer
             
-            async with aiohttp.ClientSession() as session:
-                async with session.get(
-                    url,
-                    headers=headers,
-                    cookies=cookies,
-                    timeout=aiohttp.ClientTimeout(total=60)  # 60秒超时
-                ) as response:
-                    if response.status != 200:
-                        logger.error(f"附件下载失败: {url}, 状态码: {response.status}")
+            session = await http_client_manager.get_session('download')
+            async with session.get(
+                url,
+                headers=headers,
+                cookies=cookies
+            ) as response:
+                if response.status != 200:
+                    logger.error(f"附件下载失败: {url}, 状态码: {response.status}")
+                    return None
+                
+                # 检查文件大小
+                content_length = response.headers.get('Content-Length')
+                if content_length:
+                    size_mb = int(content_length) / (1024 * 1024)
+                    if size_mb > self.max_size_mb:
+                        logger.error(f"附件过大: {size_mb:.2f}MB > {self.max_size_mb}MB")
                         return None
-                    
-                    # 检查文件大小
-                    content_length = response.headers.get('Content-Length')
-                    if content_length:
-                        size_mb = int(content_length) / (1024 * 1024)
-                        if size_mb > self.max_size_mb:
-                            logger.error(f"附件过大: {size_mb:.2f}MB > {self.max_size_mb}MB")
-                            return None
-                        logger.info(f"附件大小: {size_mb:.2f}MB")
-                    
-                    # 生成安全的文件名
-                    safe_filename = self._sanitize_filename(filename)
-                    
-                    # 如果文件已存在，添加时间戳
+                    logger.info(f"附件大小: {size_mb:.2f}MB")
+                
+                # 生成安全的文件名
+                safe_filename = self._sanitize_filename(filename)
+                
+                # 如果文件已存在，添加时间戳
+                filepath = self.storage_path / safe_filename
+                if filepath.exists():
+                    name, ext = os.path.splitext(safe_filename)
+                    timestamp = int(time.time())
+                    safe_filename = f"{name}_{timestamp}{ext}"
                     filepath = self.storage_path / safe_filename
-                    if filepath.exists():
-                        name, ext = os.path.splitext(safe_filename)
-                        timestamp = int(time.time())
-                        safe_filename = f"{name}_{timestamp}{ext}"
-                        filepath = self.storage_path / safe_filename
-                    
-                    # 分块下载并保存
-                    total_size = 0
-                    with open(filepath, 'wb') as f:
-                        async for chunk in response.content.iter_chunked(8192):
-                            f.write(chunk)
-                            total_size += len(chunk)
-                            
-                            # 检查是否超过最大大小
-                            if total_size > self.max_size_mb * 1024 * 1024:
-                                f.close()
-                                filepath.unlink()  # 删除部分下载的文件
-                                logger.error(f"附件下载超过最大限制: {self.max_size_mb}MB")
-                                return None
-                    
-                    logger.info(f"✅ 附件下载成功: {filepath}, 大小: {total_size / 1024:.2f}KB")
-                    return str(filepath)
-                    
+                
+                # 分块下载并保存
+                total_size = 0
+                with open(filepath, 'wb') as f:
+                    async for chunk in response.content.iter_chunked(8192):
+                        f.write(chunk)
+                        total_size += len(chunk)
+                        
+                        # 检查是否超过最大大小
+                        if total_size > self.max_size_mb * 1024 * 1024:
+                            f.close()
+                            filepath.unlink()  # 删除部分下载的文件
+                            logger.error(f"附件下载超过最大限制: {self.max_size_mb}MB")
+                            return None
+                
+                logger.info(f"✅ 附件下载成功: {filepath}, 大小: {total_size / 1024:.2f}KB")
+                return str(filepath)
+                
         except asyncio.TimeoutError:
             logger.error(f"附件下载超时: {url}")
             return None
@@ -0,0 +1,715 @@
+"""
+KMarkdown解析与渲染
+消息只扫描一遍，解析为紧凑的中间表示（节点元组），各平台渲染器读取同一份中间表示
+
+- 节点为 (类型, 值)：叶子节点的值是字符串，容器节点的值是子节点元组，
+  链接节点的值是 (子节点元组, URL)
+- 未闭合的标记按原样保留为文本（与KOOK客户端的显示一致）
+- 行内格式不跨行；代码和代码块内部不再解析
+- 渲染器负责各平台的转义（Telegram HTML转义 <>&，Markdown保留原有的反斜杠转义）
+- 长消息在中间表示上单遍分段：按平台自己的长度单位计算（Telegram为实体解析后的UTF-16长度），
+  不在格式标记、代码和链接中间断开（跨段的粗体等在段尾闭合、下一段重新打开）
+"""
+import re
+import html
+from bisect import bisect_right
+from functools import lru_cache
+from itertools import accumulate
+from typing import Any, Dict, List, Optional, Tuple
+from ..config import settings
+
+
+# 节点类型
+TEXT = 'text'
+ESCAPE = 'escape'  # 反斜杠转义的单个字符
+EMOJI = 'emoji'
+CODE = 'code'
+CODE_BLOCK = 'code_block'
+BOLD = 'bold'
+ITALIC = 'italic'
+STRIKE = 'strike'
+UNDERLINE = 'underline'
+SPOILER = 'spoiler'
+LINK = 'link'
+RAW = 'raw'  # 已是目标平台格式的文本（分段时的前缀/后缀），原样输出
+
+Node = Tuple[str, Any]
+
+# 容器节点的开始标记（未闭合时按原样输出）
+OPEN_MARKERS = {
+    BOLD: '**',
+    ITALIC: '*',
+    STRIKE: '~~',
+    UNDERLINE: '(ins)',
+    SPOILER: '(spl)',
+    LINK: '['
+}
+
+# 行内格式容器
+STYLE_KINDS = (BOLD, ITALIC, STRIKE, UNDERLINE, SPOILER)
+
+# 可以用反斜杠转义的字符
+ESCAPABLE = set('\\`*_~[]()>#-+.!|')
+
+# 可能开始一个标记的字符
+_SPECIAL_RE = re.compile(r'[\\`*~(\[\]\n]')
+# (emj)表情名(emj)[表情ID]
+_EMOJI_RE = re.compile(r'\(emj\)(\w+)\(emj\)(?:\[[^\]\s]*\])?')
+# 链接地址（不含空白）
+_URL_RE = re.compile(r'\(([^()\s]+)\)')
+# 分段断点，按分组从前到后优先级递减：段落、换行、句子、子句、空白
+_BREAK_RE = re.compile(r'(\n{2,})|(\n)|([。！？!?]+\s*)|([，,；;：:、]+\s*)|(\s+)')
+# HTML标签（计算Telegram实体解析后的长度）
+_TAG_RE = re.compile(r'<[^>]*>')
+# 代码块语言标记（第一行是简短标识符时才视为语言，否则是代码）
+_LANG_RE = re.compile(r'^[A-Za-z0-9_+#.-]{1,20}$')
+
+
+class _Parser:
+    """单遍扫描的KMarkdown解析器"""
+    
+    def __init__(self, text: str):
+        self.text = text
+        # 打开中的容器栈: [类型, 子节点列表]，栈底为根
+        self.stack: List[list] = [[None, []]]
+    
+    def _emit(self, node: Node):
+        """向当前容器追加节点（相邻文本合并）"""
+        children = self.stack[-1][1]
+        if node[0] == TEXT and children and children[-1][0] == TEXT:
+            children[-1] = (TEXT, children[-1][1] + node[1])
+        else:
+            children.append(node)
+    
+    def _emit_text(self, text: str):
+        if text:
+            self._emit((TEXT, text))
+    
+    def _is_open(self, kind: str) -> bool:
+        return any(frame[0] == kind for frame in self.stack[1:])
+    
+    def _unwind(self):
+        """弹出栈顶容器，按原样还原为文本"""
+        kind, children = self.stack.pop()
+        self._emit_text(OPEN_MARKERS[kind])
+        for child in children:
+            self._emit(child)
+    
+    def _close(self, kind: str, marker: str, url: Optional[str] = None):
+        """闭合最近的同类容器（其上未闭合的容器还原为文本）"""
+        while self.stack[-1][0] != kind:
+            self._unwind()
+        
+        _, children = self.stack.pop()
+        if not children:
+            # 空内容（如 ****、[](url)）不构成格式
+            self._emit_text(OPEN_MARKERS[kind] + marker + (f"({url})" if url else ''))
+        elif kind == LINK:
+            self._emit((LINK, (tuple(children), url)))
+        else:
+            self._emit((kind, tuple(children)))
+    
+    def _toggle(self, kind: str, marker: str):
+        if self._is_open(kind):
+            self._close(kind, marker)
+        else:
+            self.stack.append([kind, []])
+    
+    def _stars(self, count: int):
+        """处理一串连续的 *（*斜体*、**粗体**、***粗斜体***）"""
+        # 优先闭合栈顶
+        while count > 0:
+            top = self.stack[-1][0]
+            if top == ITALIC and self.stack[-1][1]:
+                self._close(ITALIC, '*')
+                count -= 1
+            elif top == BOLD and count >= 2 and self.stack[-1][1]:
+                self._close(BOLD, '**')
+                count -= 2
+            else:
+                break
+        
+        # 再闭合更深处的同类容器
+        while count > 0:
+            if count >= 2 and self._is_open(BOLD):
+                self._close(BOLD, '**')
+                count -= 2
+            elif self._is_open(ITALIC):
+                self._close(ITALIC, '*')
+                count -= 1
+            else:
+                break
+        
+        if count >= 2:
+            self.stack.append([BOLD, []])
+            count -= 2
+        if count == 1:
+            self.stack.append([ITALIC, []])
+            count -= 1
+        self._emit_text('*' * count)
+    
+    def parse(self) -> Tuple[Node, ...]:
+        text = self.text
+        length = len(text)
+        pos = 0
+        
+        while pos < length:
+            match = _SPECIAL_RE.search(text, pos)
+            if match is None:
+                self._emit_text(text[pos:])
+                break
+            
+            start = match.start()
+            self._emit_text(text[pos:start])
+            char = text[start]
+            pos = start + 1
+            
+            if char == '\n':
+                # 行内格式不跨行
+                while len(self.stack) > 1:
+                    self._unwind()
+                self._emit_text('\n')
+            
+            elif char == '\\':
+                if pos < length and text[pos] in ESCAPABLE:
+                    self._emit((ESCAPE, text[pos]))
+                    pos += 1
+                else:
+                    self._emit_text('\\')
+            
+            elif char == '`':
+                if text.startswith('``', pos):
+                    end = text.find('```', pos + 2)
+                    if end >= 0:
+                        self._emit((CODE_BLOCK, text[pos + 2:end]))
+                        pos = end + 3
+                    else:
+                        self._emit_text('```')
+                        pos += 2
+                else:
+                    end = text.find('`', pos)
+                    if end > pos and '\n' not in text[pos:end]:
+                        self._emit((CODE, text[pos:end]))
+                        pos = end + 1
+                    else:
+                        self._emit_text('`')
+            
+            elif char == '*':
+                end = pos
+                while end < length and text[end] == '*':
+                    end += 1
+                self._stars(end - start)
+                pos = end
+            
+            elif char == '~':
+                if text.startswith('~', pos):
+                    self._toggle(STRIKE, '~~')
+                    pos += 1
+                else:
+                    self._emit_text('~')
+            
+            elif char == '(':
+                emoji = _EMOJI_RE.match(text, start)
+                if emoji:
+                    self._emit((EMOJI, emoji.group(1)))
+                    pos = emoji.end()
+                elif text.startswith('ins)', pos):
+                    self._toggle(UNDERLINE, '(ins)')
+                    pos += 4
+                elif text.startswith('spl)', pos):
+                    self._toggle(SPOILER, '(spl)')
+                    pos += 4
+                else:
+                    self._emit_text('(')
+            
+            elif char == '[':
+                self.stack.append([LINK, []])
+            
+            elif char == ']':
+                url = _URL_RE.match(text, pos) if self._is_open(LINK) else None
+                if url:
+                    self._close(LINK, ']', url.group(1))
+                    pos = url.end()
+                else:
+                    if self.stack[-1][0] == LINK:
+                        self._unwind()
+                    self._emit_text(']')
+        
+        while len(self.stack) > 1:
+            self._unwind()
+        return tuple(self.stack[0][1])
+
+
+@lru_cache(maxsize=settings.formatter_cache_size)
+def parse(text: str) -> Tuple[Node, ...]:
+    """
+    解析KMarkdown（结果缓存，同一条消息发往多个目标只解析一次）
+    
+    Args:
+        text: KMarkdown文本
+    
+    Returns:
+        节点元组
+    """
+    if not text:
+        return ()
+    return _Parser(text).parse()
+
+
+def _utf16_length(text: str) -> int:
+    return len(text.encode('utf-16-le')) // 2
+
+
+LENGTH_UNITS = {
+    'chars': len,
+    'utf16': _utf16_length,
+    'utf8': lambda text: len(text.encode('utf-8'))
+}
+
+
+def split_code_block(value: str) -> Tuple[str, str]:
+    """
+    拆分代码块的语言标记
+    
+    Args:
+        value: 代码块内容（```与```之间的原文）
+    
+    Returns:
+        (语言, 代码)，没有语言标记时语言为空字符串
+    """
+    first_line, newline, rest = value.partition('\n')
+    lang = first_line.strip()
+    if newline and _LANG_RE.match(lang):
+        return lang, rest.rstrip('\n')
+    return '', value.strip('\n')
+
+
+class MarkdownRenderer:
+    """标准Markdown渲染器（飞书等）"""
+    
+    # 容器节点的前后标记，None表示平台不支持，只输出内容
+    wrappers: Dict[str, Optional[Tuple[str, str]]] = {
+        BOLD: ('**', '**'),
+        ITALIC: ('*', '*'),
+        STRIKE: ('~~', '~~'),
+        UNDERLINE: None,
+        SPOILER: None
+    }
+    
+    # 平台计算消息长度的单位：chars（字符）/ utf16（UTF-16码元）/ utf8（字节）
+    unit = 'chars'
+    
+    def __init__(self, emoji_map: Dict[str, str]):
+        self.emoji_map = emoji_map
+    
+    def length(self, text: str) -> int:
+        """按平台的单位计算文本长度"""
+        return LENGTH_UNITS[self.unit](text)
+    
+    def rendered_length(self, text: str) -> int:
+        """计算已渲染文本在平台上的长度"""
+        return self.length(text)
+    
+    def cost(self, node: Node) -> int:
+        """计算单个节点渲染后的长度"""
+        return self.rendered_length(self.render((node,)))
+    
+    def wrapper_cost(self, kind: str) -> int:
+        """计算格式容器前后标记的长度"""
+        wrapper = self.wrappers.get(kind)
+        return self.rendered_length(wrapper[0] + wrapper[1]) if wrapper else 0
+    
+    def render(self, nodes: Tuple[Node, ...]) -> str:
+        """把节点元组渲染为目标平台文本"""
+        parts: List[str] = []
+        self._render(nodes, parts)
+        return ''.join(parts)
+    
+    def _render(self, nodes: Tuple[Node, ...], parts: List[str]):
+        for kind, value in nodes:
+            if kind == TEXT:
+                parts.append(self.text(value))
+            elif kind == RAW:
+                parts.append(value)
+            elif kind == ESCAPE:
+                parts.append(self.escape(value))
+            elif kind == EMOJI:
+                parts.append(self.emoji(value))
+            elif kind == CODE:
+                parts.append(self.code(value))
+            elif kind == CODE_BLOCK:
+                parts.append(self.code_block(value))
+            elif kind == LINK:
+                children, url = value
+                parts.append(self.link(self.render(children), url))
+            else:
+                wrapper = self.wrappers.get(kind)
+                if wrapper:
+                    parts.append(wrapper[0])
+                    self._render(value, parts)
+                    parts.append(wrapper[1])
+                else:
+                    self._render(value, parts)
+    
+    def text(self, value: str) -> str:
+        return value
+    
+    def escape(self, char: str) -> str:
+        return '\\' + char
+    
+    def emoji(self, name: str) -> str:
+        return self.emoji_map.get(name, f":{name}:")
+    
+    def code(self, value: str) -> str:
+        return f"`{value}`"
+    
+    def code_block(self, value: str) -> str:
+        return f"```{value}```"
+    
+    def link(self, label: str, url: str) -> str:
+        return f"[{label}]({url})"
+
+
+class DiscordRenderer(MarkdownRenderer):
+    """Discord Markdown渲染器（支持下划线和剧透）"""
+    
+    wrappers = {
+        **MarkdownRenderer.wrappers,
+        UNDERLINE: ('__', '__'),
+        SPOILER: ('||', '||')
+    }
+
+
+class TelegramHtmlRenderer(MarkdownRenderer):
+    """Telegram HTML渲染器（parse_mode=HTML）"""
+    
+    unit = 'utf16'
+    
+    wrappers = {
+        BOLD: ('<b>', '</b>'),
+        ITALIC: ('<i>', '</i>'),
+        STRIKE: ('<s>', '</s>'),
+        UNDERLINE: ('<u>', '</u>'),
+        SPOILER: ('<tg-spoiler>', '</tg-spoiler>')
+    }
+    
+    def text(self, value: str) -> str:
+        return html.escape(value, quote=False)
+    
+    def escape(self, char: str) -> str:
+        return html.escape(char, quote=False)
+    
+    def code(self, value: str) -> str:
+        return f"<code>{html.escape(value, quote=False)}</code>"
+    
+    def code_block(self, value: str) -> str:
+        lang, code = split_code_block(value)
+        code = html.escape(code, quote=False)
+        if lang:
+            return f'<pre><code class="language-{html.escape(lang)}">{code}</code></pre>'
+        return f"<pre>{code}</pre>"
+    
+    def link(self, label: str, url: str) -> str:
+        return f'<a href="{html.escape(url)}">{label}</a>'
+    
+    def rendered_length(self, text: str) -> int:
+        # Telegram按实体解析后的文本计算长度（标签不计入，实体还原为单个字符）
+        return self.length(html.unescape(_TAG_RE.sub('', text)))
+
+
+class PlainTextRenderer(MarkdownRenderer):
+    """纯文本渲染器（企业微信、钉钉的text消息）"""
+    
+    unit = 'utf8'  # 企业微信按UTF-8字节数限制text消息长度
+    
+    wrappers = {kind: None for kind in MarkdownRenderer.wrappers}
+    
+    def escape(self, char: str) -> str:
+        return char
+    
+    def code(self, value: str) -> str:
+        return value
+    
+    def code_block(self, value: str) -> str:
+        return split_code_block(value)[1]
+    
+    def link(self, label: str, url: str) -> str:
+        return url if label == url else f"{label} ({url})"
+
+
+def _text_pieces(text: str, min_priority: int = 1) -> List[Tuple[str, int]]:
+    """
+    把文本切成以断点结尾的片段
+    
+    Args:
+        text: 文本
+        min_priority: 只在不低于该优先级的断点处切开
+    
+    Returns:
+        [(片段, 断点优先级)]，优先级0表示片段后不是断点
+    """
+    pieces = []
+    pos = 0
+    for match in _BREAK_RE.finditer(text):
+        priority = 6 - match.lastindex
+        if priority >= min_priority:
+            pieces.append((text[pos:match.end()], priority))
+            pos = match.end()
+    if pos < len(text):
+        pieces.append((text[pos:], 0))
+    return pieces
+
+
+def _pack(pieces: List[tuple], max_length: int, overhead) -> List[List[tuple]]:
+    """
+    贪心装箱（单遍，超长时回退到当前段里最合适的断点）
+    
+    Args:
+        pieces: [(样式, 节点, 长度, 断点优先级)]，每个片段单独放得下
+        max_length: 单段最大长度
+        overhead: overhead(前一片段样式, 当前片段样式) -> 新打开的格式标记长度
+    
+    Returns:
+        分段后的片段列表
+    """
+    chunks = []
+    start = 0
+    index = 0
+    used = 0
+    breaks: Dict[int, Tuple[int, int]] = {}  # 优先级 -> (段结束位置, 段长度)
+    
+    while index < len(pieces):
+        styles, _, cost, priority = pieces[index]
+        prev_styles = pieces[index - 1][0] if index > start else ()
+        size = cost + overhead(prev_styles, styles)
+        
+        if used + size > max_length and index > start:
+            # 优先在高优先级断点处断开，但不为此产生过短的段
+            end = index
+            for level in sorted(breaks, reverse=True):
+                if breaks[level][1] >= max_length // 2:
+                    end = breaks[level][0]
+                    break
+            chunks.append(pieces[start:end])
+            start = index = end
+            used = 0
+            breaks = {}
+            continue
+        
+        used += size
+        if priority:
+            breaks[priority] = (index + 1, used)
+        index += 1
+    
+    if start < len(pieces):
+        chunks.append(pieces[start:])
+    return chunks
+
+
+def _trim(pieces: List[tuple]) -> List[tuple]:
+    """去掉段首段尾的空白文本"""
+    pieces = list(pieces)
+    while pieces and pieces[0][1][0] == TEXT and not pieces[0][1][1].lstrip():
+        pieces.pop(0)
+    while pieces and pieces[-1][1][0] == TEXT and not pieces[-1][1][1].rstrip():
+        pieces.pop()
+    if pieces and pieces[0][1][0] == TEXT:
+        styles, node = pieces[0][:2]
+        pieces[0] = (styles, (TEXT, node[1].lstrip())) + pieces[0][2:]
+    if pieces and pieces[-1][1][0] == TEXT:
+        styles, node = pieces[-1][:2]
+        pieces[-1] = (styles, (TEXT, node[1].rstrip())) + pieces[-1][2:]
+    return pieces
+
+
+def split_plain(text: str, max_length: int, length=len) -> List[str]:
+    """
+    分割纯文本（不识别格式标记）
+    
+    单遍扫描断点：每段在长度上限内选优先级最高且不短于上限一半的断点，
+    没有时取最后一个断点，仍没有时按字符截断
+    
+    Args:
+        text: 文本
+        max_length: 单段最大长度
+        length: 长度计算函数
+    
+    Returns:
+        分段列表
+    """
+    total = length(text)
+    if total <= max_length:
+        return [text]
+    
+    if total == len(text):
+        # 按字符计算（或文本中没有多单位字符）时位置即长度
+        offsets = None
+        cost_at = lambda pos: pos
+    else:
+        offsets = [0, *accumulate(map(length, text))]
+        cost_at = offsets.__getitem__
+    
+    breaks = [(match.end(), 6 - match.lastindex) for match in _BREAK_RE.finditer(text)]
+    positions = [pos for pos, _ in breaks]
+    
+    chunks = []
+    start = 0
+    while total - cost_at(start) > max_length:
+        limit = cost_at(start) + max_length
+        half = cost_at(start) + max_length // 2
+        
+        end = None
+        best = -1
+        latest = None
+        index = bisect_right(positions, start)
+        while index < len(breaks) and cost_at(breaks[index][0]) <= limit:
+            pos, priority = breaks[index]
+            latest = pos
+            if cost_at(pos) >= half and priority >= best:
+                end, best = pos, priority
+            index += 1
+        
+        if end is None:
+            end = latest
+        if end is None:
+            # 强制截断
+            end = start + max_length if offsets is None else bisect_right(offsets, limit) - 1
+            end = max(end, start + 1)
+        
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+        start = end
+    
+    chunk = text[start:].strip()
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+class _Splitter:
+    """在中间表示上分段"""
+    
+    def __init__(self, renderer: MarkdownRenderer, max_length: int):
+        self.renderer = renderer
+        self.max_length = max_length
+        self.pieces: List[tuple] = []
+        self._wrapper_costs = {kind: renderer.wrapper_cost(kind) for kind in STYLE_KINDS}
+    
+    def overhead(self, prev_styles: tuple, styles: tuple) -> int:
+        """当前片段需要新打开的格式标记长度（与前一片段共同的外层格式不重复计算）"""
+        if prev_styles == styles:
+            return 0
+        common = 0
+        while common < min(len(prev_styles), len(styles)) and prev_styles[common] == styles[common]:
+            common += 1
+        return sum(self._wrapper_costs[kind] for kind in styles[common:])
+    
+    def add(self, nodes: Tuple[Node, ...], styles: tuple = ()):
+        """展开节点为片段（格式容器展开为样式，文本按断点切开）"""
+        for node in nodes:
+            kind, value = node
+            if kind in STYLE_KINDS:
+                self.add(value, styles + (kind,))
+            elif kind == TEXT:
+                # 只在句子及以上的断点处切开，句子内部超长时再细分
+                for piece, priority in _text_pieces(value, min_priority=3):
+                    self._fit(styles, (TEXT, piece), priority)
+            else:
+                self._fit(styles, node, 4 if kind == CODE_BLOCK else 0)
+    
+    def _fit(self, styles: tuple, node: Node, priority: int):
+        """放入片段，单个片段超长时拆开"""
+        renderer = self.renderer
+        budget = self.max_length - (self.overhead((), styles) if styles else 0)
+        kind, value = node
+        # 文本在各平台上的长度就是原文长度（转义字符不计入）
+        cost = renderer.length(value) if kind == TEXT else renderer.cost(node)
+        if cost <= budget:
+            self.pieces.append((styles, node, cost, priority))
+            return
+        
+        if kind == TEXT:
+            for piece, piece_priority in _text_pieces(value):
+                piece_cost = renderer.length(piece)
+                if piece_cost <= budget:
+                    self.pieces.append((styles, (TEXT, piece), piece_cost, piece_priority))
+                    continue
+                for part in split_plain(piece, budget, renderer.length):
+                    self.pieces.append((styles, (TEXT, part), renderer.length(part), 0))
+        elif kind == RAW:
+            for part in split_plain(value, budget, renderer.rendered_length):
+                self.pieces.append((styles, (RAW, part), renderer.rendered_length(part), 3))
+        elif kind in (CODE, CODE_BLOCK):
+            # 超长代码拆成多个代码块，每块都是完整的格式
+            if kind == CODE_BLOCK:
+                lang, code = split_code_block(value)
+                make = lambda part: (CODE_BLOCK, f"{lang}\n{part}\n")
+            else:
+                code = value
+                make = lambda part: (CODE, part)
+            wrapper = renderer.cost(make(''))
+            if kind == CODE_BLOCK and lang and wrapper >= budget:
+                # 语言标记占满了单段长度，去掉语言标记
+                lang = ''
+                wrapper = renderer.cost(make(''))
+            if wrapper >= budget:
+                # 代码格式本身就放不下，按纯文本拆开
+                for part in split_plain(code, budget, renderer.length):
+                    self.pieces.append((styles, (TEXT, part), renderer.length(part), 0))
+                return
+            for part in split_plain(code, budget - wrapper, renderer.length):
+                self.pieces.append((styles, make(part), renderer.cost(make(part)), 4))
+        elif kind == LINK:
+            # 超长链接退化为文本
+            self.add(value[0], styles)
+        else:
+            self.pieces.append((styles, node, cost, priority))
+    
+    def render(self, chunk: List[tuple]) -> str:
+        """把一段片段还原为节点树（相同外层样式合并）并渲染"""
+        root: List[Node] = []
+        stack = [((), root)]
+        for styles, node, _, _ in chunk:
+            while styles[:len(stack[-1][0])] != stack[-1][0]:
+                opened, children = stack.pop()
+                stack[-1][1].append((opened[-1], tuple(children)))
+            while len(stack[-1][0]) < len(styles):
+                stack.append((styles[:len(stack[-1][0]) + 1], []))
+            stack[-1][1].append(node)
+        while len(stack) > 1:
+            opened, children = stack.pop()
+            stack[-1][1].append((opened[-1], tuple(children)))
+        return self.renderer.render(tuple(root))
+    
+    def split(self) -> List[str]:
+        chunks = []
+        for chunk in _pack(self.pieces, self.max_length, self.overhead):
+            chunk = _trim(chunk)
+            if chunk:
+                chunks.append(self.render(chunk))
+        return chunks
+
+
+def split_nodes(nodes: Tuple[Node, ...], renderer: MarkdownRenderer, max_length: int,
+                prefix: str = '', suffix: str = '') -> List[str]:
+    """
+    把解析结果渲染并分段
+    
+    Args:
+        nodes: 节点元组
+        renderer: 目标平台渲染器
+        max_length: 单段最大长度（平台单位）
+        prefix: 放在第一段开头的已渲染文本（如发送者名称）
+        suffix: 放在最后一段末尾的已渲染文本（如附件列表）
+    
+    Returns:
+        可直接发送的分段列表
+    """
+    splitter = _Splitter(renderer, max_length)
+    if prefix:
+        splitter._fit((), (RAW, prefix), 0)
+    splitter.add(nodes)
+    if suffix:
+        splitter._fit((), (RAW, suffix), 0)
+    return splitter.split()
@@ -1,22 +1,86 @@
 """
 链接预览处理模块
 自动提取链接的标题、描述、图片等元数据
+
+- 按URL缓存预览结果（失败/无预览的URL也缓存较短时间，避免反复抓取）
+- 同一URL的并发请求只抓取一次
+- 流式读取页面，读到</head>或达到字节上限即停止
+- HTML解析在线程池中执行，不阻塞事件循环
 """
 import re
 import asyncio
-import aiohttp
 from bs4 import BeautifulSoup
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 from urllib.parse import urljoin, urlparse
+from ..config import settings
 from ..utils.logger import logger
+from ..utils.http_client import http_client_manager
+from ..utils.cache_manager import MemoryCache, SingleFlight
+
+
+# 负缓存标记（该URL没有可用预览）
+_NO_PREVIEW = object()
+
+# 页面头部结束标记
+_HEAD_END = re.compile(rb'</head\s*>', re.IGNORECASE)
 
 
 class LinkPreviewGenerator:
     """链接预览生成器"""
     
     def __init__(self):
-        self.timeout = aiohttp.ClientTimeout(total=10)
         self.user_agent = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+        
+        # URL -> 预览（或负缓存标记）
+        self.cache = MemoryCache(
+            max_size=settings.link_preview_cache_size,
+            default_ttl=settings.link_preview_cache_ttl
+        )
+        self.single_flight = SingleFlight()
+    
+    async def get_preview(self, url: str) -> Optional[Dict[str, Any]]:
+        """
+        获取链接预览（优先使用缓存）
+        
+        Args:
+            url: 链接URL
+            
+        Returns:
+            预览信息字典，没有可用预览返回None
+        """
+        cached = self.cache.get(url)
+        if cached is not None:
+            return None if cached is _NO_PREVIEW else cached
+        
+        return await self.single_flight.do(url, lambda: self._load_preview(url))
+    
+    def get_cached_preview(self, url: str) -> Optional[Dict[str, Any]]:
+        """
+        只从缓存获取预览（不发起抓取）
+        
+        Args:
+            url: 链接URL
+            
+        Returns:
+            缓存的预览，未缓存或没有可用预览返回None
+        """
+        cached = self.cache.get(url)
+        return None if cached is None or cached is _NO_PREVIEW else cached
+    
+    def is_cached(self, url: str) -> bool:
+        """URL是否已有缓存结果（包括负缓存）"""
+        return self.cache.get(url) is not None
+    
+    async def _load_preview(self, url: str) -> Optional[Dict[str, Any]]:
+        """抓取预览并写入缓存"""
+        preview = await self.extract_preview(url)
+        
+        if preview:
+            self.cache.set(url, preview)
+        else:
+            self.cache.set(url, _NO_PREVIEW, ttl=settings.link_preview_negative_ttl)
+        
+        return preview
     
     async def extract_preview(self, url: str) -> Optional[Dict[str, Any]]:
         """
@@ -36,6 +100,26 @@ class LinkPreviewGenerator:
             if not html:
                 return None
             
+            # 在线程池中解析页面
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, self._parse_preview, url, html)
+                
+        except Exception as e:
+            logger.error(f"❌ 链接预览提取失败: {url}, 错误: {str(e)}")
+            return None
+    
+    def _parse_preview(self, url: str, html: str) -> Optional[Dict[str, Any]]:
+        """
+        解析页面元数据（同步，在线程池中执行）
+        
+        Args:
+            url: 链接URL
+            html: 页面HTML（通常只有<head>部分）
+            
+        Returns:
+            预览信息字典
+        """
+        try:
             # 解析页面
             soup = BeautifulSoup(html, 'html.parser')
             
@@ -79,12 +163,12 @@ class LinkPreviewGenerator:
                 return None
                 
         except Exception as e:
-            logger.error(f"❌ 链接预览提取失败: {url}, 错误: {str(e)}")
+            logger.error(f"❌ 链接预览解析失败: {url}, 错误: {str(e)}")
             return None
     
     async def _fetch_html(self, url: str) -> Optional[str]:
         """
-        下载网页HTML
+        下载网页HTML（只读取到</head>，最多 link_preview_max_bytes 字节）
         
         Args:
             url: 网页URL
@@ -99,21 +183,21 @@ class LinkPreviewGenerator:
                 'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
             }
             
-            async with aiohttp.ClientSession(timeout=self.timeout) as session:
-                async with session.get(url, headers=headers, allow_redirects=True) as response:
-                    if response.status == 200:
-                        # 检查Content-Type
-                        content_type = response.headers.get('Content-Type', '')
-                        if 'text/html' not in content_type and 'application/xhtml' not in content_type:
-                            logger.warning(f"URL不是HTML页面: {content_type}")
-                            return None
-                        
-                        html = await response.text()
-                        return html
-                    else:
-                        logger.error(f"下载失败: HTTP {response.status}")
+            session = await http_client_manager.get_session('preview')
+            async with session.get(url, headers=headers, allow_redirects=True) as response:
+                if response.status == 200:
+                    # 检查Content-Type
+                    content_type = response.headers.get('Content-Type', '')
+                    if 'text/html' not in content_type and 'application/xhtml' not in content_type:
+                        logger.warning(f"URL不是HTML页面: {content_type}")
                         return None
-                        
+                    
+                    html = await self._read_head(response)
+                    return html
+                else:
+                    logger.error(f"下载失败: HTTP {response.status}")
+                    return None
+                    
         except asyncio.TimeoutError:
             logger.error(f"下载超时: {url}")
             return None
@@ -121,6 +205,39 @@ class LinkPreviewGenerator:
             logger.error(f"下载异常: {url}, {str(e)}")
             return None
     
+    async def _read_head(self, response) -> str:
+        """
+        流式读取响应，遇到</head>或达到字节上限即停止
+        
+        Args:
+            response: aiohttp响应
+            
+        Returns:
+            已读取的HTML
+        """
+        max_bytes = settings.link_preview_max_bytes
+        data = bytearray()
+        
+        async for chunk in response.content.iter_chunked(8192):
+            # 从上一块末尾往回几个字节开始查找，避免标记跨块
+            search_from = max(0, len(data) - 8)
+            data.extend(chunk)
+            
+            match = _HEAD_END.search(data, search_from)
+            if match:
+                del data[match.end():]
+                break
+            
+            if len(data) >= max_bytes:
+                del data[max_bytes:]
+                break
+        
+        try:
+            return bytes(data).decode(response.charset or 'utf-8', errors='replace')
+        except LookupError:
+            # 未知编码
+            return bytes(data).decode('utf-8', errors='replace')
+    
     def _extract_opengraph(self, soup: BeautifulSoup) -> Optional[Dict[str, Any]]:
         """
         提取Open Graph元数据
@@ -274,14 +391,55 @@ class LinkPreviewGenerator:
         # 限制数量
         urls = urls[:max_previews]
         
-        # 为每个URL生成预览
+        # 并发生成预览（命中缓存的URL不再抓取）
+        results = await asyncio.gather(*(self.get_preview(url) for url in urls))
+        
+        return [preview for preview in results if preview]
+    
+    def get_cached_message_links(self, message_content: str, max_previews: int = 3) -> tuple:
+        """
+        只从缓存获取消息中链接的预览（不等待抓取）
+        
+        Args:
+            message_content: 消息内容
+            max_previews: 最多几个链接
+            
+        Returns:
+            (已缓存的预览列表, 尚未缓存的URL列表)
+        """
+        urls = self.extract_urls_from_text(message_content)[:max_previews]
+        
         previews = []
+        pending = []
         for url in urls:
-            preview = await self.extract_preview(url)
-            if preview:
-                previews.append(preview)
+            if self.is_cached(url):
+                preview = self.get_cached_preview(url)
+                if preview:
+                    previews.append(preview)
+            else:
+                pending.append(url)
         
-        return previews
+        return previews, pending
+    
+    async def fetch_previews(self, urls: List[str]) -> List[Dict[str, Any]]:
+        """
+        抓取一组URL的预览（后台补发时使用）
+        
+        Args:
+            urls: URL列表
+            
+        Returns:
+            成功提取的预览列表
+        """
+        results = await asyncio.gather(*(self.get_preview(url) for url in urls))
+        return [preview for preview in results if preview]
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取预览缓存统计"""
+        return {
+            'cache': self.cache.get_stats(),
+            'single_flight': self.single_flight.get_stats()
+        }
     
     def format_preview_for_discord(self, preview: Dict[str, Any]) -> Dict[str, Any]:
         """
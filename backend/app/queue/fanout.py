@@ -0,0 +1,287 @@
+"""
+消息扇出转发模块
+将一条KOOK消息并发分发到所有映射目标
+
+- 按平台、按Bot限制并发，避免单个平台被瞬间打满
+- 同一目标频道内按出队顺序串行投递：出队时领取顺序票据，确定目标后（媒体处理之前）
+  按票据顺序在各目标频道预留位置，媒体处理快慢不会打乱顺序
+- 每个目标独立计时、独立记录结果，单个目标慢或失败不影响其他目标
+"""
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, asdict
+from typing import Dict, Any, List, Optional, Callable, Awaitable, Tuple, Deque
+from ..utils.logger import logger
+from ..config import settings
+
+
+@dataclass
+class TargetResult:
+    """单个目标的转发结果"""
+    mapping_id: Optional[int]
+    platform: str
+    target_channel: str
+    bot_id: Optional[int]
+    success: bool
+    latency_ms: int
+    error: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+# 目标发送函数签名: (message, mapping) -> 是否成功
+SendFunc = Callable[[Dict[str, Any], Dict[str, Any]], Awaitable[bool]]
+
+# 目标频道键: (平台, 频道ID)
+ChannelKey = Tuple[str, str]
+
+
+def channel_key(mapping: Dict[str, Any]) -> ChannelKey:
+    """映射对应的目标频道键"""
+    return mapping.get('target_platform', 'unknown'), str(mapping.get('target_channel_id', ''))
+
+
+class OrderTicket:
+    """
+    消息的投递顺序票据
+
+    出队时按顺序领取；确定目标后调用 claim() 在各目标频道排队，
+    前一张票据排完队之后才轮到本票据，所以各频道内的顺序与出队顺序一致
+    """
+
+    def __init__(self, previous: Optional['OrderTicket'] = None):
+        self._previous = previous
+        self.claimed = asyncio.Event()
+        # 已预留但尚未投递的频道位置
+        self.slots: Dict[ChannelKey, Deque[asyncio.Event]] = {}
+
+
+class FanoutDispatcher:
+    """
+    扇出调度器
+
+    获取顺序固定为：目标频道位置 → Bot信号量 → 平台信号量，
+    等待频道位置时不占用任何并发名额，因此不会出现死锁。
+    """
+
+    def __init__(self, platform_concurrency: int = 8, bot_concurrency: int = 4):
+        """
+        初始化扇出调度器
+
+        Args:
+            platform_concurrency: 每个平台同时进行的最大请求数
+            bot_concurrency: 每个Bot同时进行的最大请求数
+        """
+        self.platform_concurrency = platform_concurrency
+        self.bot_concurrency = bot_concurrency
+
+        self._platform_semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._bot_semaphores: Dict[Tuple[str, Any], asyncio.Semaphore] = {}
+
+        # 目标频道排队（队首的位置可以投递，投递完成后唤醒下一个）
+        self._channel_queues: Dict[ChannelKey, Deque[asyncio.Event]] = {}
+        self._last_ticket: Optional[OrderTicket] = None
+
+        # 统计
+        self.stats = {
+            'messages': 0,
+            'targets': 0,
+            'success': 0,
+            'failed': 0,
+            'in_flight': 0,
+            'max_in_flight': 0
+        }
+
+    def _get_platform_semaphore(self, platform: str) -> asyncio.Semaphore:
+        if platform not in self._platform_semaphores:
+            self._platform_semaphores[platform] = asyncio.Semaphore(self.platform_concurrency)
+        return self._platform_semaphores[platform]
+
+    def _get_bot_semaphore(self, platform: str, bot_id: Any) -> asyncio.Semaphore:
+        key = (platform, bot_id)
+        if key not in self._bot_semaphores:
+            self._bot_semaphores[key] = asyncio.Semaphore(self.bot_concurrency)
+        return self._bot_semaphores[key]
+
+    def reserve(self) -> OrderTicket:
+        """
+        领取顺序票据（出队后、处理前按出队顺序同步调用）
+
+        Returns:
+            票据，之后必须调用 claim() 或 release()，否则后面的消息会一直等待
+        """
+        ticket = OrderTicket(self._last_ticket)
+        self._last_ticket = ticket
+        return ticket
+
+    async def claim(self, ticket: OrderTicket, mappings: List[Dict[str, Any]]):
+        """
+        按票据顺序在各目标频道预留位置
+
+        Args:
+            ticket: reserve() 领取的票据
+            mappings: 本消息要投递的映射
+        """
+        if ticket.claimed.is_set():
+            return
+        if ticket._previous is not None:
+            await ticket._previous.claimed.wait()
+            ticket._previous = None
+
+        for mapping in mappings:
+            key = channel_key(mapping)
+            ticket.slots.setdefault(key, deque()).append(self._enqueue(key))
+        ticket.claimed.set()
+        if self._last_ticket is ticket:
+            self._last_ticket = None
+
+    async def release(self, ticket: OrderTicket):
+        """
+        释放票据（消息处理结束时调用，未投递的预留位置让给后面的消息）
+
+        Args:
+            ticket: reserve() 领取的票据
+        """
+        await self.claim(ticket, [])
+        for key, slots in ticket.slots.items():
+            for slot in slots:
+                self._leave(key, slot)
+        ticket.slots.clear()
+
+    def _enqueue(self, key: ChannelKey) -> asyncio.Event:
+        """在目标频道队尾排队，返回轮到时被设置的事件"""
+        queue = self._channel_queues.setdefault(key, deque())
+        slot = asyncio.Event()
+        queue.append(slot)
+        if len(queue) == 1:
+            slot.set()
+        return slot
+
+    def _leave(self, key: ChannelKey, slot: asyncio.Event):
+        """
+        离开目标频道队列并唤醒新的队首
+
+        队列为空时回收，防止频道数量增长导致内存泄漏
+        """
+        queue = self._channel_queues.get(key)
+        if not queue or slot not in queue:
+            return
+        was_head = queue[0] is slot
+        queue.remove(slot)
+        if not queue:
+            self._channel_queues.pop(key, None)
+        elif was_head:
+            queue[0].set()
+
+    @asynccontextmanager
+    async def _ordered(self, key: ChannelKey, ticket: Optional[OrderTicket]):
+        """
+        目标频道顺序位置（使用票据预留的位置，没有票据时在队尾排队）
+        """
+        slots = ticket.slots.get(key) if ticket else None
+        slot = slots.popleft() if slots else self._enqueue(key)
+
+        try:
+            await slot.wait()
+            yield
+        finally:
+            self._leave(key, slot)
+
+    async def dispatch(self, message: Dict[str, Any],
+                       mappings: List[Dict[str, Any]],
+                       send: SendFunc,
+                       ticket: Optional[OrderTicket] = None) -> List[TargetResult]:
+        """
+        并发转发一条消息到所有映射目标
+
+        Args:
+            message: 消息数据
+            mappings: 频道映射列表
+            send: 单目标发送函数
+            ticket: 已预留频道位置的顺序票据（不传时按调用顺序排队）
+
+        Returns:
+            每个目标的转发结果（顺序与mappings一致）
+        """
+        if not mappings:
+            return []
+
+        self.stats['messages'] += 1
+
+        results = await asyncio.gather(
+            *[self._dispatch_one(message, mapping, send, ticket) for mapping in mappings]
+        )
+
+        return list(results)
+
+    async def _dispatch_one(self, message: Dict[str, Any],
+                            mapping: Dict[str, Any],
+                            send: SendFunc,
+                            ticket: Optional[OrderTicket] = None) -> TargetResult:
+        """
+        转发到单个目标（所有异常在此捕获）
+        """
+        platform = mapping.get('target_platform', 'unknown')
+        target_channel = mapping.get('target_channel_id', '')
+        bot_id = mapping.get('target_bot_id')
+
+        error = None
+        success = False
+        start = time.monotonic()
+
+        async with self._ordered(channel_key(mapping), ticket):
+            async with self._get_bot_semaphore(platform, bot_id):
+                async with self._get_platform_semaphore(platform):
+                    # 等锁时间不计入目标延迟
+                    start = time.monotonic()
+                    self.stats['in_flight'] += 1
+                    self.stats['max_in_flight'] = max(
+                        self.stats['max_in_flight'], self.stats['in_flight']
+                    )
+
+                    try:
+                        success = bool(await send(message, mapping))
+                    except Exception as e:
+                        error = str(e)
+                        logger.error(
+                            f"扇出转发异常: {platform} - {target_channel}, 错误: {error}"
+                        )
+                    finally:
+                        self.stats['in_flight'] -= 1
+
+        latency_ms = int((time.monotonic() - start) * 1000)
+
+        self.stats['targets'] += 1
+        if success:
+            self.stats['success'] += 1
+        else:
+            self.stats['failed'] += 1
+
+        return TargetResult(
+            mapping_id=mapping.get('id'),
+            platform=platform,
+            target_channel=str(target_channel),
+            bot_id=bot_id,
+            success=success,
+            latency_ms=latency_ms,
+            error=error
+        )
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取扇出统计"""
+        return {
+            **self.stats,
+            'platform_concurrency': self.platform_concurrency,
+            'bot_concurrency': self.bot_concurrency,
+            'active_channels': len(self._channel_queues)
+        }
+
+
+# 创建全局扇出调度器
+fanout_dispatcher = FanoutDispatcher(
+    platform_concurrency=settings.fanout_platform_concurrency,
+    bot_concurrency=settings.fanout_bot_concurrency
+)
@@ -2,6 +2,7 @@
 消息转发处理器
 从worker.py拆分出来，专注于平台转发逻辑
 """
+import html
 import asyncio
 from typing import Dict, Any, Optional
 from ..utils.structured_logger import logger, log_info, log_error
@@ -82,13 +83,11 @@ class ForwardHandler:
     ) -> bool:
         """转发到Discord"""
         try:
-            # 格式转换
-            formatted_content = formatter.kmarkdown_to_discord(content)
-            formatted_content = f"**{sender_name}**: {formatted_content}"
+            # 格式转换（超长时按渲染后的长度分段，留出分段编号的余量）
+            segments = formatter.split_message(content, 'discord', 1990, prefix=f"**{sender_name}**: ")
             
             # 处理超长消息
-            if len(formatted_content) > 2000:
-                segments = formatter.split_long_message(formatted_content, 1950)
+            if len(segments) > 1:
                 for i, segment in enumerate(segments):
                     success = await discord_forwarder.send_message(
                         webhook_url=bot_config['config']['webhook_url'],
@@ -102,7 +101,7 @@ class ForwardHandler:
             else:
                 return await discord_forwarder.send_message(
                     webhook_url=bot_config['config']['webhook_url'],
-                    content=formatted_content,
+                    content=segments[0],
                     username=sender_name
                 )
         except Exception as e:
@@ -119,13 +118,13 @@ class ForwardHandler:
     ) -> bool:
         """转发到Telegram"""
         try:
-            # 格式转换
-            formatted_content = formatter.kmarkdown_to_telegram_html(content)
-            formatted_content = f"<b>{sender_name}</b>: {formatted_content}"
+            # 格式转换（超长时按实体解析后的UTF-16长度分段，每段都是完整的HTML）
+            segments = formatter.split_message(
+                content, 'telegram', 4080, prefix=f"<b>{html.escape(sender_name)}</b>: "
+            )
             
             # 处理超长消息
-            if len(formatted_content) > 4096:
-                segments = formatter.split_long_message(formatted_content, 4000)
+            if len(segments) > 1:
                 for i, segment in enumerate(segments):
                     success = await telegram_forwarder.send_message(
                         token=bot_config['config']['token'],
@@ -140,7 +139,7 @@ class ForwardHandler:
                 return await telegram_forwarder.send_message(
                     token=bot_config['config']['token'],
                     chat_id=target_channel,
-                    content=formatted_content
+                    content=segments[0]
                 )
         except Exception as e:
             log_error("Telegram转发失败", error=str(e))
@@ -156,13 +155,11 @@ class ForwardHandler:
     ) -> bool:
         """转发到飞书"""
         try:
-            # 格式转换
-            formatted_content = formatter.kmarkdown_to_feishu_text(content)
-            formatted_content = f"{sender_name}: {formatted_content}"
+            # 格式转换（超长时按渲染后的长度分段）
+            segments = formatter.split_message(content, 'feishu', 4980, prefix=f"{sender_name}: ")
             
             # 处理超长消息
-            if len(formatted_content) > 5000:
-                segments = formatter.split_long_message(formatted_content, 4900)
+            if len(segments) > 1:
                 for i, segment in enumerate(segments):
                     success = await feishu_forwarder.send_message(
                         app_id=bot_config['config']['app_id'],
@@ -179,7 +176,7 @@ class ForwardHandler:
                     app_id=bot_config['config']['app_id'],
                     app_secret=bot_config['config']['app_secret'],
                     chat_id=target_channel,
-                    content=formatted_content
+                    content=segments[0]
                 )
         except Exception as e:
             log_error("飞书转发失败", error=str(e))
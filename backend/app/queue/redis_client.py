@@ -1,11 +1,18 @@
 """
 Redis队列客户端
 """
+import asyncio
 import redis.asyncio as aioredis
 import json
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 from ..utils.logger import logger
 from ..config import settings
+from ..utils.message_wal import message_wal
+from .redis_stream import RedisStreamQueue
+
+
+# 本地Fallback在预写日志中的记录类型
+FALLBACK_KIND = 'fallback'
 
 
 class RedisQueue:
@@ -14,6 +21,17 @@ class RedisQueue:
     def __init__(self):
         self.redis: Optional[aioredis.Redis] = None
         self.queue_name = "kook_messages"
+        
+        # 队列后端：list（默认）或 stream（消费组+确认，Worker崩溃不丢消息）
+        self.backend = settings.queue_backend
+        self.stream: Optional[RedisStreamQueue] = None
+        if self.backend == "stream":
+            self.stream = RedisStreamQueue(
+                stream_name=f"{self.queue_name}:stream",
+                group_name=settings.queue_stream_group,
+                claim_idle_seconds=settings.queue_stream_claim_idle,
+                max_deliveries=settings.queue_stream_max_deliveries
+            )
     
     async def connect(self):
         """连接Redis"""
@@ -29,10 +47,42 @@ class RedisQueue:
             await self.redis.ping()
             logger.info("Redis连接成功")
             
+            if self.stream:
+                await self.stream.setup(self.redis)
+                await self._migrate_list_to_stream()
+            
         except Exception as e:
             logger.error(f"Redis连接失败: {str(e)}")
             pass  # Disabled: allow startup without Redis
     
+    async def _migrate_list_to_stream(self):
+        """
+        切换到Stream后端时，把旧列表队列中的遗留消息迁移过去
+        
+        每批消息写入Stream成功后才从列表删除：写入失败或进程崩溃时消息仍留在列表中，
+        下次启动重新迁移（重复写入的消息由Worker按message_id去重）
+        """
+        migrated = 0
+        while True:
+            async with self.redis.pipeline(transaction=True) as pipe:
+                # 多个Worker进程同时迁移时，列表被其他进程修剪过则重新读取，避免删掉未迁移的消息
+                await pipe.watch(self.queue_name)
+                chunk = await pipe.lrange(self.queue_name, 0, 499)
+                if not chunk:
+                    break
+                await self.stream.enqueue_many([json.loads(m) for m in chunk])
+                
+                pipe.multi()
+                pipe.ltrim(self.queue_name, len(chunk), -1)
+                try:
+                    await pipe.execute()
+                except aioredis.WatchError:
+                    continue
+            migrated += len(chunk)
+        
+        if migrated:
+            logger.info(f"已将 {migrated} 条遗留消息从列表队列迁移到Stream")
+    
     async def disconnect(self):
         """断开连接"""
         if self.redis:
@@ -52,8 +102,11 @@ class RedisQueue:
         # ✅ P2-4优化：3次重试+自动重连
         for attempt in range(3):
             try:
-                message_json = json.dumps(message, ensure_ascii=False)
-                await self.redis.rpush(self.queue_name, message_json)
+                if self.stream:
+                    await self.stream.enqueue(message)
+                else:
+                    message_json = json.dumps(message, ensure_ascii=False)
+                    await self.redis.rpush(self.queue_name, message_json)
                 logger.debug(f"消息已入队: {message.get('message_id')}")
                 return True
                 
@@ -76,62 +129,101 @@ class RedisQueue:
         await self._save_to_local_fallback(message)
         return False
     
+    async def enqueue_many(self, messages: List[Dict[str, Any]],
+                           chunk_size: int = 500) -> int:
+        """
+        批量入队（每个分块一次往返，而不是每条消息一次RPUSH）
+        
+        Args:
+            messages: 消息列表
+            chunk_size: 单次写入的最大条数
+            
+        Returns:
+            成功入队的数量
+        """
+        if not messages:
+            return 0
+        
+        enqueued = 0
+        
+        for start in range(0, len(messages), chunk_size):
+            chunk = messages[start:start + chunk_size]
+            
+            for attempt in range(3):
+                try:
+                    if self.stream:
+                        await self.stream.enqueue_many(chunk)
+                    else:
+                        await self.redis.rpush(
+                            self.queue_name,
+                            *[json.dumps(m, ensure_ascii=False) for m in chunk]
+                        )
+                    enqueued += len(chunk)
+                    break
+                    
+                except (aioredis.ConnectionError, aioredis.TimeoutError) as e:
+                    logger.warning(f"Redis连接失败，尝试重连 ({attempt+1}/3): {str(e)}")
+                    
+                    try:
+                        await self.connect()
+                        await asyncio.sleep(1)
+                    except:
+                        pass
+                        
+                except Exception as e:
+                    logger.error(f"批量入队失败: {str(e)}")
+                    break
+            else:
+                # 3次重试都失败，保存到本地Fallback
+                logger.error(f"Redis操作失败，{len(chunk)} 条消息保存到本地Fallback")
+                for message in chunk:
+                    await self._save_to_local_fallback(message)
+        
+        logger.debug(f"批量入队 {enqueued}/{len(messages)} 条消息")
+        return enqueued
+    
     async def _save_to_local_fallback(self, message: Dict[str, Any]):
         """
-        本地Fallback：Redis不可用时保存消息到文件（✅ P2-4优化）
+        本地Fallback：Redis不可用时把消息追加到预写日志（✅ P2-4优化）
         
         Args:
             message: 消息数据
         """
         try:
-            from ..config import settings
-            import json
-            from datetime import datetime
-            
-            fallback_dir = settings.data_dir / "fallback_queue"
-            fallback_dir.mkdir(exist_ok=True)
-            
-            # 使用时间戳作为文件名
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
-            filename = fallback_dir / f"msg_{timestamp}.json"
-            
-            with open(filename, 'w', encoding='utf-8') as f:
-                json.dump(message, f, ensure_ascii=False, indent=2)
-            
-            logger.info(f"✅ 消息已保存到本地Fallback: {filename}")
+            record_id = message_wal.append(FALLBACK_KIND, message.get('message_id'), message)
+            logger.info(f"✅ 消息已保存到本地Fallback: {record_id}")
             
         except Exception as e:
             logger.error(f"本地Fallback失败: {str(e)}")
     
+    def _import_legacy_fallback(self):
+        """把旧版本每条消息一个文件的Fallback导入预写日志"""
+        fallback_dir = settings.data_dir / "fallback_queue"
+        if not fallback_dir.exists():
+            return
+        
+        for file_path in sorted(fallback_dir.glob("msg_*.json")):
+            try:
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    message = json.load(f)
+                message_wal.append(FALLBACK_KIND, message.get('message_id'), message)
+                file_path.unlink()
+            except Exception as e:
+                logger.error(f"导入Fallback消息失败: {file_path}, {str(e)}")
+    
     async def load_from_local_fallback(self) -> list:
         """
-        从本地Fallback加载消息（✅ P2-4优化）
+        从本地Fallback加载消息（✅ P2-4优化），加载后确认这些记录
         
         Returns:
             消息列表
         """
         try:
-            from ..config import settings
-            import json
-            
-            fallback_dir = settings.data_dir / "fallback_queue"
-            if not fallback_dir.exists():
-                return []
+            self._import_legacy_fallback()
             
-            messages = []
-            
-            # 读取所有JSON文件
-            for file_path in fallback_dir.glob("msg_*.json"):
-                try:
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        message = json.load(f)
-                        messages.append(message)
-                    
-                    # 删除已加载的文件
-                    file_path.unlink()
-                    
-                except Exception as e:
-                    logger.error(f"加载Fallback消息失败: {file_path}, {str(e)}")
+            items = message_wal.replay(FALLBACK_KIND, with_ids=True)
+            message_wal.ack_many(FALLBACK_KIND, [record_id for record_id, _ in items])
+            messages = [message for _, message in items]
             
             if messages:
                 logger.info(f"✅ 从本地Fallback加载了 {len(messages)} 条消息")
@@ -153,6 +245,10 @@ class RedisQueue:
             消息数据，如果队列为空返回None
         """
         try:
+            if self.stream:
+                messages = await self.stream.dequeue_batch(1, timeout)
+                return messages[0] if messages else None
+            
             if timeout > 0:
                 # 阻塞式取出
                 result = await self.redis.blpop(self.queue_name, timeout)
@@ -187,19 +283,24 @@ class RedisQueue:
         messages = []
         
         try:
+            if self.stream:
+                # Stream出队的消息处理完成后需调用ack确认
+                return await self.stream.dequeue_batch(count, timeout)
+            
             # 首条消息使用阻塞式取出
             first_result = await self.redis.blpop(self.queue_name, timeout)
             if first_result:
                 _, message_json = first_result
                 messages.append(json.loads(message_json))
                 
-                # 后续消息使用非阻塞式快速取出
-                for _ in range(count - 1):
-                    message_json = await self.redis.lpop(self.queue_name)
-                    if message_json:
-                        messages.append(json.loads(message_json))
-                    else:
-                        break  # 队列已空
+                # 后续消息在一个MULTI事务中一次取出（LRANGE+LTRIM，一次往返）
+                # 内置Redis为5.0，不支持 LPOP key count（6.2+）和 LMPOP（7.0+）
+                if count > 1:
+                    pipe = self.redis.pipeline(transaction=True)
+                    pipe.lrange(self.queue_name, 0, count - 2)
+                    pipe.ltrim(self.queue_name, count - 1, -1)
+                    rest, _ = await pipe.execute()
+                    messages.extend(json.loads(m) for m in rest)
             
             if messages:
                 logger.debug(f"批量出队 {len(messages)} 条消息")
@@ -210,6 +311,78 @@ class RedisQueue:
             logger.error(f"批量出队失败: {str(e)}")
             return messages  # 返回已获取的消息
     
+    async def ack(self, messages: List[Dict[str, Any]]) -> int:
+        """
+        确认消息已处理完成（仅Stream后端生效，列表后端出队即删除）
+        
+        Args:
+            messages: 出队得到的消息列表
+            
+        Returns:
+            确认数量
+        """
+        if not self.stream:
+            return 0
+        
+        entry_ids = [m['_stream_id'] for m in messages if m.get('_stream_id')]
+        try:
+            return await self.stream.ack(entry_ids)
+        except Exception as e:
+            logger.error(f"消息确认失败: {str(e)}")
+            return 0
+    
+    async def mark_targets_delivered(self, message_id: str, mapping_ids: List[Any],
+                                     expire: int = 86400):
+        """
+        记录消息已成功投递的映射（Stream重投时跳过这些目标，避免重复转发）
+        
+        Args:
+            message_id: KOOK消息ID
+            mapping_ids: 已成功的映射ID列表
+            expire: 记录保留时间（秒）
+        """
+        if not self.stream or not mapping_ids:
+            return
+        
+        key = f"delivered:{message_id}"
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.sadd(key, *[str(mid) for mid in mapping_ids])
+            pipe.expire(key, expire)
+            await pipe.execute()
+        except Exception as e:
+            logger.error(f"记录投递状态失败: {str(e)}")
+    
+    async def get_delivered_targets(self, message_id: str) -> set:
+        """
+        获取消息已成功投递的映射ID
+        
+        Args:
+            message_id: KOOK消息ID
+            
+        Returns:
+            映射ID集合（字符串）
+        """
+        if not self.stream:
+            return set()
+        
+        try:
+            return set(await self.redis.smembers(f"delivered:{message_id}"))
+        except Exception as e:
+            logger.error(f"获取投递状态失败: {str(e)}")
+            return set()
+    
+    async def get_stream_stats(self) -> Optional[Dict[str, Any]]:
+        """获取Stream消费组统计（列表后端返回None）"""
+        if not self.stream:
+            return None
+        
+        try:
+            return await self.stream.get_stream_stats()
+        except Exception as e:
+            logger.error(f"获取Stream统计失败: {str(e)}")
+            return None
+    
     async def length(self) -> int:
         """
         获取队列长度（别名方法）
@@ -222,6 +395,8 @@ class RedisQueue:
     async def get_queue_size(self) -> int:
         """获取队列大小"""
         try:
+            if self.stream:
+                return await self.stream.length()
             return await self.redis.llen(self.queue_name)
         except Exception as e:
             logger.error(f"获取队列大小失败: {str(e)}")
@@ -231,6 +406,10 @@ class RedisQueue:
         """清空队列"""
         try:
             await self.redis.delete(self.queue_name)
+            if self.stream:
+                # 删除Stream会同时删除消费组，需重新创建
+                await self.redis.delete(self.stream.stream_name)
+                await self.stream.setup(self.redis)
             logger.info("队列已清空")
         except Exception as e:
             logger.error(f"清空队列失败: {str(e)}")
@@ -0,0 +1,327 @@
+"""
+Redis Streams可靠队列
+XADD入队、XREADGROUP按消费组出队、处理完成后XACK确认
+
+- 多个Worker进程以不同consumer名称加入同一消费组，消息不会被重复分发
+- 已出队但未确认的消息保存在PEL中，进程崩溃后由其他consumer按空闲时间认领
+- 多次投递仍失败的消息转入死信流，避免毒消息反复拖垮Worker
+- 认领使用XPENDING+XCLAIM，兼容内置的Redis 5.0
+"""
+import os
+import json
+import socket
+import time
+from typing import Optional, Dict, Any, List
+import redis.asyncio as aioredis
+from redis.exceptions import ResponseError
+from ..utils.logger import logger
+
+
+class RedisStreamQueue:
+    """基于Redis Streams和消费组的消息队列"""
+
+    def __init__(self, stream_name: str = "kook_messages:stream",
+                 group_name: str = "kook_workers",
+                 consumer_name: Optional[str] = None,
+                 claim_idle_seconds: int = 60,
+                 max_deliveries: int = 5):
+        """
+        初始化Stream队列
+
+        Args:
+            stream_name: Stream键名
+            group_name: 消费组名称
+            consumer_name: 当前consumer名称（默认 主机名-进程号）
+            claim_idle_seconds: 未确认消息空闲多久后可被其他consumer认领
+            max_deliveries: 最大投递次数，超过后转入死信流
+        """
+        self.redis: Optional[aioredis.Redis] = None
+        self.stream_name = stream_name
+        self.group_name = group_name
+        self.consumer_name = consumer_name or f"{socket.gethostname()}-{os.getpid()}"
+        self.dead_letter_stream = f"{stream_name}:dead"
+        self.claim_idle_ms = claim_idle_seconds * 1000
+        self.max_deliveries = max_deliveries
+
+        # 认领检查间隔（避免每次出队都执行XPENDING）
+        self.claim_interval = max(1.0, claim_idle_seconds / 4)
+        self._last_claim_check = 0.0
+
+        self.stats = {
+            'enqueued': 0,
+            'delivered': 0,
+            'acked': 0,
+            'reclaimed': 0,
+            'dead_lettered': 0
+        }
+
+    async def setup(self, redis: aioredis.Redis):
+        """
+        绑定Redis连接并创建消费组（已存在则忽略）
+
+        Args:
+            redis: Redis连接
+        """
+        self.redis = redis
+
+        try:
+            await self.redis.xgroup_create(
+                self.stream_name, self.group_name, id='0', mkstream=True
+            )
+            logger.info(f"已创建Stream消费组: {self.stream_name}/{self.group_name}")
+        except ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+
+        logger.info(f"Stream队列就绪，consumer: {self.consumer_name}")
+
+    @staticmethod
+    def _encode(message: Dict[str, Any]) -> str:
+        """序列化消息（去掉出队时附加的内部字段）"""
+        payload = {k: v for k, v in message.items() if not k.startswith('_stream')}
+        payload.pop('_redelivered', None)
+        return json.dumps(payload, ensure_ascii=False)
+
+    @staticmethod
+    def _decode(entry_id: str, fields: Optional[Dict[str, str]],
+                redelivered: bool = False) -> Optional[Dict[str, Any]]:
+        """反序列化Stream条目，附加条目ID"""
+        if not fields or 'data' not in fields:
+            return None
+
+        message = json.loads(fields['data'])
+        message['_stream_id'] = entry_id
+        if redelivered:
+            message['_redelivered'] = True
+        return message
+
+    async def enqueue(self, message: Dict[str, Any]) -> str:
+        """
+        消息入队
+
+        Args:
+            message: 消息数据
+
+        Returns:
+            Stream条目ID
+        """
+        entry_id = await self.redis.xadd(self.stream_name, {'data': self._encode(message)})
+        self.stats['enqueued'] += 1
+        return entry_id
+
+    async def enqueue_many(self, messages: List[Dict[str, Any]]) -> List[str]:
+        """
+        批量入队（流水线执行XADD，一次往返）
+
+        Args:
+            messages: 消息列表
+
+        Returns:
+            Stream条目ID列表
+        """
+        if not messages:
+            return []
+
+        pipe = self.redis.pipeline(transaction=False)
+        for message in messages:
+            pipe.xadd(self.stream_name, {'data': self._encode(message)})
+        entry_ids = await pipe.execute()
+
+        self.stats['enqueued'] += len(entry_ids)
+        return entry_ids
+
+    async def dequeue_batch(self, count: int = 10, timeout: int = 5) -> List[Dict[str, Any]]:
+        """
+        批量出队（先认领崩溃consumer遗留的消息，再读取新消息）
+
+        Args:
+            count: 最大数量
+            timeout: 没有消息时的阻塞时间（秒）
+
+        Returns:
+            消息列表（含_stream_id，处理完成后需调用ack）
+        """
+        messages = await self.reclaim_idle(count)
+
+        remaining = count - len(messages)
+        if remaining > 0:
+            # 已认领到消息时不再阻塞
+            block_ms = None if messages else max(1, int(timeout * 1000))
+            result = await self.redis.xreadgroup(
+                self.group_name,
+                self.consumer_name,
+                {self.stream_name: '>'},
+                count=remaining,
+                block=block_ms
+            )
+
+            for _, entries in result or []:
+                for entry_id, fields in entries:
+                    message = self._decode(entry_id, fields)
+                    if message is not None:
+                        messages.append(message)
+
+        self.stats['delivered'] += len(messages)
+        return messages
+
+    async def reclaim_idle(self, count: int = 10, force: bool = False) -> List[Dict[str, Any]]:
+        """
+        认领空闲超时的未确认消息
+
+        Args:
+            count: 最多认领数量
+            force: 忽略检查间隔立即执行
+
+        Returns:
+            认领到的消息列表
+        """
+        now = time.monotonic()
+        if not force and now - self._last_claim_check < self.claim_interval:
+            return []
+        self._last_claim_check = now
+
+        pending = await self.redis.xpending_range(
+            self.stream_name, self.group_name, '-', '+', count * 4
+        )
+
+        candidates = [
+            p for p in pending
+            if p['time_since_delivered'] >= self.claim_idle_ms
+        ]
+        if not candidates:
+            return []
+
+        # 超过最大投递次数的转入死信流
+        poison_ids = [p['message_id'] for p in candidates
+                      if p['times_delivered'] >= self.max_deliveries]
+        if poison_ids:
+            await self._dead_letter(poison_ids)
+
+        claim_ids = [p['message_id'] for p in candidates
+                     if p['times_delivered'] < self.max_deliveries][:count]
+        if not claim_ids:
+            return []
+
+        claimed = await self.redis.xclaim(
+            self.stream_name, self.group_name, self.consumer_name,
+            self.claim_idle_ms, claim_ids
+        )
+
+        messages = []
+        orphan_ids = []
+        for entry_id, fields in claimed or []:
+            message = self._decode(entry_id, fields, redelivered=True)
+            if message is None:
+                orphan_ids.append(entry_id)
+            else:
+                messages.append(message)
+
+        # 条目已被删除但仍在PEL中，直接确认
+        if orphan_ids:
+            await self.redis.xack(self.stream_name, self.group_name, *orphan_ids)
+
+        if messages:
+            self.stats['reclaimed'] += len(messages)
+            logger.warning(f"认领了 {len(messages)} 条未确认消息（原consumer可能已崩溃）")
+
+        return messages
+
+    async def _dead_letter(self, entry_ids: List[str]):
+        """将毒消息移入死信流"""
+        entries = []
+        for entry_id in entry_ids:
+            entries.extend(await self.redis.xrange(self.stream_name, entry_id, entry_id))
+
+        pipe = self.redis.pipeline(transaction=False)
+        for entry_id, fields in entries:
+            pipe.xadd(self.dead_letter_stream, {**fields, 'source_id': entry_id})
+        pipe.xack(self.stream_name, self.group_name, *entry_ids)
+        pipe.xdel(self.stream_name, *entry_ids)
+        await pipe.execute()
+
+        self.stats['dead_lettered'] += len(entry_ids)
+        logger.error(f"{len(entry_ids)} 条消息超过最大投递次数，已转入死信流")
+
+    async def ack(self, entry_ids: List[str]) -> int:
+        """
+        确认消息已处理（确认后立即删除条目，Stream长度即为积压量）
+
+        Args:
+            entry_ids: Stream条目ID列表
+
+        Returns:
+            确认数量
+        """
+        if not entry_ids:
+            return 0
+
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.xack(self.stream_name, self.group_name, *entry_ids)
+        pipe.xdel(self.stream_name, *entry_ids)
+        acked, _ = await pipe.execute()
+
+        self.stats['acked'] += acked
+        return acked
+
+    async def length(self) -> int:
+        """积压量（未投递 + 已投递未确认）"""
+        return await self.redis.xlen(self.stream_name)
+
+    async def get_stream_stats(self) -> Dict[str, Any]:
+        """
+        获取消费组和各consumer的统计
+
+        Returns:
+            包含lag（未投递数）、pending（未确认数）和每个consumer的pending/idle
+        """
+        length = await self.redis.xlen(self.stream_name)
+
+        group_info: Dict[str, Any] = {}
+        for group in await self.redis.xinfo_groups(self.stream_name):
+            if group.get('name') == self.group_name:
+                group_info = group
+                break
+
+        pending = int(group_info.get('pending', 0))
+        # 已确认条目会被删除，未投递数 = 总长度 - 未确认数（Redis 7+直接返回lag）
+        lag = group_info.get('lag')
+        if lag is None:
+            lag = max(0, length - pending)
+
+        consumers = []
+        for consumer in await self.redis.xinfo_consumers(self.stream_name, self.group_name):
+            consumers.append({
+                'name': consumer.get('name'),
+                'pending': int(consumer.get('pending', 0)),
+                'idle_ms': int(consumer.get('idle', 0)),
+                'is_self': consumer.get('name') == self.consumer_name
+            })
+
+        return {
+            'stream': self.stream_name,
+            'group': self.group_name,
+            'consumer': self.consumer_name,
+            'length': length,
+            'lag': int(lag),
+            'pending': pending,
+            'dead_letter': await self.redis.xlen(self.dead_letter_stream),
+            'consumers': consumers,
+            'local': dict(self.stats)
+        }
+
+    async def prune_consumers(self, max_idle_seconds: int = 3600) -> List[str]:
+        """
+        删除长时间空闲且没有未确认消息的consumer（已退出的Worker进程）
+
+        Returns:
+            被删除的consumer名称
+        """
+        removed = []
+        for consumer in await self.redis.xinfo_consumers(self.stream_name, self.group_name):
+            name = consumer.get('name')
+            if (name != self.consumer_name
+                    and int(consumer.get('pending', 0)) == 0
+                    and int(consumer.get('idle', 0)) >= max_idle_seconds * 1000):
+                await self.redis.xgroup_delconsumer(self.stream_name, self.group_name, name)
+                removed.append(name)
+        return removed
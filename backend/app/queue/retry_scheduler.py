@@ -0,0 +1,332 @@
+"""
+重试调度器
+按到期时间维护最小堆，到期即唤醒（不再定时轮询），按平台限制并发，
+重试间隔为带随机抖动的指数退避
+"""
+import asyncio
+import heapq
+import itertools
+import random
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set
+from ..utils.logger import logger
+from ..config import settings
+
+
+@dataclass
+class RetryEntry:
+    """待重试条目"""
+    key: Any
+    payload: Any
+    platform: str = 'default'
+    retry_count: int = 0
+    due: float = 0.0  # 下次重试时间（时间戳）
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    last_retry: Optional[float] = None
+
+
+class RetryScheduler(ABC):
+    """
+    重试调度器
+    
+    条目按到期时间放入最小堆，调度循环睡到堆顶到期或有新条目加入时才醒来，
+    把所有到期条目派发出去并发重试（每个平台单独限制并发数）。
+    子类实现 attempt，并可覆盖 refill/on_success/on_retry_scheduled/on_abandon
+    接入持久化存储。
+    """
+    
+    def __init__(self, max_retries: int, base_delay: float,
+                 max_delay: Optional[float] = None,
+                 jitter: Optional[float] = None,
+                 platform_concurrency: Optional[int] = None,
+                 max_inflight: Optional[int] = None,
+                 max_idle: Optional[float] = None):
+        """
+        初始化调度器
+        
+        Args:
+            max_retries: 最大重试次数
+            base_delay: 基础重试延迟（秒），第n次失败后延迟 base_delay * 2^n
+            max_delay: 最大重试延迟（秒）
+            jitter: 延迟随机抖动比例（0.2表示±20%）
+            platform_concurrency: 每个平台同时进行的重试数
+            max_inflight: 同时进行的重试总数
+            max_idle: 没有到期条目时最长睡眠时间（秒，None表示一直睡到被唤醒）
+        """
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay if max_delay is not None else settings.message_retry_max_delay
+        self.jitter = jitter if jitter is not None else settings.message_retry_jitter
+        self.platform_concurrency = platform_concurrency or settings.message_retry_concurrency
+        self.max_inflight = max_inflight or settings.message_retry_batch_size
+        self.max_idle = max_idle
+        
+        # 待重试条目及到期时间堆（取消/改期的旧堆项在弹出时跳过）
+        self.entries: Dict[Any, RetryEntry] = {}
+        self._heap: List[tuple] = []
+        self._counter = itertools.count()
+        
+        # 正在重试的条目
+        self._inflight: Set[Any] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self.is_running = False
+        
+        # 统计
+        self.stats = {
+            'total_retried': 0,
+            'retry_success': 0,
+            'retry_failed': 0,
+            'abandoned': 0
+        }
+    
+    def compute_delay(self, retry_count: int) -> float:
+        """
+        计算重试延迟（指数退避 + 随机抖动，避免故障恢复后同时重试）
+        
+        Args:
+            retry_count: 已失败次数
+        
+        Returns:
+            延迟秒数
+        """
+        delay = min(self.base_delay * (2 ** retry_count), self.max_delay)
+        if self.jitter:
+            delay *= random.uniform(1 - self.jitter, 1 + self.jitter)
+        return delay
+    
+    def schedule(self, key: Any, payload: Any, platform: str = 'default',
+                 retry_count: int = 0, due: Optional[float] = None) -> RetryEntry:
+        """
+        加入（或改期）一个待重试条目
+        
+        Args:
+            key: 条目唯一标识
+            payload: 重试所需数据
+            platform: 目标平台（按平台限制并发）
+            retry_count: 已失败次数
+            due: 到期时间戳（默认按退避延迟计算）
+        
+        Returns:
+            条目
+        """
+        if due is None:
+            due = time.time() + self.compute_delay(retry_count)
+        
+        entry = self.entries.get(key)
+        if entry is None:
+            entry = RetryEntry(key=key, payload=payload, platform=platform)
+            self.entries[key] = entry
+        else:
+            entry.payload = payload
+            entry.platform = platform
+        
+        entry.retry_count = retry_count
+        entry.due = due
+        
+        if key not in self._inflight:
+            heapq.heappush(self._heap, (due, next(self._counter), key))
+            self.notify()
+        return entry
+    
+    def cancel(self, key: Any) -> Optional[RetryEntry]:
+        """移除待重试条目（堆中的旧项在弹出时跳过）"""
+        return self.entries.pop(key, None)
+    
+    def notify(self):
+        """唤醒调度循环（有新条目或重试完成时调用）"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+    
+    def _is_current(self, due: float, key: Any) -> bool:
+        """堆项是否仍有效（未取消、未改期、未在重试中）"""
+        entry = self.entries.get(key)
+        return entry is not None and entry.due == due and key not in self._inflight
+    
+    def next_due(self) -> Optional[float]:
+        """堆中最早的到期时间"""
+        while self._heap:
+            due, _, key = self._heap[0]
+            if self._is_current(due, key):
+                return due
+            heapq.heappop(self._heap)
+        return None
+    
+    def pop_due(self, now: float, limit: int) -> List[RetryEntry]:
+        """
+        弹出已到期的条目
+        
+        Args:
+            now: 当前时间戳
+            limit: 最多弹出条数
+        
+        Returns:
+            到期条目列表（按到期时间排序）
+        """
+        entries = []
+        while self._heap and len(entries) < limit:
+            due, _, key = self._heap[0]
+            if due > now:
+                break
+            heapq.heappop(self._heap)
+            if self._is_current(due, key):
+                entries.append(self.entries[key])
+        return entries
+    
+    def get_pending_retry(self) -> List[RetryEntry]:
+        """获取已到期、等待重试的条目"""
+        now = time.time()
+        return [
+            entry for key, entry in self.entries.items()
+            if entry.due <= now and key not in self._inflight
+        ]
+    
+    async def refill(self):
+        """从持久化存储载入到期条目（内存调度器无需实现）"""
+    
+    async def next_due_time(self) -> Optional[float]:
+        """下一个条目的到期时间（持久化存储中可能有更早的条目）"""
+        return self.next_due()
+    
+    @abstractmethod
+    async def attempt(self, entry: RetryEntry) -> bool:
+        """
+        执行一次重试
+        
+        Args:
+            entry: 条目
+        
+        Returns:
+            是否成功（抛出异常视为失败）
+        """
+    
+    async def on_success(self, entry: RetryEntry):
+        """重试成功后的处理"""
+    
+    async def on_retry_scheduled(self, entry: RetryEntry):
+        """重试失败、已安排下次重试后的处理（条目仍在 entries 中时按新的到期时间留在内存堆中）"""
+    
+    async def on_abandon(self, entry: RetryEntry):
+        """达到最大重试次数、放弃后的处理"""
+    
+    def _semaphore(self, platform: str) -> asyncio.Semaphore:
+        semaphore = self._semaphores.get(platform)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.platform_concurrency)
+            self._semaphores[platform] = semaphore
+        return semaphore
+    
+    def _dispatch(self, entry: RetryEntry):
+        """派发一个到期条目（在独立任务中按平台限流执行）"""
+        self._inflight.add(entry.key)
+        task = asyncio.create_task(self._run_entry(entry))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+    
+    async def _run_entry(self, entry: RetryEntry):
+        """执行重试并根据结果移除、改期或放弃"""
+        try:
+            async with self._semaphore(entry.platform):
+                entry.last_retry = time.time()
+                self.stats['total_retried'] += 1
+                try:
+                    success = await self.attempt(entry)
+                    error = None if success else "转发失败"
+                except Exception as e:
+                    logger.error(f"重试消息异常: id={entry.key}, 错误: {str(e)}")
+                    success = False
+                    error = str(e)
+            
+            # 结果处理完成（持久化存储已更新）前条目保留在内存中，避免被重复载入
+            if success:
+                self.stats['retry_success'] += 1
+                try:
+                    await self.on_success(entry)
+                finally:
+                    self.entries.pop(entry.key, None)
+                return
+            
+            entry.retry_count += 1
+            entry.error = error
+            
+            if entry.retry_count >= self.max_retries:
+                self.stats['abandoned'] += 1
+                logger.warning(f"[指数退避重试] 消息已达最大重试次数: id={entry.key}")
+                try:
+                    await self.on_abandon(entry)
+                finally:
+                    self.entries.pop(entry.key, None)
+            else:
+                delay = self.compute_delay(entry.retry_count)
+                entry.due = time.time() + delay
+                self.stats['retry_failed'] += 1
+                logger.info(f"[指数退避重试] 消息重试失败: id={entry.key}, 将在{delay:.0f}秒后再次重试")
+                await self.on_retry_scheduled(entry)
+        
+        except Exception as e:
+            logger.error(f"处理重试结果失败: id={entry.key}, 错误: {str(e)}")
+        finally:
+            self._inflight.discard(entry.key)
+            if entry.key in self.entries:
+                # 仍在内存中的条目按新的到期时间重新入堆
+                heapq.heappush(self._heap, (entry.due, next(self._counter), entry.key))
+            self.notify()
+    
+    async def run(self):
+        """调度循环：派发到期条目，然后睡到下一个条目到期或被唤醒"""
+        self.is_running = True
+        self._wakeup = asyncio.Event()
+        self._semaphores = {}
+        
+        try:
+            while self.is_running:
+                self._wakeup.clear()
+                
+                await self.refill()
+                
+                capacity = self.max_inflight - len(self._inflight)
+                for entry in self.pop_due(time.time(), capacity):
+                    self._dispatch(entry)
+                
+                if len(self._inflight) >= self.max_inflight:
+                    # 并发已满，等重试完成时唤醒
+                    timeout = None
+                else:
+                    next_due = await self.next_due_time()
+                    timeout = None if next_due is None else max(0.0, next_due - time.time())
+                
+                if self.max_idle is not None:
+                    timeout = self.max_idle if timeout is None else min(timeout, self.max_idle)
+                
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+        
+        except asyncio.CancelledError:
+            for task in self._tasks:
+                task.cancel()
+            raise
+        finally:
+            self.is_running = False
+            if self._tasks:
+                await asyncio.gather(*self._tasks, return_exceptions=True)
+            self._wakeup = None
+    
+    async def stop(self):
+        """停止调度循环（正在进行的重试会执行完）"""
+        self.is_running = False
+        self.notify()
+    
+    def get_stats(self) -> dict:
+        """获取统计信息"""
+        return {
+            **self.stats,
+            'queue_size': len(self.entries),
+            'pending_retry': len(self.get_pending_retry()),
+            'in_flight': len(self._inflight)
+        }
@@ -2,48 +2,58 @@
 失败消息重试Worker
 自动处理失败的消息，实现重试机制
 """
-import asyncio
-from datetime import datetime, timedelta
-from typing import Dict, Any
+import html
+import time
+from datetime import datetime
+from typing import Dict, Any, Optional
 from ..utils.logger import logger
-from ..database import db
-from ..processors.filter import message_filter
+from ..database_async import async_db, AsyncDatabase
 from ..processors.formatter import formatter
-from ..processors.image import image_processor
 from ..forwarders.discord import discord_forwarder
 from ..forwarders.telegram import telegram_forwarder
 from ..forwarders.feishu import feishu_forwarder
 from ..config import settings
+from .retry_scheduler import RetryScheduler, RetryEntry
 
 
-class RetryWorker:
+class RetryWorker(RetryScheduler):
     """
     失败消息重试Worker
-    ✅ P2-2优化: 指数退避策略（30s, 60s, 120s, 240s, 480s）
+    ✅ P2-2优化: 指数退避策略（30s, 60s, 120s, 240s, 480s，带随机抖动）
+    
+    failed_messages.next_retry 上的索引作为到期时间索引：只载入已到期的消息，
+    按平台并发重试，空闲时睡到下一条消息到期或有新的失败消息写入为止
     """
     
-    def __init__(self):
-        self.is_running = False
-        self.retry_interval = settings.message_retry_interval  # 基础重试间隔（秒）
-        self.max_retries = 5  # ✅ P2-2: 增加到5次
+    def __init__(self, database: Optional[AsyncDatabase] = None):
+        """
+        初始化重试Worker
+        
+        Args:
+            database: 异步数据库（默认使用全局 async_db）
+        """
+        super().__init__(
+            max_retries=5,  # ✅ P2-2: 增加到5次
+            base_delay=settings.message_retry_interval,  # 基础重试间隔（秒）
+            # 其他Worker进程写入的失败消息无法通知到本进程，最长隔一个基础间隔检查一次
+            max_idle=settings.message_retry_interval
+        )
+        self.db = database or async_db
+        self.batch_size = settings.message_retry_batch_size
         
-        # ✅ P2-2优化: 指数退避重试延迟
-        self.retry_delays = [30, 60, 120, 240, 480]  # 秒
+        # 数据库中的积压（载入到期消息时更新）
+        self.backlog = {'queue_size': 0, 'pending_retry': 0}
         
-        logger.info(f"重试Worker配置: 最大重试{self.max_retries}次, 延迟{self.retry_delays}")
+        logger.info(
+            f"重试Worker配置: 最大重试{self.max_retries}次, "
+            f"基础延迟{self.base_delay}秒, 每平台并发{self.platform_concurrency}"
+        )
     
     async def start(self):
         """启动重试Worker"""
         try:
             logger.info("启动失败消息重试Worker")
-            self.is_running = True
-            
-            while self.is_running:
-                # 每隔一段时间检查失败消息
-                await asyncio.sleep(self.retry_interval)
-                
-                await self.process_failed_messages()
-                
+            await self.run()
         except Exception as e:
             logger.error(f"重试Worker运行异常: {str(e)}")
         finally:
@@ -52,170 +62,176 @@ class RetryWorker:
     async def stop(self):
         """停止重试Worker"""
         logger.info("停止失败消息重试Worker")
-        self.is_running = False
+        await super().stop()
     
-    async def process_failed_messages(self):
-        """处理失败的消息"""
-        try:
-            # 从数据库获取失败的消息
-            with db.get_connection() as conn:
-                cursor = conn.cursor()
-                
-                # ✅ P2-2优化: 查询需要重试的消息（考虑指数退避）
-                # 查询所有未达上限的失败消息
-                cursor.execute("""
-                    SELECT fm.*, ml.*
-                    FROM failed_messages fm
-                    JOIN message_logs ml ON fm.message_log_id = ml.id
-                    WHERE fm.retry_count < ?
-                    ORDER BY fm.last_retry ASC
-                    LIMIT 20
-                """, (self.max_retries,))
-                
-                failed_messages = [dict(row) for row in cursor.fetchall()]
-            
-            if not failed_messages:
-                return
-            
-            logger.info(f"发现 {len(failed_messages)} 条失败消息，开始重试")
+    async def refill(self):
+        """从数据库按到期时间载入已到期的失败消息"""
+        # 内存中还有足够的待重试消息时不查询，每次查询至少载入半批
+        if len(self.entries) >= self.batch_size // 2:
+            return
+        
+        now = time.time()
+        loaded = list(self.entries)
+        exclude = f"AND fm.id NOT IN ({','.join('?' * len(loaded))})" if loaded else ""
+        
+        async with self.db.reader() as conn:
+            cursor = await conn.execute(f"""
+                SELECT fm.id AS failed_id, fm.message_log_id, fm.retry_count, fm.next_retry,
+                       ml.kook_message_id, ml.kook_channel_id, ml.content, ml.message_type,
+                       ml.sender_name, ml.target_platform, ml.target_channel
+                FROM failed_messages fm
+                JOIN message_logs ml ON fm.message_log_id = ml.id
+                WHERE fm.next_retry <= ? AND fm.retry_count < ? {exclude}
+                ORDER BY fm.next_retry
+                LIMIT ?
+            """, (now, self.max_retries, *loaded, self.batch_size - len(loaded)))
+            rows = [dict(row) for row in await cursor.fetchall()]
             
-            for msg_data in failed_messages:
-                await self.retry_message(msg_data)
-                
-        except Exception as e:
-            logger.error(f"处理失败消息异常: {str(e)}")
+            cursor = await conn.execute("""
+                SELECT COUNT(*), SUM(next_retry <= ?)
+                FROM failed_messages
+                WHERE retry_count < ?
+            """, (now, self.max_retries))
+            total, due = await cursor.fetchone()
+            self.backlog = {'queue_size': total or 0, 'pending_retry': due or 0}
+        
+        if rows:
+            logger.info(f"发现 {len(rows)} 条到期的失败消息，开始重试")
+        
+        for row in rows:
+            self.schedule(
+                row['failed_id'], row,
+                platform=row['target_platform'],
+                retry_count=row['retry_count'],
+                due=row['next_retry']
+            )
     
-    async def retry_message(self, msg_data: Dict[str, Any]):
+    async def next_due_time(self) -> Optional[float]:
+        """下一条失败消息的到期时间（内存堆和数据库索引中较早的一个）"""
+        next_due = self.next_due()
+        
+        async with self.db.reader() as conn:
+            cursor = await conn.execute("""
+                SELECT MIN(next_retry) FROM failed_messages
+                WHERE next_retry > ? AND retry_count < ?
+            """, (time.time(), self.max_retries))
+            row = await cursor.fetchone()
+        
+        if row[0] is not None and (next_due is None or row[0] < next_due):
+            next_due = row[0]
+        return next_due
+    
+    async def attempt(self, entry: RetryEntry) -> bool:
         """
-        重试单条消息（✅ P2-2优化: 指数退避策略）
+        重试单条消息
         
         Args:
-            msg_data: 消息数据（包含failed_messages和message_logs的字段）
+            entry: 条目（payload为failed_messages和message_logs的字段）
+        
+        Returns:
+            是否成功
         """
-        message_log_id = msg_data.get("message_log_id")
-        retry_count = msg_data.get("retry_count", 0)
+        msg_data = entry.payload
         
-        try:
-            # ✅ P2-2优化: 检查是否到了重试时间（指数退避）
-            retry_delay = self.retry_delays[retry_count] if retry_count < len(self.retry_delays) else self.retry_delays[-1]
-            
-            last_retry = msg_data.get("last_retry")
-            if last_retry:
-                last_retry_time = datetime.fromisoformat(last_retry)
-                next_retry_time = last_retry_time + timedelta(seconds=retry_delay)
-                
-                # 如果还没到重试时间，跳过
-                if datetime.now() < next_retry_time:
-                    wait_seconds = (next_retry_time - datetime.now()).total_seconds()
-                    logger.debug(f"消息未到重试时间: id={message_log_id}, 还需等待{wait_seconds:.0f}秒")
-                    return
-            
-            logger.info(
-                f"[指数退避重试] 消息: id={message_log_id}, "
-                f"第{retry_count + 1}/{self.max_retries}次, 延迟{retry_delay}秒"
-            )
-            
-            # 重构消息数据
-            message = {
-                "message_id": msg_data.get("kook_message_id"),
-                "channel_id": msg_data.get("kook_channel_id"),
-                "content": msg_data.get("content"),
-                "message_type": msg_data.get("message_type"),
-                "sender_name": msg_data.get("sender_name"),
-            }
-            
-            # 获取目标平台和频道
-            target_platform = msg_data.get("target_platform")
-            target_channel = msg_data.get("target_channel")
-            
-            # 查找映射配置
-            mappings = db.get_channel_mappings(message["channel_id"])
-            
-            # 找到对应的映射
-            mapping = None
-            for m in mappings:
-                if m["target_platform"] == target_platform and m["target_channel_id"] == target_channel:
-                    mapping = m
-                    break
-            
-            if not mapping:
-                logger.error(f"未找到映射配置: platform={target_platform}, channel={target_channel}")
-                await self.mark_retry_failed(message_log_id, retry_count, "映射配置不存在")
-                return
-            
-            # 尝试重新转发
-            success = await self.forward_message(message, mapping)
+        logger.info(
+            f"[指数退避重试] 消息: id={msg_data['message_log_id']}, "
+            f"第{entry.retry_count + 1}/{self.max_retries}次"
+        )
+        
+        # 重构消息数据
+        message = {
+            "message_id": msg_data.get("kook_message_id"),
+            "channel_id": msg_data.get("kook_channel_id"),
+            "content": msg_data.get("content"),
+            "message_type": msg_data.get("message_type"),
+            "sender_name": msg_data.get("sender_name"),
+        }
+        
+        # 获取目标平台和频道
+        target_platform = msg_data.get("target_platform")
+        target_channel = msg_data.get("target_channel")
+        
+        # 查找映射配置
+        mappings = await self.db.get_channel_mappings(message["channel_id"])
+        
+        # 找到对应的映射
+        mapping = None
+        for m in mappings:
+            if m["target_platform"] == target_platform and m["target_channel_id"] == target_channel:
+                mapping = m
+                break
+        
+        if not mapping:
+            raise LookupError(f"映射配置不存在: platform={target_platform}, channel={target_channel}")
+        
+        # 尝试重新转发
+        return await self.forward_message(message, mapping)
+    
+    async def on_success(self, entry: RetryEntry):
+        """重试成功，更新日志状态并删除失败记录"""
+        message_log_id = entry.payload['message_log_id']
+        
+        async with self.db.writer() as conn:
+            # 更新消息日志状态
+            await conn.execute("""
+                UPDATE message_logs
+                SET status = 'success', error_message = NULL
+                WHERE id = ?
+            """, (message_log_id,))
             
-            if success:
-                # 重试成功，更新状态
-                with db.get_connection() as conn:
-                    cursor = conn.cursor()
-                    
-                    # 更新消息日志状态
-                    cursor.execute("""
-                        UPDATE message_logs
-                        SET status = 'success', error_message = NULL
-                        WHERE id = ?
-                    """, (message_log_id,))
-                    
-                    # 删除失败消息记录
-                    cursor.execute("""
-                        DELETE FROM failed_messages
-                        WHERE message_log_id = ?
-                    """, (message_log_id,))
-                    
-                    conn.commit()
-                
-                logger.info(f"消息重试成功: id={message_log_id}")
-            else:
-                # 重试失败，更新重试次数
-                await self.mark_retry_failed(message_log_id, retry_count, "转发失败")
-                
-        except Exception as e:
-            logger.error(f"重试消息异常: id={message_log_id}, 错误: {str(e)}")
-            await self.mark_retry_failed(message_log_id, retry_count, str(e))
+            # 删除失败消息记录
+            await conn.execute("""
+                DELETE FROM failed_messages
+                WHERE message_log_id = ?
+            """, (message_log_id,))
+        
+        logger.info(f"消息重试成功: id={message_log_id}")
+    
+    async def on_retry_scheduled(self, entry: RetryEntry):
+        """重试失败，写回下次重试时间（由数据库索引负责再次调度，不占用内存）"""
+        try:
+            await self.mark_retry_failed(entry)
+        finally:
+            self.entries.pop(entry.key, None)
+    
+    async def on_abandon(self, entry: RetryEntry):
+        """达到最大重试次数"""
+        await self.mark_retry_failed(entry)
     
-    async def mark_retry_failed(self, message_log_id: int, retry_count: int, error: str):
+    async def mark_retry_failed(self, entry: RetryEntry):
         """
         标记重试失败
         
         Args:
-            message_log_id: 消息日志ID
-            retry_count: 当前重试次数
-            error: 错误信息
+            entry: 条目（retry_count为新的失败次数，due为下次重试时间）
         """
         try:
-            with db.get_connection() as conn:
-                cursor = conn.cursor()
-                
-                new_retry_count = retry_count + 1
-                
+            async with self.db.writer() as conn:
                 # 更新失败消息记录
-                cursor.execute("""
+                await conn.execute("""
                     UPDATE failed_messages
-                    SET retry_count = ?, last_retry = ?
-                    WHERE message_log_id = ?
-                """, (new_retry_count, datetime.now(), message_log_id))
+                    SET retry_count = ?, last_retry = ?, next_retry = ?
+                    WHERE id = ?
+                """, (entry.retry_count, datetime.now(), entry.due, entry.key))
                 
                 # 更新消息日志
-                cursor.execute("""
+                await conn.execute("""
                     UPDATE message_logs
                     SET error_message = ?
                     WHERE id = ?
-                """, (f"重试{new_retry_count}次失败: {error}", message_log_id))
-                
-                conn.commit()
-            
-            if new_retry_count >= self.max_retries:
-                logger.warning(f"[指数退避重试] 消息已达最大重试次数: id={message_log_id}")
-            else:
-                # ✅ P2-2优化: 显示下次重试的延迟时间
-                next_delay = self.retry_delays[new_retry_count] if new_retry_count < len(self.retry_delays) else self.retry_delays[-1]
-                logger.info(f"[指数退避重试] 消息重试失败，将在{next_delay}秒后再次重试")
-                
+                """, (f"重试{entry.retry_count}次失败: {entry.error}", entry.payload['message_log_id']))
+        
         except Exception as e:
             logger.error(f"更新重试状态失败: {str(e)}")
     
+    def get_stats(self) -> dict:
+        """获取统计信息（积压数量来自数据库）"""
+        return {
+            **self.stats,
+            **self.backlog,
+            'in_flight': len(self._inflight)
+        }
+    
     async def forward_message(self, message: Dict[str, Any], mapping: Dict[str, Any]) -> bool:
         """
         转发消息到目标平台
@@ -233,7 +249,7 @@ class RetryWorker:
         
         try:
             # 获取Bot配置
-            bot_configs = db.get_bot_configs(platform)
+            bot_configs = await self.db.get_bot_configs(platform)
             bot_config = next((b for b in bot_configs if b['id'] == bot_id), None)
             
             if not bot_config:
@@ -259,7 +275,7 @@ class RetryWorker:
                 
             elif platform == 'telegram':
                 formatted_content = formatter.kmarkdown_to_telegram_html(content)
-                formatted_content = f"<b>{sender_name}</b>: {formatted_content}"
+                formatted_content = f"<b>{html.escape(sender_name)}</b>: {formatted_content}"
                 
                 token = bot_config['config'].get('token')
                 
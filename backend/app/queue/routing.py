@@ -0,0 +1,266 @@
+"""
+频道路由表
+按KOOK频道ID预先计算好所有转发目标，消息处理时不再查询数据库、不再解析Bot配置
+
+- 路由描述 = 映射行 + 已解析的Bot配置 + 平台格式化函数 + 平台转发器
+- 整表在后台构建完成后一次性替换引用，读取方不会看到半成品
+- 映射/Bot配置变更时失效：本进程由数据库变更监听和API直接触发，
+  其他Worker进程通过Redis pub/sub（routing:invalidate）收到通知
+- 另有TTL兜底，覆盖直接写SQL而未触发通知的旧代码路径
+"""
+import os
+import json
+import time
+import asyncio
+from typing import Dict, Any, List, Optional
+import redis.asyncio as aioredis
+from ..utils.logger import logger
+from ..config import settings
+from ..database import db
+from ..database_async import async_db, AsyncDatabase
+from ..processors.formatter import formatter
+from ..forwarders.discord import discord_forwarder
+from ..forwarders.telegram import telegram_forwarder
+from ..forwarders.feishu import feishu_forwarder
+from ..forwarders.wechatwork import wechatwork_forwarder
+from ..forwarders.dingtalk import dingtalk_forwarder
+
+
+# 路由失效通知的Redis频道
+INVALIDATE_CHANNEL = "routing:invalidate"
+
+# 各平台的转发器和KMarkdown转换函数
+PLATFORM_FORWARDERS = {
+    'discord': discord_forwarder,
+    'telegram': telegram_forwarder,
+    'feishu': feishu_forwarder,
+    'wechatwork': wechatwork_forwarder,
+    'dingtalk': dingtalk_forwarder,
+}
+
+PLATFORM_FORMATTERS = {
+    'discord': formatter.kmarkdown_to_discord,
+    'telegram': formatter.kmarkdown_to_telegram_html,
+    'feishu': formatter.kmarkdown_to_feishu_text,
+    'wechatwork': formatter.kmarkdown_to_plain_text,
+    'dingtalk': formatter.kmarkdown_to_plain_text,
+}
+
+
+class RoutingTable:
+    """KOOK频道 → 转发目标 的内存路由表"""
+
+    def __init__(self, database: AsyncDatabase = async_db, ttl: int = 300):
+        """
+        初始化路由表
+
+        Args:
+            database: 异步数据库
+            ttl: 兜底重建间隔（秒）
+        """
+        self.database = database
+        self.ttl = ttl
+
+        self._routes: Dict[str, List[Dict[str, Any]]] = {}
+        self._bots: Dict[int, Dict[str, Any]] = {}
+        self._built_at: Optional[float] = None
+        self._version = 0  # 每次失效+1，构建期间发生失效则结果作废
+        self._built_version = -1
+        self._build_lock: Optional[asyncio.Lock] = None
+        self._lock_loop: Optional[asyncio.AbstractEventLoop] = None
+
+        # pub/sub
+        self.redis: Optional[aioredis.Redis] = None
+        self.instance_id = f"{os.getpid()}-{id(self)}"
+        self._listener_task: Optional[asyncio.Task] = None
+
+        self.stats = {
+            'builds': 0,
+            'lookups': 0,
+            'invalidations': 0,
+            'remote_invalidations': 0,
+            'last_build_ms': 0
+        }
+
+    def _get_build_lock(self) -> asyncio.Lock:
+        loop = asyncio.get_running_loop()
+        if self._build_lock is None or self._lock_loop is not loop:
+            self._build_lock = asyncio.Lock()
+            self._lock_loop = loop
+        return self._build_lock
+
+    def _is_stale(self) -> bool:
+        if self._built_version != self._version or self._built_at is None:
+            return True
+        return time.monotonic() - self._built_at > self.ttl
+
+    async def rebuild(self):
+        """从数据库重建整张路由表（构建完成后原子替换）"""
+        start = time.monotonic()
+        version = self._version
+
+        bot_rows = await self.database.get_bot_configs()
+        mapping_rows = await self.database.get_channel_mappings()
+
+        bots = {bot['id']: bot for bot in bot_rows}
+
+        routes: Dict[str, List[Dict[str, Any]]] = {}
+        for mapping in mapping_rows:
+            if not mapping.get('enabled', 1):
+                continue
+
+            platform = mapping.get('target_platform')
+            routes.setdefault(mapping['kook_channel_id'], []).append({
+                **mapping,
+                'bot': bots.get(mapping.get('target_bot_id')),
+                'forwarder': PLATFORM_FORWARDERS.get(platform),
+                'format': PLATFORM_FORMATTERS.get(platform)
+            })
+
+        # 原子替换
+        self._routes = routes
+        self._bots = bots
+        self._built_at = time.monotonic()
+        self._built_version = version
+
+        self.stats['builds'] += 1
+        self.stats['last_build_ms'] = int((time.monotonic() - start) * 1000)
+        logger.debug(
+            f"路由表已重建: {len(routes)} 个频道, {len(mapping_rows)} 条映射, "
+            f"{len(bots)} 个Bot, 耗时{self.stats['last_build_ms']}ms"
+        )
+
+    async def _ensure_fresh(self):
+        if not self._is_stale():
+            return
+
+        # 并发请求只触发一次重建
+        async with self._get_build_lock():
+            if self._is_stale():
+                await self.rebuild()
+
+    async def get_routes(self, kook_channel_id: str) -> List[Dict[str, Any]]:
+        """
+        获取KOOK频道的所有转发目标
+
+        Args:
+            kook_channel_id: KOOK频道ID
+
+        Returns:
+            路由描述列表（映射字段 + bot/forwarder/format）
+        """
+        await self._ensure_fresh()
+        self.stats['lookups'] += 1
+        return list(self._routes.get(str(kook_channel_id), ()))
+
+    async def get_bot(self, bot_id: int) -> Optional[Dict[str, Any]]:
+        """
+        获取已解析的Bot配置
+
+        Args:
+            bot_id: Bot ID
+
+        Returns:
+            Bot配置（config字段已解析），不存在返回None
+        """
+        await self._ensure_fresh()
+        return self._bots.get(bot_id)
+
+    def invalidate(self, table: Optional[str] = None, publish: bool = True):
+        """
+        使路由表失效（下次查询时重建）
+
+        Args:
+            table: 变更的表名（仅用于日志）
+            publish: 是否通知其他Worker进程
+        """
+        self._version += 1
+        self.stats['invalidations'] += 1
+        logger.debug(f"路由表已失效: {table or 'manual'}")
+
+        if publish and self.redis is not None:
+            try:
+                asyncio.get_running_loop().create_task(self._publish(table))
+            except RuntimeError:
+                pass  # 没有运行中的事件循环（同步脚本），跳过跨进程通知
+
+    async def _publish(self, table: Optional[str]):
+        try:
+            await self.redis.publish(INVALIDATE_CHANNEL, json.dumps({
+                'source': self.instance_id,
+                'table': table
+            }))
+        except Exception as e:
+            logger.error(f"发布路由失效通知失败: {str(e)}")
+
+    async def start(self, redis: Optional[aioredis.Redis]):
+        """
+        订阅其他进程的失效通知
+
+        Args:
+            redis: Redis连接（为None时仅本进程生效）
+        """
+        if redis is None or self._listener_task is not None:
+            return
+
+        self.redis = redis
+        pubsub = redis.pubsub()
+        await pubsub.subscribe(INVALIDATE_CHANNEL)
+        self._listener_task = asyncio.create_task(self._listen(pubsub))
+        logger.info("路由表已订阅失效通知")
+
+    async def _listen(self, pubsub):
+        try:
+            async for item in pubsub.listen():
+                if item.get('type') != 'message':
+                    continue
+
+                try:
+                    payload = json.loads(item['data'])
+                except (TypeError, ValueError):
+                    payload = {}
+
+                if payload.get('source') == self.instance_id:
+                    continue
+
+                self.stats['remote_invalidations'] += 1
+                self.invalidate(payload.get('table'), publish=False)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.error(f"路由失效通知监听异常: {str(e)}")
+        finally:
+            try:
+                await pubsub.unsubscribe(INVALIDATE_CHANNEL)
+                await pubsub.aclose()
+            except Exception:
+                pass
+
+    async def stop(self):
+        """停止订阅"""
+        if self._listener_task:
+            self._listener_task.cancel()
+            try:
+                await self._listener_task
+            except asyncio.CancelledError:
+                pass
+            self._listener_task = None
+        self.redis = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取路由表统计"""
+        return {
+            **self.stats,
+            'channels': len(self._routes),
+            'routes': sum(len(r) for r in self._routes.values()),
+            'bots': len(self._bots),
+            'stale': self._is_stale(),
+            'subscribed': self._listener_task is not None
+        }
+
+
+# 创建全局路由表
+routing_table = RoutingTable(ttl=settings.routing_table_ttl)
+
+# 同步数据库写入映射/Bot配置时自动失效
+db.add_change_listener(routing_table.invalidate)
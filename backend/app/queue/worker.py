@@ -1,13 +1,18 @@
 """
 消息处理Worker
 """
+import os
+import html
 import asyncio
+from functools import partial
 from datetime import datetime
 from collections import OrderedDict
 from typing import Dict, Any, List, Optional
 from ..utils.logger import logger
 from ..utils.error_diagnosis import ErrorDiagnostic, diagnostic_logger
-from ..database import db
+from ..utils.batch_writer import batch_writer_manager
+from ..database_async import async_db
+from ..config import settings
 from ..processors.filter import message_filter
 from ..processors.formatter import formatter
 from ..processors.image import image_processor, attachment_processor
@@ -19,6 +24,27 @@ from ..forwarders.feishu import feishu_forwarder
 from ..forwarders.wechatwork import wechatwork_forwarder
 from ..forwarders.dingtalk import dingtalk_forwarder
 from .redis_client import redis_queue
+from .fanout import fanout_dispatcher, OrderTicket
+from .routing import routing_table
+from .retry_worker import retry_worker
+
+
+async def _write_message_logs(records: List[Dict[str, Any]]) -> List[int]:
+    """写入一批消息日志，有新的失败消息时唤醒重试Worker重新计算下次唤醒时间"""
+    log_ids = await async_db.add_message_logs_batch(records)
+    if any(record.get('retry') for record in records):
+        retry_worker.notify()
+    return log_ids
+
+
+# 消息日志组提交写入器（需要重试的记录在同一事务中写入failed_messages）
+log_writer = batch_writer_manager.register(
+    'message_logs',
+    batch_size=settings.log_batch_size,
+    flush_interval=settings.log_flush_interval,
+    write_func=_write_message_logs,
+    max_buffer=settings.log_buffer_max
+)
 
 
 class LRUCache:
@@ -68,11 +94,29 @@ class MessageWorker:
         self.is_running = False
         # 使用LRU缓存防止内存泄漏（最多保留10000条消息ID）
         self.processed_messages = LRUCache(max_size=10000)
+        # 自适应批量大小：出队取满说明有积压则放大，取不满则收缩
+        self.batch_size = settings.queue_batch_min
+        # 后台补发链接预览的任务（link_preview_async 模式）
+        self._preview_tasks = set()
+        # 本批消息中需要重试的失败记录：已进入写入缓冲区 / 写入失败（确认前检查，见 _commit_retry_logs）
+        self._retry_logs_pending = False
+        self._retry_logs_failed = False
+        
+        # 处理统计（多进程模式下由各进程上报，见 worker_pool）
+        self.stats = {
+            'batches': 0,
+            'messages': 0,
+            'succeeded': 0,
+            'failed': 0,
+            'started_at': None,
+            'last_batch_at': None
+        }
     
     async def start(self):
         """启动Worker（✅ P1-3+P2-4优化：批量处理+异常恢复）"""
         logger.info("启动消息处理Worker（批量处理+自动恢复模式）")
         self.is_running = True
+        self.stats['started_at'] = datetime.now().isoformat()
         
         consecutive_errors = 0  # ✅ P2-4优化：连续错误计数
         max_consecutive_errors = 10  # 最多10次连续错误后才停止
@@ -80,16 +124,20 @@ class MessageWorker:
         # ✅ P2-4优化：Worker级别异常不退出
         while self.is_running:
             try:
-                # ✅ P1-3优化：批量出队（10条/次）
-                messages = await redis_queue.dequeue_batch(count=10, timeout=5)
+                # ✅ P1-3优化：批量出队（批量大小随队列积压自适应）
+                messages = await redis_queue.dequeue_batch(count=self.batch_size, timeout=5)
+                self._adapt_batch_size(len(messages))
                 
                 if messages:
                     # ✅ P1-3优化：并行处理（asyncio.gather）
                     logger.debug(f"批量处理 {len(messages)} 条消息")
                     
+                    # 按出队顺序领取投递顺序票据（同一目标频道按此顺序投递）
+                    tickets = [fanout_dispatcher.reserve() for _ in messages]
+                    
                     # ✅ P2-4优化：每条消息单独try-catch，单个失败不影响Worker
                     results = await asyncio.gather(
-                        *[self._safe_process_message(msg) for msg in messages],
+                        *[self._safe_process_message(msg, ticket) for msg, ticket in zip(messages, tickets)],
                         return_exceptions=True
                     )
                     
@@ -97,11 +145,23 @@ class MessageWorker:
                     success_count = sum(1 for r in results if r is True)
                     failure_count = len(results) - success_count
                     
+                    self.stats['batches'] += 1
+                    self.stats['messages'] += len(messages)
+                    self.stats['succeeded'] += success_count
+                    self.stats['failed'] += failure_count
+                    self.stats['last_batch_at'] = datetime.now().isoformat()
+                    
                     if failure_count > 0:
                         logger.warning(f"批量处理完成：成功 {success_count} 条，失败 {failure_count} 条")
                     else:
                         logger.debug(f"批量处理完成：全部成功 {success_count} 条")
                     
+                    # Stream后端：处理完成后确认（进程在此之前崩溃则由其他Worker认领重投）
+                    if await self._commit_retry_logs():
+                        await redis_queue.ack(messages)
+                    else:
+                        logger.warning(f"失败消息记录未能写入数据库，{len(messages)} 条消息暂不确认，等待重新投递")
+                    
                     # 成功处理消息，重置错误计数
                     consecutive_errors = 0
                 else:
@@ -124,18 +184,35 @@ class MessageWorker:
         
         logger.info("消息处理Worker已停止")
     
-    async def _safe_process_message(self, message: Dict[str, Any]) -> bool:
+    def _adapt_batch_size(self, dequeued: int):
+        """
+        根据上次出队数量调整批量大小
+        
+        取满时翻倍（队列有积压），不足一半时减半（积压已消化），
+        在 queue_batch_min ~ queue_batch_max 之间变化
+        
+        Args:
+            dequeued: 上次实际出队数量
+        """
+        if dequeued >= self.batch_size:
+            self.batch_size = min(self.batch_size * 2, settings.queue_batch_max)
+        elif dequeued < self.batch_size // 2:
+            self.batch_size = max(self.batch_size // 2, settings.queue_batch_min)
+    
+    async def _safe_process_message(self, message: Dict[str, Any],
+                                    ticket: Optional[OrderTicket] = None) -> bool:
         """
         安全地处理单条消息（✅ P2-4优化：捕获所有异常）
         
         Args:
             message: 消息数据
+            ticket: 投递顺序票据
             
         Returns:
             是否成功
         """
         try:
-            await self.process_message(message)
+            await self.process_message(message, ticket)
             return True
         except Exception as e:
             logger.error(f"处理消息失败: {message.get('message_id')}, {str(e)}")
@@ -157,8 +234,8 @@ class MessageWorker:
             error: 错误信息
         """
         try:
-            # 记录失败日志
-            log_id = db.add_message_log(
+            # 记录失败日志并加入失败消息队列
+            await self._log_result(
                 kook_message_id=message.get('message_id', ''),
                 kook_channel_id=message.get('channel_id', ''),
                 content=message.get('content', '')[:200],
@@ -167,83 +244,203 @@ class MessageWorker:
                 target_platform='unknown',
                 target_channel='unknown',
                 status='failed',
-                error_message=str(error)[:200]
+                error_message=str(error)[:200],
+                retry=True
             )
             
-            # 添加到失败消息队列
-            with db.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute("""
-                    INSERT INTO failed_messages (message_log_id, retry_count)
-                    VALUES (?, 0)
-                """, (log_id,))
-                conn.commit()
-            
-            logger.info(f"消息已添加到失败队列: log_id={log_id}")
+            logger.info(f"消息已添加到失败队列: {message.get('message_id')}")
             
         except Exception as e:
             logger.error(f"记录失败消息异常: {str(e)}")
     
+    async def _log_result(self, kook_message_id: str, kook_channel_id: str,
+                          content: str, message_type: str, sender_name: str,
+                          target_platform: str, target_channel: str, status: str,
+                          error_message: Optional[str] = None,
+                          latency_ms: Optional[int] = None,
+                          retry: bool = False,
+                          retry_delay: Optional[float] = None):
+        """
+        记录转发结果（交给组提交写入器，与其他结果合并在一个事务中提交）
+        
+        Args:
+            retry: 是否同时加入失败消息队列等待重试
+            retry_delay: 首次重试延迟（秒，默认 message_retry_interval）
+            其余参数同 async_db.add_message_log
+        """
+        record = {
+            'kook_message_id': kook_message_id,
+            'kook_channel_id': kook_channel_id,
+            'content': content,
+            'message_type': message_type,
+            'sender_name': sender_name,
+            'target_platform': target_platform,
+            'target_channel': target_channel,
+            'status': status,
+            'error_message': error_message,
+            'latency_ms': latency_ms,
+            'retry': retry,
+            'retry_delay': retry_delay
+        }
+        if not retry:
+            await log_writer.add(record)
+            return
+        
+        self._retry_logs_pending = True
+        try:
+            await log_writer.add(record)
+        except Exception:
+            self._retry_logs_failed = True
+            raise
+    
+    async def _commit_retry_logs(self) -> bool:
+        """
+        提交本批消息中需要重试的失败记录
+        
+        消息确认后Stream不再重投，失败消息只剩失败队列这一份，
+        所以确认前这些记录必须已经提交到数据库，不能还留在写入缓冲区里
+        
+        Returns:
+            是否可以确认本批消息
+        """
+        pending, failed = self._retry_logs_pending, self._retry_logs_failed
+        self._retry_logs_pending = self._retry_logs_failed = False
+        
+        if failed:
+            return False
+        if pending:
+            return await log_writer.flush()
+        return True
+    
     async def stop(self):
         """停止Worker"""
         logger.info("停止消息处理Worker")
         self.is_running = False
+        
+        for task in list(self._preview_tasks):
+            task.cancel()
     
-    async def process_message(self, message: Dict[str, Any]):
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        获取Worker统计
+        
+        Returns:
+            处理数量、当前批量大小、运行状态和扇出统计
+        """
+        return {
+            **self.stats,
+            'pid': os.getpid(),
+            'is_running': self.is_running,
+            'batch_size': self.batch_size,
+            'fanout': fanout_dispatcher.get_stats(),
+            'routing': routing_table.get_stats(),
+            'log_writer': log_writer.get_stats(),
+            'link_preview': link_preview_generator.get_stats()
+        }
+    
+    async def process_message(self, message: Dict[str, Any],
+                              ticket: Optional[OrderTicket] = None) -> List[Dict[str, Any]]:
         """
         处理单条消息
         
         Args:
             message: 消息数据
+            ticket: 出队时领取的投递顺序票据（不传时在扇出时按调用顺序排队）
+            
+        Returns:
+            每个目标的转发结果列表
         """
         start_time = datetime.now()
         message_id = message.get('message_id')
+        # Stream认领重投的消息：原Worker已标记去重但可能未转发完成
+        redelivered = message.get('_redelivered', False)
         
         try:
             logger.info(f"开始处理消息: {message_id}")
             
             # 去重检查
-            if message_id in self.processed_messages:
+            if message_id in self.processed_messages and not redelivered:
                 logger.debug(f"消息已处理过，跳过: {message_id}")
-                return
+                return []
             
             # 或者使用Redis去重
             dedup_key = f"processed:{message_id}"
-            if await redis_queue.exists(dedup_key):
+            if not redelivered and await redis_queue.exists(dedup_key):
                 logger.debug(f"消息已处理过（Redis），跳过: {message_id}")
-                return
+                return []
             
             # 标记为已处理（保留7天）
             await redis_queue.set(dedup_key, "1", expire=7*24*3600)
             self.processed_messages.add(message_id)
             
-            # 应用过滤规则
-            should_forward, reason = message_filter.should_forward(message)
-            if not should_forward:
-                logger.info(f"消息被过滤: {message_id}, 原因: {reason}")
-                return
-            
-            # 查找频道映射
+            # 查找频道映射（内存路由表，映射/Bot配置变更时自动重建）
             channel_id = message.get('channel_id')
-            mappings = db.get_channel_mappings(channel_id)
+            mappings = await routing_table.get_routes(channel_id)
             
             if not mappings:
                 logger.debug(f"未找到频道映射: {channel_id}")
-                return
+                return []
             
-            # 转发到所有映射的目标
-            for mapping in mappings:
-                await self.forward_to_target(message, mapping)
+            # 应用过滤规则（全局/服务器/频道/映射级规则一次判断，被拒绝的目标不再转发）
+            # 规则缓存过期时通过异步只读连接重新加载，select_routes 直接使用缓存
+            await message_filter.load_rules_async()
+            mappings, rejected = message_filter.select_routes(message, mappings)
+            if not mappings:
+                logger.info(f"消息被过滤: {message_id}, 原因: {rejected[0][1] if rejected else '无可用目标'}")
+                return []
+            for mapping, reason in rejected:
+                logger.debug(f"目标已过滤: {message_id} -> {mapping.get('target_platform')}/"
+                             f"{mapping.get('target_channel_id')}, 原因: {reason}")
+            
+            if redelivered:
+                # 跳过上次已成功投递的目标
+                delivered = await redis_queue.get_delivered_targets(message_id)
+                mappings = [m for m in mappings if str(m.get('id')) not in delivered]
+                if not mappings:
+                    logger.info(f"重投消息的所有目标均已投递: {message_id}")
+                    return []
+            
+            # 目标已确定：媒体处理前按出队顺序在各目标频道预留位置
+            if ticket is not None:
+                await fanout_dispatcher.claim(ticket, mappings)
+            
+            # 媒体处理阶段：每个图片/附件只下载、压缩、保存一次，所有目标共享结果
+            media = await self.prepare_media(message)
+            
+            # 并发扇出到所有映射的目标（按平台/Bot限并发，同一目标频道保序）
+            results = await fanout_dispatcher.dispatch(
+                message, mappings, partial(self.forward_to_target, media=media), ticket=ticket
+            )
+            
+            # 记录已成功的目标，消息被重投时不再重复发送
+            await redis_queue.mark_targets_delivered(
+                message_id, [r.mapping_id for r in results if r.success]
+            )
+            
+            # 尚未缓存的链接预览在后台抓取，完成后补发到已投递的目标
+            if media.get('pending_link_urls'):
+                delivered_ids = {r.mapping_id for r in results if r.success}
+                self._schedule_link_previews(
+                    message,
+                    [m for m in mappings if m.get('id') in delivered_ids],
+                    media['pending_link_urls']
+                )
             
             # 计算延迟
             latency_ms = int((datetime.now() - start_time).total_seconds() * 1000)
-            logger.info(f"消息处理完成: {message_id}, 延迟: {latency_ms}ms")
+            success_count = sum(1 for r in results if r.success)
+            logger.info(
+                f"消息处理完成: {message_id}, 目标: {success_count}/{len(results)}成功, "
+                f"延迟: {latency_ms}ms"
+            )
+            
+            return [r.to_dict() for r in results]
             
         except Exception as e:
             logger.error(f"处理消息失败: {message_id}, 错误: {str(e)}")
             
             # 记录失败日志
-            db.add_message_log(
+            await self._log_result(
                 kook_message_id=message_id,
                 kook_channel_id=message.get('channel_id', ''),
                 content=message.get('content', ''),
@@ -254,6 +451,156 @@ class MessageWorker:
                 status='failed',
                 error_message=str(e)
             )
+            return []
+        finally:
+            # 未使用的预留位置让给后面的消息
+            if ticket is not None:
+                await fanout_dispatcher.release(ticket)
+    
+    async def prepare_media(self, message: Dict[str, Any]) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        消息级媒体处理（在扇出前执行一次）
+        
+        同一URL在一条消息内只处理一次，图片和附件并行处理。
+        返回结果由所有目标平台共享，其中图片包含压缩后的数据、
+        本地路径和带Token的图床URL，附件包含本地路径。
+        
+        Args:
+            message: 消息数据
+            
+        Returns:
+            {'images': 处理后的图片列表, 'attachments': 处理后的附件列表,
+             'link_previews': 链接预览列表, 'pending_link_urls': 待后台抓取预览的URL}
+        """
+        # 去重并保持原有顺序
+        image_urls = list(dict.fromkeys(message.get('image_urls') or []))
+        
+        file_attachments = []
+        seen_urls = set()
+        for attachment in message.get('file_attachments') or []:
+            url = attachment.get('url')
+            if url in seen_urls:
+                continue
+            seen_urls.add(url)
+            file_attachments.append(attachment)
+        
+        if image_urls:
+            logger.info(f"检测到 {len(image_urls)} 张图片")
+        if file_attachments:
+            logger.info(f"检测到 {len(file_attachments)} 个附件")
+        
+        content = message.get('content') or ''
+        pending_link_urls = []
+        
+        if settings.link_preview_async:
+            # 只使用已缓存的预览，未缓存的不阻塞发送
+            link_previews, pending_link_urls = link_preview_generator.get_cached_message_links(
+                content, max_previews=3
+            )
+            images, attachments = await asyncio.gather(
+                self.process_images(image_urls, message),
+                self.process_attachments(file_attachments, message)
+            )
+        else:
+            # ✅ P1-1优化：链接预览与图片/附件并行生成（最多3个链接）
+            images, attachments, link_previews = await asyncio.gather(
+                self.process_images(image_urls, message),
+                self.process_attachments(file_attachments, message),
+                self._generate_link_previews(content)
+            )
+        
+        return {
+            'images': images,
+            'attachments': attachments,
+            'link_previews': link_previews,
+            'pending_link_urls': pending_link_urls
+        }
+    
+    async def _generate_link_previews(self, content: str) -> List[Dict[str, Any]]:
+        """生成消息中链接的预览（失败时返回空列表，不影响转发）"""
+        if not content:
+            return []
+        
+        try:
+            link_previews = await link_preview_generator.process_message_links(
+                content, 
+                max_previews=3
+            )
+            if link_previews:
+                logger.info(f"生成了 {len(link_previews)} 个链接预览")
+            return link_previews
+        except Exception as e:
+            logger.warning(f"链接预览生成失败: {str(e)}")
+            return []
+    
+    def _schedule_link_previews(self, message: Dict[str, Any],
+                                mappings: List[Dict[str, Any]], urls: List[str]):
+        """
+        后台抓取链接预览并补发（link_preview_async 模式）
+        
+        Args:
+            message: 消息数据
+            mappings: 已成功投递的映射
+            urls: 待抓取的URL
+        """
+        task = asyncio.create_task(self._send_link_previews_later(message, mappings, urls))
+        self._preview_tasks.add(task)
+        task.add_done_callback(self._preview_tasks.discard)
+    
+    async def _send_link_previews_later(self, message: Dict[str, Any],
+                                        mappings: List[Dict[str, Any]], urls: List[str]):
+        """抓取预览（同时写入缓存），再作为单独一条消息补发"""
+        try:
+            link_previews = await link_preview_generator.fetch_previews(urls)
+            if not link_previews:
+                return
+            
+            for mapping in mappings:
+                await self.send_link_previews(message, mapping, link_previews)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"链接预览补发失败: {str(e)}")
+    
+    async def send_link_previews(self, message: Dict[str, Any], mapping: Dict[str, Any],
+                                 link_previews: List[Dict[str, Any]]) -> bool:
+        """
+        单独发送链接预览（支持Discord和Telegram）
+        
+        Args:
+            message: 消息数据
+            mapping: 频道映射配置
+            link_previews: 预览列表
+            
+        Returns:
+            是否成功
+        """
+        platform = mapping['target_platform']
+        bot_config = mapping.get('bot') or await routing_table.get_bot(mapping['target_bot_id'])
+        if not bot_config:
+            return False
+        
+        sender_name = message.get('sender_name', '未知用户')
+        
+        if platform == 'discord':
+            return await discord_forwarder.send_message(
+                webhook_url=bot_config['config'].get('webhook_url'),
+                content='',
+                username=sender_name,
+                embeds=[link_preview_generator.format_preview_for_discord(p) for p in link_previews]
+            )
+        
+        if platform == 'telegram':
+            content = "📎 <b>链接预览:</b>"
+            for preview in link_previews:
+                content += f"\n{link_preview_generator.format_preview_for_telegram(preview)}"
+            return await telegram_forwarder.send_message(
+                token=bot_config['config'].get('token'),
+                chat_id=mapping['target_channel_id'],
+                content=content
+            )
+        
+        return False
     
     async def process_images(self, image_urls: List[str], 
                             message: Dict[str, Any]) -> List[Dict[str, Any]]:
@@ -342,6 +689,9 @@ class MessageWorker:
             )
             
             if result:
+                # 保留压缩后的数据，供需要直接上传的平台复用
+                result['data'] = compressed_data
+                result['size'] = len(compressed_data)
                 return result
             else:
                 logger.error(f"图片处理返回None: {url}")
@@ -454,67 +804,52 @@ class MessageWorker:
             raise  # 重新抛出让gather捕获
     
     async def forward_to_target(self, message: Dict[str, Any], 
-                               mapping: Dict[str, Any]):
+                               mapping: Dict[str, Any],
+                               media: Optional[Dict[str, List[Dict[str, Any]]]] = None) -> bool:
         """
         转发消息到目标平台
         
         Args:
             message: 消息数据
             mapping: 频道映射配置
+            media: 已处理的媒体（prepare_media的结果），为None时在此处理
+            
+        Returns:
+            是否成功
         """
         platform = mapping['target_platform']
         target_channel = mapping['target_channel_id']
         bot_id = mapping['target_bot_id']
         
         try:
-            # 获取Bot配置
-            bot_configs = db.get_bot_configs(platform)
-            bot_config = next((b for b in bot_configs if b['id'] == bot_id), None)
+            # 获取Bot配置（路由描述中已解析，其他调用方按ID从路由表获取）
+            bot_config = mapping.get('bot') or await routing_table.get_bot(bot_id)
             
             if not bot_config:
                 logger.error(f"未找到Bot配置: {bot_id}")
-                return
+                return False
             
             # 准备消息内容
             content = message.get('content', '')
             sender_name = message.get('sender_name', '未知用户')
             message_type = message.get('message_type', 'text')
-            image_urls = message.get('image_urls', [])
-            file_attachments = message.get('file_attachments', [])
             
             # 提取引用和提及
             quote = message.get('quote')
             mentions = message.get('mentions', [])
             
-            # ✅ P1-1优化：检测链接并生成预览（最多3个链接）
-            link_previews = []
-            if content:
-                try:
-                    link_previews = await link_preview_generator.process_message_links(
-                        content, 
-                        max_previews=3
-                    )
-                    if link_previews:
-                        logger.info(f"生成了 {len(link_previews)} 个链接预览")
-                except Exception as e:
-                    logger.warning(f"链接预览生成失败: {str(e)}")
-            
             # 处理表情反应消息
             if message_type == 'reaction' or message.get('type') == 'reaction':
                 reaction_text = formatter.format_reaction(message)
                 content = f"💬 表情反应: {reaction_text}"
             
-            # 处理图片（如果有）
-            processed_images = []
-            if image_urls:
-                logger.info(f"检测到 {len(image_urls)} 张图片")
-                processed_images = await self.process_images(image_urls, message)
-            
-            # 处理附件（如果有）
-            processed_attachments = []
-            if file_attachments:
-                logger.info(f"检测到 {len(file_attachments)} 个附件")
-                processed_attachments = await self.process_attachments(file_attachments, message)
+            # 图片和附件（扇出前已统一处理，单独调用时在此处理）
+            if media is None:
+                media = await self.prepare_media(message)
+            processed_images = media['images']
+            processed_attachments = media['attachments']
+            # 链接预览（消息级生成一次，所有目标共享）
+            link_previews = media.get('link_previews') or []
             
             # 格式转换
             if platform == 'discord':
@@ -522,17 +857,19 @@ class MessageWorker:
                 quote_text = formatter.format_quote(quote, 'discord') if quote else ""
                 
                 # 格式化提及
-                formatted_content = formatter.kmarkdown_to_discord(content)
-                formatted_content = formatter.format_mentions(mentions, formatted_content, 'discord')
+                body = formatter.format_mentions(mentions, content, 'discord')
                 
-                # 组合最终内容
-                formatted_content = f"{quote_text}**{sender_name}**: {formatted_content}"
+                # 组合最终内容（引用和发送者在前，附件列表在后）
+                prefix = f"{quote_text}**{sender_name}**: "
+                suffix = ""
                 
                 # 如果有附件，添加到内容中
                 if processed_attachments:
-                    formatted_content += f"\n\n📎 **附件** ({len(processed_attachments)}个):"
+                    suffix += f"\n\n📎 **附件** ({len(processed_attachments)}个):"
                     for att in processed_attachments:
-                        formatted_content += f"\n• {att['filename']}"
+                        suffix += f"\n• {att['filename']}"
+                
+                formatted_content = prefix + formatter.kmarkdown_to_discord(body) + suffix
                 
                 webhook_url = bot_config['config'].get('webhook_url')
                 
@@ -573,9 +910,10 @@ class MessageWorker:
                 else:
                     # 纯文本消息（✅ P1-1优化：附带链接预览Embed）
                     # ✅ P0-1优化: 自动分段超长消息
-                    if len(formatted_content) > 2000:
-                        logger.warning(f"消息超长({len(formatted_content)}字符)，自动分段")
-                        segments = formatter.split_long_message(formatted_content, max_length=1950)  # 留50字符余量
+                    # 按渲染后的长度分段，不会拆开格式标记、代码块和链接（留出分段编号的余量）
+                    segments = formatter.split_message(body, 'discord', 1990, prefix=prefix, suffix=suffix)
+                    if len(segments) > 1:
+                        logger.warning(f"消息超长，自动分为{len(segments)}段")
                         success = True
                         for i, segment in enumerate(segments):
                             segment_success = await discord_forwarder.send_message(
@@ -592,7 +930,7 @@ class MessageWorker:
                     else:
                         success = await discord_forwarder.send_message(
                             webhook_url=webhook_url,
-                            content=formatted_content,
+                            content=segments[0],
                             username=sender_name,
                             embeds=embeds if embeds else None
                         )
@@ -617,25 +955,27 @@ class MessageWorker:
                 quote_text = formatter.format_quote(quote, 'telegram') if quote else ""
                 
                 # 格式化提及
-                formatted_content = formatter.kmarkdown_to_telegram_html(content)
-                formatted_content = formatter.format_mentions(mentions, formatted_content, 'telegram')
+                body = formatter.format_mentions(mentions, content, 'telegram')
                 
-                # 组合最终内容
-                formatted_content = f"{quote_text}<b>{sender_name}</b>: {formatted_content}"
+                # 组合最终内容（引用和发送者在前，链接预览和附件列表在后）
+                prefix = f"{quote_text}<b>{html.escape(sender_name)}</b>: "
+                suffix = ""
                 
                 # ✅ P1-1优化：如果有链接预览，添加到内容
                 if link_previews:
-                    formatted_content += "\n\n📎 <b>链接预览:</b>"
+                    suffix += "\n\n📎 <b>链接预览:</b>"
                     for preview in link_previews:
                         preview_text = link_preview_generator.format_preview_for_telegram(preview)
-                        formatted_content += f"\n{preview_text}"
+                        suffix += f"\n{preview_text}"
                 
                 # 如果有附件，添加到内容中
                 if processed_attachments:
-                    formatted_content += f"\n\n📎 <b>附件</b> ({len(processed_attachments)}个):"
+                    suffix += f"\n\n📎 <b>附件</b> ({len(processed_attachments)}个):"
                     for att in processed_attachments:
                         size_mb = att['size'] / (1024 * 1024)
-                        formatted_content += f"\n• {att['filename']} ({size_mb:.2f}MB)"
+                        suffix += f"\n• {att['filename']} ({size_mb:.2f}MB)"
+                
+                formatted_content = prefix + formatter.kmarkdown_to_telegram_html(body) + suffix
                 
                 token = bot_config['config'].get('token')
                 
@@ -665,9 +1005,10 @@ class MessageWorker:
                 else:
                     # 纯文本消息
                     # ✅ P0-1优化: 自动分段超长消息（Telegram限制4096字符）
-                    if len(formatted_content) > 4096:
-                        logger.warning(f"Telegram消息超长({len(formatted_content)}字符)，自动分段")
-                        segments = formatter.split_long_message(formatted_content, max_length=4000)  # 留96字符余量
+                    # 按实体解析后的UTF-16长度分段，每段都是完整的HTML（留出分段编号的余量）
+                    segments = formatter.split_message(body, 'telegram', 4080, prefix=prefix, suffix=suffix)
+                    if len(segments) > 1:
+                        logger.warning(f"Telegram消息超长，自动分为{len(segments)}段")
                         success = True
                         for i, segment in enumerate(segments):
                             segment_success = await telegram_forwarder.send_message(
@@ -684,7 +1025,7 @@ class MessageWorker:
                         success = await telegram_forwarder.send_message(
                             token=token,
                             chat_id=target_channel,
-                            content=formatted_content
+                            content=segments[0]
                         )
                 
                 # 转发附件文件（如果有）
@@ -707,18 +1048,20 @@ class MessageWorker:
                 quote_text = formatter.format_quote(quote, 'feishu') if quote else ""
                 
                 # 格式化提及
-                formatted_content = formatter.kmarkdown_to_feishu_text(content)
-                formatted_content = formatter.format_mentions(mentions, formatted_content, 'feishu')
+                body = formatter.format_mentions(mentions, content, 'feishu')
                 
-                # 组合最终内容
-                formatted_content = f"{quote_text}{sender_name}: {formatted_content}"
+                # 组合最终内容（引用和发送者在前，附件列表在后）
+                prefix = f"{quote_text}{sender_name}: "
+                suffix = ""
                 
                 # 如果有附件，添加到内容中
                 if processed_attachments:
-                    formatted_content += f"\n\n📎 附件 ({len(processed_attachments)}个):"
+                    suffix += f"\n\n📎 附件 ({len(processed_attachments)}个):"
                     for att in processed_attachments:
                         size_mb = att['size'] / (1024 * 1024)
-                        formatted_content += f"\n• {att['filename']} ({size_mb:.2f}MB)"
+                        suffix += f"\n• {att['filename']} ({size_mb:.2f}MB)"
+                
+                formatted_content = prefix + formatter.kmarkdown_to_feishu_text(body) + suffix
                 
                 app_id = bot_config['config'].get('app_id')
                 app_secret = bot_config['config'].get('app_secret')
@@ -751,9 +1094,10 @@ class MessageWorker:
                 else:
                     # 纯文本消息
                     # ✅ P0-1优化: 自动分段超长消息（飞书限制约5000字符）
-                    if len(formatted_content) > 5000:
-                        logger.warning(f"飞书消息超长({len(formatted_content)}字符)，自动分段")
-                        segments = formatter.split_long_message(formatted_content, max_length=4900)  # 留100字符余量
+                    # 按渲染后的长度分段（留出分段编号的余量）
+                    segments = formatter.split_message(body, 'feishu', 4980, prefix=prefix, suffix=suffix)
+                    if len(segments) > 1:
+                        logger.warning(f"飞书消息超长，自动分为{len(segments)}段")
                         success = True
                         for i, segment in enumerate(segments):
                             segment_success = await feishu_forwarder.send_message(
@@ -772,7 +1116,7 @@ class MessageWorker:
                             app_id=app_id,
                             app_secret=app_secret,
                             chat_id=target_channel,
-                            content=formatted_content
+                            content=segments[0]
                         )
                 
                 # 转发附件文件（如果有）
@@ -795,8 +1139,8 @@ class MessageWorker:
                 # 企业微信转发
                 webhook_url = bot_config['config'].get('webhook_url')
                 
-                # 格式化内容
-                formatted_content = f"{sender_name}: {content}"
+                # 格式化内容（text消息不支持格式标记）
+                formatted_content = f"{sender_name}: {formatter.kmarkdown_to_plain_text(content)}"
                 
                 # 提取@提及的手机号（如果有）
                 mentioned_mobiles = []
@@ -846,8 +1190,8 @@ class MessageWorker:
                 webhook_url = bot_config['config'].get('webhook_url')
                 secret = bot_config['config'].get('secret')
                 
-                # 格式化内容
-                formatted_content = f"{sender_name}: {content}"
+                # 格式化内容（text消息不支持格式标记）
+                formatted_content = f"{sender_name}: {formatter.kmarkdown_to_plain_text(content)}"
                 
                 # 提取@提及
                 at_mobiles = []
@@ -859,7 +1203,7 @@ class MessageWorker:
                     for img_info in processed_images:
                         image_url = img_info.get('original') or img_info.get('local')
                         
-                        markdown_text = f"**{sender_name}**\n\n{content}\n\n![图片]({image_url})"
+                        markdown_text = f"**{sender_name}**\n\n{formatter.kmarkdown_to_markdown(content)}\n\n![图片]({image_url})"
                         
                         success = await dingtalk_forwarder.send_markdown(
                             webhook_url=webhook_url,
@@ -894,11 +1238,12 @@ class MessageWorker:
             
             else:
                 logger.error(f"不支持的平台: {platform}")
-                return
+                return False
             
             # 记录日志
+            # 失败的同时加入失败消息队列，等待重试
             status = 'success' if success else 'failed'
-            log_id = db.add_message_log(
+            await self._log_result(
                 kook_message_id=message['message_id'],
                 kook_channel_id=message['channel_id'],
                 content=content,
@@ -906,7 +1251,8 @@ class MessageWorker:
                 sender_name=sender_name,
                 target_platform=platform,
                 target_channel=target_channel,
-                status=status
+                status=status,
+                retry=not success
             )
             
             if success:
@@ -914,17 +1260,9 @@ class MessageWorker:
             else:
                 logger.error(f"❌ 消息转发失败: {platform} - {target_channel}")
                 logger.warning("⚠️ 转发失败，但未抛出异常。可能是目标平台返回失败状态。")
-                
-                # 添加到失败消息队列，等待重试
-                with db.get_connection() as conn:
-                    cursor = conn.cursor()
-                    cursor.execute("""
-                        INSERT INTO failed_messages (message_log_id, retry_count)
-                        VALUES (?, 0)
-                    """, (log_id,))
-                    conn.commit()
-                
-                logger.info(f"消息已添加到重试队列: log_id={log_id}")
+                logger.info(f"消息已添加到重试队列: {message['message_id']}")
+            
+            return success
                 
         except Exception as e:
             # v1.11.0新增：详细错误诊断
@@ -947,6 +1285,8 @@ class MessageWorker:
             
             # 获取自动修复策略
             fix_strategy = ErrorDiagnostic.get_auto_fix_strategy(diagnosis)
+            # 延迟重试交给重试Worker（此时仍占用频道位置和并发名额，不能在这里等待）
+            retry_delay = None
             
             if fix_strategy:
                 logger.info(f"🔧 尝试自动修复策略: {fix_strategy}")
@@ -954,8 +1294,7 @@ class MessageWorker:
                 # 根据不同策略执行自动修复
                 if fix_strategy == 'retry':
                     logger.info("⏰ 将在30秒后自动重试")
-                    await asyncio.sleep(30)
-                    await redis_queue.enqueue(message)
+                    retry_delay = 30
                     
                 elif fix_strategy == 'auto_split':
                     logger.info("✂️ 消息过长，已自动分段处理（由formatter处理）")
@@ -967,17 +1306,16 @@ class MessageWorker:
                     
                 elif fix_strategy == 'wait_and_retry':
                     logger.info("⏰ API限流，等待60秒后重试")
-                    await asyncio.sleep(60)
-                    await redis_queue.enqueue(message)
+                    retry_delay = 60
             else:
                 logger.warning("⚠️ 无法自动修复，需要人工介入")
                 logger.info("💡 建议解决方案:")
                 for i, suggestion in enumerate(diagnosis['suggestions'], 1):
                     logger.info(f"  {i}. {suggestion}")
             
-            # 记录失败日志到数据库
+            # 记录失败日志到数据库（需要延迟重试或无法自动修复时，同时加入失败队列）
             error_msg = f"{diagnosis['error_type']}: {diagnosis['solution']}"
-            log_id = db.add_message_log(
+            await self._log_result(
                 message.get('message_id', ''), 
                 message.get('channel_id', ''),
                 content[:200] if 'content' in locals() else '', 
@@ -986,19 +1324,15 @@ class MessageWorker:
                 platform, 
                 target_channel, 
                 'failed',
-                error_message=error_msg[:200]
+                error_message=error_msg[:200],
+                retry=retry_delay is not None or not fix_strategy,
+                retry_delay=retry_delay
             )
             
-            # 如果不是自动修复，添加到失败队列
-            if not fix_strategy:
-                with db.get_connection() as conn:
-                    cursor = conn.cursor()
-                    cursor.execute("""
-                        INSERT INTO failed_messages (message_log_id, retry_count)
-                        VALUES (?, 0)
-                    """, (log_id,))
-                    conn.commit()
-                logger.info(f"消息已添加到失败队列: log_id={log_id}")
+            if retry_delay is not None or not fix_strategy:
+                logger.info(f"消息已添加到失败队列: {message.get('message_id')}")
+            
+            return False
 
 
 # 创建全局Worker实例
@@ -2,11 +2,14 @@
 消息处理Worker增强补丁
 ✅ P0优化集成：整合所有P0级新功能到Worker
 """
-from typing import Dict, Any
+from typing import Dict, Any, List
 from ..utils.logger import logger
 from ..processors.file_processor import file_processor
 from ..processors.reaction_aggregator import reaction_aggregator
 from ..processors.image_strategy import image_strategy
+from ..processors.formatter import formatter
+from ..forwarders.discord import discord_forwarder
+from ..forwarders.telegram import telegram_forwarder
 from ..utils.message_deduplicator import message_deduplicator
 from ..utils.message_backup import message_backup
 from ..database import db
@@ -130,8 +133,10 @@ class WorkerP0Enhancements:
                 
                 platform = mapping['target_platform']
                 
-                # 格式化表情反应
-                reaction_text = reaction_aggregator.format_reactions(message_id, platform)
+                # 格式化表情反应（Telegram取KMarkdown文本，发送时再转换为HTML，用户名随之转义）
+                reaction_text = reaction_aggregator.format_reactions(
+                    message_id, 'discord' if platform == 'telegram' else platform
+                )
                 
                 if not reaction_text:
                     continue
@@ -250,7 +255,12 @@ class WorkerP0Enhancements:
     @staticmethod
     async def _send_to_platform(platform: str, bot_config: Dict, 
                                 content: str, mapping: Dict) -> bool:
-        """发送消息到目标平台"""
+        """
+        发送消息到目标平台
+        
+        Args:
+            content: KMarkdown内容（Telegram发送前转换为HTML）
+        """
         try:
             config = bot_config.get('config', {})
             
@@ -266,7 +276,7 @@ class WorkerP0Enhancements:
                 return await telegram_forwarder.send_message(
                     token,
                     chat_id,
-                    content
+                    formatter.kmarkdown_to_telegram_html(content)
                 )
             elif platform == 'feishu':
                 # 飞书发送实现
@@ -345,14 +355,8 @@ class WorkerP0Enhancements:
             
             logger.info(f"开始恢复 {len(pending)} 条未发送消息...")
             
-            restored_count = 0
-            for msg in pending:
-                try:
-                    # 重新入队
-                    await redis_queue.enqueue(msg)
-                    restored_count += 1
-                except Exception as e:
-                    logger.error(f"恢复消息失败: {msg.get('message_id')}, {str(e)}")
+            # 批量重新入队（一次往返写入一批）
+            restored_count = await redis_queue.enqueue_many(pending)
             
             logger.info(f"✅ 成功恢复 {restored_count}/{len(pending)} 条消息")
             
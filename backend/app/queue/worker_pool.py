@@ -0,0 +1,295 @@
+"""
+多进程Worker池
+启动N个独立进程消费同一个Redis队列，格式化、过滤、JSON解析和日志写入分摊到多个CPU核心
+
+- 每个子进程拥有自己的事件循环、Redis连接和HTTP连接池，运行一个MessageWorker
+- 主进程（API服务）负责监督：崩溃自动重启（指数退避），关闭时先通知子进程处理完当前批次再退出
+- 子进程定期把统计写入Redis（worker:stats:<worker_id>），由 /api/queue/workers 汇总展示
+
+注意：限流器和扇出调度器的频道顺序锁是进程内的，多进程时同一目标频道的顺序
+只在单个进程内保证；需要崩溃不丢消息时建议配合 queue_backend=stream 使用
+"""
+import os
+import json
+import time
+import asyncio
+import multiprocessing
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Callable
+from ..utils.logger import logger
+from ..config import settings
+
+
+# 子进程统计在Redis中的键前缀
+WORKER_STATS_PREFIX = "worker:stats:"
+
+
+def run_worker_process(worker_id: int, stop_event):
+    """
+    子进程入口（spawn启动方式要求为模块级函数）
+
+    Args:
+        worker_id: Worker编号
+        stop_event: 主进程设置后子进程优雅退出
+    """
+    if os.name == 'nt':
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+
+    asyncio.run(_worker_process_main(worker_id, stop_event))
+
+
+async def _worker_process_main(worker_id: int, stop_event):
+    """子进程主协程：连接Redis、启动Worker、上报统计、等待退出信号"""
+    from .redis_client import redis_queue
+    from .worker import message_worker
+    from ..utils.http_client import http_client_manager
+    from ..database_async import async_db
+    from ..utils.batch_writer import batch_writer_manager
+    from .routing import routing_table
+    from ..utils.rate_limiter import rate_limiter_manager
+    from ..utils.message_wal import message_wal
+
+    logger.info(f"Worker进程 #{worker_id} 启动 (pid={os.getpid()})")
+
+    # 预写日志的索引在进程内存中，每个子进程写自己的目录（编号不变，重启后接着使用）
+    message_wal.set_dir(settings.wal_dir / f"worker-{worker_id}")
+
+    await redis_queue.connect()
+    await async_db.connect()
+    await batch_writer_manager.start_all()
+    await routing_table.start(redis_queue.redis)
+    rate_limiter_manager.use_redis(redis_queue.redis)
+    await http_client_manager.start()
+
+    worker_task = asyncio.create_task(message_worker.start())
+    stats_key = f"{WORKER_STATS_PREFIX}{worker_id}"
+    parent = multiprocessing.parent_process()
+    last_report = 0.0
+
+    try:
+        while not stop_event.is_set() and not worker_task.done():
+            # 主进程异常退出时子进程也退出，避免成为孤儿进程
+            if parent is not None and not parent.is_alive():
+                logger.warning(f"Worker进程 #{worker_id} 检测到主进程已退出")
+                break
+
+            now = time.monotonic()
+            if now - last_report >= settings.worker_stats_interval:
+                last_report = now
+                stats = {**message_worker.get_stats(), 'worker_id': worker_id}
+                await redis_queue.set(
+                    stats_key,
+                    json.dumps(stats, ensure_ascii=False),
+                    expire=settings.worker_stats_interval * 3
+                )
+
+            await asyncio.sleep(0.5)
+    finally:
+        # 优雅退出：Worker处理完当前批次（并确认）后结束循环
+        await message_worker.stop()
+        try:
+            await asyncio.wait_for(worker_task, timeout=settings.worker_shutdown_timeout)
+        except asyncio.TimeoutError:
+            worker_task.cancel()
+        except Exception as e:
+            logger.error(f"Worker进程 #{worker_id} 退出异常: {str(e)}")
+
+        if redis_queue.redis:
+            try:
+                await redis_queue.redis.delete(stats_key)
+            except Exception:
+                pass
+
+        await routing_table.stop()
+        await redis_queue.disconnect()
+        await batch_writer_manager.stop_all()
+        await async_db.disconnect()
+        await http_client_manager.close()
+        logger.info(f"Worker进程 #{worker_id} 已退出")
+
+
+class WorkerPool:
+    """多进程Worker池（监督者运行在主进程的事件循环中）"""
+
+    def __init__(self, processes: int = 0,
+                 target: Callable = run_worker_process,
+                 max_restart_delay: float = 60.0):
+        """
+        初始化Worker池
+
+        Args:
+            processes: 子进程数量（0表示不启用，使用进程内Worker）
+            target: 子进程入口函数，签名为 (worker_id, stop_event)
+            max_restart_delay: 崩溃重启的最大退避时间（秒）
+        """
+        self.processes = processes
+        self.target = target
+        self.max_restart_delay = max_restart_delay
+
+        # spawn在Windows/Linux/macOS上行为一致，且不会继承主进程的事件循环和连接
+        self._ctx = multiprocessing.get_context('spawn')
+        self._stop_event = None
+        self._workers: Dict[int, Dict[str, Any]] = {}
+        self._supervisor_task: Optional[asyncio.Task] = None
+        self.is_running = False
+
+    @property
+    def enabled(self) -> bool:
+        return self.processes > 0
+
+    def _spawn(self, worker_id: int):
+        """启动（或重启）一个子进程"""
+        process = self._ctx.Process(
+            target=self.target,
+            args=(worker_id, self._stop_event),
+            name=f"kook-worker-{worker_id}",
+            daemon=True
+        )
+        process.start()
+
+        # restarts 为累计重启次数（只用于统计），backoff 为连续崩溃次数（决定退避时间）
+        info = self._workers.setdefault(worker_id, {'restarts': 0, 'backoff': 0})
+        info.update({
+            'process': process,
+            'started_at': datetime.now().isoformat(),
+            'spawned_at': time.monotonic(),
+            'next_restart_at': None
+        })
+        logger.info(f"Worker进程 #{worker_id} 已启动 (pid={process.pid})")
+
+    async def start(self):
+        """启动所有子进程和监督任务"""
+        if not self.enabled or self.is_running:
+            return
+
+        self._stop_event = self._ctx.Event()
+        self.is_running = True
+
+        for worker_id in range(self.processes):
+            self._spawn(worker_id)
+
+        self._supervisor_task = asyncio.create_task(self._supervise())
+        logger.info(f"多进程Worker池已启动: {self.processes} 个进程")
+
+    async def _supervise(self):
+        """监督循环：发现退出的子进程后按指数退避重启"""
+        while self.is_running:
+            now = time.monotonic()
+
+            for worker_id, info in self._workers.items():
+                process = info['process']
+                if process.is_alive():
+                    continue
+
+                if info['next_restart_at'] is None:
+                    self._schedule_restart(worker_id, info, now)
+                elif now >= info['next_restart_at']:
+                    self._spawn(worker_id)
+
+            await asyncio.sleep(0.5)
+
+    def _schedule_restart(self, worker_id: int, info: Dict[str, Any], now: float):
+        """
+        记录子进程退出并安排重启（按连续崩溃次数指数退避）
+
+        稳定运行超过 max_restart_delay 后才退出的进程视为偶发崩溃，退避从头计算
+        """
+        process = info['process']
+        if now - info['spawned_at'] >= self.max_restart_delay:
+            info['backoff'] = 0
+        info['backoff'] += 1
+        info['restarts'] += 1
+
+        delay = min(2 ** (info['backoff'] - 1), self.max_restart_delay)
+        info['next_restart_at'] = now + delay
+        info['last_exitcode'] = process.exitcode
+        logger.error(
+            f"Worker进程 #{worker_id} 异常退出 (exitcode={process.exitcode})，"
+            f"{delay:.0f}秒后重启（第{info['restarts']}次）"
+        )
+
+    async def stop(self, timeout: Optional[float] = None):
+        """
+        优雅关闭：通知子进程退出，超时未退出的强制终止
+
+        Args:
+            timeout: 等待子进程退出的时间（秒）
+        """
+        if not self.is_running:
+            return
+
+        self.is_running = False
+        if self._supervisor_task:
+            self._supervisor_task.cancel()
+            try:
+                await self._supervisor_task
+            except asyncio.CancelledError:
+                pass
+
+        self._stop_event.set()
+
+        if timeout is None:
+            timeout = settings.worker_shutdown_timeout + 5
+        deadline = time.monotonic() + timeout
+
+        for worker_id, info in self._workers.items():
+            process = info['process']
+            remaining = max(0.0, deadline - time.monotonic())
+            await asyncio.get_running_loop().run_in_executor(None, process.join, remaining)
+
+            if process.is_alive():
+                logger.warning(f"Worker进程 #{worker_id} 未在规定时间内退出，强制终止")
+                process.terminate()
+                await asyncio.get_running_loop().run_in_executor(None, process.join, 5)
+
+        logger.info("多进程Worker池已停止")
+
+    def get_process_info(self) -> List[Dict[str, Any]]:
+        """获取各子进程的运行状态（主进程视角）"""
+        result = []
+        for worker_id, info in sorted(self._workers.items()):
+            process = info['process']
+            result.append({
+                'worker_id': worker_id,
+                'pid': process.pid,
+                'alive': process.is_alive(),
+                'restarts': info['restarts'],
+                'last_exitcode': info.get('last_exitcode'),
+                'started_at': info['started_at']
+            })
+        return result
+
+    async def get_stats(self) -> Dict[str, Any]:
+        """
+        汇总各Worker统计
+
+        Returns:
+            模式、进程状态，以及各进程上报到Redis的处理统计
+        """
+        from .redis_client import redis_queue
+
+        if not self.enabled:
+            # 进程内单Worker模式
+            from .worker import message_worker
+            return {
+                'mode': 'in_process',
+                'workers': [{**message_worker.get_stats(), 'worker_id': 0, 'alive': True}]
+            }
+
+        workers = []
+        for info in self.get_process_info():
+            reported = await redis_queue.get(f"{WORKER_STATS_PREFIX}{info['worker_id']}")
+            stats = json.loads(reported) if reported else {}
+            workers.append({**stats, **info})
+
+        return {
+            'mode': 'multi_process',
+            'processes': self.processes,
+            'alive': sum(1 for w in workers if w['alive']),
+            'total_messages': sum(w.get('messages', 0) for w in workers),
+            'workers': workers
+        }
+
+
+# 创建全局Worker池
+worker_pool = WorkerPool(processes=settings.worker_processes)
@@ -1,12 +1,114 @@
 """
 全文消息搜索
 ✅ P1-11: Elasticsearch集成搜索
+
+SQLite后端基于 message_logs_fts 全文索引（FTS5 + trigram分词）：
+- 按BM25相关度排序，返回带高亮的内容片段
+- trigram按字符三元组索引，中文无需分词也能检索；不足3个字符的词回退为LIKE
+- SQLite未编译FTS5/trigram时（async_db.fts_available为False）所有词都用LIKE匹配
+- 支持游标（keyset）分页，翻页耗时不随页数增长
+- 总数与结果使用同一组过滤条件，计数设上限避免大结果集全表计数
 """
 import asyncio
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple, Any
 from datetime import datetime
 from ..utils.logger import logger
-from ..database import get_database
+from ..database_async import async_db
+
+
+# trigram分词的最短可检索长度
+MIN_FTS_TERM_LENGTH = 3
+
+# 总数统计上限（超过后只返回上限值并标记 total_capped）
+COUNT_LIMIT = 10000
+
+# 高亮标记
+HIGHLIGHT_START = '<mark>'
+HIGHLIGHT_END = '</mark>'
+SNIPPET_TOKENS = 16
+
+# 过滤条件 -> SQL条件
+FILTER_CONDITIONS = {
+    'platform': ("m.target_platform = ?", None),
+    'status': ("m.status = ?", None),
+    'channel_id': ("m.kook_channel_id = ?", None),
+    'sender': ("m.sender_name LIKE ? ESCAPE '\\'", 'like'),
+    'start_time': ("m.created_at >= ?", None),
+    'end_time': ("m.created_at <= ?", None),
+}
+
+
+def escape_like(value: str) -> str:
+    """转义LIKE通配符"""
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def parse_query(query: Optional[str], fts: bool = True) -> Tuple[Optional[str], List[str]]:
+    """
+    解析搜索关键词
+    
+    空白分隔的每个词都必须命中（AND）；词按短语引用，用户输入中的
+    FTS5语法字符（引号、星号、NEAR等）不会被解释
+    
+    Args:
+        query: 搜索关键词
+        fts: 全文索引是否可用（不可用时所有词都用LIKE匹配）
+    
+    Returns:
+        (FTS5 MATCH表达式或None, 不足3个字符需用LIKE匹配的词)
+    """
+    fts_terms = []
+    short_terms = []
+    
+    for term in (query or '').split():
+        if fts and len(term) >= MIN_FTS_TERM_LENGTH:
+            fts_terms.append('"' + term.replace('"', '""') + '"')
+        else:
+            short_terms.append(term)
+    
+    return (' AND '.join(fts_terms) or None), short_terms
+
+
+def make_snippet(content: str, terms: List[str], width: int = 32) -> str:
+    """
+    为LIKE匹配的结果生成高亮片段（与FTS5 snippet()格式一致）
+    
+    Args:
+        content: 消息内容
+        terms: 搜索词
+        width: 片段长度（字符）
+    
+    Returns:
+        高亮片段
+    """
+    content = content or ''
+    lowered = content.lower()
+    
+    positions = [(lowered.find(term.lower()), term) for term in terms]
+    positions = [(pos, term) for pos, term in positions if pos >= 0]
+    if not positions:
+        return content[:width] + ('…' if len(content) > width else '')
+    
+    pos, _ = min(positions)
+    start = max(0, pos - width // 2)
+    end = min(len(content), start + width)
+    
+    # 只高亮最长的词，避免标记嵌套
+    term = max((t for _, t in positions), key=len).lower()
+    text = content[start:end]
+    lowered_text = text.lower()
+    parts = []
+    index = 0
+    found = lowered_text.find(term)
+    while found >= 0:
+        parts.append(text[index:found])
+        parts.append(HIGHLIGHT_START + text[found:found + len(term)] + HIGHLIGHT_END)
+        index = found + len(term)
+        found = lowered_text.find(term, index)
+    parts.append(text[index:])
+    text = ''.join(parts)
+    
+    return ('…' if start > 0 else '') + text + ('…' if end < len(content) else '')
 
 
 class MessageSearch:
@@ -14,89 +116,201 @@ class MessageSearch:
     
     def __init__(self):
         self.use_elasticsearch = False  # 可选启用ES
-        
+    
     async def search(
         self,
         query: str,
         filters: Optional[Dict] = None,
         limit: int = 100,
-        offset: int = 0
+        offset: int = 0,
+        cursor: Optional[str] = None,
+        sort: str = 'relevance'
     ) -> Dict:
         """
         搜索消息
         
         Args:
-            query: 搜索关键词
-            filters: 过滤条件
+            query: 搜索关键词（空白分隔的多个词需同时命中）
+            filters: 过滤条件（platform/status/channel_id/sender/start_time/end_time）
             limit: 返回数量
-            offset: 偏移量
-            
+            offset: 偏移量（提供cursor时忽略）
+            cursor: 上一页返回的 next_cursor（游标分页）
+            sort: relevance（相关度）或 time（最新优先）
+        
         Returns:
             搜索结果
         """
         if self.use_elasticsearch:
             return await self._search_with_es(query, filters, limit, offset)
         else:
-            return await self._search_with_sqlite(query, filters, limit, offset)
+            return await self._search_with_sqlite(query, filters, limit, offset, cursor, sort)
+    
+    def _build_conditions(
+        self,
+        short_terms: List[str],
+        filters: Optional[Dict]
+    ) -> Tuple[List[str], List[Any]]:
+        """构建LIKE短词和过滤条件（结果查询与计数共用）"""
+        conditions = []
+        params = []
+        
+        for term in short_terms:
+            pattern = f"%{escape_like(term)}%"
+            conditions.append(
+                "(m.content LIKE ? ESCAPE '\\' OR m.sender_name LIKE ? ESCAPE '\\' "
+                "OR m.kook_channel_id LIKE ? ESCAPE '\\')"
+            )
+            params.extend([pattern, pattern, pattern])
+        
+        for key, value in (filters or {}).items():
+            if value is None or value == '' or key not in FILTER_CONDITIONS:
+                continue
+            condition, kind = FILTER_CONDITIONS[key]
+            conditions.append(condition)
+            params.append(f"%{escape_like(str(value))}%" if kind == 'like' else value)
+        
+        return conditions, params
     
     async def _search_with_sqlite(
         self,
         query: str,
         filters: Optional[Dict],
         limit: int,
-        offset: int
+        offset: int,
+        cursor: Optional[str] = None,
+        sort: str = 'relevance'
     ) -> Dict:
-        """使用SQLite搜索"""
-        db = get_database()
-        
+        """使用SQLite全文索引搜索"""
         try:
-            # 构建SQL查询
-            sql = "SELECT * FROM message_logs WHERE content LIKE ?"
-            params = [f"%{query}%"]
+            match, short_terms = parse_query(query, fts=await async_db.has_fts())
+            conditions, params = self._build_conditions(short_terms, filters)
+            
+            if match:
+                source = (
+                    "message_logs_fts JOIN message_logs m ON m.id = message_logs_fts.rowid"
+                )
+                conditions.insert(0, "message_logs_fts MATCH ?")
+                params.insert(0, match)
+                columns = (
+                    "m.*, bm25(message_logs_fts) AS score, "
+                    f"snippet(message_logs_fts, 0, '{HIGHLIGHT_START}', '{HIGHLIGHT_END}', '…', {SNIPPET_TOKENS}) AS snippet"
+                )
+            else:
+                source = "message_logs m"
+                columns = "m.*, NULL AS score, NULL AS snippet"
+                sort = 'time'  # 没有全文条件时无相关度可排
+            
+            where_clause = " AND ".join(conditions) if conditions else "1=1"
             
-            # 添加过滤条件
-            if filters:
-                if 'platform' in filters:
-                    sql += " AND target_platform = ?"
-                    params.append(filters['platform'])
+            async with async_db.reader() as conn:
+                # 总数（与结果使用同一组条件，超过上限不再继续计数）
+                count_cursor = await conn.execute(
+                    f"SELECT COUNT(*) FROM (SELECT 1 FROM {source} WHERE {where_clause} LIMIT ?)",
+                    params + [COUNT_LIMIT]
+                )
+                count = (await count_cursor.fetchone())[0]
                 
-                if 'status' in filters:
-                    sql += " AND status = ?"
-                    params.append(filters['status'])
+                # 游标条件：从上一页最后一条之后继续
+                page_conditions = list(conditions)
+                page_params = list(params)
+                if cursor:
+                    if sort == 'relevance':
+                        last_score, last_id = cursor.rsplit(':', 1)
+                        page_conditions.append(
+                            "(bm25(message_logs_fts) > ? OR (bm25(message_logs_fts) = ? AND m.id < ?))"
+                        )
+                        page_params.extend([float(last_score), float(last_score), int(last_id)])
+                    else:
+                        page_conditions.append("m.id < ?")
+                        page_params.append(int(cursor.rsplit(':', 1)[-1]))
+                    offset = 0
                 
-                if 'start_time' in filters:
-                    sql += " AND created_at >= ?"
-                    params.append(filters['start_time'])
+                order_by = "score, m.id DESC" if sort == 'relevance' else "m.id DESC"
+                page_where = " AND ".join(page_conditions) if page_conditions else "1=1"
                 
-                if 'end_time' in filters:
-                    sql += " AND created_at <= ?"
-                    params.append(filters['end_time'])
+                result_cursor = await conn.execute(
+                    f"SELECT {columns} FROM {source} WHERE {page_where} "
+                    f"ORDER BY {order_by} LIMIT ? OFFSET ?",
+                    page_params + [limit, offset]
+                )
+                rows = await result_cursor.fetchall()
             
-            # 排序和分页
-            sql += " ORDER BY created_at DESC LIMIT ? OFFSET ?"
-            params.extend([limit, offset])
+            results = [dict(row) for row in rows]
+            for item in results:
+                if item['snippet'] is None:
+                    item['snippet'] = make_snippet(item.get('content'), short_terms)
             
-            # 执行查询
-            cursor = db.execute(sql, params)
-            results = cursor.fetchall()
-            
-            # 获取总数
-            count_sql = "SELECT COUNT(*) FROM message_logs WHERE content LIKE ?"
-            count_params = [f"%{query}%"]
-            
-            count = db.execute(count_sql, count_params).fetchone()[0]
+            next_cursor = None
+            if len(results) == limit:
+                last = results[-1]
+                next_cursor = (
+                    f"{last['score']!r}:{last['id']}" if sort == 'relevance' else str(last['id'])
+                )
             
             return {
                 'total': count,
-                'results': [dict(row) for row in results],
+                'total_capped': count >= COUNT_LIMIT,
+                'results': results,
                 'query': query,
                 'limit': limit,
-                'offset': offset
+                'offset': offset,
+                'next_cursor': next_cursor
             }
-            
+        
         except Exception as e:
             logger.error(f"搜索失败: {str(e)}")
-            return {'total': 0, 'results': [], 'error': str(e)}
+            return {'total': 0, 'results': [], 'next_cursor': None, 'error': str(e)}
+    
+    async def suggest(self, keyword: str, limit: int = 10) -> Dict[str, List[str]]:
+        """
+        搜索建议（匹配的发送者和频道，最近出现的优先）
+        
+        Args:
+            keyword: 关键词
+            limit: 每类返回数量
+        
+        Returns:
+            {'senders': [...], 'channels': [...]}
+        """
+        suggestions = {'senders': [], 'channels': []}
+        keyword = (keyword or '').strip()
+        if not keyword:
+            return suggestions
+        
+        try:
+            fts = await async_db.has_fts()
+            async with async_db.reader() as conn:
+                for key, column in (('senders', 'sender_name'), ('channels', 'kook_channel_id')):
+                    if fts and len(keyword) >= MIN_FTS_TERM_LENGTH:
+                        # 列过滤的全文匹配
+                        sql = f"""
+                            SELECT m.{column}, MAX(m.id) AS last_id
+                            FROM message_logs_fts JOIN message_logs m ON m.id = message_logs_fts.rowid
+                            WHERE message_logs_fts MATCH ?
+                            GROUP BY m.{column}
+                            ORDER BY last_id DESC
+                            LIMIT ?
+                        """
+                        params = ['{' + column + '}: "' + keyword.replace('"', '""') + '"', limit]
+                    else:
+                        # 短词（或全文索引不可用时）无法走trigram索引，只在最近的日志里查找
+                        sql = f"""
+                            SELECT {column}, MAX(id) AS last_id
+                            FROM (SELECT id, {column} FROM message_logs ORDER BY id DESC LIMIT ?)
+                            WHERE {column} LIKE ? ESCAPE '\\'
+                            GROUP BY {column}
+                            ORDER BY last_id DESC
+                            LIMIT ?
+                        """
+                        params = [COUNT_LIMIT, f"%{escape_like(keyword)}%", limit]
+                    
+                    cursor = await conn.execute(sql, params)
+                    suggestions[key] = [row[0] for row in await cursor.fetchall() if row[0]]
+        
+        except Exception as e:
+            logger.error(f"获取搜索建议失败: {str(e)}")
+        
+        return suggestions
     
     async def _search_with_es(
         self,
@@ -0,0 +1,167 @@
+"""
+Aho-Corasick多模式匹配自动机
+一次扫描文本即可找出所有关键词，耗时与关键词数量无关（只与文本长度和命中数有关）
+
+大小写不敏感匹配由调用方负责（关键词和文本统一 lower() 后再匹配）
+"""
+from collections import deque
+from typing import Dict, Any, List, Optional, Iterator, Tuple, Iterable
+
+
+class AhoCorasick:
+    """
+    Aho-Corasick自动机
+
+    使用方式:
+    ```python
+    automaton = AhoCorasick(['广告', '代练'])
+    automaton.find_first('这是一条广告消息')   # (4, 6, '广告', '广告')
+    list(automaton.iter_matches('代练广告'))    # 所有命中
+    ```
+    """
+
+    def __init__(self, patterns: Iterable[str] = ()):
+        """
+        初始化自动机
+
+        Args:
+            patterns: 初始关键词（可之后继续add，首次匹配前自动构建）
+        """
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[Optional[Tuple[str, Any]]] = [None]  # 在该节点结束的关键词
+        self._output_link: List[int] = [0]  # 沿失败链最近的有输出节点（0表示没有）
+        self._built = True
+        self._count = 0
+
+        for pattern in patterns:
+            self.add(pattern)
+
+    def add(self, pattern: str, value: Any = None):
+        """
+        添加关键词
+
+        Args:
+            pattern: 关键词（空字符串忽略）
+            value: 命中时一并返回的值（默认为关键词本身）
+        """
+        if not pattern:
+            return
+
+        node = 0
+        for char in pattern:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][char] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(None)
+                self._output_link.append(0)
+            node = next_node
+
+        if self._output[node] is None:
+            self._count += 1
+        self._output[node] = (pattern, pattern if value is None else value)
+        self._built = False
+
+    def remove(self, pattern: str) -> bool:
+        """
+        移除关键词（只清除结束标记，失败指针在下次匹配前重新构建）
+
+        Args:
+            pattern: 关键词
+
+        Returns:
+            是否存在并已移除
+        """
+        node = 0
+        for char in pattern:
+            node = self._goto[node].get(char)
+            if node is None:
+                return False
+
+        if not pattern or self._output[node] is None:
+            return False
+
+        self._output[node] = None
+        self._count -= 1
+        self._built = False
+        return True
+
+    def __contains__(self, pattern: str) -> bool:
+        node = 0
+        for char in pattern:
+            node = self._goto[node].get(char)
+            if node is None:
+                return False
+        return bool(pattern) and self._output[node] is not None
+
+    def build(self):
+        """按BFS计算失败指针和输出链"""
+        queue = deque()
+        for node in self._goto[0].values():
+            self._fail[node] = 0
+            self._output_link[node] = 0
+            queue.append(node)
+
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fail = self._goto[fail].get(char, 0)
+                if fail == child:
+                    fail = 0
+
+                self._fail[child] = fail
+                self._output_link[child] = fail if self._output[fail] is not None else self._output_link[fail]
+
+        self._built = True
+
+    def __len__(self) -> int:
+        return self._count
+
+    def iter_matches(self, text: str) -> Iterator[Tuple[int, int, str, Any]]:
+        """
+        扫描文本，按结束位置顺序产出所有命中（包括重叠命中）
+
+        Args:
+            text: 文本
+
+        Yields:
+            (起始位置, 结束位置(不含), 关键词, 值)
+        """
+        if not self._count:
+            return
+        if not self._built:
+            self.build()
+
+        goto, fail, output, output_link = self._goto, self._fail, self._output, self._output_link
+        node = 0
+
+        for index, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+
+            hit = node if output[node] is not None else output_link[node]
+            while hit:
+                pattern, value = output[hit]
+                yield index + 1 - len(pattern), index + 1, pattern, value
+                hit = output_link[hit]
+
+    def find_first(self, text: str) -> Optional[Tuple[int, int, str, Any]]:
+        """
+        查找第一个命中（最早结束的关键词）
+
+        Args:
+            text: 文本
+
+        Returns:
+            (起始位置, 结束位置(不含), 关键词, 值)，没有命中返回None
+        """
+        return next(self.iter_matches(text), None)
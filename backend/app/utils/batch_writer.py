@@ -1,11 +1,15 @@
 """
 批量写入Worker
 ✅ P0-2优化: 数据库异步化临时方案，减少阻塞
+
+组提交：调用方只往缓冲区追加，后台刷新任务把攒下的记录放在一个事务里提交，
+N条记录只付出一次提交（fsync）的代价。缓冲区有上限，写满后调用方等待提交完成。
 """
+import time
 import asyncio
-from typing import Dict, Any, List, Callable
+from typing import Dict, Any, List, Callable, Optional
 from datetime import datetime
-from collections import defaultdict
+from collections import defaultdict, deque
 
 
 class BatchWriter:
@@ -46,7 +50,8 @@ class BatchWriter:
         batch_size: int = 50,
         flush_interval: float = 5.0,
         write_func: Callable = None,
-        data_type: str = 'default'
+        data_type: str = 'default',
+        max_buffer: int = 10000
     ):
         """
         初始化批量写入器
@@ -56,24 +61,35 @@ class BatchWriter:
             flush_interval: 刷新间隔（秒，超时后强制写入）
             write_func: 批量写入函数
             data_type: 数据类型（用于分类缓冲区）
+            max_buffer: 缓冲区上限（写满后add()等待刷新完成，形成背压）
         """
         self.batch_size = batch_size
         self.flush_interval = flush_interval
         self.write_func = write_func
         self.data_type = data_type
+        self.max_buffer = max(max_buffer, batch_size)
         
         self.buffer: List[Dict[str, Any]] = []
         self.buffer_lock = asyncio.Lock()
+        self.write_lock = asyncio.Lock()  # 保证批次按顺序写入
+        self.flush_event: Optional[asyncio.Event] = None
         self.is_running = False
         self.flush_task = None
         self.last_flush_time = datetime.now()
         
+        # 最近60秒的提交记录（时间, 条数），用于计算写入速率
+        self._recent_commits = deque()
+        
         # 统计信息
         self.stats = {
             'total_added': 0,
             'total_flushed': 0,
             'total_batches': 0,
-            'failed_batches': 0
+            'failed_batches': 0,
+            'backpressure_waits': 0,
+            'total_commit_ms': 0.0,
+            'max_commit_ms': 0.0,
+            'last_commit_ms': 0.0
         }
     
     async def start(self):
@@ -82,6 +98,7 @@ class BatchWriter:
             return
         
         self.is_running = True
+        self.flush_event = asyncio.Event()
         self.flush_task = asyncio.create_task(self._flush_loop())
         
         from ..utils.logger import logger
@@ -121,40 +138,57 @@ class BatchWriter:
         """
         添加数据到缓冲区
         
+        未启动时直接写入（单条提交）；缓冲区已满时等待刷新完成（背压）
+        
         Args:
             data: 要写入的数据
         """
+        if not self.is_running:
+            self.stats['total_added'] += 1
+            if not await self._write([data]):
+                raise RuntimeError(f"批量写入失败 [{self.data_type}]")
+            return
+        
+        # 缓冲区已满：由调用方亲自刷新，写入跟不上时生产者随之放慢
+        while len(self.buffer) >= self.max_buffer:
+            self.stats['backpressure_waits'] += 1
+            if not await self.flush():
+                await asyncio.sleep(min(self.flush_interval, 1.0))
+        
         async with self.buffer_lock:
             self.buffer.append(data)
             self.stats['total_added'] += 1
             
-            # 如果达到批次大小，立即刷新
+            # 达到批次大小，唤醒刷新任务立即提交
             if len(self.buffer) >= self.batch_size:
-                await self._do_flush()
+                self.flush_event.set()
     
-    async def flush(self, force: bool = True):
+    async def flush(self, force: bool = True) -> bool:
         """
         手动刷新缓冲区
         
         Args:
             force: 是否强制刷新（即使缓冲区为空）
+        
+        Returns:
+            是否写入成功（缓冲区为空视为成功）
         """
-        async with self.buffer_lock:
-            await self._do_flush(force=force)
+        async with self.write_lock:
+            return await self._do_flush(force=force)
     
     async def _flush_loop(self):
-        """定时刷新循环"""
+        """定时刷新循环（达到批次大小时被提前唤醒）"""
         while self.is_running:
             try:
-                await asyncio.sleep(self.flush_interval)
-                
-                # 检查是否需要刷新
-                async with self.buffer_lock:
-                    if len(self.buffer) > 0:
-                        time_since_last_flush = (datetime.now() - self.last_flush_time).total_seconds()
-                        if time_since_last_flush >= self.flush_interval:
-                            await self._do_flush()
+                try:
+                    await asyncio.wait_for(self.flush_event.wait(), timeout=self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self.flush_event.clear()
                 
+                if len(self.buffer) > 0:
+                    await self.flush()
+            
             except asyncio.CancelledError:
                 break
             except Exception as e:
@@ -162,56 +196,96 @@ class BatchWriter:
                 logger.error(f"批量写入器刷新循环异常 [{self.data_type}]: {str(e)}")
                 await asyncio.sleep(1)
     
-    async def _do_flush(self, force: bool = False):
+    async def _do_flush(self, force: bool = False) -> bool:
         """
-        执行刷新（内部方法，需要持有锁）
+        执行刷新（内部方法，需要持有写入锁）
         
         Args:
             force: 是否强制刷新
-        """
-        if not force and len(self.buffer) == 0:
-            return
         
-        if len(self.buffer) == 0:
-            return
-        
-        # 取出当前缓冲区数据
-        data_to_write = self.buffer.copy()
-        self.buffer.clear()
+        Returns:
+            是否写入成功
+        """
+        # 取出当前缓冲区数据（写入期间新数据继续进入缓冲区）
+        async with self.buffer_lock:
+            if len(self.buffer) == 0:
+                return True
+            
+            data_to_write = self.buffer[:self.max_buffer]
+            del self.buffer[:len(data_to_write)]
         
         # 更新刷新时间
         self.last_flush_time = datetime.now()
         
-        # 执行批量写入（释放锁后执行，避免阻塞）
+        if await self._write(data_to_write):
+            return True
+        
+        # 写入失败，重新放回缓冲区头部（避免数据丢失，保持顺序）
+        async with self.buffer_lock:
+            self.buffer[:0] = data_to_write
+        return False
+    
+    async def _write(self, data_to_write: List[Dict[str, Any]]) -> bool:
+        """执行一次批量写入并记录提交耗时"""
+        from ..utils.logger import logger
+        
+        if not self.write_func:
+            return True
+        
+        start = time.perf_counter()
         try:
-            if self.write_func:
-                # 同步函数包装为异步
-                if asyncio.iscoroutinefunction(self.write_func):
-                    await self.write_func(data_to_write)
-                else:
-                    # 在线程池中执行同步函数
-                    loop = asyncio.get_event_loop()
-                    await loop.run_in_executor(None, self.write_func, data_to_write)
-                
-                self.stats['total_flushed'] += len(data_to_write)
-                self.stats['total_batches'] += 1
-                
-                from ..utils.logger import logger
-                logger.debug(
-                    f"批量写入成功 [{self.data_type}]: {len(data_to_write)}条记录"
-                )
-            
+            # 同步函数包装为异步
+            if asyncio.iscoroutinefunction(self.write_func):
+                await self.write_func(data_to_write)
+            else:
+                # 在线程池中执行同步函数
+                loop = asyncio.get_running_loop()
+                await loop.run_in_executor(None, self.write_func, data_to_write)
         except Exception as e:
             self.stats['failed_batches'] += 1
-            from ..utils.logger import logger
             logger.error(f"批量写入失败 [{self.data_type}]: {str(e)}")
-            
-            # 写入失败，重新加入缓冲区（避免数据丢失）
-            self.buffer.extend(data_to_write)
+            return False
+        
+        commit_ms = (time.perf_counter() - start) * 1000
+        self.stats['total_flushed'] += len(data_to_write)
+        self.stats['total_batches'] += 1
+        self.stats['total_commit_ms'] += commit_ms
+        self.stats['last_commit_ms'] = commit_ms
+        self.stats['max_commit_ms'] = max(self.stats['max_commit_ms'], commit_ms)
+        self._recent_commits.append((time.monotonic(), len(data_to_write)))
+        
+        logger.debug(
+            f"批量写入成功 [{self.data_type}]: {len(data_to_write)}条记录, "
+            f"耗时{commit_ms:.1f}ms"
+        )
+        return True
     
-    def get_stats(self) -> Dict[str, int]:
-        """获取统计信息"""
-        return self.stats.copy()
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        获取统计信息
+        
+        Returns:
+            计数、缓冲区大小、平均/最大提交耗时（毫秒）、平均批次大小、
+            最近60秒的写入速率（条/秒）
+        """
+        # 只保留最近60秒的提交记录
+        now = time.monotonic()
+        while self._recent_commits and now - self._recent_commits[0][0] > 60:
+            self._recent_commits.popleft()
+        
+        batches = self.stats['total_batches']
+        recent_rows = sum(rows for _, rows in self._recent_commits)
+        
+        return {
+            **self.stats,
+            'total_commit_ms': round(self.stats['total_commit_ms'], 3),
+            'max_commit_ms': round(self.stats['max_commit_ms'], 3),
+            'last_commit_ms': round(self.stats['last_commit_ms'], 3),
+            'buffer_size': len(self.buffer),
+            'avg_commit_ms': round(self.stats['total_commit_ms'] / batches, 3) if batches else 0.0,
+            'avg_batch_size': round(self.stats['total_flushed'] / batches, 1) if batches else 0.0,
+            'rows_per_sec': round(recent_rows / 60, 2)
+        }
     
     def get_buffer_size(self) -> int:
         """获取当前缓冲区大小"""
@@ -254,8 +328,9 @@ class BatchWriterManager:
         name: str,
         batch_size: int = 50,
         flush_interval: float = 5.0,
-        write_func: Callable = None
-    ):
+        write_func: Callable = None,
+        max_buffer: int = 10000
+    ) -> BatchWriter:
         """
         注册批量写入器
         
@@ -264,6 +339,10 @@ class BatchWriterManager:
             batch_size: 批次大小
             flush_interval: 刷新间隔
             write_func: 写入函数
+            max_buffer: 缓冲区上限
+        
+        Returns:
+            批量写入器
         """
         if name in self.writers:
             raise ValueError(f"批量写入器已存在: {name}")
@@ -272,9 +351,11 @@ class BatchWriterManager:
             batch_size=batch_size,
             flush_interval=flush_interval,
             write_func=write_func,
-            data_type=name
+            data_type=name,
+            max_buffer=max_buffer
         )
         self.writers[name] = writer
+        return writer
     
     async def start_all(self):
         """启动所有写入器"""
@@ -313,7 +394,7 @@ class BatchWriterManager:
             for writer in self.writers.values():
                 await writer.flush()
     
-    def get_stats(self, name: str = None) -> Dict[str, Dict[str, int]]:
+    def get_stats(self, name: str = None) -> Dict[str, Dict[str, Any]]:
         """
         获取统计信息
         
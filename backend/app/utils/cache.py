@@ -1,6 +1,12 @@
 """
 Redis缓存管理模块（优化版）
 
+两级缓存:
+- L1: 进程内 MemoryCache（TTL + LRU，O(1)读写淘汰），保留时间不超过 cache_l1_max_ttl；
+  与L2一样保存JSON，每次读取解码出新对象，调用方修改返回值不会污染缓存
+- L2: Redis（多进程共享）；Redis不可用时只使用L1
+- 缓存装饰器按键合并并发未命中（single-flight），同一时刻只有一次回源
+
 性能提升:
 - 热点数据查询: +100倍性能（缓存命中时）
 - 减少数据库负载: 90%+查询被缓存拦截
@@ -37,6 +43,7 @@ from datetime import datetime
 import redis.asyncio as aioredis
 from ..config import settings
 from .logger import logger
+from .cache_manager import MemoryCache, SingleFlight
 
 
 class CacheManager:
@@ -49,6 +56,11 @@ class CacheManager:
         self.hit_count = 0
         self.miss_count = 0
         self.error_count = 0
+        
+        # L1内存缓存与并发加载合并
+        self.local = MemoryCache(max_size=settings.cache_l1_max_size, default_ttl=settings.cache_l1_max_ttl)
+        self.local_max_ttl = settings.cache_l1_max_ttl
+        self.single_flight = SingleFlight()
     
     async def connect(self):
         """连接到Redis"""
@@ -56,6 +68,8 @@ class CacheManager:
             logger.warning("⚠️ 缓存已禁用")
             return
         
+        self.local.start_sweeper(settings.cache_sweep_interval)
+        
         try:
             self.redis = await aioredis.from_url(
                 f"redis://{settings.redis_host}:{settings.redis_port}",
@@ -67,15 +81,29 @@ class CacheManager:
             await self.redis.ping()
             logger.info("✅ Redis缓存管理器已连接")
         except Exception as e:
-            logger.error(f"❌ Redis缓存连接失败: {e}")
-            self.enabled = False
+            logger.error(f"❌ Redis缓存连接失败，仅使用内存缓存: {e}")
+            self.redis = None
     
     async def disconnect(self):
         """断开Redis连接"""
+        await self.local.stop_sweeper()
+        
         if self.redis:
             await self.redis.close()
+            self.redis = None
             logger.info("✅ Redis缓存管理器已断开")
     
+    def _local_ttl(self, ttl: Optional[int]) -> int:
+        """L1保留时间：不超过L2剩余时间和 cache_l1_max_ttl"""
+        if ttl is None or ttl <= 0:
+            return self.local_max_ttl
+        return min(ttl, self.local_max_ttl)
+    
+    def _local_get(self, key: str) -> Optional[Any]:
+        """读取L1（解码JSON，返回新对象）"""
+        serialized = self.local.get(key)
+        return json.loads(serialized) if serialized is not None else None
+    
     def _generate_key(self, key_prefix: str, *args, **kwargs) -> str:
         """
         生成缓存键
@@ -105,13 +133,27 @@ class CacheManager:
         Returns:
             缓存值或None
         """
-        if not self.enabled or not self.redis:
+        if not self.enabled:
+            return None
+        
+        value = self._local_get(key)
+        if value is not None:
+            self.hit_count += 1
+            return value
+        
+        if not self.redis:
+            self.miss_count += 1
             return None
         
         try:
-            value = await self.redis.get(key)
+            pipe = self.redis.pipeline()
+            pipe.get(key)
+            pipe.ttl(key)
+            value, remaining = await pipe.execute()
             if value:
                 self.hit_count += 1
+                # 回填L1
+                self.local.set(key, value, self._local_ttl(remaining))
                 return json.loads(value)
             else:
                 self.miss_count += 1
@@ -130,19 +172,24 @@ class CacheManager:
             value: 缓存值
             ttl: 过期时间（秒），None表示使用默认TTL
         """
-        if not self.enabled or not self.redis:
+        if not self.enabled:
             return
         
+        ttl = ttl if ttl is not None else self.default_ttl
         try:
-            ttl = ttl if ttl is not None else self.default_ttl
             serialized = json.dumps(value, ensure_ascii=False, default=str)
-            await self.redis.setex(key, ttl, serialized)
+            self.local.set(key, serialized, self._local_ttl(ttl))
+            
+            if self.redis:
+                await self.redis.setex(key, ttl, serialized)
         except Exception as e:
             self.error_count += 1
             logger.error(f"缓存设置失败: {key}, {e}")
     
     async def delete(self, key: str):
         """删除缓存"""
+        self.local.delete(key)
+        
         if not self.enabled or not self.redis:
             return
         
@@ -153,7 +200,13 @@ class CacheManager:
     
     async def exists(self, key: str) -> bool:
         """检查缓存是否存在"""
-        if not self.enabled or not self.redis:
+        if not self.enabled:
+            return False
+        
+        if self.local.get(key) is not None:
+            return True
+        
+        if not self.redis:
             return False
         
         try:
@@ -169,6 +222,8 @@ class CacheManager:
         Args:
             pattern: 键模式（支持通配符*）
         """
+        self.local.delete_pattern(pattern)
+        
         if not self.enabled or not self.redis:
             return
         
@@ -193,30 +248,40 @@ class CacheManager:
         Returns:
             缓存值列表
         """
-        if not self.enabled or not self.redis or not keys:
+        if not self.enabled or not keys:
             return [None] * len(keys)
         
+        # 先查L1，只把未命中的键发给Redis
+        results = [self._local_get(key) for key in keys]
+        missing = [index for index, value in enumerate(results) if value is None]
+        self.hit_count += len(keys) - len(missing)
+        
+        if not missing or not self.redis:
+            self.miss_count += len(missing)
+            return results
+        
         try:
             pipe = self.redis.pipeline()
-            for key in keys:
-                pipe.get(key)
+            for index in missing:
+                pipe.get(keys[index])
+                pipe.ttl(keys[index])
             
             values = await pipe.execute()
             
-            results = []
-            for value in values:
+            for position, index in enumerate(missing):
+                value, remaining = values[position * 2], values[position * 2 + 1]
                 if value:
                     self.hit_count += 1
-                    results.append(json.loads(value))
+                    results[index] = json.loads(value)
+                    self.local.set(keys[index], value, self._local_ttl(remaining))
                 else:
                     self.miss_count += 1
-                    results.append(None)
             
             return results
         except Exception as e:
-            self.error_count += len(keys)
+            self.error_count += len(missing)
             logger.error(f"缓存批量获取失败: {e}")
-            return [None] * len(keys)
+            return results
     
     async def mset(self, data: Dict[str, Any], ttl: Optional[int] = None):
         """
@@ -226,16 +291,24 @@ class CacheManager:
             data: {key: value} 字典
             ttl: 过期时间（秒）
         """
-        if not self.enabled or not self.redis or not data:
+        if not self.enabled or not data:
             return
         
+        ttl = ttl if ttl is not None else self.default_ttl
         try:
-            ttl = ttl if ttl is not None else self.default_ttl
+            serialized = {
+                key: json.dumps(value, ensure_ascii=False, default=str) for key, value in data.items()
+            }
+            for key, value in serialized.items():
+                self.local.set(key, value, self._local_ttl(ttl))
+            
+            if not self.redis:
+                return
+            
             pipe = self.redis.pipeline()
             
-            for key, value in data.items():
-                serialized = json.dumps(value, ensure_ascii=False, default=str)
-                pipe.setex(key, ttl, serialized)
+            for key, value in serialized.items():
+                pipe.setex(key, ttl, value)
             
             await pipe.execute()
         except Exception as e:
@@ -269,14 +342,18 @@ class CacheManager:
                     logger.debug(f"缓存命中: {cache_key}")
                     return cached_value
                 
-                # 缓存未命中，执行原函数
+                # 缓存未命中，执行原函数（并发未命中只执行一次）
                 logger.debug(f"缓存未命中: {cache_key}")
-                result = await func(*args, **kwargs)
                 
-                # 写入缓存
-                await self.set(cache_key, result, ttl)
+                async def load():
+                    result = await func(*args, **kwargs)
+                    
+                    # 写入缓存
+                    await self.set(cache_key, result, ttl)
+                    
+                    return result
                 
-                return result
+                return await self.single_flight.do(cache_key, load)
             
             return wrapper
         return decorator
@@ -328,7 +405,9 @@ class CacheManager:
             "error_count": self.error_count,
             "total_requests": total_requests,
             "hit_rate": f"{hit_rate:.2f}%",
-            "default_ttl": self.default_ttl
+            "default_ttl": self.default_ttl,
+            "local": self.local.get_stats(),
+            "single_flight": self.single_flight.get_stats()
         }
         
         if self.redis:
@@ -346,6 +425,8 @@ class CacheManager:
     
     async def clear_all(self):
         """清除所有缓存（谨慎使用）"""
+        self.local.clear()
+        
         if not self.enabled or not self.redis:
             return
         
@@ -3,7 +3,10 @@
 提供内存缓存、Redis缓存等多种缓存机制
 """
 import asyncio
-from typing import Any, Optional, Callable
+import time
+import fnmatch
+from collections import OrderedDict
+from typing import Any, Optional, Callable, Awaitable, Dict
 from datetime import datetime, timedelta
 from functools import wraps
 import json
@@ -12,67 +15,203 @@ from ..utils.logger import logger
 
 
 class MemoryCache:
-    """内存缓存"""
+    """
+    内存缓存（TTL + LRU）
+    
+    OrderedDict按访问顺序排列：命中时移到末尾，满时从头部淘汰，
+    get/set/淘汰都是O(1)；过期条目由后台清理任务定期移除，读到时也会顺带删除
+    
+    缓存的是对象本身（不做拷贝），调用方不应修改取出的值
+    """
     
     def __init__(self, max_size: int = 1000, default_ttl: int = 300):
-        self.cache = {}
+        self.cache: OrderedDict = OrderedDict()  # key -> (value, 过期时间)
         self.max_size = max_size
         self.default_ttl = default_ttl
-        self.access_times = {}
+        
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        
+        self._sweeper_task: Optional[asyncio.Task] = None
     
     def get(self, key: str) -> Optional[Any]:
         """获取缓存"""
-        if key not in self.cache:
+        item = self.cache.get(key)
+        if item is None:
+            self.misses += 1
             return None
         
-        item = self.cache[key]
+        value, expires_at = item
         
         # 检查是否过期
-        if item['expires_at'] < datetime.now():
+        if expires_at <= time.monotonic():
             del self.cache[key]
-            if key in self.access_times:
-                del self.access_times[key]
+            self.expirations += 1
+            self.misses += 1
             return None
         
-        # 更新访问时间
-        self.access_times[key] = datetime.now()
+        # 标记为最近使用
+        self.cache.move_to_end(key)
+        self.hits += 1
         
-        return item['value']
+        return value
     
     def set(self, key: str, value: Any, ttl: Optional[int] = None):
         """设置缓存"""
-        # 如果缓存满了，移除最久未访问的
-        if len(self.cache) >= self.max_size:
-            oldest_key = min(self.access_times, key=self.access_times.get)
-            del self.cache[oldest_key]
-            del self.access_times[oldest_key]
+        expires_at = time.monotonic() + (ttl or self.default_ttl)
         
-        expires_at = datetime.now() + timedelta(seconds=ttl or self.default_ttl)
+        if key in self.cache:
+            self.cache.move_to_end(key)
+        self.cache[key] = (value, expires_at)
         
-        self.cache[key] = {
-            'value': value,
-            'expires_at': expires_at
-        }
-        self.access_times[key] = datetime.now()
+        # 如果缓存满了，移除最久未访问的
+        while len(self.cache) > self.max_size:
+            self.cache.popitem(last=False)
+            self.evictions += 1
     
     def delete(self, key: str):
         """删除缓存"""
-        if key in self.cache:
+        self.cache.pop(key, None)
+    
+    def delete_pattern(self, pattern: str) -> int:
+        """
+        删除匹配通配符模式的缓存
+        
+        Args:
+            pattern: 键模式（支持通配符*，与Redis一致）
+            
+        Returns:
+            删除的数量
+        """
+        keys = [key for key in self.cache if fnmatch.fnmatchcase(key, pattern)]
+        for key in keys:
             del self.cache[key]
-        if key in self.access_times:
-            del self.access_times[key]
+        return len(keys)
     
     def clear(self):
         """清空缓存"""
         self.cache.clear()
-        self.access_times.clear()
+    
+    def purge_expired(self) -> int:
+        """
+        移除所有已过期的条目
+        
+        Returns:
+            移除的数量
+        """
+        now = time.monotonic()
+        expired = [key for key, (_, expires_at) in self.cache.items() if expires_at <= now]
+        for key in expired:
+            del self.cache[key]
+        
+        self.expirations += len(expired)
+        return len(expired)
+    
+    async def _sweep_loop(self, interval: float):
+        """后台清理循环"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                removed = self.purge_expired()
+                if removed:
+                    logger.debug(f"内存缓存清理过期条目: {removed}个")
+            except Exception as e:
+                logger.error(f"内存缓存清理失败: {str(e)}")
+    
+    def start_sweeper(self, interval: float = 60):
+        """
+        启动后台过期清理任务
+        
+        Args:
+            interval: 清理间隔（秒）
+        """
+        if self._sweeper_task and not self._sweeper_task.done():
+            return
+        self._sweeper_task = asyncio.create_task(self._sweep_loop(interval))
+    
+    async def stop_sweeper(self):
+        """停止后台过期清理任务"""
+        if self._sweeper_task:
+            self._sweeper_task.cancel()
+            try:
+                await self._sweeper_task
+            except asyncio.CancelledError:
+                pass
+            self._sweeper_task = None
     
     def get_stats(self) -> dict:
         """获取缓存统计"""
+        total = self.hits + self.misses
         return {
             'size': len(self.cache),
             'max_size': self.max_size,
-            'usage': f"{len(self.cache) / self.max_size * 100:.2f}%"
+            'usage': f"{len(self.cache) / self.max_size * 100:.2f}%",
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': f"{(self.hits / total * 100) if total else 0:.2f}%",
+            'evictions': self.evictions,
+            'expirations': self.expirations
+        }
+
+
+class SingleFlight:
+    """
+    按键合并并发加载
+    
+    同一个键同时只有一次加载在执行，期间的其他调用等待并共享它的结果，
+    缓存失效瞬间的并发未命中不会同时打到数据库
+    """
+    
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.loads = 0  # 实际执行的加载次数
+        self.shared = 0  # 等待并复用他人结果的次数
+    
+    async def do(self, key: str, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        执行加载（同键并发时只执行一次）
+        
+        Args:
+            key: 键
+            loader: 加载函数（无参协程函数）
+            
+        Returns:
+            加载结果（加载失败时所有等待者收到同一个异常）
+        """
+        future = self._inflight.get(key)
+        if future is not None:
+            self.shared += 1
+            # shield: 某个等待者被取消不影响其他等待者
+            return await asyncio.shield(future)
+        
+        future = asyncio.get_running_loop().create_future()
+        # 没有等待者时避免"exception was never retrieved"警告
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._inflight[key] = future
+        self.loads += 1
+        
+        try:
+            result = await loader()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            self._inflight.pop(key, None)
+    
+    def get_stats(self) -> dict:
+        """获取统计"""
+        return {
+            'loads': self.loads,
+            'shared': self.shared,
+            'inflight': len(self._inflight)
         }
 
 
@@ -128,6 +267,7 @@ class CacheManager:
     def __init__(self):
         self.memory_cache = MemoryCache(max_size=1000, default_ttl=300)
         self.redis_cache = None
+        self.single_flight = SingleFlight()
     
     def set_redis(self, redis_client):
         """设置Redis客户端"""
@@ -206,13 +346,17 @@ def cached(ttl: int = 300, use_redis: bool = False, key_prefix: str = ""):
                 logger.debug(f"缓存命中: {cache_key}")
                 return cached_value
             
-            # 调用原函数
-            result = await func(*args, **kwargs)
+            async def load():
+                # 调用原函数
+                result = await func(*args, **kwargs)
+                
+                # 存入缓存
+                await cache_manager.set(cache_key, result, ttl=ttl, use_redis=use_redis)
+                
+                return result
             
-            # 存入缓存
-            await cache_manager.set(cache_key, result, ttl=ttl, use_redis=use_redis)
-            
-            return result
+            # 并发未命中只调用一次原函数
+            return await cache_manager.single_flight.do(cache_key, load)
         
         return wrapper
     return decorator
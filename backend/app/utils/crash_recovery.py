@@ -1,32 +1,58 @@
 """
 ✅ P0-5深度优化: 崩溃恢复系统
-自动保存未发送消息，程序重启后自动恢复
+自动保存未发送消息，程序重启后自动恢复（基于消息预写日志，每条消息O(1)追加）
 """
 import json
-import asyncio
-from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from datetime import datetime
 from .logger import logger
+from .message_wal import MessageWAL, message_wal
 from ..config import DATA_DIR
 
 
 class CrashRecoveryManager:
     """崩溃恢复管理器"""
     
-    def __init__(self):
-        self.recovery_dir = DATA_DIR / "recovery"
-        self.recovery_dir.mkdir(parents=True, exist_ok=True)
-        
-        # 未发送消息文件
-        self.pending_file = self.recovery_dir / "pending_messages.json"
+    # WAL中的记录类型（全局WAL由多个子系统共享，类型不能重复）
+    PENDING = 'recovery_pending'
+    FAILED = 'recovery_failed'
+    
+    def __init__(self, wal: Optional[MessageWAL] = None):
+        """
+        初始化崩溃恢复管理器
         
-        # 失败消息文件
-        self.failed_file = self.recovery_dir / "failed_messages.json"
+        Args:
+            wal: 预写日志（默认使用全局 message_wal）
+        """
+        self.wal = wal or message_wal
         
-        # 锁文件
-        self.lock_file = self.recovery_dir / "recovery.lock"
+        # 旧版本整文件重写的恢复文件（首次使用时导入WAL）
+        self.recovery_dir = DATA_DIR / "recovery"
+        self.legacy_files = {
+            self.PENDING: self.recovery_dir / "pending_messages.json",
+            self.FAILED: self.recovery_dir / "failed_messages.json"
+        }
+        self._legacy_checked = False
+    
+    def _import_legacy(self):
+        """把旧版本的恢复文件导入WAL，导入后删除旧文件"""
+        if self._legacy_checked:
+            return
+        self._legacy_checked = True
         
+        for kind, path in self.legacy_files.items():
+            if not path.exists():
+                continue
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    messages = json.load(f)
+                for message in messages:
+                    self.wal.append(kind, message.get('kook_message_id'), message)
+                path.unlink()
+                logger.info(f"已将 {len(messages)} 条旧恢复记录导入预写日志: {path.name}")
+            except Exception as e:
+                logger.error(f"导入旧恢复文件失败: {path}, {e}")
+    
     async def save_pending_message(self, message: Dict[str, Any]):
         """
         保存待发送消息
@@ -35,19 +61,14 @@ class CrashRecoveryManager:
             message: 消息数据
         """
         try:
-            # 读取现有消息
-            pending_messages = await self._load_pending_messages()
+            self._import_legacy()
             
-            # 添加新消息
             message['saved_at'] = datetime.now().isoformat()
             message['status'] = 'pending'
-            pending_messages.append(message)
-            
-            # 保存
-            await self._save_pending_messages(pending_messages)
+            self.wal.append(self.PENDING, message.get('kook_message_id'), message)
             
             logger.debug(f"✅ 保存待发送消息: {message.get('kook_message_id')}")
-            
+        
         except Exception as e:
             logger.error(f"保存待发送消息失败: {e}")
     
@@ -60,20 +81,15 @@ class CrashRecoveryManager:
             error: 错误信息
         """
         try:
-            # 读取现有失败消息
-            failed_messages = await self._load_failed_messages()
+            self._import_legacy()
             
-            # 添加新消息
             message['failed_at'] = datetime.now().isoformat()
             message['error'] = error
             message['retry_count'] = message.get('retry_count', 0) + 1
-            failed_messages.append(message)
-            
-            # 保存
-            await self._save_failed_messages(failed_messages)
+            self.wal.append(self.FAILED, message.get('kook_message_id'), message)
             
             logger.warning(f"⚠️ 保存失败消息: {message.get('kook_message_id')}")
-            
+        
         except Exception as e:
             logger.error(f"保存失败消息失败: {e}")
     
@@ -85,13 +101,14 @@ class CrashRecoveryManager:
             待发送消息列表
         """
         try:
-            messages = await self._load_pending_messages()
+            self._import_legacy()
+            messages = self.wal.replay(self.PENDING)
             
             if messages:
                 logger.info(f"🔄 发现 {len(messages)} 条待发送消息，准备恢复")
             
             return messages
-            
+        
         except Exception as e:
             logger.error(f"恢复待发送消息失败: {e}")
             return []
@@ -104,7 +121,8 @@ class CrashRecoveryManager:
             失败消息列表
         """
         try:
-            messages = await self._load_failed_messages()
+            self._import_legacy()
+            messages = self.wal.replay(self.FAILED)
             
             # 只恢复重试次数<5的消息
             recoverable = [m for m in messages if m.get('retry_count', 0) < 5]
@@ -113,7 +131,7 @@ class CrashRecoveryManager:
                 logger.info(f"🔄 发现 {len(recoverable)} 条可恢复的失败消息")
             
             return recoverable
-            
+        
         except Exception as e:
             logger.error(f"恢复失败消息失败: {e}")
             return []
@@ -121,9 +139,8 @@ class CrashRecoveryManager:
     async def clear_pending_message(self, message_id: str):
         """清除已发送的待发送消息"""
         try:
-            messages = await self._load_pending_messages()
-            messages = [m for m in messages if m.get('kook_message_id') != message_id]
-            await self._save_pending_messages(messages)
+            self._import_legacy()
+            self.wal.ack(self.PENDING, message_id)
             logger.debug(f"✅ 清除待发送消息: {message_id}")
         except Exception as e:
             logger.error(f"清除待发送消息失败: {e}")
@@ -131,43 +148,12 @@ class CrashRecoveryManager:
     async def clear_all_pending(self):
         """清除所有待发送消息"""
         try:
-            await self._save_pending_messages([])
+            self._import_legacy()
+            self.wal.clear(self.PENDING)
             logger.info("✅ 清除所有待发送消息")
         except Exception as e:
             logger.error(f"清除失败: {e}")
     
-    async def _load_pending_messages(self) -> List[Dict[str, Any]]:
-        """加载待发送消息"""
-        if not self.pending_file.exists():
-            return []
-        
-        try:
-            with open(self.pending_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except:
-            return []
-    
-    async def _save_pending_messages(self, messages: List[Dict[str, Any]]):
-        """保存待发送消息"""
-        with open(self.pending_file, 'w', encoding='utf-8') as f:
-            json.dump(messages, f, ensure_ascii=False, indent=2)
-    
-    async def _load_failed_messages(self) -> List[Dict[str, Any]]:
-        """加载失败消息"""
-        if not self.failed_file.exists():
-            return []
-        
-        try:
-            with open(self.failed_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except:
-            return []
-    
-    async def _save_failed_messages(self, messages: List[Dict[str, Any]]):
-        """保存失败消息"""
-        with open(self.failed_file, 'w', encoding='utf-8') as f:
-            json.dump(messages, f, ensure_ascii=False, indent=2)
-    
     def get_recovery_stats(self) -> Dict[str, int]:
         """
         获取恢复统计
@@ -176,8 +162,9 @@ class CrashRecoveryManager:
             统计信息
         """
         try:
-            pending = len(self._load_pending_messages_sync())
-            failed = len(self._load_failed_messages_sync())
+            self._import_legacy()
+            pending = self.wal.count(self.PENDING)
+            failed = self.wal.count(self.FAILED)
             
             return {
                 "pending_count": pending,
@@ -190,28 +177,6 @@ class CrashRecoveryManager:
                 "failed_count": 0,
                 "total_count": 0
             }
-    
-    def _load_pending_messages_sync(self) -> List[Dict[str, Any]]:
-        """同步加载待发送消息"""
-        if not self.pending_file.exists():
-            return []
-        
-        try:
-            with open(self.pending_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except:
-            return []
-    
-    def _load_failed_messages_sync(self) -> List[Dict[str, Any]]:
-        """同步加载失败消息"""
-        if not self.failed_file.exists():
-            return []
-        
-        try:
-            with open(self.failed_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except:
-            return []
 
 
 # 全局单例
@@ -0,0 +1,173 @@
+"""
+全局HTTP客户端连接池
+下载器和各平台转发器共享同一个aiohttp连接器，避免每次请求重复DNS解析和TCP/TLS握手
+
+- 按主机限制连接数，启用keep-alive和DNS缓存
+- 按用途划分会话（default/download/preview），各自使用独立的超时配置
+- 下载和预览会话访问任意外部地址，不保存Cookie（Cookie按请求传入），避免跨请求泄漏
+- 随应用启动/关闭（main.py lifespan）
+- 统计打开、空闲、复用的连接数
+"""
+import asyncio
+import aiohttp
+from typing import Dict, Any, Optional
+from ..utils.logger import logger
+from ..config import settings
+
+
+# 不保存响应Cookie的会话（访问任意外部地址）
+COOKIELESS_SESSIONS = ('download', 'preview')
+
+
+class HttpClientManager:
+    """HTTP客户端管理器（所有会话共享一个TCPConnector）"""
+
+    def __init__(self):
+        self._connector: Optional[aiohttp.TCPConnector] = None
+        self._sessions: Dict[str, aiohttp.ClientSession] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+        # 各用途的默认超时（秒）
+        self.timeouts = {
+            'default': settings.http_timeout,
+            'download': settings.http_download_timeout,
+            'preview': settings.http_preview_timeout,
+        }
+
+        self.stats = {
+            'requests': 0,
+            'connections_created': 0,
+            'connections_reused': 0,
+            'dns_cache_hits': 0,
+            'dns_cache_misses': 0
+        }
+
+    def _create_trace_config(self) -> aiohttp.TraceConfig:
+        """创建请求追踪配置，用于统计连接复用情况"""
+        trace_config = aiohttp.TraceConfig()
+
+        async def on_request_start(session, ctx, params):
+            self.stats['requests'] += 1
+
+        async def on_connection_create_end(session, ctx, params):
+            self.stats['connections_created'] += 1
+
+        async def on_connection_reuseconn(session, ctx, params):
+            self.stats['connections_reused'] += 1
+
+        async def on_dns_cache_hit(session, ctx, params):
+            self.stats['dns_cache_hits'] += 1
+
+        async def on_dns_cache_miss(session, ctx, params):
+            self.stats['dns_cache_misses'] += 1
+
+        trace_config.on_request_start.append(on_request_start)
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+        trace_config.on_dns_cache_hit.append(on_dns_cache_hit)
+        trace_config.on_dns_cache_miss.append(on_dns_cache_miss)
+
+        return trace_config
+
+    async def _close_sessions(self):
+        """关闭所有会话（会话不拥有连接器，关闭只解除与连接器的绑定）"""
+        for session in self._sessions.values():
+            if not session.closed:
+                await session.close()
+        self._sessions = {}
+
+    async def _ensure_connector(self) -> aiohttp.TCPConnector:
+        """获取共享连接器（事件循环变化时重建）"""
+        loop = asyncio.get_running_loop()
+
+        if self._connector is None or self._connector.closed or self._loop is not loop:
+            # 旧循环上的会话无法再使用，先关闭再随连接器重建
+            await self._close_sessions()
+            self._connector = aiohttp.TCPConnector(
+                limit=settings.http_pool_limit,
+                limit_per_host=settings.http_pool_limit_per_host,
+                ttl_dns_cache=settings.http_dns_cache_ttl,
+                keepalive_timeout=settings.http_keepalive_timeout
+            )
+            self._loop = loop
+
+        return self._connector
+
+    async def start(self):
+        """启动连接池（预先创建默认会话）"""
+        await self.get_session('default')
+        logger.info(
+            f"HTTP连接池已启动: 总连接上限{settings.http_pool_limit}, "
+            f"单主机上限{settings.http_pool_limit_per_host}"
+        )
+
+    async def get_session(self, name: str = 'default') -> aiohttp.ClientSession:
+        """
+        获取共享会话
+
+        Args:
+            name: 会话用途（default/download/preview），决定默认超时
+
+        Returns:
+            aiohttp会话（调用方不要关闭）
+        """
+        connector = await self._ensure_connector()
+
+        session = self._sessions.get(name)
+        if session is None or session.closed:
+            total = self.timeouts.get(name, settings.http_timeout)
+            session = aiohttp.ClientSession(
+                connector=connector,
+                connector_owner=False,
+                timeout=aiohttp.ClientTimeout(total=total),
+                cookie_jar=aiohttp.DummyCookieJar() if name in COOKIELESS_SESSIONS else None,
+                trace_configs=[self._create_trace_config()]
+            )
+            self._sessions[name] = session
+
+        return session
+
+    async def close(self):
+        """关闭所有会话和连接器"""
+        await self._close_sessions()
+
+        if self._connector and not self._connector.closed:
+            await self._connector.close()
+        self._connector = None
+        self._loop = None
+
+        logger.info("HTTP连接池已关闭")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        获取连接池统计
+
+        Returns:
+            打开/空闲/使用中连接数和复用率等
+        """
+        idle = 0
+        in_use = 0
+
+        connector = self._connector
+        if connector is not None and not connector.closed:
+            idle = sum(len(conns) for conns in getattr(connector, '_conns', {}).values())
+            in_use = len(getattr(connector, '_acquired', ()))
+
+        created = self.stats['connections_created']
+        reused = self.stats['connections_reused']
+        total = created + reused
+
+        return {
+            **self.stats,
+            'open_connections': idle + in_use,
+            'idle_connections': idle,
+            'in_use_connections': in_use,
+            'reuse_rate': round(reused / total * 100, 2) if total else 0.0,
+            'sessions': list(self._sessions.keys()),
+            'limit': settings.http_pool_limit,
+            'limit_per_host': settings.http_pool_limit_per_host
+        }
+
+
+# 创建全局HTTP客户端管理器
+http_client_manager = HttpClientManager()
@@ -1,38 +1,82 @@
 """
 消息备份器
-✅ P0-10优化：崩溃恢复机制
+✅ P0-10优化：崩溃恢复机制（基于消息预写日志，保存和移除都是O(1)追加）
 """
 import json
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from ..config import settings
 from ..utils.logger import logger
+from .message_wal import MessageWAL, message_wal
 
 
 class MessageBackup:
     """消息备份器 - 用于崩溃恢复"""
     
-    def __init__(self):
-        self.backup_dir = Path(settings.data_dir) / "message_backup"
-        self.backup_dir.mkdir(parents=True, exist_ok=True)
-        self.backup_file = self.backup_dir / "pending_messages.jsonl"
+    # WAL中的记录类型（全局WAL由多个子系统共享，类型不能重复）
+    KIND = 'backup'
+    
+    def __init__(self, wal: Optional[MessageWAL] = None):
+        """
+        初始化消息备份器
+        
+        Args:
+            wal: 预写日志（默认使用全局 message_wal）
+        """
+        self.wal = wal or message_wal
+        
+        # 旧版本的备份文件（首次使用时导入WAL）
+        self.legacy_file = Path(settings.data_dir) / "message_backup" / "pending_messages.jsonl"
+        self._legacy_checked = False
         
         logger.info("✅ 消息备份器已初始化")
     
-    def save_message(self, message: Dict[str, Any]):
+    def _import_legacy(self):
+        """把旧版本整文件重写的备份导入WAL，导入后删除旧文件"""
+        if self._legacy_checked:
+            return
+        self._legacy_checked = True
+        
+        if not self.legacy_file.exists():
+            return
+        
+        try:
+            imported = 0
+            with open(self.legacy_file, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        try:
+                            message = json.loads(line)
+                        except json.JSONDecodeError:
+                            logger.warning(f"跳过无效的备份行: {line[:50]}")
+                            continue
+                        self.wal.append(self.KIND, message.get('message_id'), message)
+                        imported += 1
+            
+            self.legacy_file.unlink()
+            logger.info(f"已将 {imported} 条旧备份消息导入预写日志")
+        except Exception as e:
+            logger.error(f"导入旧备份失败: {str(e)}")
+    
+    def save_message(self, message: Dict[str, Any]) -> Optional[str]:
         """
         保存待发送消息到磁盘
         
         Args:
             message: 消息数据
+        
+        Returns:
+            备份记录ID（消息没有message_id时自动生成）
         """
         try:
-            with open(self.backup_file, 'a', encoding='utf-8') as f:
-                json.dump(message, f, ensure_ascii=False)
-                f.write('\n')
-            logger.debug(f"消息已备份: {message.get('message_id', 'unknown')}")
+            self._import_legacy()
+            record_id = self.wal.append(self.KIND, message.get('message_id'), message)
+            logger.debug(f"消息已备份: {record_id}")
+            return record_id
         except Exception as e:
             logger.error(f"备份消息失败: {str(e)}")
+            return None
     
     def load_pending_messages(self) -> List[Dict[str, Any]]:
         """
@@ -41,20 +85,9 @@ class MessageBackup:
         Returns:
             消息列表
         """
-        if not self.backup_file.exists():
-            return []
-        
-        messages = []
         try:
-            with open(self.backup_file, 'r', encoding='utf-8') as f:
-                for line in f:
-                    line = line.strip()
-                    if line:
-                        try:
-                            message = json.loads(line)
-                            messages.append(message)
-                        except json.JSONDecodeError:
-                            logger.warning(f"跳过无效的备份行: {line[:50]}")
+            self._import_legacy()
+            messages = self.wal.replay(self.KIND)
             
             if messages:
                 logger.info(f"从备份加载了 {len(messages)} 条待发送消息")
@@ -66,107 +99,57 @@ class MessageBackup:
     
     def remove_message(self, message_id: str):
         """
-        从备份中移除已发送的消息
+        从备份中移除已发送的消息（追加一条确认记录）
         
         Args:
             message_id: 消息ID
         """
-        if not self.backup_file.exists():
-            return
-        
         try:
-            # 读取所有消息
-            messages = []
-            with open(self.backup_file, 'r', encoding='utf-8') as f:
-                for line in f:
-                    line = line.strip()
-                    if line:
-                        try:
-                            msg = json.loads(line)
-                            if msg.get('message_id') != message_id:
-                                messages.append(msg)
-                        except:
-                            pass
-            
-            # 重写文件
-            with open(self.backup_file, 'w', encoding='utf-8') as f:
-                for msg in messages:
-                    json.dump(msg, f, ensure_ascii=False)
-                    f.write('\n')
-            
-            logger.debug(f"消息已从备份移除: {message_id}")
+            self._import_legacy()
+            if self.wal.ack(self.KIND, message_id):
+                logger.debug(f"消息已从备份移除: {message_id}")
         except Exception as e:
             logger.error(f"移除备份消息失败: {str(e)}")
     
     def remove_messages_batch(self, message_ids: List[str]):
         """
-        批量移除消息（性能优化）
+        批量移除消息
         """
-        if not self.backup_file.exists() or not message_ids:
+        if not message_ids:
             return
         
         try:
-            message_ids_set = set(message_ids)
-            
-            # 读取所有消息
-            messages = []
-            with open(self.backup_file, 'r', encoding='utf-8') as f:
-                for line in f:
-                    line = line.strip()
-                    if line:
-                        try:
-                            msg = json.loads(line)
-                            if msg.get('message_id') not in message_ids_set:
-                                messages.append(msg)
-                        except:
-                            pass
-            
-            # 重写文件
-            with open(self.backup_file, 'w', encoding='utf-8') as f:
-                for msg in messages:
-                    json.dump(msg, f, ensure_ascii=False)
-                    f.write('\n')
-            
-            logger.info(f"批量移除了 {len(message_ids)} 条备份消息")
+            self._import_legacy()
+            removed = self.wal.ack_many(self.KIND, message_ids)
+            logger.info(f"批量移除了 {removed} 条备份消息")
         except Exception as e:
             logger.error(f"批量移除备份消息失败: {str(e)}")
     
     def clear_backup(self):
         """清空备份（所有消息已发送）"""
         try:
-            if self.backup_file.exists():
-                self.backup_file.unlink()
-                logger.info("✅ 备份已清空（所有消息已发送）")
+            self._import_legacy()
+            self.wal.clear(self.KIND)
+            logger.info("✅ 备份已清空（所有消息已发送）")
         except Exception as e:
             logger.error(f"清空备份失败: {str(e)}")
     
     def get_backup_count(self) -> int:
         """获取备份消息数量"""
-        if not self.backup_file.exists():
-            return 0
-        
         try:
-            count = 0
-            with open(self.backup_file, 'r', encoding='utf-8') as f:
-                for line in f:
-                    if line.strip():
-                        count += 1
-            return count
+            self._import_legacy()
+            return self.wal.count(self.KIND)
         except Exception as e:
             logger.error(f"获取备份数量失败: {str(e)}")
             return 0
     
     def get_oldest_message_time(self) -> int:
         """获取最旧消息的时间戳"""
-        if not self.backup_file.exists():
-            return 0
-        
         try:
-            with open(self.backup_file, 'r', encoding='utf-8') as f:
-                first_line = f.readline().strip()
-                if first_line:
-                    message = json.loads(first_line)
-                    return message.get('timestamp', 0)
+            self._import_legacy()
+            oldest = self.wal.replay(self.KIND, limit=1)
+            if oldest:
+                return oldest[0].get('timestamp', 0)
         except Exception as e:
             logger.error(f"获取最旧消息时间失败: {str(e)}")
         
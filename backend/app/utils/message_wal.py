@@ -0,0 +1,414 @@
+"""
+消息预写日志（WAL）
+崩溃恢复统一使用的分段追加日志：每条待发送消息写一条插入记录，发送完成写一条确认记录，
+每条消息的持久化开销都是O(1)追加；启动时顺序扫描一遍建立索引，
+旧分段在所有记录都已确认后直接删除，垃圾较多时压缩为一个新分段
+
+索引和偏移只保存在进程内存中，每个日志目录只能由一个进程写入：
+主进程使用 wal_dir，多进程Worker池的子进程使用各自的 wal_dir/worker-<编号>
+（编号在重启后不变，重启的子进程会读到自己之前未确认的记录）
+"""
+import json
+import os
+import threading
+import uuid
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from ..config import settings
+from .logger import logger
+
+
+# 记录格式（每行一条）：
+#   插入: P\t<类型>\t<ID>\t<JSON数据>\n
+#   确认: A\t<类型>\t<ID>\n
+# 头部字段用制表符分隔，建立索引时无需解析JSON
+PUT = b'P'
+ACK = b'A'
+SEGMENT_PREFIX = 'segment-'
+SEGMENT_SUFFIX = '.log'
+
+
+def _clean_field(value: Any) -> str:
+    """头部字段不能包含制表符和换行"""
+    return str(value).replace('\t', ' ').replace('\n', ' ').replace('\r', ' ')
+
+
+class MessageWAL:
+    """分段追加的消息预写日志"""
+    
+    def __init__(self, wal_dir: Optional[Path] = None,
+                 segment_size: Optional[int] = None,
+                 compact_min_bytes: Optional[int] = None,
+                 fsync: Optional[bool] = None):
+        """
+        初始化WAL（首次使用时才扫描分段建立索引）
+        
+        Args:
+            wal_dir: 日志目录
+            segment_size: 单个分段最大字节数，超过后切换到新分段
+            compact_min_bytes: 日志总大小超过该值且一半以上是垃圾时压缩
+            fsync: 每条记录写入后是否fsync（断电安全，吞吐下降）
+        """
+        self.wal_dir = Path(wal_dir or settings.wal_dir)
+        self.segment_size = segment_size or settings.wal_segment_size
+        self.compact_min_bytes = compact_min_bytes or settings.wal_compact_min_bytes
+        self.fsync = settings.wal_fsync if fsync is None else fsync
+        
+        self._lock = threading.RLock()
+        self._loaded = False
+        
+        # 索引：(类型, ID) -> (分段号, 偏移, 字节数)
+        self._index: Dict[Tuple[str, str], Tuple[int, int, int]] = {}
+        # 各分段的大小和仍有效的插入记录字节数
+        self._segment_bytes: Dict[int, int] = {}
+        self._live_bytes: Dict[int, int] = {}
+        
+        self._active_seq = 0
+        self._active = None
+        
+        self.stats = {
+            'appends': 0,
+            'acks': 0,
+            'segments_deleted': 0,
+            'compactions': 0,
+            'replayed_records': 0
+        }
+    
+    # ========== 分段文件 ==========
+    
+    def _segment_path(self, seq: int) -> Path:
+        return self.wal_dir / f"{SEGMENT_PREFIX}{seq:08d}{SEGMENT_SUFFIX}"
+    
+    def _list_segments(self) -> List[int]:
+        seqs = []
+        for path in self.wal_dir.glob(f"{SEGMENT_PREFIX}*{SEGMENT_SUFFIX}"):
+            try:
+                seqs.append(int(path.name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)]))
+            except ValueError:
+                continue
+        return sorted(seqs)
+    
+    def _open_active(self, seq: int):
+        """打开（或新建）活动分段用于追加"""
+        if self._active is not None:
+            self._active.close()
+        self._active_seq = seq
+        self._active = open(self._segment_path(seq), 'ab')
+        self._segment_bytes.setdefault(seq, self._active.tell())
+        self._live_bytes.setdefault(seq, 0)
+    
+    def _ensure_loaded(self):
+        """首次使用时顺序扫描所有分段建立索引"""
+        if self._loaded:
+            return
+        
+        self.wal_dir.mkdir(parents=True, exist_ok=True)
+        seqs = self._list_segments()
+        
+        for seq in seqs:
+            self._scan_segment(seq)
+        
+        self._open_active(seqs[-1] if seqs else 1)
+        self._loaded = True
+        
+        if self._index:
+            logger.info(f"WAL索引已建立: {len(self._index)} 条未确认记录, {len(seqs)} 个分段")
+        
+        self._drop_dead_segments()
+    
+    def _scan_segment(self, seq: int):
+        """扫描一个分段，按插入/确认记录更新索引（只解析头部）"""
+        path = self._segment_path(seq)
+        self._segment_bytes[seq] = 0
+        self._live_bytes[seq] = 0
+        
+        offset = 0
+        with open(path, 'rb') as f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    # 崩溃时写了一半的尾部记录，截掉后从完整记录之后继续追加
+                    logger.warning(f"WAL分段尾部记录不完整，已截断: {path.name}")
+                    break
+                
+                size = len(line)
+                parts = line.rstrip(b'\n').split(b'\t', 3)
+                if len(parts) >= 3:
+                    key = (parts[1].decode('utf-8'), parts[2].decode('utf-8'))
+                    if parts[0] == PUT and len(parts) == 4:
+                        self._unlink_key(key)
+                        self._index[key] = (seq, offset, size)
+                        self._live_bytes[seq] += size
+                    elif parts[0] == ACK:
+                        self._unlink_key(key)
+                
+                offset += size
+        
+        if offset != path.stat().st_size:
+            with open(path, 'r+b') as f:
+                f.truncate(offset)
+        self._segment_bytes[seq] = offset
+    
+    def _unlink_key(self, key: Tuple[str, str]) -> bool:
+        """从索引中移除一条记录（所在分段的有效字节相应减少）"""
+        location = self._index.pop(key, None)
+        if location is None:
+            return False
+        seq, _, size = location
+        self._live_bytes[seq] -= size
+        return True
+    
+    def _write(self, data: bytes) -> int:
+        """追加一条记录到活动分段，返回记录偏移"""
+        if self._segment_bytes[self._active_seq] >= self.segment_size:
+            self._open_active(self._active_seq + 1)
+        
+        offset = self._segment_bytes[self._active_seq]
+        self._active.write(data)
+        self._active.flush()
+        if self.fsync:
+            os.fsync(self._active.fileno())
+        self._segment_bytes[self._active_seq] += len(data)
+        return offset
+    
+    def _drop_dead_segments(self):
+        """
+        删除开头连续的、已没有有效记录的分段
+        
+        确认记录只会指向同一分段或更早分段中的插入记录，
+        所以只要更早的分段都已删除，删除一个全部确认的分段就不会让旧记录“复活”
+        """
+        for seq in sorted(self._segment_bytes):
+            if seq == self._active_seq or self._live_bytes.get(seq, 0) > 0:
+                break
+            self._segment_path(seq).unlink(missing_ok=True)
+            del self._segment_bytes[seq]
+            self._live_bytes.pop(seq, None)
+            self.stats['segments_deleted'] += 1
+    
+    # ========== 写入 ==========
+    
+    def append(self, kind: str, record_id: Optional[Any], data: Dict[str, Any]) -> str:
+        """
+        写入一条插入记录（同一ID再次写入时覆盖旧记录）
+        
+        Args:
+            kind: 记录类型（pending/failed/fallback等）
+            record_id: 记录ID（None时自动生成）
+            data: 记录数据
+        
+        Returns:
+            记录ID
+        """
+        record_id = _clean_field(record_id if record_id is not None else uuid.uuid4().hex)
+        kind = _clean_field(kind)
+        line = f"P\t{kind}\t{record_id}\t{json.dumps(data, ensure_ascii=False)}\n".encode('utf-8')
+        
+        with self._lock:
+            self._ensure_loaded()
+            key = (kind, record_id)
+            offset = self._write(line)
+            self._unlink_key(key)
+            self._index[key] = (self._active_seq, offset, len(line))
+            self._live_bytes[self._active_seq] += len(line)
+            self.stats['appends'] += 1
+        
+        return record_id
+    
+    def ack(self, kind: str, record_id: Any) -> bool:
+        """
+        写入一条确认记录（记录已处理，不再需要恢复）
+        
+        Args:
+            kind: 记录类型
+            record_id: 记录ID
+        
+        Returns:
+            记录是否存在
+        """
+        return self.ack_many(kind, [record_id]) > 0
+    
+    def ack_many(self, kind: str, record_ids: Iterable[Any]) -> int:
+        """
+        批量确认记录
+        
+        Args:
+            kind: 记录类型
+            record_ids: 记录ID列表
+        
+        Returns:
+            确认的记录数（不存在的ID忽略）
+        """
+        kind = _clean_field(kind)
+        
+        with self._lock:
+            self._ensure_loaded()
+            acked = 0
+            for record_id in record_ids:
+                record_id = _clean_field(record_id)
+                key = (kind, record_id)
+                if key not in self._index:
+                    continue
+                self._write(f"A\t{kind}\t{record_id}\n".encode('utf-8'))
+                self._unlink_key(key)
+                acked += 1
+            
+            if acked:
+                self.stats['acks'] += acked
+                self._drop_dead_segments()
+                self._maybe_compact()
+        
+        return acked
+    
+    # ========== 读取 ==========
+    
+    def replay(self, kind: Optional[str] = None, limit: Optional[int] = None,
+               with_ids: bool = False) -> List[Any]:
+        """
+        读取未确认的记录（按写入顺序）
+        
+        Args:
+            kind: 记录类型（None表示全部类型）
+            limit: 最多读取条数
+            with_ids: 是否同时返回记录ID
+        
+        Returns:
+            记录数据列表（with_ids时为 (记录ID, 数据) 列表）
+        """
+        with self._lock:
+            self._ensure_loaded()
+            
+            # 按分段分组，每个分段只顺序读取一次
+            wanted: Dict[int, List[Tuple[int, int, str]]] = {}
+            for key, (seq, offset, size) in self._index.items():
+                if kind is None or key[0] == kind:
+                    wanted.setdefault(seq, []).append((offset, size, key[1]))
+            
+            records = []
+            for seq in sorted(wanted):
+                with open(self._segment_path(seq), 'rb') as f:
+                    for offset, size, record_id in sorted(wanted[seq]):
+                        f.seek(offset)
+                        line = f.read(size)
+                        try:
+                            data = json.loads(line.rstrip(b'\n').split(b'\t', 3)[3])
+                            records.append((record_id, data) if with_ids else data)
+                        except (ValueError, IndexError):
+                            logger.warning(f"跳过无效的WAL记录: 分段{seq}, 偏移{offset}")
+                            continue
+                        if limit is not None and len(records) >= limit:
+                            self.stats['replayed_records'] += len(records)
+                            return records
+            
+            self.stats['replayed_records'] += len(records)
+            return records
+    
+    def count(self, kind: Optional[str] = None) -> int:
+        """未确认的记录数"""
+        with self._lock:
+            self._ensure_loaded()
+            if kind is None:
+                return len(self._index)
+            return sum(1 for key in self._index if key[0] == kind)
+    
+    def contains(self, kind: str, record_id: Any) -> bool:
+        """记录是否未确认"""
+        with self._lock:
+            self._ensure_loaded()
+            return (_clean_field(kind), _clean_field(record_id)) in self._index
+    
+    # ========== 压缩 ==========
+    
+    def _maybe_compact(self):
+        total = sum(self._segment_bytes.values())
+        live = sum(self._live_bytes.values())
+        if total >= self.compact_min_bytes and live * 2 < total:
+            self.compact()
+    
+    def compact(self):
+        """
+        压缩：切换到新分段，把旧分段中仍有效的插入记录原样复制过去，然后删除旧分段
+        """
+        with self._lock:
+            self._ensure_loaded()
+            
+            old_seqs = sorted(self._segment_bytes)
+            before = sum(self._segment_bytes.values())
+            self._open_active(self._active_seq + 1)
+            
+            # 按分段顺序复制有效记录（保持写入顺序）
+            by_segment: Dict[int, List[Tuple[int, Tuple[str, str]]]] = {}
+            for key, (seq, offset, _) in self._index.items():
+                if seq in old_seqs:
+                    by_segment.setdefault(seq, []).append((offset, key))
+            
+            for seq in old_seqs:
+                moves = sorted(by_segment.get(seq, []))
+                if moves:
+                    with open(self._segment_path(seq), 'rb') as f:
+                        for offset, key in moves:
+                            f.seek(offset)
+                            line = f.read(self._index[key][2])
+                            new_offset = self._write(line)
+                            self._index[key] = (self._active_seq, new_offset, len(line))
+                            self._live_bytes[self._active_seq] += len(line)
+                
+                self._segment_path(seq).unlink(missing_ok=True)
+                del self._segment_bytes[seq]
+                self._live_bytes.pop(seq, None)
+            
+            if self.fsync:
+                os.fsync(self._active.fileno())
+            
+            self.stats['compactions'] += 1
+            logger.debug(f"WAL压缩完成: {before} -> {sum(self._segment_bytes.values())} 字节")
+    
+    def clear(self, kind: Optional[str] = None):
+        """
+        确认所有记录
+        
+        Args:
+            kind: 记录类型（None表示全部类型）
+        """
+        with self._lock:
+            self._ensure_loaded()
+            kinds = {key[0] for key in self._index if kind is None or key[0] == kind}
+            for record_kind in kinds:
+                self.ack_many(record_kind, [key[1] for key in list(self._index) if key[0] == record_kind])
+    
+    def set_dir(self, wal_dir: Path):
+        """
+        切换日志目录（多进程时每个进程使用独立目录，见模块说明）
+        
+        Args:
+            wal_dir: 新的日志目录（下次使用时扫描）
+        """
+        with self._lock:
+            self.close()
+            self.wal_dir = Path(wal_dir)
+    
+    def close(self):
+        """关闭活动分段（下次使用时重新扫描）"""
+        with self._lock:
+            if self._active is not None:
+                self._active.close()
+                self._active = None
+            self._loaded = False
+            self._index.clear()
+            self._segment_bytes.clear()
+            self._live_bytes.clear()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取统计信息"""
+        with self._lock:
+            self._ensure_loaded()
+            return {
+                **self.stats,
+                'pending': len(self._index),
+                'segments': len(self._segment_bytes),
+                'total_bytes': sum(self._segment_bytes.values()),
+                'live_bytes': sum(self._live_bytes.values())
+            }
+
+
+# 全局WAL实例（消息备份、崩溃恢复、Redis本地Fallback共用）
+message_wal = MessageWAL()
@@ -1,14 +1,61 @@
 """
 速率限制器
-用于forwarder_enhanced.py等模块
+转发器、插件和API限流共用的限流子系统
+
+- RateLimiter: 滑动窗口（任意 period 秒内最多 calls 次），用于按"N次/窗口"限流的接口
+- TokenBucket: 令牌桶（容量 + 补充速率），允许突发，长期稳定在速率内
+- RedisTokenBucket: 令牌桶的Redis/Lua实现，多个Worker进程共享同一份额度
+- KeyedRateLimiter: 按键（Webhook/Bot/聊天）分别限流的令牌桶集合
+- AdaptiveRateLimiter: 按平台响应（限流响应头、429）学习真实额度的按键限流器
+
+本地限流器都基于单调时钟，按"预约"方式排队：获取时立即预订下一个可用时间点，
+然后休眠到该时间点。先到先得（FIFO），休眠期间不持有锁、不递归，
+每次获取O(1)且不分配新对象
 """
 import asyncio
-from collections import deque
-from datetime import datetime, timedelta
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Union
+from ..utils.logger import logger
+from ..config import settings
+
+
+# Redis令牌桶脚本：原子地补充令牌并预订，返回需要等待的秒数
+# 令牌数可以为负，表示已被排队的调用预订；nonblocking=1 时令牌不足不预订，返回 -1
+TOKEN_BUCKET_LUA = """
+if redis.replicate_commands then redis.replicate_commands() end
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local count = tonumber(ARGV[3])
+local nonblocking = ARGV[4] == '1'
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+if now > ts then
+    tokens = math.min(capacity, tokens + (now - ts) * rate)
+else
+    now = ts
+end
+if nonblocking and tokens < count then
+    return '-1'
+end
+tokens = tokens - count
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil((capacity - tokens) / rate * 1000) + 1000)
+if tokens >= 0 then
+    return '0'
+end
+return tostring(-tokens / rate)
+"""
+
+REDIS_KEY_PREFIX = "ratelimit:"
 
 
 class RateLimiter:
-    """速率限制器"""
+    """滑动窗口限流器（任意 period 秒内最多 calls 次）"""
     
     def __init__(self, calls: int, period: int):
         """
@@ -20,57 +67,632 @@ class RateLimiter:
         """
         self.calls = calls
         self.period = period
-        self.timestamps = deque()
-        self.lock = asyncio.Lock()
+        
+        # 最近 calls 次许可的发放时间（环形缓冲区，按发放顺序排列，可能是已预订的未来时间）
+        self._slots = [float('-inf')] * calls
+        self._index = 0
+        self.waiting = 0
+    
+    def _reserve(self, now: float) -> float:
+        """预订下一个许可，返回许可生效的时间点"""
+        # 第 calls 次之前发放的许可滑出窗口后才能再发放
+        start = max(now, self._slots[self._index] + self.period)
+        self._slots[self._index] = start
+        self._index = (self._index + 1) % self.calls
+        return start
     
     async def acquire(self):
         """获取许可（阻塞直到可以执行）"""
-        async with self.lock:
-            now = datetime.now()
-            
-            # 清理过期的时间戳
-            while self.timestamps and self.timestamps[0] < now - timedelta(seconds=self.period):
-                self.timestamps.popleft()
-            
-            # 检查是否超限
-            if len(self.timestamps) >= self.calls:
-                # 计算需要等待的时间
-                oldest = self.timestamps[0]
-                wait_until = oldest + timedelta(seconds=self.period)
-                wait_time = (wait_until - now).total_seconds()
-                
-                if wait_time > 0:
-                    await asyncio.sleep(wait_time)
-                    return await self.acquire()
-            
-            # 记录时间戳
-            self.timestamps.append(now)
+        now = time.monotonic()
+        wait_time = self._reserve(now) - now
+        
+        if wait_time > 0:
+            self.waiting += 1
+            try:
+                await asyncio.sleep(wait_time)
+            finally:
+                self.waiting -= 1
     
     def try_acquire(self) -> bool:
         """尝试获取许可（非阻塞）"""
-        now = datetime.now()
-        
-        # 清理过期的时间戳
-        while self.timestamps and self.timestamps[0] < now - timedelta(seconds=self.period):
-            self.timestamps.popleft()
+        now = time.monotonic()
         
-        # 检查是否超限
-        if len(self.timestamps) >= self.calls:
+        # 检查是否超限（包括已被排队者预订的许可）
+        if self._slots[self._index] + self.period > now:
             return False
         
-        # 记录时间戳
-        self.timestamps.append(now)
+        self._reserve(now)
+        return True
+    
+    def get_wait_time(self) -> float:
+        """现在获取许可需要等待的秒数"""
+        return max(0.0, self._slots[self._index] + self.period - time.monotonic())
+    
+    def get_request_count(self) -> int:
+        """当前窗口内已发放（含已预订）的许可数"""
+        window_start = time.monotonic() - self.period
+        return sum(1 for slot in self._slots if slot > window_start)
+    
+    def get_status(self) -> Dict[str, Any]:
+        """获取限流状态"""
+        wait_time = self.get_wait_time()
+        return {
+            'is_limited': wait_time > 0,
+            'queue_size': self.waiting,
+            'wait_time': round(wait_time, 3),
+            'progress': round(min(self.get_request_count(), self.calls) / self.calls * 100, 1)
+        }
+
+
+class TokenBucket:
+    """
+    令牌桶限流器
+    
+    - 桶有固定容量（capacity），令牌以恒定速率补充（refill_rate 个/秒）
+    - 每次请求消耗令牌，令牌不足时预订并等待
+    - 令牌数可以为负，表示已被排队的调用预订
+    """
+    
+    def __init__(self, capacity: float, refill_rate: float):
+        """
+        初始化令牌桶
+        
+        Args:
+            capacity: 桶容量（最多存储多少令牌）
+            refill_rate: 令牌补充速率（每秒补充多少个）
+        """
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        self.tokens = float(capacity)  # 初始时桶满
+        self.last_refill_time = time.monotonic()
+        self.waiting = 0
+    
+    def _refill(self, now: float):
+        """按经过的时间补充令牌"""
+        elapsed = now - self.last_refill_time
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.refill_rate)
+            self.last_refill_time = now
+    
+    async def acquire(self, count: int = 1) -> bool:
+        """
+        获取令牌（令牌不足时等待）
+        
+        Args:
+            count: 需要的令牌数量
+        
+        Returns:
+            是否成功获取
+        """
+        self._refill(time.monotonic())
+        self.tokens -= count
+        
+        if self.tokens >= 0:
+            return True
+        
+        # 排在所有已预订者之后：等到补充的令牌覆盖欠下的部分
+        wait_time = -self.tokens / self.refill_rate
+        self.waiting += 1
+        try:
+            await asyncio.sleep(wait_time)
+        except asyncio.CancelledError:
+            # 放弃等待，归还预订的令牌
+            self.tokens = min(self.capacity, self.tokens + count)
+            raise
+        finally:
+            self.waiting -= 1
+        
         return True
+    
+    def try_acquire(self, count: int = 1) -> bool:
+        """
+        尝试获取令牌（非阻塞）
+        
+        Args:
+            count: 需要的令牌数量
+        
+        Returns:
+            是否成功获取（失败时不等待）
+        """
+        self._refill(time.monotonic())
+        
+        if self.tokens >= count:
+            self.tokens -= count
+            return True
+        return False
+    
+    def get_available_tokens(self) -> float:
+        """
+        获取当前可用令牌数
+        
+        Returns:
+            可用令牌数（浮点数，为负表示已被预订）
+        """
+        elapsed = max(0.0, time.monotonic() - self.last_refill_time)
+        return min(self.capacity, self.tokens + elapsed * self.refill_rate)
+    
+    def get_wait_time(self, count: int = 1) -> float:
+        """
+        计算获取指定数量令牌需要等待的时间
+        
+        Args:
+            count: 需要的令牌数量
+        
+        Returns:
+            等待时间（秒）
+        """
+        available = self.get_available_tokens()
+        if available >= count:
+            return 0.0
+        return (count - available) / self.refill_rate
+    
+    def get_status(self) -> Dict[str, Any]:
+        """获取限流状态"""
+        wait_time = self.get_wait_time()
+        available = max(0.0, self.get_available_tokens())
+        return {
+            'is_limited': wait_time > 0,
+            'queue_size': self.waiting,
+            'wait_time': round(wait_time, 3),
+            'progress': round((1 - available / self.capacity) * 100, 1)
+        }
+
+
+class RedisTokenBucket:
+    """
+    Redis令牌桶（多进程共享额度）
+    
+    补充和预订在一个Lua脚本内原子完成，时间取Redis服务器时钟，
+    各Worker进程看到同一个桶；Redis不可用时退回本进程的令牌桶
+    """
+    
+    def __init__(self, redis, script, key: str, capacity: float, refill_rate: float):
+        """
+        初始化Redis令牌桶
+        
+        Args:
+            redis: Redis连接
+            script: 已注册的 TOKEN_BUCKET_LUA 脚本
+            key: Redis键
+            capacity: 桶容量
+            refill_rate: 令牌补充速率（每秒）
+        """
+        self.redis = redis
+        self.script = script
+        self.key = key
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        self.local = TokenBucket(capacity, refill_rate)
+        self.waiting = 0
+        self.redis_errors = 0
+    
+    async def _reserve(self, count: int, nonblocking: bool) -> float:
+        """执行脚本，返回需要等待的秒数（-1表示非阻塞获取失败）"""
+        result = await self.script(
+            keys=[self.key],
+            args=[self.capacity, self.refill_rate, count, '1' if nonblocking else '0']
+        )
+        if isinstance(result, bytes):
+            result = result.decode()
+        return float(result)
+    
+    async def acquire(self, count: int = 1) -> bool:
+        """获取令牌（令牌不足时等待）"""
+        try:
+            wait_time = await self._reserve(count, nonblocking=False)
+        except Exception as e:
+            self.redis_errors += 1
+            logger.warning(f"Redis限流失败，使用本地令牌桶: {str(e)}")
+            return await self.local.acquire(count)
+        
+        if wait_time > 0:
+            self.waiting += 1
+            try:
+                await asyncio.sleep(wait_time)
+            finally:
+                self.waiting -= 1
+        
+        return True
+    
+    async def try_acquire(self, count: int = 1) -> bool:
+        """尝试获取令牌（非阻塞）"""
+        try:
+            return await self._reserve(count, nonblocking=True) >= 0
+        except Exception as e:
+            self.redis_errors += 1
+            logger.warning(f"Redis限流失败，使用本地令牌桶: {str(e)}")
+            return self.local.try_acquire(count)
+    
+    def get_status(self) -> Dict[str, Any]:
+        """获取限流状态（只统计本进程的排队情况）"""
+        return {
+            'is_limited': self.waiting > 0,
+            'queue_size': self.waiting,
+            'wait_time': 0.0,
+            'progress': 0.0,
+            'backend': 'redis',
+            'redis_errors': self.redis_errors
+        }
+
+
+class KeyedRateLimiter:
+    """
+    按键分别限流的令牌桶集合
+    
+    例如每个Discord Webhook、每个Telegram Bot、每个聊天各有一个桶；
+    键数超过上限时淘汰最久未用且没有排队者的桶
+    """
+    
+    def __init__(self, name: str, capacity: float, refill_rate: float,
+                 manager: 'RateLimiterManager', max_keys: Optional[int] = None):
+        """
+        初始化
+        
+        Args:
+            name: 限流器名称（Redis键前缀的一部分）
+            capacity: 每个桶的容量
+            refill_rate: 每个桶的补充速率（每秒）
+            manager: 所属管理器（提供Redis后端）
+            max_keys: 最多保留的桶数
+        """
+        self.name = name
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        self.manager = manager
+        self.max_keys = max_keys or settings.rate_limit_max_keys
+        self.buckets: OrderedDict = OrderedDict()
+    
+    @staticmethod
+    def _digest(key: Optional[str]) -> str:
+        """键可能包含Webhook令牌等敏感信息，只保留摘要"""
+        if key is None:
+            return 'default'
+        return hashlib.sha1(str(key).encode('utf-8')).hexdigest()[:16]
+    
+    def get_bucket(self, key: Optional[str] = None) -> Union[TokenBucket, RedisTokenBucket]:
+        """
+        获取键对应的令牌桶（不存在时创建）
+        
+        Args:
+            key: Webhook URL / Bot Token / 聊天ID 等
+        
+        Returns:
+            令牌桶
+        """
+        digest = self._digest(key)
+        bucket = self.buckets.get(digest)
+        if bucket is not None:
+            self.buckets.move_to_end(digest)
+            return bucket
+        
+        bucket = self.manager.create_bucket(f"{self.name}:{digest}", self.capacity, self.refill_rate)
+        self.buckets[digest] = bucket
+        
+        if len(self.buckets) > self.max_keys:
+            for old_digest, old_bucket in list(self.buckets.items())[:len(self.buckets) - self.max_keys]:
+                if old_bucket.waiting == 0:
+                    del self.buckets[old_digest]
+        
+        return bucket
+    
+    async def acquire(self, key: Optional[str] = None, count: int = 1) -> bool:
+        """
+        获取键对应桶的令牌（令牌不足时等待）
+        
+        Args:
+            key: Webhook URL / Bot Token / 聊天ID 等
+            count: 需要的令牌数量
+        """
+        return await self.get_bucket(key).acquire(count)
+    
+    def get_status(self) -> Dict[str, Any]:
+        """获取汇总的限流状态"""
+        statuses = [bucket.get_status() for bucket in self.buckets.values()]
+        return {
+            'is_limited': any(status['is_limited'] for status in statuses),
+            'queue_size': sum(status['queue_size'] for status in statuses),
+            'wait_time': max((status['wait_time'] for status in statuses), default=0.0),
+            'progress': max((status['progress'] for status in statuses), default=0.0),
+            'keys': len(statuses)
+        }
 
 
+class AdaptiveState:
+    """从平台响应中学到的限流状态（Discord同一个bucket下的多个Webhook共享一份）"""
+    
+    def __init__(self):
+        self.bucket_id: Optional[str] = None
+        self.limit: Optional[int] = None  # 窗口额度（X-RateLimit-Limit）
+        self.remaining: Optional[int] = None  # 当前窗口剩余额度（None表示平台未报告）
+        self.reset_at = 0.0  # 窗口重置时间（time.monotonic）
+        self.window = 0.0  # 观察到的窗口长度（秒）
+        self.blocked_until = 0.0  # 429要求的等待截止时间
+        self.successes = 0  # 上次调整速率以来的连续成功次数
+    
+    def wait_time(self, now: float) -> float:
+        """现在发送需要等待的秒数"""
+        if self.remaining is not None and now >= self.reset_at:
+            # 窗口已重置：按学到的额度恢复，下一次重置时间以窗口长度估计（收到响应后校正）
+            self.remaining = self.limit
+            self.reset_at = now + self.window
+        
+        wait_time = self.blocked_until - now
+        if self.remaining is not None and self.remaining <= 0:
+            wait_time = max(wait_time, self.reset_at - now)
+        return max(0.0, wait_time)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {
+            'bucket': self.bucket_id,
+            'limit': self.limit,
+            'remaining': self.remaining,
+            'reset_after': round(max(0.0, self.reset_at - now), 3),
+            'blocked_for': round(max(0.0, self.blocked_until - now), 3)
+        }
+
+
+class AdaptiveRateLimiter(KeyedRateLimiter):
+    """
+    根据平台响应自适应的按键限流器
+    
+    - 平台报告额度时（Discord X-RateLimit-*），按剩余额度和重置时间提前等待，
+      并把本地令牌桶调整为学到的真实额度；同一个bucket ID的Webhook共享状态
+    - 平台只在429时告知等待时间（Telegram retry_after、飞书频率限制错误码），
+      则按AIMD调整速率：429时减半，持续成功时逐步回升
+    - 同名限流器全进程共享，多个转发器看到同一份学习结果
+    """
+    
+    def __init__(self, name: str, capacity: float, refill_rate: float,
+                 manager: 'RateLimiterManager', max_keys: Optional[int] = None):
+        super().__init__(name, capacity, refill_rate, manager, max_keys)
+        self.base_rate = refill_rate
+        self.min_rate = refill_rate * settings.rate_limit_adaptive_min_scale
+        self.max_rate = refill_rate * settings.rate_limit_adaptive_max_scale
+        
+        self.states: OrderedDict = OrderedDict()  # 状态键 -> AdaptiveState
+        self.routes: OrderedDict = OrderedDict()  # 键摘要 -> 平台bucket ID
+        self.global_blocked_until = 0.0
+        
+        self.stats = {
+            'preemptive_waits': 0,
+            'rate_limited': 0,
+            'rate_decreases': 0,
+            'rate_increases': 0
+        }
+    
+    def _state(self, key: Optional[str]) -> AdaptiveState:
+        """获取键对应的限流状态（已知bucket ID时使用共享状态）"""
+        digest = self._digest(key)
+        state_key = self.routes.get(digest, digest)
+        
+        state = self.states.get(state_key)
+        if state is None:
+            state = self.states[state_key] = AdaptiveState()
+            while len(self.states) > self.max_keys:
+                self.states.popitem(last=False)
+        else:
+            self.states.move_to_end(state_key)
+        return state
+    
+    async def acquire(self, key: Optional[str] = None, count: int = 1) -> float:
+        """
+        获取发送许可
+        
+        Args:
+            key: Webhook URL / Bot Token / 聊天ID 等
+            count: 需要的令牌数量
+        
+        Returns:
+            因平台限流状态（额度耗尽、429）而提前等待的秒数
+        """
+        waited = 0.0
+        while True:
+            now = time.monotonic()
+            state = self._state(key)
+            wait_time = max(self.global_blocked_until - now, state.wait_time(now))
+            if wait_time <= 0:
+                break
+            
+            if waited == 0:
+                self.stats['preemptive_waits'] += 1
+                logger.debug(f"{self.name}限流额度已耗尽，等待{wait_time:.2f}秒")
+            # 醒来后重新检查：等待期间其他响应可能更新了状态
+            await asyncio.sleep(wait_time)
+            waited += wait_time
+        
+        # 先占用额度，避免并发发送在响应回来之前超出剩余额度
+        if state.remaining is not None:
+            state.remaining -= count
+        
+        await self.get_bucket(key).acquire(count)
+        return waited
+    
+    def on_response(self, key: Optional[str] = None, limit: Optional[int] = None,
+                    remaining: Optional[int] = None, reset_after: Optional[float] = None,
+                    bucket_id: Optional[str] = None):
+        """
+        记录一次成功响应
+        
+        Args:
+            key: 请求使用的键
+            limit: 窗口额度
+            remaining: 剩余额度
+            reset_after: 距窗口重置的秒数
+            bucket_id: 平台的限流bucket ID（相同ID的键共享额度）
+        """
+        if bucket_id:
+            digest = self._digest(key)
+            state_key = f"bucket:{bucket_id}"
+            if self.routes.get(digest) != state_key:
+                self.routes[digest] = state_key
+                while len(self.routes) > self.max_keys:
+                    self.routes.popitem(last=False)
+        
+        state = self._state(key)
+        state.bucket_id = bucket_id or state.bucket_id
+        
+        if remaining is None or reset_after is None:
+            self._increase_rate(key, state)
+            return
+        
+        state.remaining = remaining
+        state.reset_at = time.monotonic() + reset_after
+        
+        if limit:
+            state.limit = limit
+            state.window = max(state.window, reset_after)
+            if state.window > 0:
+                # 本地令牌桶按学到的额度放行（不再受配置的保守值限制）
+                bucket = self.get_bucket(key)
+                bucket.capacity = limit
+                bucket.refill_rate = limit / state.window
+    
+    def on_rate_limited(self, key: Optional[str], retry_after: float, is_global: bool = False):
+        """
+        记录一次429限流
+        
+        Args:
+            key: 请求使用的键
+            retry_after: 平台要求等待的秒数
+            is_global: 是否为全局限流（影响该限流器的所有键）
+        """
+        now = time.monotonic()
+        self.stats['rate_limited'] += 1
+        
+        if is_global:
+            self.global_blocked_until = max(self.global_blocked_until, now + retry_after)
+        
+        state = self._state(key)
+        state.blocked_until = max(state.blocked_until, now + retry_after)
+        state.successes = 0
+        if state.remaining is not None:
+            state.remaining = 0
+            state.reset_at = max(state.reset_at, state.blocked_until)
+        
+        # 乘性减小发送速率
+        bucket = self.get_bucket(key)
+        rate = max(self.min_rate, bucket.refill_rate / 2)
+        if rate < bucket.refill_rate:
+            bucket.refill_rate = rate
+            self.stats['rate_decreases'] += 1
+            logger.info(f"{self.name}触发429，发送速率降为 {rate:.2f}/秒")
+    
+    def _increase_rate(self, key: Optional[str], state: AdaptiveState):
+        """连续成功一整桶后加性增加速率（平台未报告额度时）"""
+        bucket = self.get_bucket(key)
+        state.successes += 1
+        if state.successes < bucket.capacity or bucket.refill_rate >= self.max_rate:
+            return
+        
+        state.successes = 0
+        bucket.refill_rate = min(self.max_rate, bucket.refill_rate + self.base_rate * 0.1)
+        self.stats['rate_increases'] += 1
+    
+    def get_state(self, key: Optional[str] = None) -> Dict[str, Any]:
+        """获取键的学习状态"""
+        return {
+            **self._state(key).to_dict(),
+            'rate': round(self.get_bucket(key).refill_rate, 3)
+        }
+    
+    def get_status(self) -> Dict[str, Any]:
+        """获取汇总的限流状态"""
+        status = super().get_status()
+        blocked_for = max(0.0, self.global_blocked_until - time.monotonic())
+        status['wait_time'] = max(status['wait_time'], round(blocked_for, 3))
+        status['is_limited'] = status['is_limited'] or blocked_for > 0
+        return {**status, **self.stats}
+
 
 class RateLimiterManager:
+    """限流器管理器"""
+    
     def __init__(self):
-        self.limiters = {}
+        self.limiters: Dict[str, RateLimiter] = {}
+        self.keyed_limiters: Dict[str, KeyedRateLimiter] = {}
+        
+        # Redis后端（rate_limit_backend=redis 时由 use_redis 设置）
+        self.redis = None
+        self._script = None
     
-    def get_limiter(self, name: str, calls: int, period: int):
+    def get_limiter(self, name: str, calls: int, period: int) -> RateLimiter:
+        """获取滑动窗口限流器"""
         if name not in self.limiters:
             self.limiters[name] = RateLimiter(calls, period)
         return self.limiters[name]
+    
+    def get_keyed_limiter(self, name: str, calls: int, period: float) -> KeyedRateLimiter:
+        """
+        获取按键限流的令牌桶集合
+        
+        Args:
+            name: 限流器名称
+            calls: 桶容量（允许的突发次数）
+            period: 补充满 calls 个令牌所需的秒数
+        
+        Returns:
+            按键限流器
+        """
+        if name not in self.keyed_limiters:
+            self.keyed_limiters[name] = KeyedRateLimiter(name, calls, calls / period, self)
+        return self.keyed_limiters[name]
+    
+    def get_adaptive_limiter(self, name: str, calls: int, period: float) -> AdaptiveRateLimiter:
+        """
+        获取根据平台响应自适应的按键限流器（同名共享学习状态）
+        
+        Args:
+            name: 限流器名称
+            calls: 初始桶容量
+            period: 初始补充满 calls 个令牌所需的秒数
+        
+        Returns:
+            自适应限流器
+        """
+        if name not in self.keyed_limiters:
+            self.keyed_limiters[name] = AdaptiveRateLimiter(name, calls, calls / period, self)
+        return self.keyed_limiters[name]
+    
+    def create_bucket(self, key: str, capacity: float, refill_rate: float) -> Union[TokenBucket, RedisTokenBucket]:
+        """创建令牌桶（配置了Redis后端时使用Redis令牌桶）"""
+        if self.redis is not None:
+            return RedisTokenBucket(self.redis, self._script, f"{REDIS_KEY_PREFIX}{key}", capacity, refill_rate)
+        return TokenBucket(capacity, refill_rate)
+    
+    def use_redis(self, redis):
+        """
+        启用Redis后端（仅当 rate_limit_backend=redis）
+        
+        Args:
+            redis: Redis连接（为None时保持本地限流）
+        """
+        if redis is None or settings.rate_limit_backend != 'redis':
+            return
+        
+        self.redis = redis
+        self._script = redis.register_script(TOKEN_BUCKET_LUA)
+        
+        # 已创建的本地桶换成Redis桶
+        for limiter in self.keyed_limiters.values():
+            limiter.buckets.clear()
+        
+        logger.info("限流器使用Redis后端（多进程共享额度）")
+    
+    def get_status(self, name: str) -> Dict[str, Any]:
+        """
+        获取指定限流器的状态
+        
+        Args:
+            name: 限流器名称
+        
+        Returns:
+            {'is_limited', 'queue_size', 'wait_time', 'progress'}
+        """
+        limiter = self.keyed_limiters.get(name) or self.limiters.get(name)
+        if limiter is None:
+            return {'is_limited': False, 'queue_size': 0, 'wait_time': 0, 'progress': 0}
+        return limiter.get_status()
+
 
 rate_limiter_manager = RateLimiterManager()
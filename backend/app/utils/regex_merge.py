@@ -0,0 +1,30 @@
+"""
+正则合并判断
+多个正则用 '|' 合并为一个表达式时，分组会按合并后的位置重新编号，
+引用分组的正则（反向引用、条件分组）会指向别的分组而悄悄匹配错误，这类正则只能单独匹配
+"""
+import re
+
+
+# 按编号/名称引用分组：\1-\99、(?P=name)、条件分组 (?(1)...)
+GROUP_REFERENCE = re.compile(r'\\[1-9]|\(\?P=|\(\?\(')
+
+# 开头的全局内联标志（如 (?i)），合并后不在表达式开头，无法编译
+GLOBAL_FLAGS = re.compile(r'^\(\?[aiLmsux]+\)')
+
+
+def can_merge_regex(pattern: re.Pattern) -> bool:
+    """
+    正则能否与其他正则合并为一个交替表达式
+
+    Args:
+        pattern: 已编译的正则
+
+    Returns:
+        不含命名分组（合并后可能重名）、分组引用和全局内联标志时为True
+    """
+    if pattern.groupindex:
+        return False
+    if pattern.groups and GROUP_REFERENCE.search(pattern.pattern):
+        return False
+    return not GLOBAL_FLAGS.match(pattern.pattern)
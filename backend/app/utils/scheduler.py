@@ -325,6 +325,12 @@ async def hourly_cleanup_task():
         if attachment_cleanup_result:
             logger.info("🗑️ 附件清理完成")
         
+        # 5. 清理过期的消息统计汇总
+        from ..analytics.stats_rollup import stats_rollup
+        pruned = await stats_rollup.prune()
+        if pruned > 0:
+            logger.info(f"🗑️ 清理了 {pruned} 行过期统计汇总")
+        
         logger.info("✅ 每小时清理任务完成")
         
     except Exception as e:
@@ -0,0 +1,267 @@
+"""
+翻译缓存（L1内存LRU + L2磁盘SQLite）
+服务器里大量重复的短语只需翻译一次，重启后仍然有效
+
+- 缓存键为 (原文哈希, 源语言, 目标语言)
+- L1使用进程内 MemoryCache（TTL + LRU），L2为独立的SQLite文件（不占用主库写连接）
+- 磁盘层按最近使用时间淘汰，条目数超过上限时删除最久未用的
+"""
+import asyncio
+import hashlib
+import time
+import aiosqlite
+from pathlib import Path
+from typing import Dict, List, Optional
+from .cache_manager import MemoryCache
+from ..utils.logger import logger
+from ..config import settings
+
+
+TRANSLATION_CACHE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS translation_cache (
+    cache_key TEXT PRIMARY KEY,
+    source_lang TEXT NOT NULL,
+    target_lang TEXT NOT NULL,
+    translated TEXT NOT NULL,
+    provider TEXT,
+    created_at REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_translation_cache_last_used ON translation_cache(last_used);
+"""
+
+# 单条SQL中IN参数的最大数量
+SQL_CHUNK_SIZE = 500
+
+
+def make_cache_key(text: str, source_lang: str, target_lang: str) -> str:
+    """
+    生成缓存键
+    
+    Args:
+        text: 原文
+        source_lang: 源语言
+        target_lang: 目标语言
+    
+    Returns:
+        sha1(原文):源语言:目标语言
+    """
+    digest = hashlib.sha1(text.encode('utf-8')).hexdigest()
+    return f"{digest}:{source_lang}:{target_lang}"
+
+
+class TranslationCache:
+    """两级翻译缓存"""
+    
+    def __init__(
+        self,
+        db_path: Optional[Path] = None,
+        max_size: Optional[int] = None,
+        ttl: Optional[int] = None,
+        disk_max_entries: Optional[int] = None
+    ):
+        self.db_path = Path(db_path or settings.translation_cache_db_path)
+        self.memory = MemoryCache(
+            max_size=max_size or settings.translation_cache_size,
+            default_ttl=ttl or settings.translation_cache_ttl
+        )
+        self.disk_max_entries = disk_max_entries or settings.translation_cache_disk_max_entries
+        
+        # 每写入这么多条检查一次磁盘层大小（允许短暂超出10%）
+        self.prune_every = max(1, self.disk_max_entries // 10)
+        self._writes_since_prune = 0
+        
+        self._conn: Optional[aiosqlite.Connection] = None
+        self._connect_lock: Optional[asyncio.Lock] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        
+        self.stats = {
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'writes': 0,
+            'disk_evictions': 0,
+            'disk_errors': 0
+        }
+    
+    async def _get_conn(self) -> aiosqlite.Connection:
+        """获取磁盘层连接（首次使用时打开并建表）"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # 事件循环已变化，旧连接和锁不能继续使用
+            if self._conn is not None:
+                self._conn.stop()
+            self._conn = None
+            self._connect_lock = asyncio.Lock()
+            self._loop = loop
+        
+        if self._conn is not None:
+            return self._conn
+        
+        async with self._connect_lock:
+            if self._conn is None:
+                self.db_path.parent.mkdir(parents=True, exist_ok=True)
+                conn = await aiosqlite.connect(self.db_path, check_same_thread=False)
+                await conn.execute("PRAGMA journal_mode=WAL")
+                await conn.execute("PRAGMA synchronous=NORMAL")
+                await conn.executescript(TRANSLATION_CACHE_SCHEMA)
+                await conn.commit()
+                self._conn = conn
+        
+        return self._conn
+    
+    async def get_many(
+        self,
+        texts: List[str],
+        source_lang: str,
+        target_lang: str
+    ) -> Dict[str, str]:
+        """
+        批量查询缓存（先内存后磁盘，磁盘命中回填内存）
+        
+        Args:
+            texts: 原文列表
+            source_lang: 源语言
+            target_lang: 目标语言
+        
+        Returns:
+            命中的 {原文: 译文}
+        """
+        found = {}
+        missing = {}  # 缓存键 -> 原文
+        
+        for text in texts:
+            key = make_cache_key(text, source_lang, target_lang)
+            translated = self.memory.get(key)
+            if translated is not None:
+                found[text] = translated
+                self.stats['memory_hits'] += 1
+            else:
+                missing[key] = text
+        
+        if missing:
+            try:
+                conn = await self._get_conn()
+                keys = list(missing)
+                rows = []
+                for start in range(0, len(keys), SQL_CHUNK_SIZE):
+                    chunk = keys[start:start + SQL_CHUNK_SIZE]
+                    placeholders = ','.join('?' * len(chunk))
+                    cursor = await conn.execute(
+                        f"SELECT cache_key, translated FROM translation_cache WHERE cache_key IN ({placeholders})",
+                        chunk
+                    )
+                    rows.extend(await cursor.fetchall())
+                
+                if rows:
+                    now = time.time()
+                    await conn.executemany(
+                        "UPDATE translation_cache SET last_used = ? WHERE cache_key = ?",
+                        [(now, key) for key, _ in rows]
+                    )
+                    await conn.commit()
+                
+                for key, translated in rows:
+                    found[missing[key]] = translated
+                    self.memory.set(key, translated)
+                    self.stats['disk_hits'] += 1
+            
+            except Exception as e:
+                self.stats['disk_errors'] += 1
+                logger.error(f"读取翻译缓存失败: {str(e)}")
+        
+        self.stats['misses'] += len(texts) - len(found)
+        return found
+    
+    async def get(self, text: str, source_lang: str, target_lang: str) -> Optional[str]:
+        """查询单条缓存"""
+        return (await self.get_many([text], source_lang, target_lang)).get(text)
+    
+    async def set_many(
+        self,
+        translations: Dict[str, str],
+        source_lang: str,
+        target_lang: str,
+        provider: Optional[str] = None
+    ):
+        """
+        批量写入缓存（内存和磁盘）
+        
+        Args:
+            translations: {原文: 译文}
+            source_lang: 源语言
+            target_lang: 目标语言
+            provider: 翻译服务提供商
+        """
+        if not translations:
+            return
+        
+        now = time.time()
+        rows = []
+        for text, translated in translations.items():
+            key = make_cache_key(text, source_lang, target_lang)
+            self.memory.set(key, translated)
+            rows.append((key, source_lang, target_lang, translated, provider, now, now))
+        
+        self.stats['writes'] += len(rows)
+        
+        try:
+            conn = await self._get_conn()
+            await conn.executemany(
+                "INSERT OR REPLACE INTO translation_cache "
+                "(cache_key, source_lang, target_lang, translated, provider, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            await conn.commit()
+            
+            self._writes_since_prune += len(rows)
+            if self._writes_since_prune >= self.prune_every:
+                self._writes_since_prune = 0
+                await self._prune(conn)
+        
+        except Exception as e:
+            self.stats['disk_errors'] += 1
+            logger.error(f"写入翻译缓存失败: {str(e)}")
+    
+    async def _prune(self, conn: aiosqlite.Connection):
+        """删除超出上限的最久未用条目"""
+        cursor = await conn.execute(
+            "DELETE FROM translation_cache WHERE cache_key IN ("
+            "SELECT cache_key FROM translation_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+            (self.disk_max_entries,)
+        )
+        await conn.commit()
+        
+        if cursor.rowcount > 0:
+            self.stats['disk_evictions'] += cursor.rowcount
+            logger.debug(f"翻译缓存淘汰 {cursor.rowcount} 条")
+    
+    async def clear(self):
+        """清空缓存"""
+        self.memory.clear()
+        try:
+            conn = await self._get_conn()
+            await conn.execute("DELETE FROM translation_cache")
+            await conn.commit()
+        except Exception as e:
+            logger.error(f"清空翻译缓存失败: {str(e)}")
+    
+    async def close(self):
+        """关闭磁盘层连接"""
+        if self._conn is not None:
+            try:
+                await self._conn.close()
+            except Exception as e:
+                logger.error(f"关闭翻译缓存失败: {str(e)}")
+            self._conn = None
+    
+    def get_stats(self) -> Dict:
+        """获取统计"""
+        lookups = self.stats['memory_hits'] + self.stats['disk_hits'] + self.stats['misses']
+        hits = self.stats['memory_hits'] + self.stats['disk_hits']
+        return {
+            **self.stats,
+            'hit_rate': f"{(hits / lookups * 100) if lookups else 0:.2f}%",
+            'memory': self.memory.get_stats()
+        }
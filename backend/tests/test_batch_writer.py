@@ -0,0 +1,261 @@
+"""
+批量写入器（组提交）测试
+"""
+import pytest
+import asyncio
+import time
+from app.utils.batch_writer import BatchWriter
+from app.config import settings
+from app.database_async import AsyncDatabase
+
+
+class RecordingSink:
+    """记录每次批量写入的内容"""
+
+    def __init__(self, delay: float = 0, fail_times: int = 0):
+        self.batches = []
+        self.delay = delay
+        self.fail_times = fail_times
+
+    async def write(self, rows):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if self.fail_times:
+            self.fail_times -= 1
+            raise Exception("disk I/O error")
+        self.batches.append(list(rows))
+
+    @property
+    def rows(self):
+        return [row for batch in self.batches for row in batch]
+
+
+def log_record(message_id, status='success', retry=False):
+    return {
+        'kook_message_id': message_id,
+        'kook_channel_id': 'ch1',
+        'content': '内容',
+        'message_type': 'text',
+        'sender_name': '用户',
+        'target_platform': 'discord',
+        'target_channel': 'target',
+        'status': status,
+        'retry': retry
+    }
+
+
+class TestBatchWriter:
+    """组提交写入器测试"""
+
+    @pytest.mark.asyncio
+    async def test_flush_on_batch_size(self):
+        """攒够批次大小立即提交，不等刷新间隔"""
+        sink = RecordingSink()
+        writer = BatchWriter(batch_size=5, flush_interval=10, write_func=sink.write)
+        await writer.start()
+        try:
+            for i in range(5):
+                await writer.add({'i': i})
+            await asyncio.sleep(0.05)
+
+            assert sink.batches == [[{'i': i} for i in range(5)]]
+        finally:
+            await writer.stop()
+
+    @pytest.mark.asyncio
+    async def test_flush_on_interval(self):
+        """不足一批时按刷新间隔提交"""
+        sink = RecordingSink()
+        writer = BatchWriter(batch_size=100, flush_interval=0.05, write_func=sink.write)
+        await writer.start()
+        try:
+            for i in range(3):
+                await writer.add({'i': i})
+            assert sink.batches == []
+
+            await asyncio.sleep(0.2)
+            assert len(sink.rows) == 3
+        finally:
+            await writer.stop()
+
+    @pytest.mark.asyncio
+    async def test_stop_flushes_remaining(self):
+        """停止时提交缓冲区中剩余的记录"""
+        sink = RecordingSink()
+        writer = BatchWriter(batch_size=100, flush_interval=10, write_func=sink.write)
+        await writer.start()
+
+        for i in range(7):
+            await writer.add({'i': i})
+        await writer.stop()
+
+        assert [row['i'] for row in sink.rows] == list(range(7))
+        assert writer.get_buffer_size() == 0
+
+    @pytest.mark.asyncio
+    async def test_backpressure_bounds_buffer(self):
+        """写入跟不上时缓冲区不超过上限，全部记录按顺序写入"""
+        sink = RecordingSink(delay=0.02)
+        writer = BatchWriter(batch_size=4, flush_interval=10, write_func=sink.write, max_buffer=8)
+        await writer.start()
+
+        peak = 0
+        try:
+            for i in range(50):
+                await writer.add({'i': i})
+                peak = max(peak, writer.get_buffer_size())
+        finally:
+            await writer.stop()
+
+        assert peak <= 8
+        assert writer.get_stats()['backpressure_waits'] > 0
+        assert [row['i'] for row in sink.rows] == list(range(50))
+
+    @pytest.mark.asyncio
+    async def test_failed_batch_is_retried(self):
+        """写入失败的记录放回缓冲区，下次刷新重试"""
+        sink = RecordingSink(fail_times=1)
+        writer = BatchWriter(batch_size=100, flush_interval=10, write_func=sink.write)
+        await writer.start()
+
+        for i in range(3):
+            await writer.add({'i': i})
+
+        assert await writer.flush() is False
+        assert writer.get_buffer_size() == 3
+
+        await writer.stop()
+        assert [row['i'] for row in sink.rows] == [0, 1, 2]
+        assert writer.get_stats()['failed_batches'] == 1
+
+    @pytest.mark.asyncio
+    async def test_writes_directly_when_not_started(self):
+        """未启动时每次添加直接写入"""
+        sink = RecordingSink()
+        writer = BatchWriter(batch_size=100, flush_interval=10, write_func=sink.write)
+
+        await writer.add({'i': 1})
+        assert sink.batches == [[{'i': 1}]]
+
+    @pytest.mark.asyncio
+    async def test_commit_metrics(self):
+        """统计提交耗时、批次大小和写入速率"""
+        sink = RecordingSink(delay=0.01)
+        writer = BatchWriter(batch_size=10, flush_interval=10, write_func=sink.write)
+        await writer.start()
+        for i in range(20):
+            await writer.add({'i': i})
+            if i == 9:
+                await asyncio.sleep(0.05)  # 让第一批先提交
+        await writer.stop()
+
+        stats = writer.get_stats()
+        assert stats['total_flushed'] == 20
+        assert stats['avg_commit_ms'] >= 10
+        assert stats['max_commit_ms'] >= stats['avg_commit_ms']
+        assert stats['avg_batch_size'] == 10
+        assert stats['rows_per_sec'] > 0
+
+
+class TestMessageLogsBatch:
+    """消息日志批量写入测试"""
+
+    @pytest.mark.asyncio
+    async def test_batch_insert_with_failed_messages(self, tmp_path):
+        """一个事务写入日志，需要重试的记录同时进入失败队列"""
+        adb = AsyncDatabase(db_path=tmp_path / "logs.db", pool_size=1)
+        await adb.connect()
+        try:
+            commits_before = adb.get_pool_stats()['writer']['acquired']
+
+            ids = await adb.add_message_logs_batch([
+                log_record('m1'),
+                log_record('m2', status='failed', retry=True),
+                log_record('m1', status='failed'),  # 重复消息ID返回已有记录
+            ])
+
+            assert adb.get_pool_stats()['writer']['acquired'] == commits_before + 1
+            assert ids[0] == ids[2]
+            assert (await adb.get_message_log('m2'))['status'] == 'failed'
+
+            async with adb.reader() as conn:
+                cursor = await conn.execute("SELECT message_log_id FROM failed_messages")
+                rows = await cursor.fetchall()
+            assert [row[0] for row in rows] == [ids[1]]
+        finally:
+            await adb.disconnect()
+
+    @pytest.mark.asyncio
+    async def test_retry_delay(self, tmp_path):
+        """retry_delay 指定首次重试时间（自动修复的延迟重试交给重试Worker）"""
+        adb = AsyncDatabase(db_path=tmp_path / "logs.db", pool_size=1)
+        await adb.connect()
+        try:
+            before = time.time()
+            await adb.add_message_logs_batch([
+                {**log_record('m1', status='failed', retry=True), 'retry_delay': 60},
+                log_record('m2', status='failed', retry=True),
+            ])
+
+            async with adb.reader() as conn:
+                cursor = await conn.execute("SELECT next_retry FROM failed_messages ORDER BY id")
+                delayed, default = [row[0] for row in await cursor.fetchall()]
+            assert delayed >= before + 60
+            assert before + settings.message_retry_interval <= default < delayed
+        finally:
+            await adb.disconnect()
+
+
+class TestRetryLogsBeforeAck:
+    """需要重试的失败记录在消息确认前提交"""
+
+    @staticmethod
+    async def log_failure(worker, message_id):
+        await worker._log_result(
+            message_id, 'ch1', '内容', 'text', '用户', 'discord', 'target', 'failed', retry=True
+        )
+
+    @pytest.mark.asyncio
+    async def test_retry_logs_flushed_before_ack(self, monkeypatch):
+        from app.queue import worker as worker_module
+
+        sink = RecordingSink()
+        writer = BatchWriter(batch_size=100, flush_interval=60, write_func=sink.write)
+        monkeypatch.setattr(worker_module, 'log_writer', writer)
+        await writer.start()
+        try:
+            worker = worker_module.MessageWorker()
+            await worker._log_result('ok', 'ch1', '内容', 'text', '用户', 'discord', 'target', 'success')
+            # 只有成功记录：不强制提交，继续走组提交
+            assert await worker._commit_retry_logs() is True
+            assert sink.rows == []
+
+            await self.log_failure(worker, 'm1')
+            assert sink.rows == []
+            assert await worker._commit_retry_logs() is True
+            assert [row['kook_message_id'] for row in sink.rows] == ['ok', 'm1']
+        finally:
+            await writer.stop()
+
+    @pytest.mark.asyncio
+    async def test_no_ack_when_retry_logs_not_committed(self, monkeypatch):
+        from app.queue import worker as worker_module
+
+        sink = RecordingSink(fail_times=1)
+        writer = BatchWriter(batch_size=100, flush_interval=60, write_func=sink.write)
+        monkeypatch.setattr(worker_module, 'log_writer', writer)
+        await writer.start()
+        try:
+            worker = worker_module.MessageWorker()
+            await self.log_failure(worker, 'm1')
+            assert await worker._commit_retry_logs() is False
+
+            # 写入器未启动时直接写入，写入失败同样不能确认
+            await writer.stop()
+            sink.fail_times = 1
+            with pytest.raises(RuntimeError):
+                await self.log_failure(worker, 'm2')
+            assert await worker._commit_retry_logs() is False
+            assert await worker._commit_retry_logs() is True
+        finally:
+            await writer.stop()
@@ -0,0 +1,208 @@
+"""
+缓存（L1内存 + L2 Redis）测试
+"""
+import pytest
+import asyncio
+from fakeredis import aioredis as fakeredis
+from app.utils.cache_manager import MemoryCache, SingleFlight
+from app.utils.cache import CacheManager
+
+
+class TestMemoryCache:
+    """TTL + LRU内存缓存测试"""
+
+    def test_lru_eviction(self):
+        """满时淘汰最久未访问的条目"""
+        cache = MemoryCache(max_size=3, default_ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.set('c', 3)
+
+        assert cache.get('a') == 1  # a变为最近使用
+        cache.set('d', 4)
+
+        assert cache.get('b') is None
+        assert [cache.get(key) for key in 'acd'] == [1, 3, 4]
+        assert cache.get_stats()['evictions'] == 1
+
+    def test_overwrite_does_not_evict(self):
+        cache = MemoryCache(max_size=2, default_ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.set('a', 10)
+
+        assert cache.get('a') == 10
+        assert cache.get('b') == 2
+        assert cache.evictions == 0
+
+    def test_ttl_expiry_and_purge(self, monkeypatch):
+        """过期条目读取时删除，后台清理批量删除"""
+        now = [1000.0]
+        monkeypatch.setattr('app.utils.cache_manager.time.monotonic', lambda: now[0])
+
+        cache = MemoryCache(max_size=10, default_ttl=5)
+        cache.set('short', 1, ttl=1)
+        cache.set('other', 2, ttl=1)
+        cache.set('long', 3)
+
+        now[0] += 2
+        assert cache.get('short') is None
+        assert cache.purge_expired() == 1  # other
+        assert list(cache.cache) == ['long']
+        assert cache.get_stats()['expirations'] == 2
+
+    def test_delete_pattern(self):
+        cache = MemoryCache()
+        cache.set('cache:logs:1', 1)
+        cache.set('cache:logs:2', 2)
+        cache.set('cache:user:1', 3)
+
+        assert cache.delete_pattern('cache:logs:*') == 2
+        assert list(cache.cache) == ['cache:user:1']
+
+    @pytest.mark.asyncio
+    async def test_background_sweeper(self):
+        cache = MemoryCache(default_ttl=0.01)
+        cache.set('a', 1)
+        cache.start_sweeper(interval=0.02)
+        try:
+            await asyncio.sleep(0.1)
+            assert len(cache.cache) == 0
+        finally:
+            await cache.stop_sweeper()
+
+
+class TestSingleFlight:
+    """并发加载合并测试"""
+
+    @pytest.mark.asyncio
+    async def test_concurrent_calls_share_one_load(self):
+        single_flight = SingleFlight()
+        calls = []
+
+        async def loader():
+            calls.append(1)
+            await asyncio.sleep(0.02)
+            return 'value'
+
+        results = await asyncio.gather(*(single_flight.do('key', loader) for _ in range(10)))
+
+        assert results == ['value'] * 10
+        assert len(calls) == 1
+        assert single_flight.get_stats() == {'loads': 1, 'shared': 9, 'inflight': 0}
+
+    @pytest.mark.asyncio
+    async def test_error_propagates_to_waiters(self):
+        single_flight = SingleFlight()
+
+        async def loader():
+            await asyncio.sleep(0.01)
+            raise ValueError("db down")
+
+        results = await asyncio.gather(
+            *(single_flight.do('key', loader) for _ in range(3)), return_exceptions=True
+        )
+
+        assert all(isinstance(result, ValueError) for result in results)
+        # 失败后下一次调用重新加载
+        with pytest.raises(ValueError):
+            await single_flight.do('key', loader)
+        assert single_flight.loads == 2
+
+
+class TestTieredCacheManager:
+    """两级缓存测试"""
+
+    @pytest.mark.asyncio
+    async def test_memory_only_without_redis(self):
+        manager = CacheManager()
+
+        await manager.set('k', {'v': 1}, ttl=30)
+        assert await manager.get('k') == {'v': 1}
+        assert await manager.exists('k')
+
+        await manager.delete('k')
+        assert await manager.get('k') is None
+
+    @pytest.mark.asyncio
+    async def test_l1_returns_copies(self):
+        """修改读取到的对象不会影响缓存内容"""
+        manager = CacheManager()
+        value = {'servers': ['a']}
+        await manager.set('k', value, ttl=30)
+        value['servers'].append('set-after')
+
+        first = await manager.get('k')
+        first['servers'].append('mutated')
+
+        assert await manager.get('k') == {'servers': ['a']}
+        assert (await manager.mget(['k']))[0] == {'servers': ['a']}
+
+    @pytest.mark.asyncio
+    async def test_exists_respects_expiry(self):
+        manager = CacheManager()
+        manager.local.set('k', '1', ttl=0.01)
+        assert await manager.exists('k')
+
+        await asyncio.sleep(0.02)
+        assert not await manager.exists('k')
+
+    @pytest.mark.asyncio
+    async def test_l2_hit_backfills_l1(self):
+        manager = CacheManager()
+        manager.redis = fakeredis.FakeRedis(decode_responses=True)
+        await manager.redis.set('cache:shared', '{"v": 2}', ex=30)
+
+        assert await manager.get('cache:shared') == {'v': 2}
+        assert 'cache:shared' in manager.local.cache
+
+        # 再次读取不访问Redis
+        await manager.redis.delete('cache:shared')
+        assert await manager.get('cache:shared') == {'v': 2}
+
+    @pytest.mark.asyncio
+    async def test_mget_reads_l1_then_l2(self):
+        manager = CacheManager()
+        manager.redis = fakeredis.FakeRedis(decode_responses=True)
+        await manager.set('a', 1, ttl=30)
+        await manager.redis.set('b', '2', ex=30)
+
+        assert await manager.mget(['a', 'b', 'c']) == [1, 2, None]
+        # L1与L2一样保存JSON
+        assert manager.local.get('b') == '2'
+
+    @pytest.mark.asyncio
+    async def test_clear_pattern_clears_both_tiers(self):
+        manager = CacheManager()
+        manager.redis = fakeredis.FakeRedis(decode_responses=True)
+        await manager.set('cache:logs:1', [1], ttl=30)
+        await manager.set('cache:user:1', [2], ttl=30)
+
+        await manager.clear_pattern('cache:logs:*')
+
+        assert await manager.get('cache:logs:1') is None
+        assert await manager.redis.get('cache:logs:1') is None
+        assert await manager.get('cache:user:1') == [2]
+
+    @pytest.mark.asyncio
+    async def test_cached_decorator_single_flight(self):
+        """并发未命中只调用一次原函数"""
+        manager = CacheManager()
+        calls = []
+
+        @manager.cached(ttl=30, key_prefix='servers')
+        async def get_server_list(account_id: int):
+            calls.append(account_id)
+            await asyncio.sleep(0.02)
+            return [f'server-{account_id}']
+
+        results = await asyncio.gather(*(get_server_list(1) for _ in range(5)))
+
+        assert results == [['server-1']] * 5
+        assert calls == [1]
+        assert await get_server_list(1) == ['server-1']
+        assert calls == [1]
+
+        stats = await manager.get_stats()
+        assert stats['single_flight']['shared'] == 4
+        assert stats['local']['size'] == 1
@@ -0,0 +1,83 @@
+"""
+异步数据库连接池测试
+"""
+import pytest
+import asyncio
+from app.database_async import AsyncDatabase
+
+
+@pytest.fixture
+async def adb(tmp_path):
+    database = AsyncDatabase(db_path=tmp_path / "test.db", pool_size=2)
+    await database.connect()
+    yield database
+    await database.disconnect()
+
+
+class TestAsyncDatabasePool:
+    """单写连接+只读连接池测试"""
+
+    @pytest.mark.asyncio
+    async def test_write_then_read(self, adb):
+        """写连接提交后只读连接可见"""
+        log_id = await adb.add_message_log(
+            'm1', 'ch1', '内容', 'text', '用户', 'discord', 'target', 'failed'
+        )
+        failed_id = await adb.add_failed_message(log_id)
+
+        log = await adb.get_message_log('m1')
+        assert log['id'] == log_id
+        assert failed_id > 0
+
+        # 重复消息ID返回已有记录
+        assert await adb.add_message_log(
+            'm1', 'ch1', '内容', 'text', '用户', 'discord', 'target', 'success'
+        ) == log_id
+
+    @pytest.mark.asyncio
+    async def test_readers_are_read_only(self, adb):
+        """只读连接拒绝写操作"""
+        with pytest.raises(Exception):
+            async with adb.reader() as conn:
+                await conn.execute("INSERT INTO system_config (key, value) VALUES ('a', 'b')")
+
+    @pytest.mark.asyncio
+    async def test_reader_pool_limits_concurrency(self, adb):
+        """同时借出的只读连接不超过池大小，超出部分等待"""
+        peak = 0
+
+        async def read():
+            nonlocal peak
+            async with adb.reader() as conn:
+                peak = max(peak, adb.pool_stats['reader']['in_use'])
+                await asyncio.sleep(0.05)
+                await conn.execute("SELECT 1")
+
+        await asyncio.gather(*[read() for _ in range(6)])
+
+        stats = adb.get_pool_stats()
+        assert peak == 2
+        assert stats['reader']['acquired'] == 6
+        assert stats['reader']['in_use'] == 0
+        assert stats['reader']['max_wait_ms'] >= 40
+
+    @pytest.mark.asyncio
+    async def test_writes_are_serialized(self, adb):
+        """并发写入全部成功且不会出现database is locked"""
+        await asyncio.gather(*[
+            adb.set_system_config(f'key{i}', str(i)) for i in range(20)
+        ])
+
+        values = await asyncio.gather(*[adb.get_system_config(f'key{i}') for i in range(20)])
+        assert values == [str(i) for i in range(20)]
+        assert adb.get_pool_stats()['writer']['acquired'] >= 20
+
+    @pytest.mark.asyncio
+    async def test_lazy_connect(self, tmp_path):
+        """未显式连接时首次使用自动建立连接"""
+        database = AsyncDatabase(db_path=tmp_path / "lazy.db", pool_size=1)
+        try:
+            assert await database.get_system_config('missing') is None
+            assert database.get_pool_stats()['connected'] is True
+        finally:
+            await database.disconnect()
@@ -0,0 +1,197 @@
+"""
+扇出转发调度器测试
+"""
+import pytest
+import asyncio
+import time
+from app.queue.fanout import FanoutDispatcher, TargetResult
+
+
+def make_mapping(mapping_id, platform, channel, bot_id=1):
+    return {
+        'id': mapping_id,
+        'target_platform': platform,
+        'target_channel_id': channel,
+        'target_bot_id': bot_id
+    }
+
+
+class TestFanoutDispatcher:
+    """扇出调度器测试"""
+
+    @pytest.mark.asyncio
+    async def test_targets_run_concurrently(self):
+        """多个目标应并发发送，总耗时接近单个目标"""
+        dispatcher = FanoutDispatcher()
+        mappings = [
+            make_mapping(1, 'discord', 'a'),
+            make_mapping(2, 'telegram', 'b'),
+            make_mapping(3, 'feishu', 'c'),
+            make_mapping(4, 'dingtalk', 'd'),
+        ]
+
+        async def send(message, mapping):
+            await asyncio.sleep(0.2)
+            return True
+
+        start = time.monotonic()
+        results = await dispatcher.dispatch({'message_id': 'm1'}, mappings, send)
+        duration = time.monotonic() - start
+
+        assert len(results) == 4
+        assert all(isinstance(r, TargetResult) and r.success for r in results)
+        assert duration < 0.5
+
+    @pytest.mark.asyncio
+    async def test_per_target_result(self):
+        """失败和异常只影响对应目标"""
+        dispatcher = FanoutDispatcher()
+        mappings = [
+            make_mapping(1, 'discord', 'ok'),
+            make_mapping(2, 'discord', 'fail'),
+            make_mapping(3, 'telegram', 'boom'),
+        ]
+
+        async def send(message, mapping):
+            if mapping['target_channel_id'] == 'fail':
+                return False
+            if mapping['target_channel_id'] == 'boom':
+                raise RuntimeError("network down")
+            return True
+
+        results = await dispatcher.dispatch({'message_id': 'm1'}, mappings, send)
+
+        assert [r.mapping_id for r in results] == [1, 2, 3]
+        assert [r.success for r in results] == [True, False, False]
+        assert results[2].error == "network down"
+        assert dispatcher.stats['success'] == 1
+        assert dispatcher.stats['failed'] == 2
+
+    @pytest.mark.asyncio
+    async def test_platform_concurrency_limit(self):
+        """同一平台并发数不超过上限"""
+        dispatcher = FanoutDispatcher(platform_concurrency=2, bot_concurrency=10)
+        mappings = [make_mapping(i, 'discord', f'ch{i}', bot_id=i) for i in range(6)]
+
+        active = 0
+        peak = 0
+
+        async def send(message, mapping):
+            nonlocal active, peak
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.05)
+            active -= 1
+            return True
+
+        await dispatcher.dispatch({'message_id': 'm1'}, mappings, send)
+
+        assert peak == 2
+
+    @pytest.mark.asyncio
+    async def test_bot_concurrency_limit(self):
+        """同一Bot并发数不超过上限"""
+        dispatcher = FanoutDispatcher(platform_concurrency=10, bot_concurrency=1)
+        mappings = [make_mapping(i, 'telegram', f'ch{i}', bot_id=7) for i in range(4)]
+
+        active = 0
+        peak = 0
+
+        async def send(message, mapping):
+            nonlocal active, peak
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.02)
+            active -= 1
+            return True
+
+        await dispatcher.dispatch({'message_id': 'm1'}, mappings, send)
+
+        assert peak == 1
+
+    @pytest.mark.asyncio
+    async def test_order_within_target_channel(self):
+        """同一目标频道内按消息到达顺序投递"""
+        dispatcher = FanoutDispatcher()
+        mapping = make_mapping(1, 'discord', 'same')
+        delivered = []
+
+        async def send(message, mapping):
+            # 先到的消息更慢，若不保序则顺序会颠倒
+            await asyncio.sleep(0.05 if message['message_id'] == 'm0' else 0.001)
+            delivered.append(message['message_id'])
+            return True
+
+        await asyncio.gather(*[
+            dispatcher.dispatch({'message_id': f'm{i}'}, [mapping], send)
+            for i in range(5)
+        ])
+
+        assert delivered == [f'm{i}' for i in range(5)]
+        # 没有等待者后锁对象被回收
+        assert dispatcher.get_stats()['active_channels'] == 0
+
+    @pytest.mark.asyncio
+    async def test_reserved_order_survives_slow_media(self):
+        """出队时领取票据：先出队的消息路由或媒体处理慢，同频道内仍然先投递"""
+        dispatcher = FanoutDispatcher()
+        mapping = make_mapping(1, 'discord', 'same')
+        delivered = []
+
+        async def send(message, mapping):
+            delivered.append(message['message_id'])
+            return True
+
+        async def process(message_id, ticket, route_delay=0, media_delay=0, filtered=False):
+            try:
+                await asyncio.sleep(route_delay)
+                if filtered:
+                    return
+                await dispatcher.claim(ticket, [mapping])
+                await asyncio.sleep(media_delay)
+                await dispatcher.dispatch({'message_id': message_id}, [mapping], send, ticket=ticket)
+            finally:
+                await dispatcher.release(ticket)
+
+        tickets = [dispatcher.reserve() for _ in range(4)]
+        await asyncio.gather(
+            process('m0', tickets[0], route_delay=0.03),
+            process('m1', tickets[1], media_delay=0.05),
+            process('m2', tickets[2], filtered=True),
+            process('m3', tickets[3]),
+        )
+
+        assert delivered == ['m0', 'm1', 'm3']
+        assert dispatcher.get_stats()['active_channels'] == 0
+
+    @pytest.mark.asyncio
+    async def test_release_frees_unused_slots(self):
+        """预留了位置但没有投递（如媒体处理异常）时释放，后面的消息不被卡住"""
+        dispatcher = FanoutDispatcher()
+        mapping = make_mapping(1, 'discord', 'same')
+        first, second = dispatcher.reserve(), dispatcher.reserve()
+
+        await dispatcher.claim(first, [mapping])
+        await dispatcher.claim(second, [mapping])
+        await dispatcher.release(first)
+
+        async def send(message, mapping):
+            return True
+
+        results = await asyncio.wait_for(
+            dispatcher.dispatch({'message_id': 'm1'}, [mapping], send, ticket=second), timeout=1
+        )
+        await dispatcher.release(second)
+
+        assert results[0].success
+        assert dispatcher.get_stats()['active_channels'] == 0
+
+    @pytest.mark.asyncio
+    async def test_empty_mappings(self):
+        """没有映射时直接返回空结果"""
+        dispatcher = FanoutDispatcher()
+
+        async def send(message, mapping):
+            return True
+
+        assert await dispatcher.dispatch({'message_id': 'm1'}, [], send) == []
@@ -63,6 +63,205 @@ class TestFormatter:
         assert "公告频道" in result
 
 
+class TestKMarkdownParser:
+    """KMarkdown单遍解析与各平台渲染测试"""
+    
+    def test_parse_once_for_all_platforms(self):
+        """同一条消息发往多个平台只解析一次"""
+        from app.processors.kmarkdown import parse
+        
+        text = "解析缓存测试 **粗体** (emj)开心(emj)"
+        parse.cache_clear()
+        
+        formatter.kmarkdown_to_discord(text)
+        formatter.kmarkdown_to_telegram_html(text)
+        formatter.kmarkdown_to_feishu_text(text)
+        formatter.kmarkdown_to_plain_text(text)
+        formatter.kmarkdown_to_telegram_html(text)
+        
+        assert parse.cache_info().misses == 1
+        assert formatter.get_cache_stats()['render']['hits'] >= 1
+    
+    def test_nested_formatting(self):
+        assert formatter.kmarkdown_to_telegram_html("**粗 *斜* 体**") == "<b>粗 <i>斜</i> 体</b>"
+        assert formatter.kmarkdown_to_telegram_html("***粗斜***") == "<b><i>粗斜</i></b>"
+        assert formatter.kmarkdown_to_discord("***粗斜***") == "***粗斜***"
+    
+    def test_telegram_escapes_html(self):
+        result = formatter.kmarkdown_to_telegram_html('<script>a & b</script> **x**')
+        assert result == '&lt;script&gt;a &amp; b&lt;/script&gt; <b>x</b>'
+        
+        result = formatter.kmarkdown_to_telegram_html('[链接](https://a.com/?x=1&y="2")')
+        assert result == '<a href="https://a.com/?x=1&amp;y=&quot;2&quot;">链接</a>'
+    
+    def test_code_is_not_formatted(self):
+        assert formatter.kmarkdown_to_telegram_html("`a **b** <c>`") == "<code>a **b** &lt;c&gt;</code>"
+        assert formatter.kmarkdown_to_telegram_html("```python\nx = 1 * 2 * 3\n```") == (
+            '<pre><code class="language-python">x = 1 * 2 * 3</code></pre>'
+        )
+    
+    def test_untagged_code_block_keeps_first_line(self):
+        """第一行不是简短标识符时是代码而不是语言标记"""
+        text = "```print(1)\nprint(2)```"
+        assert formatter.kmarkdown_to_telegram_html(text) == "<pre>print(1)\nprint(2)</pre>"
+        assert formatter.kmarkdown_to_plain_text(text) == "print(1)\nprint(2)"
+        assert formatter.kmarkdown_to_discord(text) == text
+    
+    def test_unclosed_markers_kept(self):
+        for text in ["a * b", "**未闭合", "[不是链接] (x)", "~单~", "****", "**跨\n行**"]:
+            assert formatter.kmarkdown_to_discord(text) == text
+            assert formatter.kmarkdown_to_telegram_html(text) == text
+    
+    def test_escaped_markers(self):
+        assert formatter.kmarkdown_to_telegram_html("\\*不是斜体\\*") == "*不是斜体*"
+        assert formatter.kmarkdown_to_discord("\\*不是斜体\\*") == "\\*不是斜体\\*"
+    
+    def test_kook_specific_markers(self):
+        text = "(ins)下划线(ins) (spl)剧透(spl) (emj)开心(emj)[1234/abc]"
+        
+        assert formatter.kmarkdown_to_discord(text) == "__下划线__ ||剧透|| 😊"
+        assert formatter.kmarkdown_to_telegram_html(text) == "<u>下划线</u> <tg-spoiler>剧透</tg-spoiler> 😊"
+        assert formatter.kmarkdown_to_plain_text(text) == "下划线 剧透 😊"
+    
+    def test_plain_text(self):
+        text = "**公告** 详见[文档](https://a.com) ~~旧~~ `cmd`"
+        assert formatter.kmarkdown_to_plain_text(text) == "公告 详见文档 (https://a.com) 旧 cmd"
+    
+    def test_markdown_round_trip(self):
+        """Markdown平台原样保留KMarkdown的通用格式"""
+        text = "**粗体** *斜体* ~~删除~~ `代码` [链接](https://a.com) 2*3=6 \\_x\\_"
+        assert formatter.kmarkdown_to_markdown(text) == text
+
+
+class TestMessageSplit:
+    """按平台长度单位、感知格式的消息分段测试"""
+    
+    def test_short_message_single_chunk(self):
+        assert formatter.split_message("**短消息**", 'telegram', 4096, prefix="<b>A</b>: ") == [
+            "<b>A</b>: <b>短消息</b>"
+        ]
+    
+    def test_chunks_within_limit(self):
+        text = "第一句话比较长。第二句，带逗号；还有分号！" * 500
+        for platform, limit in [('discord', 2000), ('telegram', 4096), ('feishu', 5000), ('text', 2048)]:
+            chunks = formatter.split_message(text, platform, limit)
+            assert len(chunks) > 1
+            assert all(formatter.message_length(chunk, platform) <= limit for chunk in chunks)
+            # 优先在句子边界断开
+            assert all(chunk.endswith(("！", "。")) for chunk in chunks[:-1])
+    
+    def test_telegram_chunks_are_valid_html(self):
+        """每段都是完整的HTML，跨段的粗体在下一段重新打开"""
+        from html.parser import HTMLParser
+        
+        class TagChecker(HTMLParser):
+            def __init__(self):
+                super().__init__()
+                self.stack = []
+            
+            def handle_starttag(self, tag, attrs):
+                self.stack.append(tag)
+            
+            def handle_endtag(self, tag):
+                assert self.stack and self.stack.pop() == tag
+        
+        text = "**" + "粗体里的很长一句话，" * 600 + "**" + " [链接](https://a.com/?x=1&y=2) <tag>" * 100
+        chunks = formatter.split_message(text, 'telegram', 4096)
+        
+        assert len(chunks) > 1
+        for chunk in chunks:
+            checker = TagChecker()
+            checker.feed(chunk)
+            assert checker.stack == []
+        assert chunks[1].startswith("<b>")
+        assert all('href' not in chunk or chunk.count('<a ') == chunk.count('</a>') for chunk in chunks)
+    
+    def test_telegram_length_in_utf16(self):
+        """Telegram按UTF-16计算，emoji占2个单位，标签和实体不计入"""
+        assert formatter.message_length("<b>😀</b>&amp;", 'telegram') == 3
+        
+        chunks = formatter.split_message("😀 " * 3000, 'telegram', 4096)
+        assert len(chunks) == 3
+        assert all(formatter.message_length(chunk, 'telegram') <= 4096 for chunk in chunks)
+    
+    def test_code_block_not_broken(self):
+        code = "```python\n" + "x = 1\n" * 100 + "```"
+        text = "说明文字。" * 300 + code + "结尾。"
+        chunks = formatter.split_message(text, 'discord', 2000)
+        
+        blocks = [chunk for chunk in chunks if "```" in chunk]
+        assert len(blocks) == 1
+        assert blocks[0].count("```") == 2
+        assert "x = 1\n" * 100 in blocks[0]
+    
+    def test_long_code_block_chunks_within_limit(self):
+        """超长代码块按单段长度拆开，语言标记放不下时去掉"""
+        code = "```" + "token_without_spaces" * 2 + "\n" + "x = 1\n" * 1000 + "```"
+        chunks = formatter.split_message(code, 'discord', 2000)
+        assert 1 < len(chunks) < 10
+        assert all(len(chunk) <= 2000 for chunk in chunks)
+        assert chunks[0].startswith("```\ntoken_without_spaces")
+        assert sum("token_without_spaces" in chunk for chunk in chunks) == 1
+        
+        code = "```python\n" + "x = 1\n" * 10 + "```"
+        for limit in (14, 5):
+            chunks = formatter.split_message(code, 'discord', limit)
+            assert all(len(chunk) <= limit for chunk in chunks)
+            assert "python" not in "".join(chunks)
+    
+    def test_prefix_and_suffix(self):
+        text = "内容。" * 1000
+        chunks = formatter.split_message(text, 'feishu', 1000, prefix="发送者: ", suffix="\n附件")
+        
+        assert chunks[0].startswith("发送者: ")
+        assert chunks[-1].endswith("\n附件")
+        assert all(len(chunk) <= 1000 for chunk in chunks)
+    
+    def test_split_long_message_plain(self):
+        chunks = formatter.split_long_message("word " * 3000, max_length=2000)
+        assert all(len(chunk) <= 2000 for chunk in chunks)
+        assert " ".join(chunks).split() == ["word"] * 3000
+        
+        # 没有断点时强制截断
+        assert formatter.split_long_message("a" * 5000, max_length=2000) == ["a" * 2000, "a" * 2000, "a" * 1000]
+    
+    def test_split_is_fast(self):
+        import time
+        
+        text = "**粗体** 普通文字，`code` [链接](https://a.com) 😀。\n" * 400
+        
+        start = time.time()
+        for platform, limit in [('discord', 2000), ('telegram', 4096), ('feishu', 5000)]:
+            formatter.split_message(text, platform, limit)
+        elapsed = time.time() - start
+        
+        # 单遍线性分段，2万字符在各平台上的分段都应很快完成
+        assert elapsed < 0.5
+
+
+class TestTelegramCallers:
+    """绕过Worker格式化直接发送到Telegram的调用方"""
+    
+    @pytest.mark.asyncio
+    async def test_send_to_platform_converts_kmarkdown(self, monkeypatch):
+        """WorkerP0增强直接发送的KMarkdown在发送前转换为HTML"""
+        from app.queue import worker_enhanced_p0
+        from app.queue.worker_enhanced_p0 import WorkerP0Enhancements
+        
+        sent = []
+        
+        async def fake_send(token, chat_id, content, parse_mode="HTML"):
+            sent.append(content)
+            return True
+        
+        monkeypatch.setattr(worker_enhanced_p0.telegram_forwarder, 'send_message', fake_send)
+        
+        assert await WorkerP0Enhancements._send_to_platform(
+            'telegram', {'config': {'token': 't', 'chat_id': '1'}}, "**表情反应：**\n👍 <A&B> (1)", {}
+        )
+        assert sent == ["<b>表情反应：</b>\n👍 &lt;A&amp;B&gt; (1)"]
+
+
 class TestEmojiMapping:
     """Emoji映射测试"""
     
@@ -5,6 +5,7 @@ import pytest
 from app.forwarders.discord import DiscordForwarder
 from app.forwarders.telegram import TelegramForwarder
 from app.forwarders.feishu import FeishuForwarder
+from app.utils.http_client import http_client_manager
 
 
 class TestDiscordForwarder:
@@ -187,6 +188,164 @@ class TestFeishuForwarder:
         assert isinstance(card['elements'], list)
 
 
+class TestDiscordWebhookClient:
+    """Discord异步Webhook客户端测试（本地模拟服务器）"""
+    
+    @staticmethod
+    async def _start_server(handler):
+        from aiohttp import web
+        from aiohttp.test_utils import TestServer
+        
+        app = web.Application()
+        app.router.add_post('/api/webhooks/1/token', handler)
+        server = TestServer(app)
+        await server.start_server()
+        return server
+    
+    @pytest.mark.asyncio
+    async def test_retry_after_429(self):
+        """429限流后按retry_after等待并重试"""
+        from aiohttp import web
+        from app.forwarders.discord import DiscordWebhookClient
+        
+        calls = []
+        
+        async def handler(request):
+            calls.append(await request.json())
+            if len(calls) == 1:
+                return web.json_response(
+                    {'message': 'rate limited', 'retry_after': 0.05, 'global': False},
+                    status=429
+                )
+            return web.json_response({'id': '1'}, headers={
+                'X-RateLimit-Limit': '5',
+                'X-RateLimit-Remaining': '4',
+                'X-RateLimit-Reset-After': '1.5',
+                'X-RateLimit-Bucket': 'abc'
+            })
+        
+        server = await self._start_server(handler)
+        client = DiscordWebhookClient()
+        try:
+            webhook_url = str(server.make_url('/api/webhooks/1/token'))
+            status, _ = await client.execute(webhook_url, {'content': 'hi'})
+            
+            assert status == 200
+            assert len(calls) == 2
+            assert calls[0]['content'] == 'hi'
+            assert client.stats['rate_limited'] == 1
+            assert client.buckets[webhook_url]['remaining'] == 4
+            assert client.buckets[webhook_url]['bucket'] == 'abc'
+        finally:
+            await http_client_manager.close()
+            await server.close()
+    
+    @pytest.mark.asyncio
+    async def test_preemptive_wait_when_bucket_exhausted(self):
+        """桶额度耗尽时在发送前等待重置"""
+        import time
+        from aiohttp import web
+        from app.forwarders.discord import DiscordWebhookClient
+        
+        async def handler(request):
+            return web.Response(status=204, headers={
+                'X-RateLimit-Limit': '5',
+                'X-RateLimit-Remaining': '0',
+                'X-RateLimit-Reset-After': '0.2'
+            })
+        
+        server = await self._start_server(handler)
+        client = DiscordWebhookClient()
+        try:
+            webhook_url = str(server.make_url('/api/webhooks/1/token'))
+            await client.execute(webhook_url, {'content': 'a'})
+            
+            start = time.monotonic()
+            status, _ = await client.execute(webhook_url, {'content': 'b'})
+            
+            assert status == 204
+            assert time.monotonic() - start >= 0.15
+            assert client.stats['preemptive_waits'] == 1
+        finally:
+            await http_client_manager.close()
+            await server.close()
+    
+    @pytest.mark.asyncio
+    async def test_learned_bucket_shared_between_clients(self):
+        """同一bucket的Webhook共享学到的额度，不同客户端（转发器）看到同一份状态"""
+        import time
+        from aiohttp import web
+        from aiohttp.test_utils import TestServer
+        from app.forwarders.discord import DiscordWebhookClient
+
+        async def handler(request):
+            return web.Response(status=204, headers={
+                'X-RateLimit-Limit': '5',
+                'X-RateLimit-Remaining': '0' if request.match_info['id'] == '2' else '3',
+                'X-RateLimit-Reset-After': '0.2',
+                'X-RateLimit-Bucket': 'shared-bucket'
+            })
+
+        app = web.Application()
+        app.router.add_post('/api/webhooks/{id}/token', handler)
+        server = TestServer(app)
+        await server.start_server()
+        first, second = DiscordWebhookClient(), DiscordWebhookClient()
+        try:
+            url_a = str(server.make_url('/api/webhooks/1/token'))
+            url_b = str(server.make_url('/api/webhooks/2/token'))
+            await first.execute(url_a, {'content': 'a'})
+            await second.execute(url_b, {'content': 'b'})
+
+            # url_b的响应耗尽了共享bucket，url_a的下一次发送提前等待
+            start = time.monotonic()
+            status, _ = await first.execute(url_a, {'content': 'c'})
+
+            assert status == 204
+            assert time.monotonic() - start >= 0.15
+            assert first.limiter is second.limiter
+        finally:
+            await http_client_manager.close()
+            await server.close()
+
+    @pytest.mark.asyncio
+    async def test_multipart_upload(self):
+        """附件以multipart方式上传"""
+        import json
+        from aiohttp import web
+        from app.forwarders.discord import DiscordForwarder, DiscordWebhookClient
+        
+        received = {}
+        
+        async def handler(request):
+            data = await request.post()
+            payload = data['payload_json']
+            if hasattr(payload, 'file'):
+                payload = payload.file.read()
+            received['payload'] = json.loads(payload)
+            received['file'] = data['files[0]'].file.read()
+            received['filename'] = data['files[0]'].filename
+            return web.json_response({'id': '1'})
+        
+        server = await self._start_server(handler)
+        client = DiscordWebhookClient()
+        forwarder = DiscordForwarder(client=client)
+        try:
+            webhook_url = str(server.make_url('/api/webhooks/1/token'))
+            success = await forwarder.send_image_direct(
+                webhook_url, 'https://img.kookapp.cn/a/test.png',
+                content='图片', image_data=b'PNGDATA'
+            )
+            
+            assert success is True
+            assert received['file'] == b'PNGDATA'
+            assert received['filename'] == 'test.png'
+            assert received['payload']['content'] == '图片'
+        finally:
+            await http_client_manager.close()
+            await server.close()
+
+
 class TestForwarderRateLimiting:
     """转发器限流测试"""
     
@@ -0,0 +1,115 @@
+"""
+全局HTTP连接池测试
+"""
+import pytest
+import asyncio
+import aiohttp
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from app.utils.http_client import HttpClientManager
+
+
+@pytest.fixture
+async def local_server():
+    """本地HTTP服务器"""
+    async def handler(request):
+        return web.Response(text="ok")
+    
+    app = web.Application()
+    app.router.add_get('/ping', handler)
+    server = TestServer(app)
+    await server.start_server()
+    yield server
+    await server.close()
+
+
+class TestHttpClientManager:
+    """HTTP客户端管理器测试"""
+    
+    @pytest.mark.asyncio
+    async def test_connections_are_reused(self, local_server):
+        """同一主机的连续请求复用keep-alive连接"""
+        manager = HttpClientManager()
+        try:
+            session = await manager.get_session()
+            for _ in range(5):
+                async with session.get(local_server.make_url('/ping')) as resp:
+                    assert await resp.text() == "ok"
+            
+            stats = manager.get_stats()
+            assert stats['requests'] == 5
+            assert stats['connections_created'] == 1
+            assert stats['connections_reused'] == 4
+            assert stats['idle_connections'] == 1
+            assert stats['in_use_connections'] == 0
+        finally:
+            await manager.close()
+    
+    @pytest.mark.asyncio
+    async def test_named_sessions_share_connector(self, local_server):
+        """不同用途的会话共享连接器，超时配置各自独立"""
+        manager = HttpClientManager()
+        try:
+            default = await manager.get_session('default')
+            download = await manager.get_session('download')
+            
+            assert default is not download
+            assert default.connector is download.connector
+            assert default.timeout.total == manager.timeouts['default']
+            assert download.timeout.total == manager.timeouts['download']
+            assert await manager.get_session('default') is default
+            
+            async with default.get(local_server.make_url('/ping')):
+                pass
+            async with download.get(local_server.make_url('/ping')):
+                pass
+            
+            assert manager.get_stats()['connections_reused'] == 1
+        finally:
+            await manager.close()
+    
+    @pytest.mark.asyncio
+    async def test_close_releases_everything(self):
+        """关闭后会话和连接器均已释放"""
+        manager = HttpClientManager()
+        session = await manager.get_session()
+        
+        await manager.close()
+        
+        assert session.closed
+        assert manager.get_stats()['open_connections'] == 0
+        assert manager.get_stats()['sessions'] == []
+    
+    @pytest.mark.asyncio
+    async def test_download_sessions_do_not_keep_cookies(self):
+        """下载/预览会话不保存响应Cookie，默认会话照常保存"""
+        manager = HttpClientManager()
+        try:
+            default = await manager.get_session('default')
+            download = await manager.get_session('download')
+            preview = await manager.get_session('preview')
+            
+            assert not isinstance(default.cookie_jar, aiohttp.DummyCookieJar)
+            assert isinstance(download.cookie_jar, aiohttp.DummyCookieJar)
+            assert isinstance(preview.cookie_jar, aiohttp.DummyCookieJar)
+        finally:
+            await manager.close()
+    
+    def test_old_loop_sessions_closed(self):
+        """事件循环变化时关闭旧循环上的会话后重建"""
+        manager = HttpClientManager()
+        
+        old = asyncio.run(manager.get_session('download'))
+        
+        async def on_new_loop():
+            try:
+                session = await manager.get_session('download')
+                assert session is not old
+                assert session.connector is not old.connector
+                return session
+            finally:
+                await manager.close()
+        
+        asyncio.run(on_new_loop())
+        
+        assert old.closed
@@ -0,0 +1,134 @@
+"""
+链接预览（缓存、流式抓取）测试
+"""
+import pytest
+import asyncio
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from app.config import settings
+from app.processors import link_preview as link_preview_module
+from app.processors.link_preview import LinkPreviewGenerator
+from app.utils.http_client import HttpClientManager
+
+
+HEAD = (
+    '<html><head><title>普通标题</title>'
+    '<meta property="og:title" content="预览标题">'
+    '<meta property="og:image" content="/cover.png"></head>'
+)
+
+
+@pytest.fixture
+async def preview_server(monkeypatch):
+    """本地页面服务器（记录每个路径的请求次数）"""
+    hits = {}
+
+    async def page(request):
+        hits[request.path] = hits.get(request.path, 0) + 1
+        await asyncio.sleep(0.02)
+        return web.Response(text=HEAD + '<body>内容</body></html>', content_type='text/html')
+
+    async def large(request):
+        hits[request.path] = hits.get(request.path, 0) + 1
+        response = web.StreamResponse(headers={'Content-Type': 'text/html; charset=utf-8'})
+        await response.prepare(request)
+        if request.path == '/large':
+            await response.write(HEAD.encode())
+        try:
+            for _ in range(200):
+                await response.write(b'<p>' + b'x' * 8192 + b'</p>')
+        except Exception:
+            pass  # 客户端读完<head>后断开
+        return response
+
+    async def missing(request):
+        hits[request.path] = hits.get(request.path, 0) + 1
+        return web.Response(status=404)
+
+    app = web.Application()
+    app.router.add_get('/page', page)
+    app.router.add_get('/large', large)
+    app.router.add_get('/no-head', large)
+    app.router.add_get('/missing', missing)
+    server = TestServer(app)
+    await server.start_server()
+
+    manager = HttpClientManager()
+    monkeypatch.setattr(link_preview_module, 'http_client_manager', manager)
+    server.hits = hits
+    try:
+        yield server
+    finally:
+        await manager.close()
+        await server.close()
+
+
+class TestLinkPreview:
+    """链接预览测试"""
+
+    @pytest.mark.asyncio
+    async def test_preview_cached_by_url(self, preview_server):
+        generator = LinkPreviewGenerator()
+        url = str(preview_server.make_url('/page'))
+
+        preview = await generator.get_preview(url)
+        assert preview['title'] == '预览标题'
+        assert preview['image'] == str(preview_server.make_url('/cover.png'))
+
+        assert await generator.get_preview(url) == preview
+        assert preview_server.hits['/page'] == 1
+
+    @pytest.mark.asyncio
+    async def test_concurrent_requests_fetch_once(self, preview_server):
+        generator = LinkPreviewGenerator()
+        url = str(preview_server.make_url('/page'))
+
+        results = await asyncio.gather(*(generator.get_preview(url) for _ in range(5)))
+
+        assert all(result['title'] == '预览标题' for result in results)
+        assert preview_server.hits['/page'] == 1
+
+    @pytest.mark.asyncio
+    async def test_negative_cache(self, preview_server):
+        """没有预览的URL也缓存，短时间内不再抓取"""
+        generator = LinkPreviewGenerator()
+        url = str(preview_server.make_url('/missing'))
+
+        assert await generator.get_preview(url) is None
+        assert await generator.get_preview(url) is None
+        assert preview_server.hits['/missing'] == 1
+        assert generator.is_cached(url)
+        assert generator.get_cached_preview(url) is None
+
+    @pytest.mark.asyncio
+    async def test_reads_only_head(self, preview_server):
+        """读到</head>即停止，不下载正文"""
+        generator = LinkPreviewGenerator()
+
+        html = await generator._fetch_html(str(preview_server.make_url('/large')))
+
+        assert html == HEAD
+
+    @pytest.mark.asyncio
+    async def test_read_capped_by_max_bytes(self, preview_server, monkeypatch):
+        """没有</head>的页面最多读取 link_preview_max_bytes 字节"""
+        monkeypatch.setattr(settings, 'link_preview_max_bytes', 20000)
+        generator = LinkPreviewGenerator()
+
+        html = await generator._fetch_html(str(preview_server.make_url('/no-head')))
+
+        assert len(html) == 20000
+
+    @pytest.mark.asyncio
+    async def test_process_message_links(self, preview_server):
+        generator = LinkPreviewGenerator()
+        page = str(preview_server.make_url('/page'))
+        missing = str(preview_server.make_url('/missing'))
+
+        previews = await generator.process_message_links(f"看看 {page} 和 {missing}")
+        assert [p['title'] for p in previews] == ['预览标题']
+
+        # 两个URL都已缓存（包括负缓存）
+        cached, pending = generator.get_cached_message_links(f"{page} {missing} http://example.invalid/x")
+        assert [p['title'] for p in cached] == ['预览标题']
+        assert pending == ['http://example.invalid/x']
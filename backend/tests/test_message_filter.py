@@ -0,0 +1,281 @@
+"""
+消息过滤器（编译后的规则匹配）测试
+"""
+import pytest
+from app.utils.aho_corasick import AhoCorasick
+from app.processors.filter import (
+    KeywordMatcher, CompiledFilterRules, FilterDecisionTable, MessageFilter, parse_scope
+)
+
+
+def make_rules(**overrides):
+    rules = {
+        'keyword_blacklist': [],
+        'keyword_whitelist': [],
+        'user_blacklist': [],
+        'user_whitelist': [],
+        'message_types': [],
+        'mention_all_only': False
+    }
+    rules.update(overrides)
+    return rules
+
+
+class TestAhoCorasick:
+    """多模式匹配自动机测试"""
+
+    def test_finds_all_overlapping_matches(self):
+        """重叠和嵌套的关键词都能找到"""
+        automaton = AhoCorasick(['he', 'she', 'his', 'hers'])
+        matches = [(start, end, pattern) for start, end, pattern, _ in automaton.iter_matches('ushers')]
+
+        assert matches == [(1, 4, 'she'), (2, 4, 'he'), (2, 6, 'hers')]
+
+    def test_find_first_returns_value(self):
+        """命中时返回关键词附带的值"""
+        automaton = AhoCorasick()
+        automaton.add('广告', value='rule-1')
+        automaton.add('代练', value='rule-2')
+
+        assert automaton.find_first('找代练，不是广告') == (1, 3, '代练', 'rule-2')
+        assert automaton.find_first('正常消息') is None
+        assert len(automaton) == 2
+
+    def test_add_after_build(self):
+        """匹配后继续添加关键词会重新构建"""
+        automaton = AhoCorasick(['abc'])
+        assert automaton.find_first('xbcd') is None
+
+        automaton.add('bcd')
+        assert automaton.find_first('xbcd')[2] == 'bcd'
+
+    def test_remove(self):
+        """移除关键词后不再命中，共享前缀的关键词不受影响"""
+        automaton = AhoCorasick(['代练', '代练群', '外挂'])
+
+        assert automaton.remove('代练')
+        assert not automaton.remove('代练')
+        assert not automaton.remove('不存在')
+        assert '代练' not in automaton
+        assert '代练群' in automaton
+        assert len(automaton) == 2
+
+        matches = [pattern for _, _, pattern, _ in automaton.iter_matches('加代练群买外挂，代练')]
+        assert matches == ['代练群', '外挂']
+
+
+class TestKeywordMatcher:
+    """关键词匹配器测试"""
+
+    def test_literal_keywords_case_insensitive(self):
+        """普通关键词不区分大小写"""
+        matcher = KeywordMatcher(['广告', 'SPAM'])
+
+        assert matcher.match('this is spam') == 'SPAM'
+        assert matcher.match('这是一条广告') == '广告'
+        assert matcher.match('正常消息') is None
+        assert len(matcher.literals) == 2
+        assert matcher.regex is None
+
+    def test_regex_keywords_report_rule(self):
+        """正则关键词合并为一个表达式，并报告命中的是哪一条"""
+        matcher = KeywordMatcher([r'\d{11}', r'v[x]?信', '代练'])
+
+        assert matcher.regex is not None
+        assert matcher.match('加我V信') == r'v[x]?信'
+        assert matcher.match('电话13800138000') == r'\d{11}'
+        assert matcher.match('代练上分') == '代练'
+
+    def test_invalid_regex_treated_as_literal(self):
+        """无效的正则按普通字符串匹配"""
+        matcher = KeywordMatcher(['[限时', 'a(b'])
+
+        assert matcher.match('【通知】[限时活动') == '[限时'
+        assert matcher.match('A(B') == 'a(b'
+        assert matcher.regex_keywords == []
+
+    def test_uncombinable_regex_falls_back(self):
+        """含反向引用的正则不合并，逐个匹配"""
+        matcher = KeywordMatcher([r'(\w)\1{3}', r'x+y'])
+
+        assert matcher.regex_keywords == ['x+y']
+        assert [keyword for keyword, _ in matcher.regex_list] == [r'(\w)\1{3}']
+        assert matcher.match('aaaa') == r'(\w)\1{3}'
+        assert matcher.match('xxy') == 'x+y'
+
+    def test_backreference_keeps_its_own_group(self):
+        """合并会让分组重新编号，反向引用不能指向别的正则的分组"""
+        matcher = KeywordMatcher(['(a)x', r'(b)\1', r'(?P<d>c)(?P=d)', '(?i)Q+'])
+
+        assert matcher.match('bb') == r'(b)\1'
+        assert matcher.match('cc') == r'(?P<d>c)(?P=d)'
+        assert matcher.match('qq') == '(?i)Q+'
+        assert matcher.match('ax') == '(a)x'
+        assert matcher.match('ab') is None
+        assert matcher.regex_keywords == ['(a)x']
+
+    def test_empty_keyword_matches_everything(self):
+        """空关键词与原实现一致：匹配任意内容"""
+        assert KeywordMatcher(['']).match('任意内容') == ''
+
+
+class TestCompiledFilterRules:
+    """编译后的过滤规则测试"""
+
+    def test_keyword_blacklist(self):
+        compiled = CompiledFilterRules(make_rules(keyword_blacklist=['广告', '代练']))
+
+        forward, reason, rule = compiled.evaluate({'content': '这是一条广告消息'})
+        assert forward is False
+        assert reason == '包含黑名单关键词: 广告'
+        assert rule == ('keyword_blacklist', '广告')
+
+        assert compiled.evaluate({'content': '正常消息'}) == (True, '通过所有过滤规则', None)
+
+    def test_keyword_whitelist(self):
+        compiled = CompiledFilterRules(make_rules(keyword_whitelist=['公告']))
+
+        assert compiled.evaluate({'content': '重要公告'})[0] is True
+        assert compiled.evaluate({'content': '闲聊'})[2] == ('keyword_whitelist', None)
+
+    def test_user_lists(self):
+        compiled = CompiledFilterRules(make_rules(user_blacklist=['spammer', 'u42']))
+
+        assert compiled.evaluate({'sender_id': 'u42', 'sender_name': '某人'})[2] == ('user_blacklist', 'u42')
+        assert compiled.evaluate({'sender_id': 'u1', 'sender_name': 'spammer'})[0] is False
+        assert compiled.evaluate({'sender_id': 'u1', 'sender_name': '正常用户'})[0] is True
+
+        compiled = CompiledFilterRules(make_rules(user_whitelist=['admin']))
+        assert compiled.evaluate({'sender_id': 'u1', 'sender_name': 'admin'})[0] is True
+        assert compiled.evaluate({'sender_id': 'u1', 'sender_name': 'guest'})[0] is False
+
+    def test_message_type_and_mention_all(self):
+        compiled = CompiledFilterRules(make_rules(message_types=['text'], mention_all_only=True))
+
+        assert compiled.evaluate({'message_type': 'image', 'mention_all': True})[2] == ('message_type', 'image')
+        assert compiled.evaluate({'message_type': 'text'})[2] == ('mention_all_only', True)
+        assert compiled.evaluate({'message_type': 'text', 'mention_all': True})[0] is True
+
+
+class TestFilterDecisionTable:
+    """作用域规则决策表测试"""
+
+    def test_parse_scope(self):
+        assert parse_scope('global') == ('global', None)
+        assert parse_scope(None) == ('global', None)
+        assert parse_scope('server:s1') == ('server', 's1')
+        assert parse_scope('mapping:7') == ('mapping', '7')
+        assert parse_scope('1234567') == ('channel', '1234567')  # 旧写法
+
+    def test_server_and_channel_scopes(self):
+        """服务器/频道规则只作用于对应的消息"""
+        table = FilterDecisionTable({
+            ('server', 's1'): make_rules(keyword_blacklist=['广告']),
+            ('channel', 'c2'): make_rules(message_types=['text']),
+        })
+
+        forward, reason, rule = table.evaluate_message(
+            {'server_id': 's1', 'channel_id': 'c1', 'content': '广告'}
+        )
+        assert forward is False
+        assert reason == '[服务器 s1] 包含黑名单关键词: 广告'
+        assert rule == ('keyword_blacklist', '广告')
+
+        assert table.evaluate_message({'server_id': 's2', 'channel_id': 'c1', 'content': '广告'})[0] is True
+        assert table.evaluate_message({'server_id': 's2', 'channel_id': 'c2', 'message_type': 'image'})[0] is False
+
+    def test_select_routes_by_mapping(self):
+        """映射级规则决定消息发往哪些目标"""
+        table = FilterDecisionTable({
+            ('global', None): make_rules(user_blacklist=['spammer']),
+            ('mapping', '1'): make_rules(keyword_whitelist=['公告']),
+            ('mapping', '2'): make_rules(message_types=['text']),
+        })
+        routes = [{'id': 1}, {'id': 2}, {'id': 3}]
+
+        allowed, rejected = table.select_routes({'content': '闲聊', 'message_type': 'text'}, routes)
+        assert [r['id'] for r in allowed] == [2, 3]
+        assert [(r['id'], reason) for r, reason in rejected] == [(1, '[映射 1] 不包含白名单关键词')]
+
+        allowed, _ = table.select_routes({'content': '重要公告', 'message_type': 'image'}, routes)
+        assert [r['id'] for r in allowed] == [1, 3]
+
+        # 全局规则拒绝时所有目标都不转发
+        allowed, rejected = table.select_routes({'sender_name': 'spammer', 'content': '公告'}, routes)
+        assert allowed == []
+        assert len(rejected) == 3
+
+    def test_no_scoped_rules_keeps_all_routes(self):
+        table = FilterDecisionTable({})
+        routes = [{'id': 1}, {'id': 2}]
+
+        assert table.select_routes({'content': '消息'}, routes) == (routes, [])
+
+
+class TestMessageFilter:
+    """过滤器规则加载与编译测试"""
+
+    def test_rules_compiled_once_until_changed(self):
+        """规则缓存有效期内不重复编译，规则变更后重新编译"""
+        message_filter = MessageFilter()
+
+        message_filter.should_forward({'content': '消息'})
+        compiled = message_filter.compiled
+        assert compiled is not None
+
+        for _ in range(10):
+            message_filter.should_forward({'content': '消息'})
+        assert message_filter.compiled is compiled
+
+        # 修改规则会清空缓存（不存在的规则ID，不影响数据）
+        message_filter.update_rule_status(-1, True)
+        message_filter.should_forward({'content': '消息'})
+        assert message_filter.compiled is not compiled
+
+    def test_scoped_rules_loaded_from_database(self):
+        """数据库中的作用域规则编译进决策表"""
+        message_filter = MessageFilter()
+        scope = 'mapping:987654321'
+
+        assert message_filter.add_rule('keyword_blacklist', ['仅此目标屏蔽'], scope=scope)
+        try:
+            routes = [{'id': 987654321}, {'id': 987654322}]
+            allowed, rejected = message_filter.select_routes({'content': '仅此目标屏蔽的内容'}, routes)
+
+            assert [r['id'] for r in allowed] == [987654322]
+            assert rejected[0][0]['id'] == 987654321
+            # 全局判断不受映射级规则影响
+            assert message_filter.should_forward({'content': '仅此目标屏蔽的内容'})[0] is True
+        finally:
+            for rule in message_filter.get_all_rules():
+                if rule['scope'] == scope:
+                    message_filter.remove_rule(rule['id'])
+
+    @pytest.mark.asyncio
+    async def test_async_load_does_not_touch_sync_db(self, tmp_path, monkeypatch):
+        """Worker热路径通过异步只读连接加载规则，select_routes不再同步查询"""
+        from app import database_async
+        from app.processors import filter as filter_module
+
+        adb = database_async.AsyncDatabase(db_path=tmp_path / "filter.db", pool_size=1)
+        await adb.connect()
+        try:
+            async with adb.writer() as conn:
+                await conn.execute(
+                    "INSERT INTO filter_rules (rule_type, rule_value, scope, enabled) VALUES (?, ?, ?, 1)",
+                    ('keyword_blacklist', '["异步屏蔽"]', 'mapping:1')
+                )
+            monkeypatch.setattr(database_async, 'async_db', adb)
+
+            def no_sync_query():
+                raise AssertionError("同步数据库不应在Worker热路径上被调用")
+            monkeypatch.setattr(filter_module.db, 'get_connection', no_sync_query)
+
+            message_filter = MessageFilter()
+            await message_filter.load_rules_async()
+            allowed, rejected = message_filter.select_routes({'content': '异步屏蔽的内容'}, [{'id': 1}, {'id': 2}])
+
+            assert [r['id'] for r in allowed] == [2]
+            assert rejected[0][0]['id'] == 1
+        finally:
+            await adb.disconnect()
@@ -0,0 +1,209 @@
+"""
+消息全文搜索（FTS5索引）测试
+"""
+import pytest
+from app.database_async import AsyncDatabase
+from app.search import message_search as search_module
+from app.search.message_search import MessageSearch, parse_query, make_snippet
+
+
+def log_record(message_id, content, sender='用户', channel='ch1', platform='discord', status='success'):
+    return {
+        'kook_message_id': message_id,
+        'kook_channel_id': channel,
+        'content': content,
+        'message_type': 'text',
+        'sender_name': sender,
+        'target_platform': platform,
+        'target_channel': 'target',
+        'status': status
+    }
+
+
+@pytest.fixture
+async def search_db(tmp_path, monkeypatch):
+    """使用临时数据库的搜索引擎"""
+    adb = AsyncDatabase(db_path=tmp_path / "search.db", pool_size=1)
+    await adb.connect()
+    monkeypatch.setattr(search_module, 'async_db', adb)
+    try:
+        yield adb
+    finally:
+        await adb.disconnect()
+
+
+async def fts_rowids(adb, match):
+    async with adb.reader() as conn:
+        cursor = await conn.execute(
+            "SELECT rowid FROM message_logs_fts WHERE message_logs_fts MATCH ? ORDER BY rowid", (match,)
+        )
+        return [row[0] for row in await cursor.fetchall()]
+
+
+class TestQueryParsing:
+    """关键词解析测试"""
+
+    def test_terms_quoted_as_phrases(self):
+        """FTS5语法字符按普通文本处理"""
+        match, short_terms = parse_query('hello "world" NEAR* 天气')
+        assert match == '"hello" AND """world""" AND "NEAR*"'
+        assert short_terms == ['天气']
+
+    def test_empty_query(self):
+        assert parse_query('   ') == (None, [])
+
+    def test_make_snippet(self):
+        assert make_snippet('今天天气很好', ['天气']) == '今天<mark>天气</mark>很好'
+        assert make_snippet('x' * 40 + '天气', ['天气'], width=10).startswith('…')
+
+
+class TestFtsIndexSync:
+    """触发器同步测试"""
+
+    @pytest.mark.asyncio
+    async def test_insert_update_delete(self, search_db):
+        log_id = await search_db.add_message_log(**log_record('m1', '服务器维护通知'))
+        assert await fts_rowids(search_db, '"维护通知"') == [log_id]
+
+        async with search_db.writer() as conn:
+            await conn.execute("UPDATE message_logs SET content = ? WHERE id = ?", ('版本更新公告', log_id))
+        assert await fts_rowids(search_db, '"维护通知"') == []
+        assert await fts_rowids(search_db, '"更新公告"') == [log_id]
+
+        # 只更新状态不重建索引
+        async with search_db.writer() as conn:
+            await conn.execute("UPDATE message_logs SET status = 'failed' WHERE id = ?", (log_id,))
+        assert await fts_rowids(search_db, '"更新公告"') == [log_id]
+
+        async with search_db.writer() as conn:
+            await conn.execute("DELETE FROM message_logs WHERE id = ?", (log_id,))
+        assert await fts_rowids(search_db, '"更新公告"') == []
+
+    @pytest.mark.asyncio
+    async def test_existing_logs_indexed_on_first_init(self, tmp_path):
+        """索引首次创建时为已有日志建立索引"""
+        adb = AsyncDatabase(db_path=tmp_path / "legacy.db", pool_size=1)
+        await adb.connect()
+        try:
+            log_id = await adb.add_message_log(**log_record('m1', '历史消息内容'))
+            async with adb.writer() as conn:
+                await conn.execute("DROP TABLE message_logs_fts")
+                await conn.execute("DROP TRIGGER message_logs_fts_insert")
+        finally:
+            await adb.disconnect()
+
+        await adb.connect()
+        try:
+            assert await fts_rowids(adb, '"历史消息"') == [log_id]
+        finally:
+            await adb.disconnect()
+
+
+class TestMessageSearch:
+    """搜索测试"""
+
+    @pytest.mark.asyncio
+    async def test_relevance_ranking_and_snippet(self, search_db):
+        await search_db.add_message_logs_batch([
+            log_record('m1', '今天的活动公告，请大家准时参加'),
+            log_record('m2', '活动公告：活动公告：活动公告：重复三次'),
+            log_record('m3', '无关消息'),
+        ])
+
+        result = await MessageSearch().search('活动公告')
+
+        assert result['total'] == 2
+        assert [item['kook_message_id'] for item in result['results']] == ['m2', 'm1']
+        assert '<mark>活动公告</mark>' in result['results'][1]['snippet']
+        assert result['results'][0]['score'] < result['results'][1]['score']
+
+    @pytest.mark.asyncio
+    async def test_multiple_terms_and_short_terms(self, search_db):
+        """多个词同时命中；不足3个字符的词回退为LIKE"""
+        await search_db.add_message_logs_batch([
+            log_record('m1', '周末副本开荒 速来'),
+            log_record('m2', '周末副本 已满'),
+            log_record('m3', '速来集合'),
+        ])
+        engine = MessageSearch()
+
+        result = await engine.search('周末副本 速来')
+        assert [item['kook_message_id'] for item in result['results']] == ['m1']
+
+        result = await engine.search('速来')
+        assert sorted(item['kook_message_id'] for item in result['results']) == ['m1', 'm3']
+        assert result['total'] == 2
+        assert '<mark>速来</mark>' in result['results'][0]['snippet']
+
+    @pytest.mark.asyncio
+    async def test_filters_apply_to_total(self, search_db):
+        """总数与结果使用同一组过滤条件"""
+        await search_db.add_message_logs_batch([
+            log_record(f'm{i}', f'更新公告 第{i}条', platform='discord' if i % 2 else 'telegram')
+            for i in range(10)
+        ])
+
+        result = await MessageSearch().search('更新公告', filters={'platform': 'telegram', 'status': None})
+
+        assert result['total'] == 5
+        assert len(result['results']) == 5
+        assert {item['target_platform'] for item in result['results']} == {'telegram'}
+
+    @pytest.mark.asyncio
+    async def test_keyset_pagination(self, search_db):
+        """游标分页遍历全部结果且不重复"""
+        await search_db.add_message_logs_batch([
+            log_record(f'm{i}', '公告内容 ' * (1 + i % 3)) for i in range(25)
+        ])
+        engine = MessageSearch()
+
+        for sort in ('relevance', 'time'):
+            seen = []
+            cursor = None
+            while True:
+                result = await engine.search('公告内容', limit=10, cursor=cursor, sort=sort)
+                seen.extend(item['id'] for item in result['results'])
+                cursor = result['next_cursor']
+                if cursor is None:
+                    break
+
+            assert len(seen) == 25
+            assert len(set(seen)) == 25
+
+    @pytest.mark.asyncio
+    async def test_suggestions(self, search_db):
+        await search_db.add_message_logs_batch([
+            log_record('m1', '消息', sender='管理员小王', channel='channel-100'),
+            log_record('m2', '消息', sender='管理员小李', channel='channel-200'),
+            log_record('m3', '消息', sender='普通用户', channel='other'),
+        ])
+        engine = MessageSearch()
+
+        suggestions = await engine.suggest('管理员')
+        assert suggestions['senders'] == ['管理员小李', '管理员小王']
+        assert suggestions['channels'] == []
+
+        assert (await engine.suggest('channel'))['channels'] == ['channel-200', 'channel-100']
+        assert (await engine.suggest('小王'))['senders'] == ['管理员小王']
+
+    @pytest.mark.asyncio
+    async def test_like_fallback_without_fts(self, search_db):
+        """SQLite未编译FTS5时所有词都用LIKE匹配，不查询全文索引表"""
+        async with search_db.writer() as conn:
+            for trigger in ('insert', 'delete', 'update'):
+                await conn.execute(f"DROP TRIGGER message_logs_fts_{trigger}")
+            await conn.execute("DROP TABLE message_logs_fts")
+        search_db.fts_available = False
+
+        await search_db.add_message_logs_batch([
+            log_record('m1', '周末副本开荒 速来', sender='管理员小王'),
+            log_record('m2', '周末副本 已满'),
+        ])
+        engine = MessageSearch()
+
+        result = await engine.search('周末副本 速来')
+        assert 'error' not in result
+        assert [item['kook_message_id'] for item in result['results']] == ['m1']
+        assert '<mark>周末副本</mark>' in result['results'][0]['snippet']
+
+        assert (await engine.suggest('管理员'))['senders'] == ['管理员小王']
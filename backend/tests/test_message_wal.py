@@ -0,0 +1,274 @@
+"""
+消息预写日志（WAL）测试
+"""
+import pytest
+import json
+import time
+from app.utils.message_wal import MessageWAL
+from app.utils.message_backup import MessageBackup
+from app.utils.crash_recovery import CrashRecoveryManager
+
+
+@pytest.fixture
+def wal_dir(tmp_path):
+    return tmp_path / "wal"
+
+
+def make_wal(wal_dir, **kwargs):
+    kwargs.setdefault('segment_size', 1024 * 1024)
+    kwargs.setdefault('compact_min_bytes', 1024 * 1024)
+    return MessageWAL(wal_dir=wal_dir, fsync=False, **kwargs)
+
+
+def segment_files(wal_dir):
+    return sorted(path.name for path in wal_dir.glob("segment-*.log"))
+
+
+class TestMessageWAL:
+    """WAL引擎测试"""
+
+    def test_append_ack_replay_in_order(self, wal_dir):
+        wal = make_wal(wal_dir)
+
+        for index in range(5):
+            wal.append('pending', f'm{index}', {'message_id': f'm{index}', 'n': index})
+        wal.ack('pending', 'm1')
+        wal.ack_many('pending', ['m3', 'missing'])
+
+        assert [m['n'] for m in wal.replay('pending')] == [0, 2, 4]
+        assert wal.count('pending') == 3
+        assert wal.contains('pending', 'm0')
+        assert not wal.contains('pending', 'm1')
+
+    def test_kinds_are_independent(self, wal_dir):
+        wal = make_wal(wal_dir)
+
+        wal.append('pending', 'same', {'kind': 'pending'})
+        wal.append('failed', 'same', {'kind': 'failed'})
+        wal.ack('pending', 'same')
+
+        assert wal.replay('pending') == []
+        assert wal.replay('failed') == [{'kind': 'failed'}]
+        assert wal.count() == 1
+
+    def test_generated_ids(self, wal_dir):
+        wal = make_wal(wal_dir)
+
+        record_id = wal.append('fallback', None, {'content': 'x'})
+        assert wal.replay('fallback', with_ids=True) == [(record_id, {'content': 'x'})]
+
+    def test_replay_after_restart(self, wal_dir):
+        wal = make_wal(wal_dir)
+        for index in range(10):
+            wal.append('pending', f'm{index}', {'n': index})
+        wal.ack_many('pending', [f'm{index}' for index in range(0, 10, 2)])
+        wal.close()
+
+        reopened = make_wal(wal_dir)
+        assert [m['n'] for m in reopened.replay('pending')] == [1, 3, 5, 7, 9]
+
+        # 重启后继续追加和确认
+        reopened.append('pending', 'm10', {'n': 10})
+        reopened.ack('pending', 'm1')
+        reopened.close()
+
+        assert [m['n'] for m in make_wal(wal_dir).replay('pending')] == [3, 5, 7, 9, 10]
+
+    def test_torn_tail_truncated(self, wal_dir):
+        wal = make_wal(wal_dir)
+        wal.append('pending', 'ok', {'n': 1})
+        wal.close()
+
+        # 模拟写到一半时崩溃
+        (segment,) = wal_dir.glob("segment-*.log")
+        with open(segment, 'ab') as f:
+            f.write(b'P\tpending\ttorn\t{"n": ')
+
+        reopened = make_wal(wal_dir)
+        assert reopened.replay('pending') == [{'n': 1}]
+
+        reopened.append('pending', 'next', {'n': 2})
+        reopened.close()
+        assert make_wal(wal_dir).replay('pending') == [{'n': 1}, {'n': 2}]
+
+    def test_rotation_deletes_fully_acked_segments(self, wal_dir):
+        wal = make_wal(wal_dir, segment_size=512)
+        payload = {'content': 'x' * 100}
+
+        ids = [wal.append('pending', f'm{index}', payload) for index in range(20)]
+        assert len(segment_files(wal_dir)) > 3
+
+        # 确认后面的消息不会删除仍有有效记录的前部分段
+        wal.ack_many('pending', ids[10:])
+        first_segment = segment_files(wal_dir)[0]
+        assert first_segment in segment_files(wal_dir)
+
+        # 前部分段全部确认后直接删除
+        wal.ack_many('pending', ids[:10])
+        assert wal.count() == 0
+        assert first_segment not in segment_files(wal_dir)
+        assert wal.stats['segments_deleted'] > 0
+
+        wal.close()
+        assert make_wal(wal_dir, segment_size=512).replay() == []
+
+    def test_compaction_keeps_live_records(self, wal_dir):
+        wal = make_wal(wal_dir, segment_size=4096, compact_min_bytes=1 << 30)
+        payload = {'content': 'x' * 100}
+
+        # 第一条一直不确认，旧分段无法按前缀删除
+        wal.append('pending', 'keep', {'n': 'keep'})
+        for index in range(200):
+            wal.append('pending', f'm{index}', payload)
+        wal.ack_many('pending', [f'm{index}' for index in range(200)])
+
+        before = wal.get_stats()['total_bytes']
+        wal.compact()
+        after = wal.get_stats()['total_bytes']
+
+        assert after < before / 10
+        assert wal.replay('pending') == [{'n': 'keep'}]
+        assert len(segment_files(wal_dir)) == 1
+
+        wal.close()
+        assert make_wal(wal_dir).replay('pending') == [{'n': 'keep'}]
+
+    def test_automatic_compaction(self, wal_dir):
+        wal = make_wal(wal_dir, segment_size=4096, compact_min_bytes=8192)
+        payload = {'content': 'x' * 100}
+
+        wal.append('pending', 'keep', {'n': 'keep'})
+        for index in range(200):
+            wal.append('pending', f'm{index}', payload)
+            wal.ack('pending', f'm{index}')
+
+        assert wal.stats['compactions'] > 0
+        assert wal.get_stats()['total_bytes'] < 8192 * 2
+        assert wal.replay('pending') == [{'n': 'keep'}]
+
+    def test_set_dir_isolates_processes(self, wal_dir):
+        """每个Worker进程写自己的目录，互不压缩/删除对方的分段"""
+        main = make_wal(wal_dir, segment_size=256, compact_min_bytes=512)
+        worker = make_wal(wal_dir)
+        worker.set_dir(wal_dir / "worker-0")
+
+        worker.append('fallback', 'w1', {'n': 'worker'})
+        main.append('fallback', 'keep', {'n': 'main'})
+        for index in range(50):
+            main.append('pending', f'm{index}', {'content': 'x' * 50})
+            main.ack('pending', f'm{index}')
+
+        assert main.stats['compactions'] > 0
+        assert main.replay('fallback') == [{'n': 'main'}]
+        assert worker.replay('fallback') == [{'n': 'worker'}]
+        assert segment_files(wal_dir / "worker-0") == ['segment-00000001.log']
+
+        # 同一编号的进程重启后读到自己未确认的记录
+        restarted = make_wal(wal_dir)
+        restarted.set_dir(wal_dir / "worker-0")
+        assert restarted.replay('fallback') == [{'n': 'worker'}]
+
+    def test_constant_cost_per_message(self, wal_dir):
+        """插入/确认不随积压数量变慢（旧实现每次移除都重写整个文件）"""
+        wal = make_wal(wal_dir)
+        payload = {'content': 'x' * 200}
+
+        for index in range(20000):
+            wal.append('pending', f'backlog{index}', payload)
+
+        start = time.perf_counter()
+        for index in range(2000):
+            wal.append('pending', f'm{index}', payload)
+            wal.ack('pending', f'm{index}')
+        elapsed = time.perf_counter() - start
+
+        assert elapsed < 0.5
+        assert wal.count('pending') == 20000
+
+
+class TestWALFacades:
+    """基于WAL的消息备份器和崩溃恢复管理器测试"""
+
+    def test_message_backup(self, wal_dir):
+        backup = MessageBackup(wal=make_wal(wal_dir))
+        backup.legacy_file = wal_dir / "missing.jsonl"
+
+        backup.save_message({'message_id': 'a', 'content': '1'})
+        backup.save_message({'message_id': 'b', 'content': '2', 'timestamp': 1700000000})
+        backup.save_message({'message_id': 'c', 'content': '3'})
+        backup.remove_message('a')
+        backup.remove_messages_batch(['c'])
+
+        messages = backup.load_pending_messages()
+        assert [m['message_id'] for m in messages] == ['b']
+        assert backup.get_oldest_message_time() == 1700000000
+
+        backup.clear_backup()
+        assert backup.get_backup_count() == 0
+
+    def test_message_backup_imports_legacy_file(self, wal_dir, tmp_path):
+        legacy_file = tmp_path / "pending_messages.jsonl"
+        legacy_file.write_text(
+            json.dumps({'message_id': 'old1'}) + "\n" + json.dumps({'message_id': 'old2'}) + "\n",
+            encoding='utf-8'
+        )
+
+        backup = MessageBackup(wal=make_wal(wal_dir))
+        backup.legacy_file = legacy_file
+
+        assert [m['message_id'] for m in backup.load_pending_messages()] == ['old1', 'old2']
+        assert not legacy_file.exists()
+
+    @pytest.mark.asyncio
+    async def test_crash_recovery(self, wal_dir, tmp_path):
+        manager = CrashRecoveryManager(wal=make_wal(wal_dir))
+        manager.legacy_files = {
+            manager.PENDING: tmp_path / "pending_messages.json",
+            manager.FAILED: tmp_path / "failed_messages.json"
+        }
+        manager.legacy_files[manager.FAILED].write_text(
+            json.dumps([{'kook_message_id': 'old', 'error': '超时'}]), encoding='utf-8'
+        )
+
+        await manager.save_pending_message({'kook_message_id': 'p1'})
+        await manager.save_pending_message({'kook_message_id': 'p2'})
+        await manager.save_failed_message({'kook_message_id': 'f1'}, '网络错误')
+        await manager.clear_pending_message('p1')
+
+        assert [m['kook_message_id'] for m in await manager.recover_pending_messages()] == ['p2']
+        failed = await manager.recover_failed_messages()
+        assert [m['kook_message_id'] for m in failed] == ['old', 'f1']
+        assert failed[1]['error'] == '网络错误'
+        assert manager.get_recovery_stats()['pending_count'] == 1
+        assert not manager.legacy_files[manager.FAILED].exists()
+
+        await manager.clear_all_pending()
+        assert await manager.recover_pending_messages() == []
+
+    @pytest.mark.asyncio
+    async def test_facades_share_one_wal(self, wal_dir, tmp_path):
+        """备份器和崩溃恢复管理器共用全局WAL时互不影响"""
+        wal = make_wal(wal_dir)
+        backup = MessageBackup(wal=wal)
+        backup.legacy_file = tmp_path / "missing.jsonl"
+        manager = CrashRecoveryManager(wal=wal)
+        manager.legacy_files = {
+            manager.PENDING: tmp_path / "missing_pending.json",
+            manager.FAILED: tmp_path / "missing_failed.json"
+        }
+
+        backup.save_message({'message_id': 'm1', 'content': 'backup'})
+        await manager.save_pending_message({'kook_message_id': 'm1', 'content': 'recovery'})
+        await manager.save_failed_message({'kook_message_id': 'm2'}, '网络错误')
+
+        assert [m['content'] for m in backup.load_pending_messages()] == ['backup']
+        assert [m['content'] for m in await manager.recover_pending_messages()] == ['recovery']
+
+        # 一方确认/清空不会删除另一方的记录
+        backup.remove_message('m1')
+        assert [m['content'] for m in await manager.recover_pending_messages()] == ['recovery']
+
+        backup.save_message({'message_id': 'm3'})
+        await manager.clear_all_pending()
+        assert backup.get_backup_count() == 1
+        assert [m['kook_message_id'] for m in await manager.recover_failed_messages()] == ['m2']
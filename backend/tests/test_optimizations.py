@@ -327,15 +327,16 @@ class TestAutoRetry:
         # 保存到本地Fallback
         await redis_queue._save_to_local_fallback(message)
         
-        # 验证文件存在
-        fallback_dir = settings.data_dir / "fallback_queue"
-        assert fallback_dir.exists()
+        # 验证已写入预写日志
+        from app.utils.message_wal import message_wal
+        assert message_wal.contains('fallback', 'fallback_test')
         
         # 加载Fallback消息
         loaded = await redis_queue.load_from_local_fallback()
         
-        # 应该能找到保存的消息
+        # 应该能找到保存的消息，加载后已确认
         assert any(m['message_id'] == 'fallback_test' for m in loaded)
+        assert not message_wal.contains('fallback', 'fallback_test')
 
 
 class TestAPIAuthentication:
@@ -0,0 +1,159 @@
+"""
+插件钩子执行（管道/观察者、时间预算、熔断）测试
+"""
+import pytest
+import asyncio
+from app.config import settings
+from app.plugins.plugin_system import (
+    PluginManager, PluginBase, PluginInfo, PluginHook, HookLatencyStats
+)
+
+
+class DemoPlugin(PluginBase):
+    """测试插件"""
+
+    def __init__(self, plugin_id, delay=0.0, suffix='', fail=False):
+        super().__init__()
+        self.plugin_id = plugin_id
+        self.delay = delay
+        self.suffix = suffix
+        self.fail = fail
+        self.calls = 0
+        self.info = self.get_info()
+
+    def get_info(self):
+        return PluginInfo(id=self.plugin_id, name=self.plugin_id, version='1.0',
+                          author='test', description='')
+
+    async def process(self, message):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise ValueError("插件异常")
+        message['content'] += self.suffix
+        message.setdefault('order', []).append(self.plugin_id)
+        return message
+
+
+@pytest.fixture
+def manager(monkeypatch):
+    monkeypatch.setattr(settings, 'plugin_hook_budget_ms', 50)
+    monkeypatch.setattr(settings, 'plugin_breaker_threshold', 2)
+    monkeypatch.setattr(settings, 'plugin_breaker_cooldown', 0.2)
+    return PluginManager()
+
+
+class TestHookExecution:
+    """钩子执行模式测试"""
+
+    @pytest.mark.asyncio
+    async def test_pipeline_runs_in_order(self, manager):
+        a, b = DemoPlugin('a', suffix='-a'), DemoPlugin('b', suffix='-b')
+        manager.register_hook(PluginHook.AFTER_MESSAGE_PROCESS, a.process)
+        manager.register_hook(PluginHook.AFTER_MESSAGE_PROCESS, b.process)
+
+        message = await manager.run_pipeline(PluginHook.AFTER_MESSAGE_PROCESS, {'content': '消息'})
+
+        assert message['content'] == '消息-a-b'
+        assert message['order'] == ['a', 'b']
+
+    @pytest.mark.asyncio
+    async def test_slow_pipeline_plugin_is_skipped(self, manager):
+        """超出预算的插件被跳过，它的修改不生效，后续插件照常执行"""
+        slow, fast = DemoPlugin('slow', delay=0.5, suffix='-slow'), DemoPlugin('fast', suffix='-fast')
+        manager.register_hook(PluginHook.AFTER_MESSAGE_PROCESS, slow.process)
+        manager.register_hook(PluginHook.AFTER_MESSAGE_PROCESS, fast.process)
+
+        original = {'content': '消息'}
+        message = await manager.run_pipeline(PluginHook.AFTER_MESSAGE_PROCESS, original)
+
+        assert message['content'] == '消息-fast'
+        assert original == {'content': '消息'}
+        assert manager.get_hook_stats()['slow']['timeouts'] == 1
+
+    @pytest.mark.asyncio
+    async def test_observer_hooks_run_concurrently(self, manager):
+        plugins = [DemoPlugin(f'p{i}', delay=0.03) for i in range(5)]
+        for plugin in plugins:
+            manager.register_hook(PluginHook.AFTER_MESSAGE_FORWARD, plugin.process)
+
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        results = await manager.call_hook(PluginHook.AFTER_MESSAGE_FORWARD, {'content': ''})
+
+        assert len(results) == 5
+        assert loop.time() - start < 0.1  # 并发执行，总耗时约等于单个插件
+
+    @pytest.mark.asyncio
+    async def test_plugin_budget_override(self, manager):
+        plugin = DemoPlugin('translator', delay=0.08, suffix='-t')
+        plugin.hook_budget_ms = 500
+        manager.register_hook(PluginHook.AFTER_MESSAGE_PROCESS, plugin.process)
+
+        message = await manager.run_pipeline(PluginHook.AFTER_MESSAGE_PROCESS, {'content': '消息'})
+        assert message['content'] == '消息-t'
+
+    @pytest.mark.asyncio
+    async def test_disabled_plugin_not_called(self, manager):
+        plugin = DemoPlugin('off', suffix='-off')
+        plugin.enabled = False
+        manager.register_hook(PluginHook.AFTER_MESSAGE_PROCESS, plugin.process)
+
+        assert await manager.call_hook(PluginHook.AFTER_MESSAGE_PROCESS, {'content': ''}) == []
+        assert plugin.calls == 0
+
+
+class TestCircuitBreaker:
+    """插件熔断测试"""
+
+    @pytest.mark.asyncio
+    async def test_breaker_opens_and_recovers(self, manager):
+        plugin = DemoPlugin('flaky', fail=True)
+        manager.register_hook(PluginHook.AFTER_MESSAGE_PROCESS, plugin.process)
+
+        for _ in range(4):
+            await manager.run_pipeline(PluginHook.AFTER_MESSAGE_PROCESS, {'content': ''})
+
+        # 连续2次失败后熔断，之后的调用被跳过
+        stats = manager.get_hook_stats()['flaky']
+        assert plugin.calls == 2
+        assert stats['errors'] == 2
+        assert stats['skipped'] == 2
+        assert stats['breaker']['state'] == 'open'
+
+        # 冷却后放行一次试探调用，成功则恢复
+        await asyncio.sleep(0.25)
+        plugin.fail = False
+        message = await manager.run_pipeline(PluginHook.AFTER_MESSAGE_PROCESS, {'content': ''})
+        assert message['order'] == ['flaky']
+        assert manager.get_hook_stats()['flaky']['breaker']['state'] == 'closed'
+
+    @pytest.mark.asyncio
+    async def test_manual_reset(self, manager):
+        plugin = DemoPlugin('flaky', fail=True)
+        manager.register_hook(PluginHook.AFTER_MESSAGE_PROCESS, plugin.process)
+        for _ in range(2):
+            await manager.run_pipeline(PluginHook.AFTER_MESSAGE_PROCESS, {'content': ''})
+
+        assert manager.reset_breaker('flaky')
+        assert not manager.reset_breaker('unknown')
+        assert manager.get_hook_stats()['flaky']['breaker']['state'] == 'closed'
+
+
+class TestHookLatencyStats:
+    """耗时直方图测试"""
+
+    def test_histogram_and_percentiles(self):
+        stats = HookLatencyStats()
+        for ms in [0.5] * 90 + [30] * 9 + [8000]:
+            stats.record(ms)
+
+        data = stats.to_dict()
+        assert data['calls'] == 100
+        assert data['histogram']['<=1ms'] == 90
+        assert data['histogram']['<=50ms'] == 9
+        assert data['histogram']['>5000ms'] == 1
+        assert data['p50_ms'] == 1.0
+        assert data['p95_ms'] == 50.0
+        assert data['p99_ms'] == 50.0
+        assert data['max_ms'] == 8000
@@ -3,7 +3,13 @@
 """
 import pytest
 import asyncio
-from app.utils.rate_limiter import RateLimiter
+import time
+import fakeredis
+from fakeredis import aioredis as fakeaioredis
+from app.config import settings
+from app.utils.rate_limiter import (
+    RateLimiter, TokenBucket, RedisTokenBucket, RateLimiterManager, AdaptiveRateLimiter
+)
 
 
 class TestRateLimiter:
@@ -55,5 +61,272 @@ class TestRateLimiter:
         assert limiter.try_acquire() == False
 
 
+async def acquire_times(limiter, count, *args):
+    """并发获取，返回每次获取完成的相对时间（按提交顺序）"""
+    start = time.monotonic()
+    
+    async def one():
+        await limiter.acquire(*args)
+        return time.monotonic() - start
+    
+    return await asyncio.gather(*(one() for _ in range(count)))
+
+
+class TestSlidingWindow:
+    """滑动窗口（预约排队）测试"""
+    
+    @pytest.mark.asyncio
+    async def test_window_never_exceeded_and_fifo(self):
+        """任意窗口内不超过calls次，按提交顺序放行"""
+        limiter = RateLimiter(calls=3, period=0.2)
+        
+        times = await acquire_times(limiter, 9)
+        
+        assert times == sorted(times)
+        for index in range(len(times) - 3):
+            assert times[index + 3] - times[index] >= 0.19
+        assert times[-1] < 0.7
+    
+    @pytest.mark.asyncio
+    async def test_many_waiters_without_recursion(self):
+        limiter = RateLimiter(calls=1, period=0.0005)
+        
+        await asyncio.gather(*(limiter.acquire() for _ in range(2000)))
+        
+        assert limiter.waiting == 0
+    
+    @pytest.mark.asyncio
+    async def test_try_acquire_respects_queued_waiters(self):
+        """已被排队者预订的许可不会被非阻塞获取抢走"""
+        limiter = RateLimiter(calls=1, period=0.1)
+        await limiter.acquire()
+        
+        waiter = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        await asyncio.sleep(0.11)
+        
+        assert limiter.try_acquire() is False
+        await waiter
+        assert limiter.get_status()['progress'] == 100.0
+
+
+class TestTokenBucket:
+    """令牌桶测试"""
+    
+    @pytest.mark.asyncio
+    async def test_burst_then_refill_rate(self):
+        bucket = TokenBucket(capacity=3, refill_rate=20)
+        
+        times = await acquire_times(bucket, 7)
+        
+        # 前3个立即通过，之后每50ms一个
+        assert all(t < 0.02 for t in times[:3])
+        assert times == sorted(times)
+        assert 0.18 <= times[-1] < 0.35
+    
+    @pytest.mark.asyncio
+    async def test_cancelled_waiter_returns_tokens(self):
+        bucket = TokenBucket(capacity=1, refill_rate=10)
+        await bucket.acquire()
+        
+        waiter = asyncio.create_task(bucket.acquire())
+        await asyncio.sleep(0)
+        assert bucket.waiting == 1
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        
+        assert bucket.waiting == 0
+        assert -0.05 < bucket.get_available_tokens() < 0.1
+    
+    def test_try_acquire(self):
+        bucket = TokenBucket(capacity=2, refill_rate=1)
+        
+        assert bucket.try_acquire() is True
+        assert bucket.try_acquire() is True
+        assert bucket.try_acquire() is False
+        assert 0.9 < bucket.get_wait_time() <= 1.0
+
+
+class TestKeyedRateLimiter:
+    """按键限流测试"""
+    
+    @pytest.mark.asyncio
+    async def test_keys_are_independent(self):
+        manager = RateLimiterManager()
+        limiter = manager.get_keyed_limiter('discord', calls=1, period=1)
+        
+        start = time.monotonic()
+        await asyncio.gather(*(limiter.acquire(f'https://hook/{i}') for i in range(5)))
+        assert time.monotonic() - start < 0.1
+        
+        await limiter.acquire('https://hook/0')  # 同一个Webhook需要等待
+        assert time.monotonic() - start >= 0.9
+        
+        assert manager.get_keyed_limiter('discord', 1, 1) is limiter
+        assert manager.get_status('discord')['keys'] == 5
+    
+    def test_bucket_keys_hide_secrets(self):
+        manager = RateLimiterManager()
+        limiter = manager.get_keyed_limiter('discord', calls=5, period=5)
+        
+        limiter.get_bucket('https://discord.com/api/webhooks/1/secret-token')
+        
+        assert all('secret' not in key for key in limiter.buckets)
+    
+    def test_idle_buckets_evicted(self):
+        manager = RateLimiterManager()
+        limiter = manager.get_keyed_limiter('telegram', calls=5, period=1)
+        limiter.max_keys = 3
+        
+        for index in range(5):
+            limiter.get_bucket(f'bot-{index}')
+        
+        assert len(limiter.buckets) == 3
+        assert limiter._digest('bot-4') in limiter.buckets
+
+
+class TestAdaptiveRateLimiter:
+    """根据平台响应自适应的限流测试"""
+    
+    @pytest.mark.asyncio
+    async def test_waits_when_reported_remaining_exhausted(self):
+        manager = RateLimiterManager()
+        limiter = manager.get_adaptive_limiter('discord', calls=5, period=5)
+        
+        await limiter.acquire('hook')
+        limiter.on_response('hook', limit=2, remaining=0, reset_after=0.2, bucket_id='b1')
+        
+        start = time.monotonic()
+        waited = await limiter.acquire('hook')
+        
+        assert waited >= 0.15
+        assert time.monotonic() - start >= 0.15
+        assert limiter.stats['preemptive_waits'] == 1
+        # 本地令牌桶改为学到的额度（2次/0.2秒）
+        assert limiter.get_bucket('hook').refill_rate == pytest.approx(10)
+    
+    @pytest.mark.asyncio
+    async def test_reserves_remaining_before_response(self):
+        """响应回来之前，并发发送不超过剩余额度"""
+        manager = RateLimiterManager()
+        limiter = manager.get_adaptive_limiter('discord', calls=50, period=1)
+        limiter.on_response('hook', limit=10, remaining=2, reset_after=0.2)
+        
+        start = time.monotonic()
+        results = await asyncio.gather(*(limiter.acquire('hook') for _ in range(3)))
+        
+        assert sorted(w > 0 for w in results) == [False, False, True]
+        assert time.monotonic() - start >= 0.15
+    
+    def test_same_bucket_id_shares_state(self):
+        manager = RateLimiterManager()
+        limiter = manager.get_adaptive_limiter('discord', calls=5, period=5)
+        
+        limiter.on_response('hook-a', limit=5, remaining=3, reset_after=2, bucket_id='shared')
+        limiter.on_response('hook-b', limit=5, remaining=1, reset_after=2, bucket_id='shared')
+        
+        assert limiter.get_state('hook-a')['remaining'] == 1
+        assert limiter.get_state('hook-a')['bucket'] == 'shared'
+        assert limiter.get_state('other')['remaining'] is None
+    
+    @pytest.mark.asyncio
+    async def test_retry_after_blocks_key_and_halves_rate(self):
+        manager = RateLimiterManager()
+        limiter = manager.get_adaptive_limiter('telegram_chat', calls=20, period=1)
+        
+        limiter.on_rate_limited('bot:chat', 0.2)
+        
+        assert limiter.get_state('bot:chat')['rate'] == pytest.approx(10)
+        assert limiter.get_state('bot:other')['rate'] == pytest.approx(20)
+        
+        start = time.monotonic()
+        await limiter.acquire('bot:other')
+        assert time.monotonic() - start < 0.05
+        
+        await limiter.acquire('bot:chat')
+        assert time.monotonic() - start >= 0.15
+    
+    def test_rate_recovers_after_successes(self):
+        manager = RateLimiterManager()
+        limiter = manager.get_adaptive_limiter('feishu', calls=4, period=1)
+        
+        for _ in range(10):
+            limiter.on_rate_limited('app', 0)
+        assert limiter.get_state('app')['rate'] == pytest.approx(limiter.min_rate)
+        
+        for _ in range(4):
+            limiter.on_response('app')
+        assert limiter.get_state('app')['rate'] > limiter.min_rate
+        assert limiter.stats['rate_increases'] == 1
+    
+    @pytest.mark.asyncio
+    async def test_global_limit_blocks_every_key(self):
+        manager = RateLimiterManager()
+        limiter = manager.get_adaptive_limiter('discord', calls=5, period=5)
+        
+        limiter.on_rate_limited('hook-a', 0.2, is_global=True)
+        
+        assert manager.get_status('discord')['is_limited'] is True
+        assert await limiter.acquire('hook-b') >= 0.15
+    
+    def test_shared_between_forwarders(self):
+        manager = RateLimiterManager()
+        limiter = manager.get_adaptive_limiter('discord', 5, 5)
+        
+        assert isinstance(limiter, AdaptiveRateLimiter)
+        assert manager.get_adaptive_limiter('discord', 5, 5) is limiter
+
+
+class TestRedisTokenBucket:
+    """Redis令牌桶（多进程共享额度）测试"""
+    
+    @pytest.fixture
+    def redis_backend(self, monkeypatch):
+        monkeypatch.setattr(settings, 'rate_limit_backend', 'redis')
+        return fakeredis.FakeServer()
+    
+    @pytest.mark.asyncio
+    async def test_processes_share_one_budget(self, redis_backend):
+        """两个进程（各自的管理器和连接）共享同一个Webhook的额度"""
+        limiters = []
+        for _ in range(2):
+            manager = RateLimiterManager()
+            manager.use_redis(fakeaioredis.FakeRedis(server=redis_backend))
+            limiters.append(manager.get_keyed_limiter('discord', calls=2, period=0.2))
+        
+        for limiter in limiters:
+            assert isinstance(limiter.get_bucket('hook'), RedisTokenBucket)
+        
+        start = time.monotonic()
+        await asyncio.gather(*(limiter.acquire('hook') for limiter in limiters for _ in range(2)))
+        elapsed = time.monotonic() - start
+        
+        # 容量2、每秒补充10个：第3、4次分别等待约0.1、0.2秒
+        assert 0.18 <= elapsed < 0.4
+        
+        bucket = limiters[0].get_bucket('hook')
+        assert await bucket.try_acquire() is False
+    
+    @pytest.mark.asyncio
+    async def test_local_backend_ignores_redis(self):
+        manager = RateLimiterManager()
+        manager.use_redis(fakeaioredis.FakeRedis())
+        
+        assert manager.redis is None
+        assert isinstance(manager.get_keyed_limiter('discord', 5, 5).get_bucket('hook'), TokenBucket)
+    
+    @pytest.mark.asyncio
+    async def test_falls_back_to_local_bucket_on_redis_error(self, redis_backend):
+        async def broken_script(keys, args):
+            raise ConnectionError("redis down")
+        
+        bucket = RedisTokenBucket(None, broken_script, 'ratelimit:test', capacity=1, refill_rate=100)
+        
+        assert await bucket.acquire() is True
+        assert await bucket.try_acquire() is False
+        assert bucket.redis_errors == 2
+
+
 if __name__ == '__main__':
     pytest.main([__file__, '-v'])
@@ -0,0 +1,89 @@
+"""
+Redis队列批量入队/出队测试
+"""
+import pytest
+from fakeredis import aioredis as fakeredis
+from app.queue.redis_client import RedisQueue
+from app.queue.worker import MessageWorker
+from app.config import settings
+
+
+@pytest.fixture
+async def queue():
+    q = RedisQueue()
+    q.stream = None
+    q.queue_name = "test:kook_messages"
+    q.redis = fakeredis.FakeRedis(decode_responses=True)
+    yield q
+    await q.redis.flushall()
+    await q.redis.aclose()
+
+
+class TestBatchQueue:
+    """批量队列操作测试"""
+
+    @pytest.mark.asyncio
+    async def test_enqueue_many_single_round_trip(self, queue):
+        """批量入队只执行一次RPUSH"""
+        calls = 0
+        original_rpush = queue.redis.rpush
+
+        async def counting_rpush(*args, **kwargs):
+            nonlocal calls
+            calls += 1
+            return await original_rpush(*args, **kwargs)
+
+        queue.redis.rpush = counting_rpush
+
+        messages = [{'message_id': f'm{i}'} for i in range(50)]
+        assert await queue.enqueue_many(messages) == 50
+        assert calls == 1
+        assert await queue.get_queue_size() == 50
+
+    @pytest.mark.asyncio
+    async def test_enqueue_many_chunks(self, queue):
+        """超过分块大小时分多次写入，顺序不变"""
+        messages = [{'message_id': f'm{i}'} for i in range(25)]
+        assert await queue.enqueue_many(messages, chunk_size=10) == 25
+
+        batch = await queue.dequeue_batch(count=100, timeout=1)
+        assert [m['message_id'] for m in batch] == [f'm{i}' for i in range(25)]
+
+    @pytest.mark.asyncio
+    async def test_dequeue_batch_drains_in_order(self, queue):
+        """批量出队按FIFO顺序取出，剩余消息保留在队列中"""
+        await queue.enqueue_many([{'message_id': f'm{i}'} for i in range(30)])
+
+        batch = await queue.dequeue_batch(count=10, timeout=1)
+        assert [m['message_id'] for m in batch] == [f'm{i}' for i in range(10)]
+        assert await queue.get_queue_size() == 20
+
+        batch = await queue.dequeue_batch(count=10, timeout=1)
+        assert batch[0]['message_id'] == 'm10'
+
+    @pytest.mark.asyncio
+    async def test_dequeue_batch_partial(self, queue):
+        """队列不足一批时返回全部"""
+        await queue.enqueue_many([{'message_id': 'a'}, {'message_id': 'b'}])
+
+        batch = await queue.dequeue_batch(count=10, timeout=1)
+        assert [m['message_id'] for m in batch] == ['a', 'b']
+        assert await queue.get_queue_size() == 0
+
+
+class TestAdaptiveBatchSize:
+    """Worker自适应批量大小测试"""
+
+    def test_grows_when_full_and_shrinks_when_idle(self):
+        worker = MessageWorker()
+        assert worker.batch_size == settings.queue_batch_min
+
+        # 连续取满，逐步放大到上限
+        for _ in range(20):
+            worker._adapt_batch_size(worker.batch_size)
+        assert worker.batch_size == settings.queue_batch_max
+
+        # 队列变空，逐步收缩到下限
+        for _ in range(20):
+            worker._adapt_batch_size(0)
+        assert worker.batch_size == settings.queue_batch_min
@@ -0,0 +1,173 @@
+"""
+Redis Streams队列测试
+"""
+import pytest
+import json
+from fakeredis import aioredis as fakeredis
+from app.queue.redis_client import RedisQueue
+from app.queue.redis_stream import RedisStreamQueue
+
+
+@pytest.fixture
+async def redis():
+    client = fakeredis.FakeRedis(decode_responses=True)
+    yield client
+    await client.flushall()
+    await client.aclose()
+
+
+async def make_queue(redis, consumer, claim_idle=60, max_deliveries=5):
+    queue = RedisStreamQueue(
+        stream_name="test:stream",
+        group_name="test_workers",
+        consumer_name=consumer,
+        claim_idle_seconds=claim_idle,
+        max_deliveries=max_deliveries
+    )
+    await queue.setup(redis)
+    return queue
+
+
+class TestRedisStreamQueue:
+    """Stream队列测试"""
+
+    @pytest.mark.asyncio
+    async def test_enqueue_dequeue_ack(self, redis):
+        """入队、出队、确认后积压清零"""
+        queue = await make_queue(redis, "w1")
+
+        for i in range(3):
+            await queue.enqueue({'message_id': f'm{i}', 'content': '测试'})
+
+        messages = await queue.dequeue_batch(count=10, timeout=1)
+        assert [m['message_id'] for m in messages] == ['m0', 'm1', 'm2']
+        assert all('_stream_id' in m for m in messages)
+        assert messages[0]['content'] == '测试'
+
+        # 未确认前仍计入积压
+        assert await queue.length() == 3
+
+        acked = await queue.ack([m['_stream_id'] for m in messages])
+        assert acked == 3
+        assert await queue.length() == 0
+
+    @pytest.mark.asyncio
+    async def test_enqueue_many(self, redis):
+        """批量入队保持顺序"""
+        queue = await make_queue(redis, "w1")
+
+        ids = await queue.enqueue_many([{'message_id': f'm{i}'} for i in range(5)])
+        assert len(ids) == 5
+
+        messages = await queue.dequeue_batch(count=10, timeout=1)
+        assert [m['message_id'] for m in messages] == [f'm{i}' for i in range(5)]
+
+    @pytest.mark.asyncio
+    async def test_setup_is_idempotent(self, redis):
+        """重复创建消费组不报错"""
+        await make_queue(redis, "w1")
+        await make_queue(redis, "w2")
+
+    @pytest.mark.asyncio
+    async def test_consumers_do_not_share_messages(self, redis):
+        """同组的多个consumer不会拿到同一条消息"""
+        q1 = await make_queue(redis, "w1")
+        q2 = await make_queue(redis, "w2")
+
+        for i in range(6):
+            await q1.enqueue({'message_id': f'm{i}'})
+
+        batch1 = await q1.dequeue_batch(count=3, timeout=1)
+        batch2 = await q2.dequeue_batch(count=10, timeout=1)
+
+        ids1 = {m['message_id'] for m in batch1}
+        ids2 = {m['message_id'] for m in batch2}
+        assert len(ids1) == 3
+        assert ids1.isdisjoint(ids2)
+        assert ids1 | ids2 == {f'm{i}' for i in range(6)}
+
+    @pytest.mark.asyncio
+    async def test_unacked_message_reclaimed(self, redis):
+        """consumer崩溃（未确认）后消息被其他consumer认领"""
+        crashed = await make_queue(redis, "crashed", claim_idle=0)
+        survivor = await make_queue(redis, "survivor", claim_idle=0)
+
+        await crashed.enqueue({'message_id': 'm1'})
+        assert len(await crashed.dequeue_batch(count=1, timeout=1)) == 1
+
+        messages = await survivor.dequeue_batch(count=10, timeout=1)
+        assert [m['message_id'] for m in messages] == ['m1']
+        assert messages[0]['_redelivered'] is True
+
+        await survivor.ack([messages[0]['_stream_id']])
+        assert await survivor.length() == 0
+
+    @pytest.mark.asyncio
+    async def test_poison_message_dead_lettered(self, redis):
+        """超过最大投递次数的消息转入死信流"""
+        queue = await make_queue(redis, "w1", claim_idle=0, max_deliveries=2)
+
+        await queue.enqueue({'message_id': 'poison'})
+        await queue.dequeue_batch(count=1, timeout=1)
+        redelivered = await queue.reclaim_idle(force=True)
+        assert len(redelivered) == 1
+
+        assert await queue.reclaim_idle(force=True) == []
+        assert await queue.length() == 0
+        assert await redis.xlen(queue.dead_letter_stream) == 1
+        assert queue.stats['dead_lettered'] == 1
+
+    @pytest.mark.asyncio
+    async def test_stream_stats(self, redis):
+        """统计每个consumer的未确认数和整体积压"""
+        q1 = await make_queue(redis, "w1")
+        q2 = await make_queue(redis, "w2")
+
+        for i in range(5):
+            await q1.enqueue({'message_id': f'm{i}'})
+
+        await q1.dequeue_batch(count=2, timeout=1)
+
+        stats = await q2.get_stream_stats()
+        assert stats['length'] == 5
+        assert stats['pending'] == 2
+        assert stats['lag'] == 3
+
+        consumers = {c['name']: c for c in stats['consumers']}
+        assert consumers['w1']['pending'] == 2
+        assert consumers['w1']['is_self'] is False
+
+
+class TestListMigration:
+    """列表队列遗留消息迁移到Stream"""
+
+    @pytest.mark.asyncio
+    async def test_failed_write_keeps_messages_in_list(self, redis):
+        queue = RedisQueue()
+        queue.redis = redis
+        queue.stream = await make_queue(redis, "w1")
+        await redis.rpush(queue.queue_name, *[json.dumps({'message_id': f'm{i}'}) for i in range(1200)])
+
+        enqueue_many = queue.stream.enqueue_many
+        calls = 0
+
+        async def flaky_enqueue_many(messages):
+            nonlocal calls
+            calls += 1
+            if calls == 2:
+                raise ConnectionError("XADD失败")
+            return await enqueue_many(messages)
+
+        queue.stream.enqueue_many = flaky_enqueue_many
+        with pytest.raises(ConnectionError):
+            await queue._migrate_list_to_stream()
+
+        # 第一批已迁移并删除，写入失败的第二批仍在列表中
+        assert await redis.llen(queue.queue_name) == 700
+        assert await queue.stream.length() == 500
+
+        await queue._migrate_list_to_stream()
+        assert await redis.llen(queue.queue_name) == 0
+
+        messages = await queue.stream.dequeue_batch(count=2000, timeout=1)
+        assert [m['message_id'] for m in messages] == [f'm{i}' for i in range(1200)]
@@ -0,0 +1,281 @@
+"""
+重试调度器（到期时间堆、按平台并发、退避抖动）测试
+"""
+import pytest
+import asyncio
+import json
+import time
+from app.database_async import AsyncDatabase
+from app.queue.retry_scheduler import RetryScheduler
+from app.queue.retry_worker import RetryWorker
+from app.queue.failed_message_queue import FailedMessageQueue
+
+
+class RecordingScheduler(RetryScheduler):
+    """记录每次重试的调度器（按payload决定成功与否）"""
+
+    def __init__(self, delay: float = 0, **kwargs):
+        kwargs.setdefault('max_retries', 3)
+        kwargs.setdefault('base_delay', 0.05)
+        kwargs.setdefault('jitter', 0)
+        super().__init__(**kwargs)
+        self.delay = delay
+        self.attempts = []
+        self.running = {}
+        self.max_running = {}
+
+    async def attempt(self, entry):
+        self.attempts.append((entry.key, time.monotonic()))
+        running = self.running.get(entry.platform, 0) + 1
+        self.running[entry.platform] = running
+        self.max_running[entry.platform] = max(self.max_running.get(entry.platform, 0), running)
+        try:
+            await asyncio.sleep(self.delay)
+            return entry.payload.get('ok', True)
+        finally:
+            self.running[entry.platform] -= 1
+
+
+async def wait_until(predicate, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "等待超时"
+        await asyncio.sleep(0.005)
+
+
+@pytest.fixture
+async def run_scheduler():
+    """在后台运行调度器，测试结束时停止"""
+    tasks = []
+
+    def starter(scheduler):
+        tasks.append((scheduler, asyncio.create_task(scheduler.run())))
+        return scheduler
+
+    try:
+        yield starter
+    finally:
+        for scheduler, task in tasks:
+            await scheduler.stop()
+            await asyncio.wait_for(task, 5)
+
+
+class TestRetryScheduler:
+    """内存调度器测试"""
+
+    def test_attempt_is_abstract(self):
+        with pytest.raises(TypeError):
+            RetryScheduler(max_retries=3, base_delay=1)
+
+    def test_backoff_with_jitter(self):
+        scheduler = RecordingScheduler(base_delay=30, max_delay=480, jitter=0.2)
+
+        for retry_count in range(6):
+            expected = min(30 * 2 ** retry_count, 480)
+            delays = [scheduler.compute_delay(retry_count) for _ in range(50)]
+            assert all(expected * 0.8 <= delay <= expected * 1.2 for delay in delays)
+            assert len(set(delays)) > 1
+
+    @pytest.mark.asyncio
+    async def test_wakes_when_due(self, run_scheduler):
+        """不轮询：睡到最早的条目到期，新加入更早的条目时立即重新计算"""
+        scheduler = run_scheduler(RecordingScheduler())
+        start = time.monotonic()
+
+        scheduler.schedule('late', {}, due=time.time() + 0.3)
+        await asyncio.sleep(0.02)
+        scheduler.schedule('early', {}, due=time.time() + 0.05)
+
+        await wait_until(lambda: len(scheduler.attempts) == 2)
+
+        (first, first_at), (second, second_at) = scheduler.attempts
+        assert (first, second) == ('early', 'late')
+        assert 0.05 <= first_at - start < 0.2
+        assert 0.3 <= second_at - start < 0.45
+
+    @pytest.mark.asyncio
+    async def test_platform_concurrency(self, run_scheduler):
+        scheduler = run_scheduler(RecordingScheduler(delay=0.05, platform_concurrency=3))
+
+        for index in range(12):
+            scheduler.schedule(f'd{index}', {}, platform='discord', due=0)
+            scheduler.schedule(f't{index}', {}, platform='telegram', due=0)
+
+        start = time.monotonic()
+        await wait_until(lambda: len(scheduler.attempts) == 24 and not scheduler._inflight)
+        elapsed = time.monotonic() - start
+
+        assert scheduler.max_running == {'discord': 3, 'telegram': 3}
+        # 每个平台12条、并发3：约4轮，两个平台并行
+        assert elapsed < 0.4
+        assert scheduler.get_stats()['retry_success'] == 24
+
+    @pytest.mark.asyncio
+    async def test_failure_rescheduled_then_abandoned(self, run_scheduler):
+        scheduler = run_scheduler(RecordingScheduler(max_retries=3, base_delay=0.02))
+
+        scheduler.schedule('bad', {'ok': False}, due=0)
+        await wait_until(lambda: scheduler.stats['abandoned'] == 1)
+
+        times = [at for _, at in scheduler.attempts]
+        assert len(times) == 3
+        # 第n次失败后等待 base_delay * 2^n
+        assert times[1] - times[0] >= 0.04
+        assert times[2] - times[1] >= 0.08
+        assert scheduler.entries == {}
+
+    @pytest.mark.asyncio
+    async def test_cancel_and_reschedule(self, run_scheduler):
+        scheduler = run_scheduler(RecordingScheduler())
+
+        scheduler.schedule('a', {}, due=time.time() + 0.05)
+        scheduler.schedule('b', {}, due=time.time() + 0.05)
+        scheduler.cancel('a')
+        scheduler.schedule('b', {}, due=time.time() + 0.1)  # 改期后旧堆项失效
+
+        await asyncio.sleep(0.2)
+        assert [key for key, _ in scheduler.attempts] == ['b']
+
+
+class TestFailedMessageQueue:
+    """内存失败消息队列（基于同一调度器）测试"""
+
+    @pytest.mark.asyncio
+    async def test_retry_with_handler(self):
+        queue = FailedMessageQueue(max_retries=3, base_delay=0.02)
+        queue.jitter = 0
+        handled = []
+
+        async def handler(message):
+            handled.append(message['id'])
+            return len(handled) > 1  # 第一次失败，第二次成功
+
+        queue.set_message_handler(handler)
+        await queue.start()
+        try:
+            queue.add('m1', {'id': 'm1'}, '超时')
+            assert queue.get_stats()['queue_size'] == 1
+
+            await wait_until(lambda: queue.stats['retry_success'] == 1)
+            assert handled == ['m1', 'm1']
+            assert queue.get('m1') is None
+        finally:
+            await queue.stop()
+
+
+@pytest.fixture
+async def retry_db(tmp_path):
+    adb = AsyncDatabase(db_path=tmp_path / "retry.db", pool_size=2)
+    await adb.connect()
+    async with adb.writer() as conn:
+        await conn.execute(
+            "INSERT INTO bot_configs (id, platform, name, config) VALUES (1, 'discord', 'bot', ?)",
+            (json.dumps({'webhook_url': 'https://discord.test/webhook'}),)
+        )
+        await conn.execute("""
+            INSERT INTO channel_mappings
+            (kook_server_id, kook_channel_id, kook_channel_name, target_platform, target_bot_id, target_channel_id)
+            VALUES ('s1', 'ch1', '频道', 'discord', 1, 'target')
+        """)
+    try:
+        yield adb
+    finally:
+        await adb.disconnect()
+
+
+async def add_failed(adb, count, due_in=-1.0):
+    """写入失败消息（到期时间为当前时间+due_in）"""
+    ids = await adb.add_message_logs_batch([{
+        'kook_message_id': f'm{index}',
+        'kook_channel_id': 'ch1',
+        'content': f'消息{index}',
+        'message_type': 'text',
+        'sender_name': '用户',
+        'target_platform': 'discord',
+        'target_channel': 'target',
+        'status': 'failed',
+        'retry': True
+    } for index in range(count)])
+    async with adb.writer() as conn:
+        await conn.execute("UPDATE failed_messages SET next_retry = ?", (time.time() + due_in,))
+    return ids
+
+
+class TestRetryWorker:
+    """基于数据库到期时间索引的重试Worker测试"""
+
+    @pytest.mark.asyncio
+    async def test_due_query_uses_index(self, retry_db):
+        async with retry_db.reader() as conn:
+            cursor = await conn.execute("""
+                EXPLAIN QUERY PLAN
+                SELECT MIN(next_retry) FROM failed_messages
+                WHERE next_retry > ? AND retry_count < ?
+            """, (time.time(), 5))
+            plan = " ".join(str(row[-1]) for row in await cursor.fetchall())
+        assert 'idx_failed_messages_due' in plan
+
+    @pytest.mark.asyncio
+    async def test_new_failures_scheduled_after_interval(self, retry_db):
+        await retry_db.add_failed_message(1)
+        async with retry_db.reader() as conn:
+            cursor = await conn.execute("SELECT next_retry FROM failed_messages")
+            (next_retry,) = await cursor.fetchone()
+        assert next_retry > time.time() + 10
+
+    @pytest.mark.asyncio
+    async def test_drains_backlog_concurrently(self, retry_db, run_scheduler):
+        """积压的失败消息并发重试，成功的删除，失败的写回下次重试时间"""
+        ids = await add_failed(retry_db, 40)
+        sent = []
+
+        worker = RetryWorker(database=retry_db)
+        worker.platform_concurrency = 4
+
+        async def forward_message(message, mapping):
+            sent.append(message['message_id'])
+            await asyncio.sleep(0.05)
+            return message['message_id'] != 'm0'
+
+        worker.forward_message = forward_message
+
+        start = time.monotonic()
+        run_scheduler(worker)
+        await wait_until(lambda: worker.stats['total_retried'] == 40 and not worker._inflight)
+        elapsed = time.monotonic() - start
+
+        # 40条、每条50ms、并发4：约0.5秒（逐条重试需要2秒）
+        assert elapsed < 1.5
+        assert sorted(sent) == sorted(f'm{index}' for index in range(40))
+
+        async with retry_db.reader() as conn:
+            cursor = await conn.execute("SELECT message_log_id, retry_count, next_retry FROM failed_messages")
+            rows = [tuple(row) for row in await cursor.fetchall()]
+            cursor = await conn.execute("SELECT COUNT(*) FROM message_logs WHERE status = 'success'")
+            (succeeded,) = await cursor.fetchone()
+
+        assert succeeded == 39
+        assert len(rows) == 1
+        log_id, retry_count, next_retry = rows[0]
+        assert log_id == ids[0] and retry_count == 1
+        assert next_retry > time.time() + worker.base_delay
+
+    @pytest.mark.asyncio
+    async def test_sleeps_until_next_due(self, retry_db, run_scheduler):
+        """没有到期消息时不查询重试，到期后立即处理"""
+        await add_failed(retry_db, 1, due_in=0.2)
+        sent = []
+
+        worker = RetryWorker(database=retry_db)
+
+        async def forward_message(message, mapping):
+            sent.append(time.monotonic())
+            return True
+
+        worker.forward_message = forward_message
+
+        start = time.monotonic()
+        run_scheduler(worker)
+        await wait_until(lambda: sent)
+
+        assert 0.15 <= sent[0] - start < 0.5
@@ -0,0 +1,161 @@
+"""
+频道路由表测试
+"""
+import json
+import pytest
+import asyncio
+from fakeredis import aioredis as fakeredis
+from app.database_async import AsyncDatabase
+from app.queue.routing import RoutingTable
+from app.forwarders.discord import discord_forwarder
+from app.processors.formatter import formatter
+
+
+@pytest.fixture
+async def adb(tmp_path):
+    database = AsyncDatabase(db_path=tmp_path / "routing.db", pool_size=1)
+    await database.connect()
+    yield database
+    await database.disconnect()
+
+
+async def add_bot(adb, platform='discord', config=None):
+    async with adb.writer() as conn:
+        cursor = await conn.execute(
+            "INSERT INTO bot_configs (platform, name, config) VALUES (?, ?, ?)",
+            (platform, 'bot', json.dumps(config or {'webhook_url': 'https://example.com/hook'}))
+        )
+        return cursor.lastrowid
+
+
+async def add_mapping(adb, channel, bot_id, platform='discord', target='target', enabled=1):
+    async with adb.writer() as conn:
+        cursor = await conn.execute("""
+            INSERT INTO channel_mappings
+            (kook_server_id, kook_channel_id, kook_channel_name,
+             target_platform, target_bot_id, target_channel_id, enabled)
+            VALUES ('s1', ?, 'name', ?, ?, ?, ?)
+        """, (channel, platform, bot_id, target, enabled))
+        return cursor.lastrowid
+
+
+class TestRoutingTable:
+    """路由表测试"""
+
+    @pytest.mark.asyncio
+    async def test_resolved_routes(self, adb):
+        """路由描述包含已解析的Bot配置、转发器和格式化函数"""
+        bot_id = await add_bot(adb)
+        await add_mapping(adb, 'ch1', bot_id, target='a')
+        await add_mapping(adb, 'ch1', bot_id, target='b')
+        await add_mapping(adb, 'ch1', bot_id, target='off', enabled=0)
+
+        table = RoutingTable(database=adb)
+        routes = await table.get_routes('ch1')
+
+        assert [r['target_channel_id'] for r in routes] == ['a', 'b']
+        assert routes[0]['bot']['config']['webhook_url'] == 'https://example.com/hook'
+        assert routes[0]['forwarder'] is discord_forwarder
+        assert routes[0]['format'] == formatter.kmarkdown_to_discord
+        assert await table.get_routes('unknown') == []
+
+    @pytest.mark.asyncio
+    async def test_lookups_hit_memory(self, adb):
+        """表构建后重复查询不再访问数据库"""
+        bot_id = await add_bot(adb)
+        await add_mapping(adb, 'ch1', bot_id)
+
+        table = RoutingTable(database=adb)
+        for _ in range(50):
+            await table.get_routes('ch1')
+
+        assert table.stats['builds'] == 1
+        assert table.stats['lookups'] == 50
+
+    @pytest.mark.asyncio
+    async def test_invalidate_rebuilds(self, adb):
+        """失效后下次查询看到新映射"""
+        bot_id = await add_bot(adb)
+        table = RoutingTable(database=adb)
+        assert await table.get_routes('ch1') == []
+
+        await add_mapping(adb, 'ch1', bot_id)
+        assert await table.get_routes('ch1') == []  # 未失效前仍是旧表
+
+        table.invalidate('channel_mappings')
+        assert len(await table.get_routes('ch1')) == 1
+        assert table.stats['builds'] == 2
+
+    @pytest.mark.asyncio
+    async def test_concurrent_lookups_single_build(self, adb):
+        """并发查询只触发一次重建"""
+        bot_id = await add_bot(adb)
+        await add_mapping(adb, 'ch1', bot_id)
+
+        table = RoutingTable(database=adb)
+        results = await asyncio.gather(*[table.get_routes('ch1') for _ in range(20)])
+
+        assert all(len(r) == 1 for r in results)
+        assert table.stats['builds'] == 1
+
+    @pytest.mark.asyncio
+    async def test_invalidation_across_processes(self, adb):
+        """一个实例的失效通过Redis pub/sub传播到其他实例"""
+        redis = fakeredis.FakeRedis(decode_responses=True)
+        bot_id = await add_bot(adb)
+
+        writer_side = RoutingTable(database=adb)
+        worker_side = RoutingTable(database=adb)
+        await writer_side.start(redis)
+        await worker_side.start(redis)
+
+        try:
+            assert await worker_side.get_routes('ch1') == []
+
+            await add_mapping(adb, 'ch1', bot_id)
+            writer_side.invalidate('channel_mappings')
+
+            for _ in range(50):
+                if worker_side.stats['remote_invalidations']:
+                    break
+                await asyncio.sleep(0.02)
+
+            assert worker_side.stats['remote_invalidations'] == 1
+            assert writer_side.stats['remote_invalidations'] == 0
+            assert len(await worker_side.get_routes('ch1')) == 1
+        finally:
+            await writer_side.stop()
+            await worker_side.stop()
+            await redis.aclose()
+
+    def test_database_writes_invalidate_global_table(self):
+        """通过同步数据库修改映射时全局路由表自动失效"""
+        from app.database import db
+        from app.queue.routing import routing_table
+
+        before = routing_table.stats['invalidations']
+
+        db.execute("SELECT * FROM channel_mappings").fetchall()
+        assert routing_table.stats['invalidations'] == before
+
+        db.execute("UPDATE channel_mappings SET enabled = enabled WHERE id = -1")
+        assert routing_table.stats['invalidations'] == before + 1
+
+    @pytest.mark.asyncio
+    async def test_backup_replace_import_invalidates(self, tmp_path, monkeypatch):
+        """替换模式导入配置时清空映射后通知路由表重建"""
+        import io
+        from fastapi import UploadFile
+        from app.api import backup as backup_api
+        from app.database import Database
+
+        database = Database(tmp_path / "backup.db")
+        changes = []
+        database.add_change_listener(changes.append)
+        monkeypatch.setattr(backup_api, 'db', database)
+
+        upload = UploadFile(file=io.BytesIO(json.dumps({'version': '1'}).encode('utf-8')), filename='config.json')
+        result = await backup_api.import_config(file=upload, mode='replace')
+
+        assert result['status'] == 'success'
+        assert 'channel_mappings' in changes
@@ -0,0 +1,91 @@
+"""
+敏感词过滤插件测试
+"""
+import re
+import pytest
+from app.plugins.sensitive_word_filter import SensitiveWordFilter
+
+
+@pytest.fixture
+async def word_filter(tmp_path):
+    """使用临时词库文件的过滤器"""
+    words_file = tmp_path / 'sensitive_words.txt'
+    words_file.write_text(
+        '# 敏感词列表（每行一个）\n'
+        '广告\n'
+        '代练\n'
+        '代练群\n'
+        '外挂\n'
+        r'/\d{11}/' '\n'
+        r'/v[x]?信/' '\n',
+        encoding='utf-8'
+    )
+
+    plugin = SensitiveWordFilter()
+    plugin.words_file = words_file
+    await plugin.load_words()
+    return plugin
+
+
+class TestSensitiveWordFilter:
+    """敏感词过滤测试"""
+
+    @pytest.mark.asyncio
+    async def test_load_words(self, word_filter):
+        assert word_filter.sensitive_words == {'广告', '代练', '代练群', '外挂'}
+        assert len(word_filter.sensitive_patterns) == 2
+        assert word_filter.combined_pattern is not None
+        assert word_filter.get_word_count() == 6
+
+        # 重复加载不会累积
+        await word_filter.load_words()
+        assert word_filter.get_word_count() == 6
+
+    def test_mask_all_hits_in_one_pass(self, word_filter):
+        text, found = word_filter._filter_text('加代练群，电话13800138000，vx信联系，卖外挂')
+
+        assert text == '加***，电话***********，***联系，卖**'
+        assert found == ['代练', '代练群', '13800138000', 'vx信', '外挂']
+
+    def test_remove_and_custom_modes(self, word_filter):
+        word_filter.replace_mode = 'remove'
+        assert word_filter._filter_text('广告外挂正常')[0] == '正常'
+
+        word_filter.replace_mode = 'custom'
+        assert word_filter._filter_text('广告外挂 正常')[0] == '[已过滤][已过滤] 正常'
+
+    def test_backreference_patterns_not_merged(self, word_filter):
+        """合并会让分组重新编号，含反向引用的正则单独匹配"""
+        word_filter.sensitive_patterns = [re.compile(r'(a)b'), re.compile(r'(c)\1')]
+        word_filter._compile()
+
+        assert word_filter._filter_text('xx cc yy') == ('xx ** yy', ['cc'])
+        assert word_filter._filter_text('ab cc') == ('** **', ['ab', 'cc'])
+
+    def test_no_hits_returns_original(self, word_filter):
+        assert word_filter._filter_text('正常消息') == ('正常消息', [])
+
+    @pytest.mark.asyncio
+    async def test_add_and_remove_word(self, word_filter):
+        await word_filter.add_word('刷屏')
+        assert word_filter._filter_text('不要刷屏')[0] == '不要**'
+
+        await word_filter.remove_word('代练')
+        text, found = word_filter._filter_text('代练和代练群')
+        assert text == '代练和***'
+        assert found == ['代练群']
+
+        # 词库文件保留正则
+        reloaded = SensitiveWordFilter()
+        reloaded.words_file = word_filter.words_file
+        await reloaded.load_words()
+        assert reloaded.sensitive_words == {'广告', '代练群', '外挂', '刷屏'}
+        assert len(reloaded.sensitive_patterns) == 2
+
+    @pytest.mark.asyncio
+    async def test_filter_message(self, word_filter):
+        message = await word_filter.filter_message({'content': '广告位招租'})
+
+        assert message['content'] == '**位招租'
+        assert message['filtered_words'] == ['广告']
+        assert word_filter.get_stats()['messages_filtered'] == 1
@@ -0,0 +1,263 @@
+"""
+消息统计汇总表（触发器维护的分钟/小时预聚合）测试
+"""
+import pytest
+import random
+import sqlite3
+import time
+from datetime import datetime, timezone
+from app.database import Database
+from app.database_async import AsyncDatabase
+from app.analytics.stats_rollup import StatsRollup
+
+
+def utc(timestamp: float) -> str:
+    """message_logs.created_at 格式（UTC）"""
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+async def insert_log(adb, message_id, status='success', platform='discord', channel='ch1',
+                     latency_ms=None, created_at=None):
+    async with adb.writer() as conn:
+        await conn.execute("""
+            INSERT INTO message_logs
+            (kook_message_id, kook_channel_id, content, message_type, sender_name,
+             target_platform, target_channel, status, latency_ms, created_at)
+            VALUES (?, ?, '内容', 'text', '用户', ?, 'target', ?, ?, ?)
+        """, (message_id, channel, platform, status, latency_ms,
+              utc(created_at if created_at is not None else time.time())))
+
+
+@pytest.fixture
+async def stats_db(tmp_path):
+    adb = AsyncDatabase(db_path=tmp_path / "stats.db", pool_size=2)
+    await adb.connect()
+    try:
+        yield adb
+    finally:
+        await adb.disconnect()
+
+
+class TestStatsRollup:
+    """汇总表维护与查询测试"""
+
+    @pytest.mark.asyncio
+    async def test_summary_from_batch_writes(self, stats_db):
+        await stats_db.add_message_logs_batch([{
+            'kook_message_id': f'm{index}',
+            'kook_channel_id': 'ch1',
+            'content': '内容',
+            'message_type': 'text',
+            'sender_name': '用户',
+            'target_platform': 'discord' if index % 2 else 'telegram',
+            'target_channel': 'target',
+            'status': 'failed' if index % 5 == 0 else 'success',
+            'latency_ms': None if index % 5 == 0 else index * 100
+        } for index in range(10)])
+
+        rollup = StatsRollup(database=stats_db)
+        stats = await rollup.summary(time.time() - 3600)
+
+        assert (stats['total'], stats['success'], stats['failed']) == (10, 8, 2)
+        assert stats['success_rate'] == 0.8
+        # 成功消息延迟：100,200,300,400,600,700,800,900
+        assert stats['avg_latency_ms'] == 500.0
+        assert stats['latency_buckets'] == {100: 4, 500: 4}
+
+        discord = await rollup.summary(time.time() - 3600, platform='discord')
+        assert discord['total'] == 5
+
+    @pytest.mark.asyncio
+    async def test_status_update_moves_counts(self, stats_db):
+        await insert_log(stats_db, 'm1', status='failed')
+        await insert_log(stats_db, 'm2', status='success', latency_ms=50)
+
+        async with stats_db.writer() as conn:
+            await conn.execute("UPDATE message_logs SET status = 'success' WHERE kook_message_id = 'm1'")
+            # 不影响统计的列变更不触发汇总更新
+            await conn.execute("UPDATE message_logs SET error_message = '重试失败' WHERE kook_message_id = 'm2'")
+
+        rollup = StatsRollup(database=stats_db)
+        stats = await rollup.summary(time.time() - 3600)
+        assert (stats['total'], stats['success'], stats['failed']) == (2, 2, 0)
+
+        hour_stats = await rollup.summary(time.time() - 7 * 86400)
+        assert hour_stats['total'] == 2 and hour_stats['success'] == 2
+
+    @pytest.mark.asyncio
+    async def test_matches_full_scan(self, stats_db):
+        """汇总结果与直接扫描message_logs一致"""
+        rng = random.Random(7)
+        now = time.time()
+        for index in range(300):
+            await insert_log(
+                stats_db, f'm{index}',
+                status=rng.choice(['success', 'success', 'failed', 'pending']),
+                platform=rng.choice(['discord', 'telegram', 'feishu']),
+                channel=rng.choice(['ch1', 'ch2']),
+                latency_ms=rng.choice([None, rng.randint(1, 20000)]),
+                created_at=now - rng.randint(0, 3 * 86400)
+            )
+
+        rollup = StatsRollup(database=stats_db)
+        since = (int(now) - 86400) // 3600 * 3600
+        stats = await rollup.summary(since - 3 * 86400)
+        platforms = await rollup.breakdown(since - 3 * 86400, by='platform')
+
+        async with stats_db.reader() as conn:
+            cursor = await conn.execute("SELECT status, COUNT(*) FROM message_logs GROUP BY status")
+            by_status = {status: count for status, count in await cursor.fetchall()}
+            cursor = await conn.execute(
+                "SELECT target_platform, COUNT(*) FROM message_logs GROUP BY target_platform"
+            )
+            by_platform = {platform: count for platform, count in await cursor.fetchall()}
+            cursor = await conn.execute(
+                "SELECT COUNT(*) FROM message_logs WHERE created_at >= ?", (utc(since),)
+            )
+            (recent,) = await cursor.fetchone()
+
+        assert stats['by_status'] == by_status
+        assert {platform: s['total'] for platform, s in platforms.items()} == by_platform
+        # 按小时对齐的窗口，分钟表和小时表结果一致
+        assert (await rollup.summary(since))['total'] == recent
+
+    @pytest.mark.asyncio
+    async def test_timeline_zero_filled(self, stats_db):
+        now = int(time.time()) // 60 * 60
+        await insert_log(stats_db, 'a', created_at=now - 600 + 5)
+        await insert_log(stats_db, 'b', status='failed', created_at=now - 600 + 30)
+        await insert_log(stats_db, 'c', created_at=now - 60)
+
+        rollup = StatsRollup(database=stats_db)
+        points = await rollup.timeline(now - 900, 300)
+
+        assert [p['timestamp'] for p in points][:3] == [now - 900, now - 600, now - 300]
+        assert [p['total'] for p in points][:3] == [0, 2, 1]
+        assert points[1]['failed'] == 1 and points[1]['success'] == 1
+
+    @pytest.mark.asyncio
+    async def test_counts_by_time(self, stats_db):
+        hour = int(time.time()) // 3600 * 3600
+        await insert_log(stats_db, 'a', created_at=hour - 3600 + 10)
+        await insert_log(stats_db, 'b', created_at=hour - 3600 + 20)
+        await insert_log(stats_db, 'c', created_at=hour + 1)
+
+        rollup = StatsRollup(database=stats_db)
+        hourly = await rollup.counts_by_time(hour - 7200, '%H')
+
+        assert hourly == {
+            datetime.fromtimestamp(hour - 3600, timezone.utc).strftime('%H'): 2,
+            datetime.fromtimestamp(hour, timezone.utc).strftime('%H'): 1
+        }
+
+    @pytest.mark.asyncio
+    async def test_breakdown_dimensions(self, stats_db):
+        await insert_log(stats_db, 'a', channel='ch1')
+        await insert_log(stats_db, 'b', channel='ch2', status='failed')
+
+        rollup = StatsRollup(database=stats_db)
+        channels = await rollup.breakdown(time.time() - 3600, by='channel')
+        assert {key: s['total'] for key, s in channels.items()} == {'ch1': 1, 'ch2': 1}
+
+        with pytest.raises(ValueError):
+            await rollup.breakdown(time.time() - 3600, by='content')
+
+    @pytest.mark.asyncio
+    async def test_prune(self, stats_db):
+        now = time.time()
+        await insert_log(stats_db, 'old', created_at=now - 5 * 86400)
+        await insert_log(stats_db, 'new', created_at=now)
+
+        rollup = StatsRollup(database=stats_db)
+        assert await rollup.prune(now) > 0
+
+        async with stats_db.reader() as conn:
+            cursor = await conn.execute("SELECT COUNT(*) FROM message_stats_minute")
+            (minute_rows,) = await cursor.fetchone()
+            cursor = await conn.execute("SELECT COUNT(*) FROM message_stats_hour")
+            (hour_rows,) = await cursor.fetchone()
+
+        # 5天前的分钟级数据超过保留期被清理，小时级数据保留
+        assert minute_rows == 1
+        assert hour_rows == 2
+
+
+class TestTodayStatsApi:
+    """/api/stats/today 读取汇总表和活跃账号/Bot/映射数"""
+
+    @pytest.mark.asyncio
+    async def test_today_stats(self, stats_db, tmp_path, monkeypatch):
+        from app.api import stats as stats_api
+
+        sync_db = Database(tmp_path / "stats.db")
+        sync_db.execute("INSERT INTO accounts (email, status) VALUES ('a@example.com', 'online')")
+        sync_db.execute("INSERT INTO accounts (email) VALUES ('b@example.com')")
+        sync_db.execute("INSERT INTO bot_configs (platform, name, config) VALUES ('discord', 'bot', '{}')")
+        sync_db.execute(
+            "INSERT INTO bot_configs (platform, name, config, status) VALUES ('telegram', 'off', '{}', 'inactive')"
+        )
+        sync_db.execute("""
+            INSERT INTO channel_mappings
+            (kook_server_id, kook_channel_id, kook_channel_name, target_platform, target_bot_id,
+             target_channel_id, enabled)
+            VALUES ('s', 'ch1', '频道', 'discord', 1, 't1', 1), ('s', 'ch2', '频道', 'discord', 1, 't2', 0)
+        """)
+        await insert_log(stats_db, 'm1', latency_ms=100)
+        await insert_log(stats_db, 'm2', status='failed')
+
+        monkeypatch.setattr(stats_api, 'db', sync_db)
+        monkeypatch.setattr(stats_api, 'stats_rollup', StatsRollup(database=stats_db))
+
+        result = await stats_api.get_today_stats()
+
+        assert result['messagesTotal'] == 2
+        assert result['messagesSuccess'] == 1
+        assert result['successRate'] == 50.0
+        assert result['avgLatency'] == 100.0
+        assert (result['activeAccounts'], result['activeBots'], result['activeMappings']) == (1, 1, 1)
+
+
+class TestStatsBackfill:
+    """已有日志的数据库首次创建汇总表时回填"""
+
+    @pytest.mark.asyncio
+    async def test_backfill_existing_logs(self, tmp_path):
+        db_path = tmp_path / "legacy.db"
+        conn = sqlite3.connect(db_path)
+        conn.execute("""
+            CREATE TABLE message_logs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kook_message_id TEXT NOT NULL UNIQUE,
+                kook_channel_id TEXT NOT NULL,
+                content TEXT,
+                message_type TEXT,
+                sender_name TEXT,
+                target_platform TEXT,
+                target_channel TEXT,
+                status TEXT,
+                error_message TEXT,
+                latency_ms INTEGER,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        conn.executemany(
+            "INSERT INTO message_logs (kook_message_id, kook_channel_id, target_platform, status, latency_ms) "
+            "VALUES (?, 'ch1', 'discord', ?, ?)",
+            [(f'm{index}', 'success' if index % 4 else 'failed', 200) for index in range(20)]
+        )
+        conn.commit()
+        conn.close()
+
+        adb = AsyncDatabase(db_path=db_path, pool_size=1)
+        await adb.connect()
+        try:
+            stats = await StatsRollup(database=adb).summary(time.time() - 3600)
+            assert (stats['total'], stats['success'], stats['failed']) == (20, 15, 5)
+
+            # 再次初始化不会重复回填
+            await adb.disconnect()
+            await adb.connect()
+            stats = await StatsRollup(database=adb).summary(time.time() - 3600)
+            assert stats['total'] == 20
+        finally:
+            await adb.disconnect()
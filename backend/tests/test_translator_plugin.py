@@ -0,0 +1,239 @@
+"""
+翻译插件（译文缓存、批量请求）测试
+"""
+import pytest
+import asyncio
+import importlib
+import time
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from app.plugins.translator_plugin import TranslatorPlugin
+from app.utils.http_client import HttpClientManager
+from app.utils.translation_cache import TranslationCache, make_cache_key
+
+# app.plugins 导出了同名的插件实例，这里取模块本身
+translator_module = importlib.import_module('app.plugins.translator_plugin')
+
+
+@pytest.fixture
+async def stub_provider(monkeypatch):
+    """本地翻译API桩（记录每次请求的文本数量）"""
+    requests = []
+
+    async def google(request):
+        body = await request.json()
+        requests.append(body['q'])
+        await asyncio.sleep(0.02)
+        return web.json_response({
+            'data': {'translations': [{'translatedText': f"EN({text})"} for text in body['q']]}
+        })
+
+    async def baidu(request):
+        form = await request.post()
+        lines = form['q'].split('\n')
+        requests.append(lines)
+        await asyncio.sleep(0.02)
+        if len(form['q'].encode('utf-8')) > server.baidu_max_bytes:
+            return web.json_response({'error_code': '54003', 'error_msg': 'q too long'})
+        return web.json_response({
+            'trans_result': [{'src': line, 'dst': f"EN({line})"} for line in lines]
+        })
+
+    app = web.Application()
+    app.router.add_post('/google', google)
+    app.router.add_post('/baidu', baidu)
+    server = TestServer(app)
+    await server.start_server()
+
+    manager = HttpClientManager()
+    monkeypatch.setattr(translator_module, 'http_client_manager', manager)
+    server.requests = requests
+    server.baidu_max_bytes = 6000
+    try:
+        yield server
+    finally:
+        await manager.close()
+        await server.close()
+
+
+@pytest.fixture
+async def make_plugin(tmp_path, stub_provider):
+    """创建指向本地桩的翻译插件"""
+    plugins = []
+
+    def factory(provider='google', db_name='translation.db'):
+        plugin = TranslatorPlugin(cache=TranslationCache(db_path=tmp_path / db_name))
+        plugin.enabled_translation = True
+        plugin.api_provider = provider
+        plugin.google_api_url = str(stub_provider.make_url('/google'))
+        plugin.baidu_api_url = str(stub_provider.make_url('/baidu'))
+        plugin.batch_window = 0.01
+        plugins.append(plugin)
+        return plugin
+
+    try:
+        yield factory
+    finally:
+        for plugin in plugins:
+            await plugin.on_unload()
+
+
+class TestTranslationCache:
+    """两级译文缓存测试"""
+
+    @pytest.mark.asyncio
+    async def test_key_includes_languages(self):
+        assert make_cache_key('你好', 'zh', 'en') != make_cache_key('你好', 'zh', 'ja')
+        assert make_cache_key('你好', 'zh', 'en') == make_cache_key('你好', 'zh', 'en')
+
+    @pytest.mark.asyncio
+    async def test_disk_tier_survives_restart(self, tmp_path):
+        cache = TranslationCache(db_path=tmp_path / 'cache.db')
+        await cache.set_many({'你好': 'hello'}, 'zh', 'en', provider='google')
+        await cache.close()
+
+        cache = TranslationCache(db_path=tmp_path / 'cache.db')
+        try:
+            assert await cache.get('你好', 'zh', 'en') == 'hello'
+            assert await cache.get('你好', 'zh', 'ja') is None
+            assert cache.stats['disk_hits'] == 1
+
+            # 磁盘命中回填内存
+            assert await cache.get('你好', 'zh', 'en') == 'hello'
+            assert cache.stats['memory_hits'] == 1
+        finally:
+            await cache.close()
+
+    @pytest.mark.asyncio
+    async def test_disk_lru_eviction(self, tmp_path):
+        """超过上限时淘汰最久未用的条目"""
+        cache = TranslationCache(db_path=tmp_path / 'cache.db', disk_max_entries=3)
+        try:
+            for index in range(3):
+                await cache.set_many({f'text-{index}': f'tr-{index}'}, 'zh', 'en')
+                await asyncio.sleep(0.01)
+
+            cache.memory.clear()
+            assert await cache.get('text-0', 'zh', 'en') == 'tr-0'  # text-0 变为最近使用
+
+            await cache.set_many({'text-3': 'tr-3'}, 'zh', 'en')
+            cache.memory.clear()
+
+            assert await cache.get('text-1', 'zh', 'en') is None
+            found = await cache.get_many(['text-0', 'text-2', 'text-3'], 'zh', 'en')
+            assert len(found) == 3
+            assert cache.stats['disk_evictions'] == 1
+        finally:
+            await cache.close()
+
+
+class TestTranslatorPlugin:
+    """翻译插件测试"""
+
+    @pytest.mark.asyncio
+    async def test_translate_message_uses_cache(self, make_plugin, stub_provider):
+        plugin = make_plugin()
+
+        message = await plugin.translate_message({'content': '欢迎新人'})
+        assert message['translated_content'] == 'EN(欢迎新人)'
+
+        message = await plugin.translate_message({'content': '欢迎新人'})
+        assert message['translated_content'] == 'EN(欢迎新人)'
+        assert len(stub_provider.requests) == 1
+        assert plugin.stats['cache_hits'] == 1
+
+    @pytest.mark.asyncio
+    async def test_concurrent_messages_batched(self, make_plugin, stub_provider):
+        """窗口内的并发消息合并为一次请求，重复文本只翻译一次"""
+        plugin = make_plugin()
+        contents = [f'消息{index}' for index in range(10)] + ['消息0', '消息1']
+
+        messages = await asyncio.gather(
+            *(plugin.translate_message({'content': content}) for content in contents)
+        )
+
+        assert [m['translated_content'] for m in messages] == [f'EN({c})' for c in contents]
+        assert stub_provider.requests == [[f'消息{index}' for index in range(10)]]
+        assert plugin.stats['shared'] == 2
+
+    @pytest.mark.asyncio
+    async def test_batch_split_by_max_size(self, make_plugin, stub_provider):
+        plugin = make_plugin()
+        plugin.batch_max_size = 4
+
+        await asyncio.gather(*(plugin._translate_text(f'文本{i}', 'auto', 'en') for i in range(10)))
+
+        assert [len(batch) for batch in stub_provider.requests] == [4, 4, 2]
+
+    @pytest.mark.asyncio
+    async def test_baidu_multiline_batch(self, make_plugin, stub_provider):
+        """百度按行翻译，多行文本还原回各自的消息"""
+        plugin = make_plugin(provider='baidu')
+
+        results = await asyncio.gather(
+            plugin._translate_text('第一行\n\n第二行', 'auto', 'en'),
+            plugin._translate_text('单行', 'auto', 'en')
+        )
+
+        assert results == ['EN(第一行)\n\nEN(第二行)', 'EN(单行)']
+        assert stub_provider.requests == [['第一行', '第二行', '单行']]
+
+    @pytest.mark.asyncio
+    async def test_baidu_request_capped_by_utf8_bytes(self, make_plugin, stub_provider):
+        """百度 q 按UTF-8字节数限制：中文每字3字节，超出上限按行拆成多次请求"""
+        plugin = make_plugin(provider='baidu')
+        plugin.baidu_max_bytes = 40
+        texts = [f'第{i}行文本内容' for i in range(6)]  # 每行19字节，两行拼接39字节
+
+        results = await asyncio.gather(*(plugin._translate_text(text, 'auto', 'en') for text in texts))
+
+        assert results == [f'EN({text})' for text in texts]
+        assert [len(lines) for lines in stub_provider.requests] == [2, 2, 2]
+        assert all(len('\n'.join(lines).encode('utf-8')) <= 40 for lines in stub_provider.requests)
+
+        plugin.baidu_max_bytes = 6000
+        stub_provider.requests.clear()
+        await asyncio.gather(*(plugin._translate_text(f'{text}!', 'auto', 'en') for text in texts))
+        assert [len(lines) for lines in stub_provider.requests] == [6]
+
+    @pytest.mark.asyncio
+    async def test_baidu_oversized_line_fails_only_its_text(self, make_plugin, stub_provider):
+        """超长行单独请求失败时，同一批次的其他文本照常翻译"""
+        plugin = make_plugin(provider='baidu')
+        plugin.baidu_max_bytes = 40
+        stub_provider.baidu_max_bytes = 40
+        texts = ['第一条消息', '很长的一行' * 10 + '\n第二行', '第三条消息']
+
+        results = await plugin._translate_with_baidu(texts, 'auto', 'en')
+
+        assert results == ['EN(第一条消息)', None, 'EN(第三条消息)']
+        assert len(stub_provider.requests) == 3
+
+    @pytest.mark.asyncio
+    async def test_provider_error_not_cached(self, make_plugin, stub_provider):
+        plugin = make_plugin()
+        plugin.google_api_url = str(stub_provider.make_url('/missing'))
+
+        message = await plugin.translate_message({'content': '你好'})
+
+        assert 'translated_content' not in message
+        assert plugin.stats['failed'] == 1
+        assert await plugin.cache.get('你好', plugin.source_lang, plugin.target_lang) is None
+
+    @pytest.mark.asyncio
+    async def test_throughput_against_stub(self, make_plugin, stub_provider):
+        """本地桩上的吞吐与延迟统计"""
+        plugin = make_plugin()
+        count = 200
+
+        start = time.monotonic()
+        await asyncio.gather(*(plugin._translate_text(f'短语{i % 50}', 'auto', 'en') for i in range(count)))
+        elapsed = time.monotonic() - start
+
+        stats = plugin.get_stats()
+        assert stats['api_texts'] == 50
+        assert stats['api_requests'] <= 4
+        assert stats['latency']['calls'] == count
+        assert stats['api_latency']['p95_ms'] is not None
+        # 200次翻译只产生少量API请求（每次约20ms）
+        assert elapsed < 1.0
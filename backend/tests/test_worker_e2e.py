@@ -10,6 +10,8 @@ from unittest.mock import Mock, patch, AsyncMock
 from app.queue.worker import message_worker, MessageWorker
 from app.queue.redis_client import redis_queue
 from app.database import db
+from app.database_async import async_db
+from app.queue.routing import routing_table
 from app.processors.formatter import formatter
 from app.processors.image import image_processor
 from app.forwarders.discord import discord_forwarder
@@ -17,6 +19,13 @@ from app.forwarders.telegram import telegram_forwarder
 from app.forwarders.feishu import feishu_forwarder
 
 
+@pytest.fixture(autouse=True)
+async def close_async_db():
+    """每个测试结束后关闭异步数据库连接（连接绑定在测试的事件循环上）"""
+    yield
+    await async_db.disconnect()
+
+
 @pytest.fixture
 def sample_message():
     """示例消息"""
@@ -308,6 +317,44 @@ class TestMessageProcessingFlow:
             assert mock_telegram.called
 
 
+class TestSharedMediaStage:
+    """消息级媒体处理测试"""
+    
+    @pytest.mark.asyncio
+    async def test_images_processed_once_for_all_targets(self, sample_image_message):
+        """多个目标共享同一份图片处理结果"""
+        worker = MessageWorker()
+        bot = {'id': 1, 'config': {'webhook_url': 'https://discord.com/api/webhooks/x/y'}}
+        routes = [
+            {
+                'id': i,
+                'target_platform': 'discord',
+                'target_bot_id': 1,
+                'target_channel_id': f'discord_ch_{i}',
+                'bot': bot
+            }
+            for i in range(3)
+        ]
+        
+        with patch.object(routing_table, 'get_routes', new_callable=AsyncMock, return_value=routes), \
+             patch.object(async_db, 'add_message_log', new_callable=AsyncMock, return_value=1), \
+             patch.object(image_processor, 'download_image', new_callable=AsyncMock) as mock_download, \
+             patch.object(discord_forwarder, 'send_message', new_callable=AsyncMock) as mock_send:
+            
+            mock_download.return_value = b"fake_image_data"
+            mock_send.return_value = True
+            
+            message = dict(sample_image_message, message_id="shared_media_msg")
+            message['image_urls'] = message['image_urls'] * 2  # 重复URL只处理一次
+            
+            results = await worker.process_message(message)
+            
+            assert mock_download.call_count == 1
+            assert mock_send.call_count == 3
+            assert len(results) == 3
+            assert all(r['success'] for r in results)
+
+
 class TestQueueIntegration:
     """队列集成测试"""
     
@@ -0,0 +1,108 @@
+"""
+多进程Worker池测试
+"""
+import sys
+import time
+import pytest
+import asyncio
+from app.queue.worker_pool import WorkerPool
+
+
+def idle_worker(worker_id, stop_event):
+    """等待退出信号后正常退出"""
+    stop_event.wait(30)
+
+
+def crashing_worker(worker_id, stop_event):
+    """启动后立即崩溃"""
+    sys.exit(3)
+
+
+def stubborn_worker(worker_id, stop_event):
+    """忽略退出信号"""
+    time.sleep(30)
+
+
+async def wait_until(predicate, timeout=15.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        await asyncio.sleep(0.1)
+    return False
+
+
+class TestWorkerPool:
+    """Worker池测试"""
+
+    @pytest.mark.asyncio
+    async def test_start_and_graceful_stop(self):
+        """启动N个进程，关闭时子进程收到信号后正常退出"""
+        pool = WorkerPool(processes=2, target=idle_worker)
+        await pool.start()
+
+        try:
+            assert await wait_until(lambda: all(w['alive'] for w in pool.get_process_info()))
+            pids = {w['pid'] for w in pool.get_process_info()}
+            assert len(pids) == 2
+        finally:
+            await pool.stop(timeout=15)
+
+        info = pool.get_process_info()
+        assert not any(w['alive'] for w in info)
+        assert all(w['restarts'] == 0 for w in info)
+        assert all(pool._workers[w['worker_id']]['process'].exitcode == 0 for w in info)
+
+    @pytest.mark.asyncio
+    async def test_crashed_worker_restarted(self):
+        """崩溃的进程被监督者重启"""
+        pool = WorkerPool(processes=1, target=crashing_worker, max_restart_delay=0.5)
+        await pool.start()
+
+        try:
+            assert await wait_until(lambda: pool.get_process_info()[0]['restarts'] >= 2)
+            assert pool.get_process_info()[0]['last_exitcode'] == 3
+        finally:
+            await pool.stop(timeout=5)
+
+    def test_backoff_resets_after_stable_run(self):
+        """连续崩溃时退避时间翻倍，稳定运行一段时间后的崩溃重新从1秒开始"""
+        class ExitedProcess:
+            exitcode = 3
+
+        pool = WorkerPool(processes=1, max_restart_delay=60)
+        info = {'process': ExitedProcess(), 'restarts': 0, 'backoff': 0, 'spawned_at': 0.0}
+
+        delays = []
+        for now in (1.0, 2.0, 3.0):
+            info['spawned_at'] = now - 1
+            pool._schedule_restart(0, info, now)
+            delays.append(info['next_restart_at'] - now)
+        assert delays == [1, 2, 4]
+
+        info['spawned_at'] = 100.0
+        pool._schedule_restart(0, info, 100.0 + 60)
+        assert info['next_restart_at'] - 160.0 == 1
+        assert info['restarts'] == 4
+
+    @pytest.mark.asyncio
+    async def test_stubborn_worker_terminated(self):
+        """超时未退出的进程被强制终止"""
+        pool = WorkerPool(processes=1, target=stubborn_worker)
+        await pool.start()
+
+        assert await wait_until(lambda: pool.get_process_info()[0]['alive'])
+        await pool.stop(timeout=1)
+
+        assert not pool.get_process_info()[0]['alive']
+
+    @pytest.mark.asyncio
+    async def test_disabled_pool_reports_in_process_worker(self):
+        """未启用多进程时返回进程内Worker统计"""
+        pool = WorkerPool(processes=0)
+        await pool.start()
+
+        stats = await pool.get_stats()
+        assert stats['mode'] == 'in_process'
+        assert len(stats['workers']) == 1
+        assert 'batch_size' in stats['workers'][0]